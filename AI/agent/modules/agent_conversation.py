@@ -11,9 +11,14 @@ import re
 from datetime import datetime
 from pathlib import Path
 import asyncio
+from .json_stream import IncrementalJSONParser
+from .prompt_budget import PromptBuilder
+from .worker_pool import run_blocking
+from .atomic_io import write_json_atomic
 
 class AgentConversationManager:
-    def __init__(self, ollama_client, memory_utils, word2vec_model, max_turns=10):
+    def __init__(self, ollama_client, memory_utils, word2vec_model, max_turns=10, prompt_token_budget=None,
+                 worker_pool=None):
         """
         Agent 대화 관리자 초기화
         
@@ -22,11 +27,15 @@ class AgentConversationManager:
             memory_utils: MemoryUtils 인스턴스
             word2vec_model: Word2Vec 모델
             max_turns: 최대 대화 턴 수 (기본값: 10)
+            prompt_token_budget: 대화 프롬프트 토큰 예산 (None이면 prompt_budget의 "conversation" 기본 예산)
+            worker_pool: 메모리 조회 / 저장을 실행할 작업자 풀 (None이면 이벤트 루프에서 바로 실행)
         """
         self.ollama_client = ollama_client
         self.memory_utils = memory_utils
         self.word2vec_model = word2vec_model
         self.max_turns = max_turns  # 모듈 내부에서 최대 턴 수 설정
+        self.prompt_token_budget = prompt_token_budget
+        self.worker_pool = worker_pool
         
         # 현재 파일의 절대 경로를 기준으로 상위 디렉토리 찾기
         current_dir = Path(__file__).parent
@@ -50,143 +59,257 @@ class AgentConversationManager:
             dict: 처리 결과
         """
         try:
-            # 기본 검증
-            if "agents" not in payload or len(payload.get("agents", [])) < 2:
-                return {"success": False, "error": "At least two agents are required"}
-            
-            # 대화 ID 확인
-            conversation_id = payload.get("conversation_id")
-            is_new_conversation = not conversation_id
-            
-            # 에이전트 정보 추출
-            agents = payload.get("agents", [])
-            current_speaker_name = payload.get("current_speaker")
-            location = payload.get("location", "")
-            context = payload.get("context", "")
-            
-            # 화자 정보 추출
-            current_speaker = next((a for a in agents if a["name"] == current_speaker_name), None)
-            other_agent = next((a for a in agents if a["name"] != current_speaker_name), None)
-            
-            if not current_speaker or not other_agent:
-                return {"success": False, "error": "Invalid speaker configuration"}
-            
-            # 1. 새 대화 또는 기존 대화 로드
-            if is_new_conversation:
-                conversation = self._initialize_conversation(agents, location, context)
-                conversation_id = conversation["conversation_id"]
-            else:
-                conversation = await self._load_conversation(conversation_id)
-                if not conversation:
-                    return {"success": False, "error": f"Conversation {conversation_id} not found"}
-            
-            # 2. 대화 턴 수 확인 - 최대 턴 수에 도달했는지 체크
-            current_turns = len(conversation["messages"])
-            force_end = False
+            turn, error = await self._prepare_turn(payload)
+            if error:
+                return error
+            
+            # 6. Gemma 모델 호출 (스트리밍으로 받아 JSON 객체가 닫히면 바로 반환)
+            response = await self.ollama_client.process_prompt_until_json(
+                prompt=turn["prompt"],
+                system_prompt=turn["system_prompt"],
+                model_name="gemma3",
+                priority="interactive"
+            )
             
-            if current_turns >= self.max_turns - 1:  # 이번 턴이 마지막 턴이 될 경우
-                print(f"🔚 최대 대화 턴 수({self.max_turns})에 도달하여 대화를 종료합니다.")
-                force_end = True
+            # 7. 응답 파싱
+            parsed_response = self._parse_turn_response(response, turn["other_agent"]["name"])
             
-            # 3. 이전 대화 메모리 로드
-            previous_conversations = await self._get_previous_conversations(
-                current_speaker["name"], 
-                other_agent["name"]
-            )
+            return await self._complete_turn(turn, parsed_response)
             
-            # 4. 프롬프트 생성 - 강제 종료 힌트 포함
-            prompt = self._create_conversation_prompt(
-                conversation=conversation,
-                current_speaker=current_speaker,
-                other_agent=other_agent,
-                previous_conversations=previous_conversations,
-                location=location,
-                context=context,
-                force_end=force_end,
-                current_turns=current_turns,
-                max_turns=self.max_turns
-            )
+        except Exception as e:
+            print(f"Error processing conversation: {e}")
+            return {"success": False, "error": str(e)}
+    
+    async def process_conversation_stream(self, payload):
+        """
+        대화 처리 (스트리밍)
+        
+        process_conversation과 같은 처리를 하면서 생성 중인 대사를 조각으로 먼저 보냅니다.
+        
+        Args:
+            payload: 대화 요청 데이터
             
-            # 5. 시스템 프롬프트 생성
-            system_prompt = self._get_system_prompt(force_end)
+        Yields:
+            dict: 이벤트
+                - {"type": "start", "conversation_id", "speaker"}
+                - {"type": "delta", "text"}: 새로 생성된 대사 조각
+                - {"type": "result", ...}: process_conversation과 같은 최종 결과
+                - {"type": "error", "error"}
+        """
+        try:
+            turn, error = await self._prepare_turn(payload)
+            if error:
+                yield {"type": "error", "error": error.get("error", "")}
+                return
+            
+            yield {
+                "type": "start",
+                "conversation_id": turn["conversation_id"],
+                "speaker": turn["current_speaker"]["name"]
+            }
             
-            # 6. Gemma 모델 호출
-            response = await self.ollama_client.process_prompt(
-                prompt=prompt,
-                system_prompt=system_prompt,
-                model_name="gemma3"
+            # 6. Gemma 모델 스트리밍 호출 - message 필드가 자라는 만큼 전송, 객체가 닫히면 생성 중단
+            parser = IncrementalJSONParser()
+            sent = 0
+            stream = self.ollama_client.stream_prompt(
+                prompt=turn["prompt"],
+                system_prompt=turn["system_prompt"],
+                model_name="gemma3",
+                priority="interactive"
             )
+            try:
+                async for chunk in stream:
+                    parser.feed(chunk)
+                    message = parser.partial_string("message")
+                    if message is not None and len(message) > sent:
+                        yield {"type": "delta", "text": message[sent:]}
+                        sent = len(message)
+                    if parser.complete:
+                        break
+            finally:
+                await stream.aclose()
             
             # 7. 응답 파싱
-            parsed_response = self._parse_conversation_response(
-                response.get("response", ""),
-                default_next_speaker=other_agent["name"]
+            parsed_response = self._parse_turn_response(
+                {"response": parser.text, "json": parser.value},
+                turn["other_agent"]["name"]
             )
             
-            # 8. 강제 종료 적용
-            if force_end:
-                parsed_response["should_continue"] = False
-                if not parsed_response.get("reason_to_end"):
-                    parsed_response["reason_to_end"] = f"Conversation naturally concluded after {current_turns + 1} exchanges"
-            
-            # 9. 대화 업데이트
-            new_message = {
-                "speaker": current_speaker["name"],
-                "message": parsed_response["message"],
-                "emotion": parsed_response["emotion"],
-                "time": current_speaker["time"]
-            }
-            
-            conversation["messages"].append(new_message)
-            conversation["last_updated"] = current_speaker["time"]
-            
-            # 10. 대화 저장
-            await self._save_conversation(conversation)
+            result = await self._complete_turn(turn, parsed_response)
+            yield {"type": "result", **result}
             
-            # 11. 대화 종료 처리
-            memory_ids = []
-            if not parsed_response["should_continue"]:
-                # 대화 종료 처리
-                conversation["status"] = "completed"
-                
-                # 종료 이유 (강제 종료 여부에 따라 다름)
-                if force_end and not parsed_response.get("reason_to_end"):
-                    conversation["end_reason"] = f"Conversation reached the maximum of {self.max_turns} turns"
-                else:
-                    conversation["end_reason"] = parsed_response.get("reason_to_end", "Natural conclusion")
-                
-                # 대화 메모리에 저장
-                memory_ids = await self._save_conversation_to_memory(
-                    conversation, 
-                    agents,
-                    parsed_response.get("importance", 3)
-                )
-                
-                # 대화 저장 (상태 업데이트)
-                await self._save_conversation(conversation)
+        except Exception as e:
+            print(f"Error processing conversation stream: {e}")
+            yield {"type": "error", "error": str(e)}
+    
+    async def _prepare_turn(self, payload):
+        """
+        대화 턴 준비 (검증, 대화 로드, 프롬프트 생성)
+        
+        Args:
+            payload: 대화 요청 데이터
             
-            # 12. 응답 구성
-            result = {
-                "success": True,
-                "conversation_id": conversation_id,
-                "message": new_message,
-                "should_continue": parsed_response["should_continue"],
-                "next_speaker": parsed_response["next_speaker"],
-                "turns": current_turns + 1,
-                "max_turns": self.max_turns
-            }
+        Returns:
+            tuple: (턴 정보 dict, 오류 응답 dict) - 둘 중 하나는 None
+        """
+        # 기본 검증
+        if "agents" not in payload or len(payload.get("agents", [])) < 2:
+            return None, {"success": False, "error": "At least two agents are required"}
+        
+        # 대화 ID 확인
+        conversation_id = payload.get("conversation_id")
+        is_new_conversation = not conversation_id
+        
+        # 에이전트 정보 추출
+        agents = payload.get("agents", [])
+        current_speaker_name = payload.get("current_speaker")
+        location = payload.get("location", "")
+        context = payload.get("context", "")
+        
+        # 화자 정보 추출
+        current_speaker = next((a for a in agents if a["name"] == current_speaker_name), None)
+        other_agent = next((a for a in agents if a["name"] != current_speaker_name), None)
+        
+        if not current_speaker or not other_agent:
+            return None, {"success": False, "error": "Invalid speaker configuration"}
+        
+        # 1. 새 대화 또는 기존 대화 로드
+        if is_new_conversation:
+            conversation = self._initialize_conversation(agents, location, context)
+            conversation_id = conversation["conversation_id"]
+        else:
+            conversation = await self._load_conversation(conversation_id)
+            if not conversation:
+                return None, {"success": False, "error": f"Conversation {conversation_id} not found"}
+        
+        # 2. 대화 턴 수 확인 - 최대 턴 수에 도달했는지 체크
+        current_turns = len(conversation["messages"])
+        force_end = False
+        
+        if current_turns >= self.max_turns - 1:  # 이번 턴이 마지막 턴이 될 경우
+            print(f"🔚 최대 대화 턴 수({self.max_turns})에 도달하여 대화를 종료합니다.")
+            force_end = True
+        
+        # 3. 이전 대화 메모리 로드
+        previous_conversations = await self._get_previous_conversations(
+            current_speaker["name"], 
+            other_agent["name"]
+        )
+        
+        # 4. 프롬프트 생성 - 강제 종료 힌트 포함
+        prompt = self._create_conversation_prompt(
+            conversation=conversation,
+            current_speaker=current_speaker,
+            other_agent=other_agent,
+            previous_conversations=previous_conversations,
+            location=location,
+            context=context,
+            force_end=force_end,
+            current_turns=current_turns,
+            max_turns=self.max_turns
+        )
+        
+        # 5. 시스템 프롬프트 생성
+        system_prompt = self._get_system_prompt(force_end)
+        
+        return {
+            "conversation": conversation,
+            "conversation_id": conversation_id,
+            "agents": agents,
+            "current_speaker": current_speaker,
+            "other_agent": other_agent,
+            "current_turns": current_turns,
+            "force_end": force_end,
+            "prompt": prompt,
+            "system_prompt": system_prompt
+        }, None
+    
+    def _parse_turn_response(self, response, default_next_speaker):
+        """스트리밍으로 완성된 JSON 객체가 있으면 사용하고, 없으면 전체 텍스트를 파싱"""
+        parsed_json = response.get("json")
+        if isinstance(parsed_json, dict) and "message" in parsed_json:
+            return self._validate_response(parsed_json, default_next_speaker)
+        return self._parse_conversation_response(
+            response.get("response", ""),
+            default_next_speaker=default_next_speaker
+        )
+    
+    async def _complete_turn(self, turn, parsed_response):
+        """
+        파싱된 응답으로 대화를 갱신하고 저장 (대화가 끝나면 메모리에 저장)
+        
+        Args:
+            turn: _prepare_turn이 만든 턴 정보
+            parsed_response: 파싱된 모델 응답
             
-            if memory_ids:
-                result["memory_ids"] = memory_ids
+        Returns:
+            dict: 처리 결과
+        """
+        conversation = turn["conversation"]
+        current_speaker = turn["current_speaker"]
+        current_turns = turn["current_turns"]
+        force_end = turn["force_end"]
+        
+        # 8. 강제 종료 적용
+        if force_end:
+            parsed_response["should_continue"] = False
+            if not parsed_response.get("reason_to_end"):
+                parsed_response["reason_to_end"] = f"Conversation naturally concluded after {current_turns + 1} exchanges"
+        
+        # 9. 대화 업데이트
+        new_message = {
+            "speaker": current_speaker["name"],
+            "message": parsed_response["message"],
+            "emotion": parsed_response["emotion"],
+            "time": current_speaker["time"]
+        }
+        
+        conversation["messages"].append(new_message)
+        conversation["last_updated"] = current_speaker["time"]
+        
+        # 10. 대화 저장
+        await self._save_conversation(conversation)
+        
+        # 11. 대화 종료 처리
+        memory_ids = []
+        if not parsed_response["should_continue"]:
+            # 대화 종료 처리
+            conversation["status"] = "completed"
             
-            if not parsed_response["should_continue"]:
-                result["conversation"] = conversation
+            # 종료 이유 (강제 종료 여부에 따라 다름)
+            if force_end and not parsed_response.get("reason_to_end"):
+                conversation["end_reason"] = f"Conversation reached the maximum of {self.max_turns} turns"
+            else:
+                conversation["end_reason"] = parsed_response.get("reason_to_end", "Natural conclusion")
             
-            return result
+            # 대화 메모리에 저장
+            memory_ids = await self._save_conversation_to_memory(
+                conversation, 
+                turn["agents"],
+                parsed_response.get("importance", 3)
+            )
             
-        except Exception as e:
-            print(f"Error processing conversation: {e}")
-            return {"success": False, "error": str(e)}
+            # 대화 저장 (상태 업데이트)
+            await self._save_conversation(conversation)
+        
+        # 12. 응답 구성
+        result = {
+            "success": True,
+            "conversation_id": turn["conversation_id"],
+            "message": new_message,
+            "should_continue": parsed_response["should_continue"],
+            "next_speaker": parsed_response["next_speaker"],
+            "turns": current_turns + 1,
+            "max_turns": self.max_turns
+        }
+        
+        if memory_ids:
+            result["memory_ids"] = memory_ids
+        
+        if not parsed_response["should_continue"]:
+            result["conversation"] = conversation
+        
+        return result
     
     def _initialize_conversation(self, agents, location, context):
         """새 대화 초기화"""
@@ -224,24 +347,32 @@ class AgentConversationManager:
         filepath = self.conversations_dir / f"{conversation['conversation_id']}.json"
         
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(conversation, f, ensure_ascii=False, indent=2)
+            write_json_atomic(filepath, conversation)
             return True
         except Exception as e:
             print(f"Error saving conversation: {e}")
             return False
     
     async def _get_previous_conversations(self, agent1_name, agent2_name, max_count=3):
-        """이전 대화 메모리 조회"""
-        # 메모리에서 두 에이전트 간의 이전 대화 검색
+        """이전 대화 메모리 조회 (메모리 저장소를 읽으므로 에이전트 잠금을 잡고 store 레인에서 실행)"""
+        async with self.memory_utils.agent_lock(agent1_name):
+            return await run_blocking(
+                self.worker_pool, "conversation.previous", self._find_previous_conversations,
+                agent1_name, agent2_name, max_count, lane="store"
+            )
+
+    def _find_previous_conversations(self, agent1_name, agent2_name, max_count):
+        # 메모리에서 두 에이전트 간의 이전 대화 검색 (저장소의 event_type 조회)
         memories = self.memory_utils._load_memories()
         
         if agent1_name not in memories:
             return []
         
+        agent_memories = memories[agent1_name].get("memories", {})
         conversation_memories = []
-        for memory in memories[agent1_name]["memories"]:
-            if memory.get("event_type") == "conversation":
+        for memory_id in self.memory_utils.store.find_memory_ids(agent1_name, "conversation"):
+            memory = agent_memories.get(memory_id)
+            if memory is not None:
                 details = memory.get("details", {})
                 if details.get("with") == agent2_name:
                     conversation_memories.append({
@@ -251,17 +382,25 @@ class AgentConversationManager:
                         "location": details.get("location", "")
                     })
         
-        # 최근 대화 순으로 정렬
-        conversation_memories.sort(key=lambda x: x["time"], reverse=True)
+        # 조회 결과가 최신순이므로 앞에서부터 max_count개
         return conversation_memories[:max_count]
     
     async def _save_conversation_to_memory(self, conversation, agents, importance=5):
         """대화를 메모리에 저장"""
-        memory_ids = []
-        
         # 대화 요약 생성
         summaries = await self._generate_conversation_summaries(conversation, agents)
         
+        # 두 에이전트를 함께 잠그고 store 레인에서 저장
+        async with self.memory_utils.agent_lock(*(agent["name"] for agent in agents)):
+            return await run_blocking(
+                self.worker_pool, "conversation.save_memory", self._store_conversation_memories,
+                conversation, agents, summaries, importance, lane="store"
+            )
+
+    def _store_conversation_memories(self, conversation, agents, summaries, importance):
+        """에이전트별 대화 메모리 저장 후 메모리 ID 목록 반환"""
+        memory_ids = []
+        
         # 각 에이전트에 대해 메모리 저장
         for agent in agents:
             agent_name = agent["name"]
@@ -277,7 +416,6 @@ class AgentConversationManager:
             memory = {
                 "event": event_sentence,
                 "time": agent["time"],
-                "embeddings": embedding,
                 "event_type": "conversation",
                 "importance": summaries.get("importance", importance),
                 "details": {
@@ -289,22 +427,12 @@ class AgentConversationManager:
                 }
             }
             
-            # 메모리에 저장
-            memories = self.memory_utils._load_memories()
-            
-            if agent_name not in memories:
-                memories[agent_name] = {"memories": []}
-            
-            # 메모리 ID 생성
-            memory_id = 1
-            if memories[agent_name]["memories"]:
-                memory_id = max([m.get("event_id", 0) for m in memories[agent_name]["memories"]]) + 1
-            
-            memory["event_id"] = memory_id
-            memories[agent_name]["memories"].append(memory)
-            
-            # 저장
-            self.memory_utils._save_memories(memories)
+            # 메모리 ID 발급과 공유 저장소의 memories/embeddings 구조로 저장 (저널 레코드 하나)
+            memory_id = self.memory_utils.store.add_memory(agent_name, memory, {
+                "event": embedding,
+                "action": [],
+                "feedback": []
+            })
             memory_ids.append(memory_id)
         
         return memory_ids
@@ -345,7 +473,8 @@ Format your response as JSON:
         response = await self.ollama_client.process_prompt(
             prompt=prompt,
             system_prompt=system_prompt,
-            model_name="gemma3"
+            model_name="gemma3",
+            priority="interactive"
         )
         
         # JSON 파싱
@@ -403,18 +532,14 @@ IMPORTANT: This conversation has reached its maximum allowed length. You MUST se
         return base_prompt
     
     def _create_conversation_prompt(self, conversation, current_speaker, other_agent, previous_conversations, location, context, force_end=False, current_turns=0, max_turns=10):
-        """대화 프롬프트 생성"""
-        # 대화 기록 포맷팅
-        conversation_history = self._format_conversation_history(conversation["messages"])
-        
-        # 이전 대화 메모리 포맷팅
-        previous_conversations_text = self._format_previous_conversations(previous_conversations)
-        
+        """대화 프롬프트 생성 (토큰 예산을 넘으면 이전 대화 → 오래된 대화 기록 순으로 줄임)"""
         # 에이전트 상태 정보 포맷팅
         current_state = self._format_agent_state(current_speaker.get("state", {}))
         
+        builder = PromptBuilder("conversation", budget=self.prompt_token_budget)
+        
         # 기본 프롬프트
-        prompt = f"""
+        builder.add("profile", f"""
 You are {current_speaker["name"]} with personality: {current_speaker["personality"]}
 You are talking with {other_agent["name"]} who has personality: {other_agent["personality"]}
 Location: {location}
@@ -423,12 +548,23 @@ Context: {context}
 Your current state:
 {current_state}
 
-Previous interactions with {other_agent["name"]}:
-{previous_conversations_text}
-
-Current conversation:
-{conversation_history}
-"""
+""", required=True)
+        
+        # 이전 대화 메모리 (최근 순)
+        builder.add_items(
+            "previous_conversations", self._format_previous_conversations(previous_conversations),
+            priority=0, header=f"Previous interactions with {other_agent['name']}:\n",
+            omitted_format="- ({count} earlier interactions omitted)", empty_text=f"Previous interactions with {other_agent['name']}:\nNo previous interactions."
+        )
+        
+        # 대화 기록 (넘치면 오래된 메시지부터 제외)
+        builder.add_items(
+            "history", self._format_conversation_history(conversation["messages"]),
+            priority=1, keep="tail", header="\n\nCurrent conversation:\n",
+            omitted_format="({count} earlier messages omitted)", empty_text="\n\nCurrent conversation:\nNo messages yet."
+        )
+        
+        prompt = "\n"
 
         # 대화 턴 수에 관한 정보 추가
         if current_turns > 0:
@@ -460,29 +596,16 @@ Base your decision to continue or end the conversation on:
 End the conversation only if it would logically conclude (e.g., you need to leave, conversation reached a natural end, etc.)
 """
         
-        return prompt
+        builder.add("instructions", prompt, required=True)
+        return builder.build()
     
     def _format_conversation_history(self, messages):
-        """대화 기록 포맷팅"""
-        if not messages:
-            return "No messages yet."
-        
-        formatted = []
-        for msg in messages:
-            formatted.append(f"{msg['speaker']}: {msg['message']} ({msg['emotion']})")
-        
-        return "\n".join(formatted)
+        """대화 기록 포맷팅 (메시지별 줄 목록)"""
+        return [f"{msg['speaker']}: {msg['message']} ({msg['emotion']})" for msg in messages or []]
     
     def _format_previous_conversations(self, previous_conversations):
-        """이전 대화 메모리 포맷팅"""
-        if not previous_conversations:
-            return "No previous interactions."
-        
-        formatted = []
-        for conv in previous_conversations:
-            formatted.append(f"- {conv['summary']} ({conv['time']})")
-        
-        return "\n".join(formatted)
+        """이전 대화 메모리 포맷팅 (대화별 줄 목록)"""
+        return [f"- {conv['summary']} ({conv['time']})" for conv in previous_conversations or []]
     
     def _format_agent_state(self, state):
         """에이전트 상태 포맷팅"""
@@ -0,0 +1,113 @@
+"""
+에이전트별 비동기 잠금 모듈
+
+서로 다른 에이전트(NPC)의 요청은 동시에 처리하고, 같은 에이전트의 메모리 / 반성 / 계획을
+읽고 쓰는 구간만 순서대로 실행되도록 에이전트별 asyncio.Lock을 제공합니다.
+
+- agent(*names): 에이전트 잠금 (대화처럼 두 에이전트를 함께 잠글 때는 이름순으로 잡아 교착을 막음)
+- exclusive(): 모든 에이전트 잠금 (/data/save, /data/load, /data/clear, 임베딩 일괄 갱신 등 전체 데이터 작업)
+  exclusive가 대기 중이면 새 에이전트 잠금은 exclusive가 끝날 때까지 기다립니다.
+
+MemoryUtils, MemoryProcessor, ReflectionGenerator, PlanGenerator는 같은 데이터 디렉토리에 대해
+get_agent_locks()로 하나의 잠금 집합을 공유합니다.
+잠금은 이벤트 루프에서만 잡고, 실제 파일 / 저장소 작업은 잠금을 잡은 채 작업자 풀에서 실행할 수 있습니다.
+"""
+
+import os
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict
+
+
+class AgentLocks:
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._exclusive_lock = asyncio.Lock()
+        self._exclusive = False
+        self._released = asyncio.Event()
+        self._released.set()
+
+    def _lock(self, agent_name: str) -> asyncio.Lock:
+        lock = self._locks.get(agent_name)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[agent_name] = lock
+        return lock
+
+    @asynccontextmanager
+    async def agent(self, *agent_names: str):
+        """에이전트 잠금 (이름이 여러 개면 이름순으로 모두 잠금)"""
+        names = sorted(set(agent_names))
+        while True:
+            await self._released.wait()
+            acquired = []
+            try:
+                for name in names:
+                    lock = self._lock(name)
+                    await lock.acquire()
+                    acquired.append(lock)
+            except BaseException:
+                for lock in reversed(acquired):
+                    lock.release()
+                raise
+            if not self._exclusive:
+                break
+            # 잠금을 기다리는 사이 exclusive가 시작됐으면 양보하고 다시 시도
+            for lock in reversed(acquired):
+                lock.release()
+        try:
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+    @asynccontextmanager
+    async def exclusive(self):
+        """모든 에이전트 잠금 (진행 중인 에이전트 작업이 끝날 때까지 기다림)"""
+        async with self._exclusive_lock:
+            self._exclusive = True
+            self._released.clear()
+            acquired = []
+            try:
+                for name in sorted(self._locks):
+                    lock = self._locks[name]
+                    await lock.acquire()
+                    acquired.append(lock)
+                yield
+            finally:
+                for lock in reversed(acquired):
+                    lock.release()
+                self._exclusive = False
+                self._released.set()
+
+    def stats(self) -> Dict[str, int]:
+        """잠금을 만든 에이전트 수, 현재 잠긴 에이전트 수, exclusive 진행 여부"""
+        return {
+            "agents": len(self._locks),
+            "locked": sum(1 for lock in self._locks.values() if lock.locked()),
+            "exclusive": int(self._exclusive)
+        }
+
+
+_agent_locks: Dict[str, AgentLocks] = {}
+_agent_locks_guard = threading.Lock()
+
+
+def get_agent_locks(data_dir: str) -> AgentLocks:
+    """
+    데이터 디렉토리별 공유 에이전트 잠금 집합
+
+    Args:
+        data_dir: 메모리 / 반성 / 계획 파일이 있는 디렉토리
+
+    Returns:
+        AgentLocks: 같은 디렉토리를 쓰는 모듈끼리 공유하는 잠금 집합
+    """
+    key = os.path.abspath(str(data_dir))
+    with _agent_locks_guard:
+        locks = _agent_locks.get(key)
+        if locks is None:
+            locks = AgentLocks()
+            _agent_locks[key] = locks
+        return locks
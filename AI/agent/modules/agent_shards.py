@@ -0,0 +1,213 @@
+"""
+에이전트별 샤드 파일 모듈
+
+reflections.json, plans.json처럼 {에이전트 이름: 데이터} 형태의 파일을 에이전트마다 한 파일로 나눠 저장합니다.
+    agent/data/reflections.json  →  agent/data/reflections/<에이전트>.json
+한 에이전트를 읽고 쓸 때 다른 에이전트의 파일은 건드리지 않으므로 기록 비용이 그 에이전트의 데이터 크기에만
+비례하고, 에이전트별 잠금(agent_locks)과 함께 서로 다른 에이전트를 동시에 기록할 수 있습니다.
+
+- load_agent / save_agent: 에이전트 한 명만 읽기 / 쓰기
+- load_agents: 지정한 에이전트들만 읽기 (하루 마무리 일괄 처리용)
+- load_all / save_all: 전체를 조립 / 분할 (/data/load, /data/save, /data/clear용)
+- 예전 단일 파일이 남아 있으면 처음 사용할 때 샤드로 나누고, 원본은 <파일>.migrated로 이름을 바꿉니다.
+  (이미 샤드가 있는 에이전트는 샤드가 더 최신이므로 덮어쓰지 않음)
+
+같은 파일을 쓰는 모듈끼리는 get_agent_shards()로 하나의 인스턴스를 공유합니다.
+"""
+
+import os
+import json
+import threading
+from urllib.parse import quote, unquote
+from typing import Dict, Any, Callable, Iterable, List, Optional
+from .atomic_io import write_json_atomic
+
+SHARD_SUFFIX = ".json"
+
+
+def agent_file_stem(agent_name: str) -> str:
+    """에이전트 이름을 확장자 없는 파일 이름으로 변환 (경로 구분자 등은 %XX로 인코딩)"""
+    stem = quote(agent_name, safe=" ")
+    # 숨김 / 임시 파일과 구분되도록 맨 앞의 "."도 인코딩
+    return "%2E" + stem[1:] if stem.startswith(".") else stem
+
+
+def shard_file_name(agent_name: str) -> str:
+    """에이전트 이름을 파일 이름으로 변환 (경로 구분자 등은 %XX로 인코딩)"""
+    return agent_file_stem(agent_name) + SHARD_SUFFIX
+
+
+def shard_agent_name(file_name: str) -> Optional[str]:
+    """샤드 파일 이름에서 에이전트 이름 복원 (샤드 파일이 아니면 None)"""
+    if not file_name.endswith(SHARD_SUFFIX) or file_name.startswith("."):
+        return None
+    return unquote(file_name[:-len(SHARD_SUFFIX)])
+
+
+def read_shards(shard_dir: str, names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    샤드 디렉토리에서 에이전트 데이터 읽기
+
+    Args:
+        shard_dir: 샤드 디렉토리
+        names: 읽을 에이전트 이름 (None이면 전체)
+
+    Returns:
+        {에이전트 이름: 데이터} (파일이 없거나 읽을 수 없는 에이전트는 빠짐)
+    """
+    if names is None:
+        try:
+            file_names = sorted(os.listdir(shard_dir))
+        except FileNotFoundError:
+            return {}
+        names = [name for name in map(shard_agent_name, file_names) if name is not None]
+
+    data = {}
+    for agent_name in names:
+        path = os.path.join(shard_dir, shard_file_name(agent_name))
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data[agent_name] = json.load(f)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            print(f"⚠️ {path} 로드 실패: {e}")
+    return data
+
+
+class AgentShards:
+    def __init__(self, legacy_file: str, default_agent: Callable[[], Any],
+                 default_agents: Iterable[str] = ("Tom", "Jane")):
+        """
+        에이전트별 샤드 저장소 초기화
+
+        Args:
+            legacy_file: 예전 단일 JSON 파일 경로 (샤드 디렉토리는 확장자를 뺀 경로)
+            default_agent: 에이전트 데이터가 없을 때 쓸 기본값을 만드는 함수
+            default_agents: load_all 결과에 항상 포함할 에이전트
+        """
+        self.legacy_file = str(legacy_file)
+        self.shard_dir = os.path.splitext(self.legacy_file)[0]
+        self.default_agent = default_agent
+        self.default_agents = list(default_agents)
+        self._migrate_lock = threading.Lock()
+
+    def path(self, agent_name: str) -> str:
+        """에이전트 샤드 파일 경로"""
+        return os.path.join(self.shard_dir, shard_file_name(agent_name))
+
+    def migrate(self) -> bool:
+        """
+        예전 단일 파일을 에이전트별 샤드로 나눔 (단일 파일이 없으면 아무것도 하지 않음)
+
+        Returns:
+            bool: 옮긴 경우 True
+        """
+        if not os.path.exists(self.legacy_file):
+            return False
+        with self._migrate_lock:
+            if not os.path.exists(self.legacy_file):
+                return False
+            try:
+                with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"⚠️ {self.legacy_file} 샤드 변환 실패: {e}")
+                return False
+            if isinstance(data, dict):
+                for agent_name, agent_data in data.items():
+                    if not os.path.exists(self.path(agent_name)):
+                        write_json_atomic(self.path(agent_name), agent_data)
+            os.replace(self.legacy_file, self.legacy_file + ".migrated")
+            print(f"📦 {os.path.basename(self.legacy_file)}을 에이전트별 파일로 나눴습니다: {self.shard_dir}")
+            return True
+
+    def agents(self) -> List[str]:
+        """샤드 파일이 있는 에이전트 이름 목록"""
+        self.migrate()
+        try:
+            file_names = sorted(os.listdir(self.shard_dir))
+        except FileNotFoundError:
+            return []
+        return [name for name in map(shard_agent_name, file_names) if name is not None]
+
+    def load_agent(self, agent_name: str) -> Any:
+        """에이전트 한 명의 데이터 (없으면 기본값)"""
+        self.migrate()
+        data = read_shards(self.shard_dir, [agent_name])
+        return data[agent_name] if agent_name in data else self.default_agent()
+
+    def load_agents(self, agent_names: Iterable[str]) -> Dict[str, Any]:
+        """지정한 에이전트들의 데이터 (샤드가 없는 에이전트는 빠짐)"""
+        self.migrate()
+        return read_shards(self.shard_dir, agent_names)
+
+    def save_agent(self, agent_name: str, agent_data: Any):
+        """에이전트 한 명의 데이터를 기록 (임시 파일에 쓴 뒤 교체)"""
+        self.migrate()
+        write_json_atomic(self.path(agent_name), agent_data)
+
+    def delete_agent(self, agent_name: str):
+        """에이전트 샤드 파일 삭제"""
+        try:
+            os.remove(self.path(agent_name))
+        except FileNotFoundError:
+            pass
+
+    def load_all(self) -> Dict[str, Any]:
+        """모든 에이전트 데이터를 하나의 딕셔너리로 조립 (예전 단일 파일과 같은 구조)"""
+        self.migrate()
+        data = {agent_name: self.default_agent() for agent_name in self.default_agents}
+        data.update(read_shards(self.shard_dir))
+        return data
+
+    def save_all(self, data: Dict[str, Any]):
+        """전체 데이터를 에이전트별로 나눠 기록하고, data에 없는 에이전트의 샤드는 삭제"""
+        self.migrate()
+        for agent_name, agent_data in data.items():
+            self.save_agent(agent_name, agent_data)
+        for agent_name in self.agents():
+            if agent_name not in data:
+                self.delete_agent(agent_name)
+
+
+_shards: Dict[str, AgentShards] = {}
+_shards_lock = threading.Lock()
+
+
+def _default_reflections() -> Dict[str, Any]:
+    return {"reflections": []}
+
+
+def _default_plans() -> Dict[str, Any]:
+    return {}
+
+
+def get_agent_shards(legacy_file: str, default_agent: Callable[[], Any] = dict) -> AgentShards:
+    """
+    파일 경로별로 하나의 AgentShards를 반환합니다.
+
+    Args:
+        legacy_file: 예전 단일 JSON 파일 경로
+        default_agent: 에이전트 데이터 기본값 함수 (처음 만들 때만 적용)
+
+    Returns:
+        AgentShards: 공유 샤드 저장소
+    """
+    key = os.path.normcase(os.path.abspath(str(legacy_file)))
+    with _shards_lock:
+        shards = _shards.get(key)
+        if shards is None:
+            shards = AgentShards(key, default_agent)
+            _shards[key] = shards
+        return shards
+
+
+def get_reflection_shards(reflection_file: str) -> AgentShards:
+    """반성 데이터 샤드 (reflections.json → reflections/<에이전트>.json)"""
+    return get_agent_shards(reflection_file, _default_reflections)
+
+
+def get_plan_shards(plan_file: str) -> AgentShards:
+    """계획 데이터 샤드 (plans.json → plans/<에이전트>.json)"""
+    return get_agent_shards(plan_file, _default_plans)
@@ -0,0 +1,221 @@
+"""
+근사 최근접 이웃(ANN) 인덱스 모듈
+
+에이전트 메모리 임베딩용 IVF(Inverted File) 인덱스를 NumPy로 구현합니다.
+- 학습: 점수 계산에 쓰이는 벡터(feedback 우선, 없으면 event)를 구면 k-means로 n_lists개 묶음으로 나눔
+- 검색: 질의와 가장 가까운 nprobe개 묶음의 메모리만 후보로 반환
+- 갱신: 메모리 추가/수정/삭제 시 해당 메모리만 가장 가까운 묶음에 다시 배정 (재학습 없음)
+  메모리 수가 학습 시점보다 rebuild_growth배 이상 늘면 다음 검색 때 다시 학습합니다.
+
+target_recall을 지정하면 학습 직후 저장된 벡터를 질의로 삼아
+recall@k가 목표 이상이 되는 가장 작은 nprobe를 고릅니다.
+"""
+
+import math
+from typing import Dict, List, Optional, Set, Iterable
+import numpy as np
+
+from .embedding_matrix import EmbeddingMatrix, EMBEDDING_FIELDS
+
+EVENT_FIELD = EMBEDDING_FIELDS.index("event")
+FEEDBACK_FIELD = EMBEDDING_FIELDS.index("feedback")
+
+
+def scoring_vectors(matrix: EmbeddingMatrix):
+    """
+    점수 계산에 쓰이는 정규화 벡터와 유효 마스크를 반환
+
+    Returns:
+        (vectors, valid): (행 수, 차원) 벡터, (행 수,) 마스크
+        feedback 임베딩이 있으면 feedback, 없으면 event를 사용하며, 0 벡터는 유효하지 않음
+    """
+    unit = matrix.unit_field_vectors(("event", "feedback"))
+    use_feedback = matrix.field_present("feedback")
+    vectors = np.where(use_feedback[:, None], unit[1], unit[0])
+    valid = np.where(use_feedback, matrix.field_nonzero("feedback"),
+                     matrix.field_present("event") & matrix.field_nonzero("event"))
+    return vectors, valid
+
+
+class IVFIndex:
+    def __init__(self, nprobe: int = 8, n_lists: Optional[int] = None, min_size: int = 5000,
+                 target_recall: Optional[float] = None, recall_k: int = 10,
+                 train_sample: int = 20000, n_iter: int = 10, rebuild_growth: float = 2.0, seed: int = 0):
+        """
+        IVF 인덱스 초기화
+
+        Args:
+            nprobe: 검색할 묶음 수 (클수록 recall이 높고 느림)
+            n_lists: 묶음 수 (None이면 sqrt(메모리 수))
+            min_size: 이보다 메모리가 적으면 인덱스를 쓰지 않고 전체 검색
+            target_recall: 지정하면 학습 후 recall@recall_k가 이 값 이상이 되도록 nprobe를 자동 조정
+            recall_k: target_recall 계산에 쓰는 k
+            train_sample: k-means 학습에 사용할 최대 벡터 수
+            n_iter: k-means 반복 횟수
+            rebuild_growth: 학습 시점 대비 이 배수 이상 늘면 재학습
+            seed: 난수 시드
+        """
+        self.nprobe = nprobe
+        self.n_lists = n_lists
+        self.min_size = min_size
+        self.target_recall = target_recall
+        self.recall_k = recall_k
+        self.train_sample = train_sample
+        self.n_iter = n_iter
+        self.rebuild_growth = rebuild_growth
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[Set[str]] = []
+        self.assignments: Dict[str, int] = {}
+        self.trained_size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def needs_rebuild(self, matrix: EmbeddingMatrix) -> bool:
+        """학습되지 않았거나 학습 이후 메모리가 많이 늘었는지 확인"""
+        if self.centroids is None:
+            return True
+        return len(matrix) > self.trained_size * self.rebuild_growth
+
+    # ------------------------------------------------------------------
+    # 학습
+    # ------------------------------------------------------------------
+
+    def _kmeans(self, data: np.ndarray, n_lists: int) -> np.ndarray:
+        """구면 k-means (내적 기준 배정, 중심 정규화)"""
+        rng = np.random.default_rng(self.seed)
+        centroids = data[rng.choice(len(data), n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            counts = np.bincount(labels, minlength=n_lists)
+            # 묶음별 합계: 라벨 순으로 정렬한 뒤 구간 합 (np.add.at보다 빠름)
+            order = np.argsort(labels, kind="stable")
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.zeros_like(centroids)
+            non_empty = counts > 0
+            sums[non_empty] = np.add.reduceat(data[order], starts[non_empty], axis=0)
+            empty = ~non_empty
+            if np.any(empty):
+                # 빈 묶음은 임의의 벡터로 다시 시작
+                sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.divide(sums, norms, out=np.zeros_like(sums), where=norms > 0)
+        return centroids
+
+    def build(self, matrix: EmbeddingMatrix):
+        """행렬 전체로 묶음을 학습하고 모든 메모리를 배정"""
+        vectors, valid = scoring_vectors(matrix)
+        rows = np.nonzero(valid)[0]
+        self.lists = []
+        self.assignments = {}
+        self.trained_size = len(matrix)
+        if len(rows) == 0:
+            self.centroids = np.zeros((0, matrix.dim or 0), dtype=np.float32)
+            return
+
+        data = vectors[rows]
+        n_lists = self.n_lists or int(math.sqrt(len(rows)))
+        n_lists = max(1, min(n_lists, len(rows)))
+        if len(rows) > self.train_sample:
+            rng = np.random.default_rng(self.seed)
+            sample = data[rng.choice(len(rows), self.train_sample, replace=False)]
+        else:
+            sample = data
+        self.centroids = self._kmeans(sample, n_lists).astype(np.float32)
+
+        labels = np.argmax(data @ self.centroids.T, axis=1)
+        self.lists = [set() for _ in range(n_lists)]
+        for row, label in zip(rows.tolist(), labels.tolist()):
+            memory_id = matrix.ids[row]
+            self.lists[label].add(memory_id)
+            self.assignments[memory_id] = label
+
+        if self.target_recall is not None:
+            self.nprobe = self.calibrate(matrix, self.target_recall, self.recall_k)
+
+    # ------------------------------------------------------------------
+    # 증분 갱신
+    # ------------------------------------------------------------------
+
+    def remove(self, memory_id: str):
+        """메모리를 인덱스에서 제거"""
+        label = self.assignments.pop(str(memory_id), None)
+        if label is not None:
+            self.lists[label].discard(str(memory_id))
+
+    def update(self, memory_id: str, matrix: EmbeddingMatrix):
+        """메모리 하나를 현재 행렬 값 기준으로 다시 배정 (추가/수정 공통)"""
+        if self.centroids is None or len(self.centroids) == 0:
+            return
+        memory_id = str(memory_id)
+        self.remove(memory_id)
+        row = matrix.index.get(memory_id)
+        if row is None:
+            return
+        field_idx = FEEDBACK_FIELD if matrix.present[FEEDBACK_FIELD, row] else EVENT_FIELD
+        if not matrix.nonzero[field_idx, row]:
+            return
+        label = int(np.argmax(self.centroids @ matrix.unit_vectors[field_idx, row]))
+        self.lists[label].add(memory_id)
+        self.assignments[memory_id] = label
+
+    # ------------------------------------------------------------------
+    # 검색
+    # ------------------------------------------------------------------
+
+    def search(self, queries: Iterable[np.ndarray], nprobe: Optional[int] = None) -> Set[str]:
+        """
+        질의들과 가까운 묶음의 메모리 ID 합집합 반환
+
+        Args:
+            queries: 정규화된 질의 벡터들 (0 벡터는 무시)
+            nprobe: 검색할 묶음 수 (None이면 self.nprobe)
+        """
+        candidates: Set[str] = set()
+        if self.centroids is None or len(self.centroids) == 0:
+            return candidates
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        for query in queries:
+            if query is None or not np.any(query):
+                continue
+            scores = self.centroids @ np.asarray(query, dtype=np.float32)
+            if nprobe < len(scores):
+                probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+            else:
+                probes = np.arange(len(scores))
+            for label in probes:
+                candidates.update(self.lists[label])
+        return candidates
+
+    def calibrate(self, matrix: EmbeddingMatrix, target_recall: float, k: int = 10, n_queries: int = 50) -> int:
+        """
+        저장된 벡터 일부를 질의로 삼아 recall@k >= target_recall 을 만족하는 가장 작은 nprobe 반환
+        """
+        vectors, valid = scoring_vectors(matrix)
+        rows = np.nonzero(valid)[0]
+        if len(rows) == 0 or self.centroids is None or len(self.centroids) == 0:
+            return self.nprobe
+        rng = np.random.default_rng(self.seed + 1)
+        query_rows = rows[rng.choice(len(rows), min(n_queries, len(rows)), replace=False)]
+        data = vectors[rows]
+        exact_top = []
+        for query_row in query_rows:
+            sims = data @ vectors[query_row]
+            top = np.argpartition(-sims, min(k, len(sims)) - 1)[:k]
+            exact_top.append({matrix.ids[rows[i]] for i in top})
+
+        nprobe = 1
+        while nprobe < len(self.centroids):
+            hits = 0
+            total = 0
+            for query_row, exact in zip(query_rows, exact_top):
+                found = self.search([vectors[query_row]], nprobe)
+                hits += len(exact & found)
+                total += len(exact)
+            if total == 0 or hits / total >= target_recall:
+                break
+            nprobe *= 2
+        return min(nprobe, len(self.centroids))
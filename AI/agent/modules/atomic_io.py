@@ -0,0 +1,57 @@
+"""
+JSON 파일 원자적 기록 모듈
+
+반성 / 계획 파일 등을 같은 디렉토리의 임시 파일에 모두 쓴 뒤 os.replace로 교체합니다.
+기록 도중 프로세스가 죽어도 기존 파일이 그대로 남아, 반쯤 쓰인 JSON 파일이 생기지 않습니다.
+메모리 저장소의 에이전트별 스냅샷은 write_text_atomic으로, 임베딩 행렬은 write_binary_atomic으로 같은 방식으로 기록합니다.
+임시 파일 이름은 호출마다 달라서 여러 스레드가 같은 파일을 기록해도 서로의 임시 파일을 덮지 않습니다.
+"""
+
+import os
+import json
+import tempfile
+from typing import Any, Callable
+
+
+def _replace_atomic(path: str, write: Callable, fsync: bool, binary: bool = False):
+    """write(f)로 같은 디렉토리의 임시 파일을 채운 뒤 path로 교체"""
+    path = str(path)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding='utf-8')) as f:
+            write(f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_json_atomic(path: str, data: Any, indent: int = 2, fsync: bool = False):
+    """
+    JSON 파일을 임시 파일에 쓴 뒤 교체
+
+    Args:
+        path: 기록할 파일 경로
+        data: JSON으로 직렬화할 데이터
+        indent: 들여쓰기 (None이면 한 줄)
+        fsync: 교체 전에 os.fsync 호출 여부 (전원 장애까지 대비할 때 사용)
+    """
+    _replace_atomic(path, lambda f: json.dump(data, f, ensure_ascii=False, indent=indent), fsync)
+
+
+def write_text_atomic(path: str, text: str, fsync: bool = False):
+    """이미 직렬화한 텍스트를 임시 파일에 쓴 뒤 교체 (lock 안에서 직렬화하고 기록은 밖에서 할 때 사용)"""
+    _replace_atomic(path, lambda f: f.write(text), fsync)
+
+
+def write_binary_atomic(path: str, write: Callable, fsync: bool = False):
+    """write(f)로 바이너리 임시 파일을 채운 뒤 교체 (임베딩 행렬 .npz 등)"""
+    _replace_atomic(path, write, fsync, binary=True)
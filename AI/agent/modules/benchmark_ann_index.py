@@ -0,0 +1,111 @@
+"""
+ANN 인덱스 벤치마크
+
+에이전트 메모리 수와 nprobe별로 IVF 인덱스의 recall@k(전체 검색 대비)와 검색 시간을 측정합니다.
+- recall@k: 전체 코사인 검색 상위 k개 중 IVF 후보에 포함된 비율
+- top-3 일치율: score_memories 최종 상위 3개가 전체 검색 결과와 같은 비율
+
+실제 문장 임베딩처럼 주제별로 뭉친 벡터를 생성해 사용합니다.
+
+사용법 (AI 디렉토리에서):
+    python -m agent.modules.benchmark_ann_index
+    python -m agent.modules.benchmark_ann_index --sizes 20000 --nprobe 4 8 16 --k 10
+"""
+
+import time
+import argparse
+from typing import Dict, List, Any, Tuple
+import numpy as np
+
+from .embedding_matrix import EmbeddingMatrix
+from .ann_index import IVFIndex
+from .memory_scoring import score_memories
+
+DIM = 300
+
+
+def make_clustered_dataset(size: int, n_topics: int = 200, noise: float = 1.5, seed: int = 0
+                           ) -> Tuple[Dict[str, Dict[str, Any]], EmbeddingMatrix, np.ndarray]:
+    """주제 중심 주변에 모인 메모리 임베딩 생성"""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, DIM)).astype(np.float32)
+    topics /= np.linalg.norm(topics, axis=1, keepdims=True)
+
+    labels = rng.integers(0, n_topics, size)
+    vectors = topics[labels] + noise * rng.standard_normal((size, DIM)).astype(np.float32) / np.sqrt(DIM)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    memories = {}
+    matrix = EmbeddingMatrix(dim=DIM, capacity=size)
+    for i in range(size):
+        memory_id = str(i + 1)
+        minute = i // 2
+        day, minute_of_day = divmod(minute, 24 * 60)
+        memories[memory_id] = {
+            "event": f"event {i}",
+            "time": f"2025.{1 + day // 28 % 12:02d}.{1 + day % 28:02d}.{minute_of_day // 60:02d}:{minute_of_day % 60:02d}",
+            "importance": int(rng.integers(1, 11))
+        }
+        matrix.set(memory_id, {"event": vectors[i]})
+    return memories, matrix, topics
+
+
+def run_benchmark(sizes: List[int], nprobes: List[int], k: int = 10, n_queries: int = 50):
+    """크기, nprobe별 recall@k와 검색 시간 출력"""
+    rng = np.random.default_rng(7)
+    print(f"{'memories':>9} | {'lists':>5} | {'nprobe':>6} | {'recall@' + str(k):>9} | {'top-3 same':>10} | "
+          f"{'candidates':>10} | {'exact (ms)':>10} | {'ivf (ms)':>8}")
+    print("-" * 92)
+    for size in sizes:
+        memories, matrix, topics = make_clustered_dataset(size)
+        index = IVFIndex()
+        build_start = time.perf_counter()
+        index.build(matrix)
+        build_ms = (time.perf_counter() - build_start) * 1000
+
+        unit = matrix.field_vectors("event")
+        queries = []
+        for _ in range(n_queries):
+            topic = topics[rng.integers(0, len(topics))]
+            query = topic + 1.5 * rng.standard_normal(DIM).astype(np.float32) / np.sqrt(DIM)
+            queries.append(query / np.linalg.norm(query))
+
+        exact_results = []
+        exact_start = time.perf_counter()
+        for query in queries:
+            exact_results.append(score_memories(memories, matrix, query.tolist(), [], top_k=3))
+        exact_ms = (time.perf_counter() - exact_start) * 1000 / n_queries
+        exact_top_k = []
+        for query in queries:
+            sims = unit @ query
+            top = np.argpartition(-sims, k - 1)[:k]
+            exact_top_k.append({matrix.ids[i] for i in top})
+
+        for nprobe in nprobes:
+            hits = 0
+            same_top3 = 0
+            candidate_total = 0
+            ivf_start = time.perf_counter()
+            for query, exact, exact_result in zip(queries, exact_top_k, exact_results):
+                candidates = index.search([query], nprobe)
+                result = score_memories(memories, matrix, query.tolist(), [], top_k=3, candidate_ids=list(candidates))
+                hits += len(exact & candidates)
+                candidate_total += len(candidates)
+                same_top3 += [m["memory_id"] for m, _, _ in result] == [m["memory_id"] for m, _, _ in exact_result]
+            ivf_ms = (time.perf_counter() - ivf_start) * 1000 / n_queries
+            print(f"{size:>9} | {len(index.centroids):>5} | {nprobe:>6} | {hits / (k * n_queries):>9.3f} | "
+                  f"{same_top3 / n_queries:>10.2f} | {candidate_total // n_queries:>10} | {exact_ms:>10.2f} | {ivf_ms:>8.2f}")
+
+        calibrated = index.calibrate(matrix, target_recall=0.95, k=k)
+        print(f"{size:>9} | 학습 {build_ms:.0f} ms, target_recall=0.95 에 필요한 nprobe = {calibrated}")
+        print("-" * 92)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ANN 인덱스 recall/속도 벤치마크")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.nprobe, args.k, args.queries)
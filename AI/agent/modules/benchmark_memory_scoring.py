@@ -0,0 +1,166 @@
+"""
+메모리 점수 계산 벤치마크
+
+기존 _find_similar_memories 반복문과 memory_scoring.score_memories(벡터화)를
+에이전트당 메모리 1천 / 1만 / 10만 개에서 비교하고, 상위 k개 결과가 같은지 확인합니다.
+
+사용법 (AI 디렉토리에서):
+    python -m agent.modules.benchmark_memory_scoring
+    python -m agent.modules.benchmark_memory_scoring --sizes 1000 10000 --repeat 5
+"""
+
+import time
+import argparse
+import random
+from typing import Dict, List, Any, Tuple
+import numpy as np
+
+from .embedding_matrix import EmbeddingMatrix
+from .memory_scoring import score_memories
+
+DIM = 300
+
+
+def make_dataset(size: int, seed: int = 0) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, List[float]]]]:
+    """무작위 메모리와 임베딩 생성 (feedback 임베딩 일부, 빈 임베딩 일부 포함)"""
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    memories = {}
+    embeddings = {}
+    for i in range(size):
+        memory_id = str(i + 1)
+        minute = i // 3  # 같은 시간의 메모리가 섞이도록
+        day, minute_of_day = divmod(minute, 24 * 60)
+        memories[memory_id] = {
+            "event": f"event {i}",
+            "feedback": "feedback" if i % 7 == 0 else "",
+            "time": f"2025.05.{1 + day % 28:02d}.{minute_of_day // 60:02d}:{minute_of_day % 60:02d}",
+            "importance": random.randint(1, 10)
+        }
+        event = rng.standard_normal(DIM).astype(np.float32)
+        event /= np.linalg.norm(event)
+        entry = {"event": event.tolist(), "action": [], "feedback": []}
+        if i % 7 == 0:
+            feedback = rng.standard_normal(DIM).astype(np.float32)
+            entry["feedback"] = (feedback / np.linalg.norm(feedback)).tolist()
+        if i % 50 == 0:
+            entry["event"] = []
+        embeddings[memory_id] = entry
+    return memories, embeddings
+
+
+def legacy_find_similar_memories(
+    memories: Dict[str, Dict[str, Any]],
+    embeddings: Dict[str, Dict[str, List[float]]],
+    event_embedding: List[float],
+    state_embedding: List[float],
+    top_k: int = 3,
+    similarity_threshold: float = 0.1
+) -> List[Tuple[Dict[str, Any], float, bool]]:
+    """기존 ReactionDecider._find_similar_memories의 반복문 (memories는 최신순으로 정렬되어 있어야 함)"""
+    memory_items = []
+    current_event_embedding_np = np.array(event_embedding)
+    current_state_embedding_np = np.array(state_embedding)
+
+    is_current_event_embedding_zero = np.all(current_event_embedding_np == 0)
+    is_current_state_embedding_zero = np.all(current_state_embedding_np == 0)
+
+    for memory_id, memory in memories.items():
+        if memory.get("event") == "" and memory.get("feedback") == "":
+            continue
+        memory_embeddings = embeddings.get(str(memory_id), {})
+        memory_with_id = memory.copy()
+        memory_with_id["memory_id"] = memory_id
+        calculated_event_similarity = 0.01
+        calculated_state_similarity = 0.01
+
+        if memory_embeddings:
+            if memory_embeddings.get("feedback"):
+                mem_embedding_np = np.array(memory_embeddings["feedback"])
+            elif memory_embeddings.get("event"):
+                mem_embedding_np = np.array(memory_embeddings["event"])
+            else:
+                mem_embedding_np = None
+            if mem_embedding_np is not None and not np.all(mem_embedding_np == 0):
+                if not is_current_event_embedding_zero:
+                    norm_current_event = np.linalg.norm(current_event_embedding_np)
+                    norm_mem = np.linalg.norm(mem_embedding_np)
+                    if norm_current_event > 0 and norm_mem > 0:
+                        calculated_event_similarity = np.dot(current_event_embedding_np, mem_embedding_np) / (norm_current_event * norm_mem)
+                if not is_current_state_embedding_zero:
+                    norm_current_state = np.linalg.norm(current_state_embedding_np)
+                    norm_mem = np.linalg.norm(mem_embedding_np)
+                    if norm_current_state > 0 and norm_mem > 0:
+                        calculated_state_similarity = np.dot(current_state_embedding_np, mem_embedding_np) / (norm_current_state * norm_mem)
+
+        avg_similarity = (calculated_event_similarity + calculated_state_similarity) / 2
+        max_similarity_val = max(calculated_event_similarity, calculated_state_similarity)
+
+        if avg_similarity >= similarity_threshold or max_similarity_val >= similarity_threshold:
+            memory_items.append((memory_with_id, float(calculated_event_similarity), float(calculated_state_similarity)))
+        else:
+            memory_items.append((memory_with_id, 0.01, 0.01))
+
+    memory_items.sort(key=lambda x: x[0].get("time", ""), reverse=True)
+
+    memory_alpha, memory_beta, memory_gamma = 0.5, 0.2, 0.3
+    K = 20
+    valued_items = []
+    for i, (item, event_sim, state_sim) in enumerate(memory_items):
+        t = min(i, K) / K
+        time_weight = max(1.0 - t**2, 0.01)
+        imp_norm = float(item.get("importance", 3)) / 10.0
+        sim_max = max(event_sim, state_sim)
+        final_score = memory_alpha * sim_max + memory_beta * imp_norm + memory_gamma * time_weight
+        valued_items.append((item, final_score, False))
+
+    valued_items.sort(key=lambda x: x[1], reverse=True)
+    return valued_items[:top_k]
+
+
+def _time_it(func, repeat: int) -> float:
+    """repeat번 실행한 평균 시간 (ms)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run_benchmark(sizes: List[int], repeat: int = 3, top_k: int = 3):
+    """크기별로 기존 반복문과 벡터화 버전을 비교해 출력"""
+    rng = np.random.default_rng(42)
+    print(f"{'memories':>10} | {'legacy (ms)':>12} | {'vectorized (ms)':>15} | {'speedup':>8} | same top-{top_k}")
+    print("-" * 70)
+    for size in sizes:
+        memories, embeddings = make_dataset(size)
+        matrix = EmbeddingMatrix.from_dict(embeddings)
+        # 기존 코드는 _load_memories(sort_by_time=True)로 최신순 정렬된 메모리를 받음
+        sorted_memories = dict(sorted(memories.items(), key=lambda item: item[1]["time"], reverse=True))
+
+        # 일부 메모리와 비슷한 질의를 만들어 유사도 항이 순위에 영향을 주도록 함
+        anchor = np.array(embeddings[str(size // 2 + 1)]["event"] or embeddings["2"]["event"])
+        event_embedding = (anchor + 0.05 * rng.standard_normal(DIM)).tolist()
+        state_embedding = rng.standard_normal(DIM).tolist()
+
+        legacy_repeat = max(1, repeat if size <= 10000 else 1)
+        legacy_ms = _time_it(lambda: legacy_find_similar_memories(
+            sorted_memories, embeddings, event_embedding, state_embedding, top_k), legacy_repeat)
+        vectorized_ms = _time_it(lambda: score_memories(
+            memories, matrix, event_embedding, state_embedding, top_k), repeat)
+
+        legacy_ids = [item["memory_id"] for item, _, _ in legacy_find_similar_memories(
+            sorted_memories, embeddings, event_embedding, state_embedding, top_k)]
+        vectorized_ids = [item["memory_id"] for item, _, _ in score_memories(
+            memories, matrix, event_embedding, state_embedding, top_k)]
+
+        print(f"{size:>10} | {legacy_ms:>12.1f} | {vectorized_ms:>15.2f} | "
+              f"{legacy_ms / max(vectorized_ms, 1e-9):>7.1f}x | {legacy_ids == vectorized_ids}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="메모리 점수 계산 벤치마크")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.repeat, args.top_k)
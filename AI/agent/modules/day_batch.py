@@ -0,0 +1,145 @@
+"""
+하루 마무리 일괄 처리 모듈
+
+여러 에이전트의 반성 → 계획 생성을 한 번에 처리합니다.
+- 처리할 에이전트의 반성 / 계획 파일만 시작할 때 한 번 읽고, 모든 에이전트 처리가 끝난 뒤 한 번만 씁니다.
+  (에이전트별 처리에서는 같은 딕셔너리를 공유해 반성 결과가 바로 계획 생성에 반영됨)
+- 에이전트별 체인(중요도 평가 → 반성 → 계획)은 LLM 동시 요청 수만큼 동시에 실행합니다.
+  실제 LLM 호출 수는 OllamaClient 스케줄러가 제한하므로, 한 에이전트가 응답을 기다리는 동안
+  다른 에이전트의 요청이 빈 슬롯을 채웁니다.
+- 반성 / 계획은 에이전트별 파일이므로 처리한 에이전트의 파일만 기록하고, 다른 에이전트의 파일은
+  건드리지 않습니다. (처리한 에이전트 잠금을 잡고 임시 파일에 쓴 뒤 교체)
+- 파일 읽기 / 쓰기와 반성 / 계획 단계의 블로킹 작업은 worker_pool(store 레인 등)에서 실행합니다.
+- 에이전트별 단계 소요 시간과 전체 시간을 반환합니다.
+"""
+
+import time
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+from .ollama_client import OllamaClient
+from .reflection.reflection_pipeline import process_reflection_request
+from .plan.plan_pipeline import process_plan_request
+from .agent_locks import get_agent_locks
+from .agent_shards import AgentShards, get_reflection_shards, get_plan_shards
+from .worker_pool import run_blocking
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+REFLECTION_FILE = DATA_DIR / "reflections.json"
+PLAN_FILE = DATA_DIR / "plans.json"
+
+
+def _load_agents(reflection_shards: AgentShards, plan_shards: AgentShards, names: List[str]):
+    """names 에이전트의 반성 / 계획 파일을 읽음"""
+    return reflection_shards.load_agents(names), plan_shards.load_agents(names)
+
+
+def _write_agents(shards: AgentShards, data: Dict[str, Any], names: List[str]):
+    """names 에이전트의 파일만 data의 내용으로 기록"""
+    for name in names:
+        if name in data:
+            shards.save_agent(name, data[name])
+
+
+async def _run_agent(agent: Dict[str, Any], ollama_client: OllamaClient, word2vec_model,
+                     reflection_data: Dict, plan_data: Dict, semaphore: asyncio.Semaphore,
+                     worker_pool=None) -> Dict[str, Any]:
+    """에이전트 한 명의 중요도 평가 → 반성 → 계획 체인 실행"""
+    payload = {"agent": agent}
+    timings: Dict[str, float] = {}
+    async with semaphore:
+        start = time.perf_counter()
+        reflection_success = await process_reflection_request(
+            payload, ollama_client, word2vec_model=word2vec_model,
+            reflection_data=reflection_data, timings=timings, worker_pool=worker_pool
+        )
+        plan_success, unity_plan = await process_plan_request(
+            payload, ollama_client, plan_data=plan_data,
+            reflection_data=reflection_data, timings=timings, worker_pool=worker_pool
+        )
+        timings["total"] = round(time.perf_counter() - start, 3)
+    return {
+        "success": reflection_success and plan_success,
+        "reflection_success": reflection_success,
+        "plan_success": plan_success,
+        "next_day_plan": unity_plan,
+        "timings": timings
+    }
+
+
+async def process_reflect_and_plan_batch(agents: List[Dict[str, Any]], ollama_client: OllamaClient,
+                                         word2vec_model=None, max_concurrent_agents: Optional[int] = None,
+                                         model_name: str = "gemma3", worker_pool=None) -> Dict[str, Any]:
+    """
+    여러 에이전트의 반성 및 계획 생성 일괄 처리
+
+    Args:
+        agents: [{"name": "Tom", "time": "2025.05.07.22:00"}, ...]
+        ollama_client: Ollama API 클라이언트 인스턴스
+        word2vec_model: word2vec 임베딩 모델 (선택적)
+        max_concurrent_agents: 동시에 처리할 에이전트 수 (None이면 model_name의 LLM 동시 요청 수)
+        model_name: 동시 처리 수 기준 모델
+        worker_pool: 파일 입출력(store 레인)과 임베딩을 실행할 WorkerPool (None이면 이벤트 루프에서 실행)
+
+    Returns:
+        {"success", "results": {에이전트 이름: 결과}, "timings": {"load", "write", "total", "sum_agents"}}
+    """
+    total_start = time.perf_counter()
+    if max_concurrent_agents is None:
+        max_concurrent_agents = ollama_client.model_concurrency.get(model_name, ollama_client.max_concurrency)
+    semaphore = asyncio.Semaphore(max(1, max_concurrent_agents))
+
+    # 1. 처리할 에이전트의 반성 / 계획 데이터를 한 번만 로드
+    load_start = time.perf_counter()
+    names = [agent.get("name", "") for agent in agents]
+    reflection_shards = get_reflection_shards(str(REFLECTION_FILE))
+    plan_shards = get_plan_shards(str(PLAN_FILE))
+    reflection_data, plan_data = await run_blocking(
+        worker_pool, "batch.load", _load_agents, reflection_shards, plan_shards, names, lane="store"
+    )
+    load_time = time.perf_counter() - load_start
+
+    # 2. 에이전트별 체인 동시 실행
+    outcomes = await asyncio.gather(
+        *(_run_agent(agent, ollama_client, word2vec_model, reflection_data, plan_data, semaphore, worker_pool)
+          for agent in agents),
+        return_exceptions=True
+    )
+
+    results: Dict[str, Any] = {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"❌ {name} 일괄 처리 실패: {outcome}")
+            results[name] = {"success": False, "error": str(outcome)}
+        else:
+            results[name] = outcome
+
+    # 3. 결과를 한 번만 기록
+    write_start = time.perf_counter()
+    try:
+        async with get_agent_locks(str(DATA_DIR)).agent(*names):
+            await run_blocking(worker_pool, "batch.write_reflections", _write_agents,
+                               reflection_shards, reflection_data, names, lane="store")
+            await run_blocking(worker_pool, "batch.write_plans", _write_agents,
+                               plan_shards, plan_data, names, lane="store")
+    except Exception as e:
+        print(f"❌ 일괄 처리 결과 저장 실패: {e}")
+        return {"success": False, "error": str(e), "results": results}
+    write_time = time.perf_counter() - write_start
+
+    total_time = time.perf_counter() - total_start
+    sum_agents = sum(r.get("timings", {}).get("total", 0.0) for r in results.values())
+    print(f"⏱ 일괄 반성/계획: 에이전트 {len(agents)}명, 전체 {total_time:.2f}초 "
+          f"(에이전트별 합계 {sum_agents:.2f}초, 동시 처리 {max_concurrent_agents})")
+
+    return {
+        "success": bool(results) and all(r.get("success") for r in results.values()),
+        "results": results,
+        "timings": {
+            "load": round(load_time, 3),
+            "write": round(write_time, 3),
+            "total": round(total_time, 3),
+            "sum_agents": round(sum_agents, 3)
+        }
+    }
@@ -0,0 +1,161 @@
+"""
+반응 결정 캐시 모듈
+
+NPC는 짧은 게임 시간 동안 같은 이벤트를 반복해서 인식합니다 (모닥불 근처에 서 있는 동안 매 틱 등).
+에이전트별로 최근 반응 결정을 보관해 같은 상황이면 판단 과정 없이 이전 결정을 그대로 반환합니다.
+
+캐시 키:
+- event_type, event_location
+- 이벤트 임베딩 버킷 (부호 기반 랜덤 투영 SimHash, 거의 같은 문장은 같은 버킷)
+- 욕구 상태 버킷 (hunger, sleepiness, loneliness, stress를 state_bucket_size 단위로 나눈 값)
+
+항목은 게임 시간 기준 ttl_minutes가 지나면 만료됩니다. (게임 시간이 거꾸로 가도 만료)
+무시 결정에는 그때 저장한 관찰 메모리 ID를 함께 보관해, 반복된 관찰을 새 메모리 대신
+기존 메모리의 count / last_seen 갱신으로 합칠 수 있게 합니다.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import numpy as np
+from .game_time import game_minutes
+from .reaction_gate import NEED_KEYS  # 게이트와 같은 욕구 상태 키로 버킷을 나눔
+
+
+class DecisionCache:
+    def __init__(self, ttl_minutes: int = 30, hash_bits: int = 16, state_bucket_size: int = 25,
+                 max_entries_per_agent: int = 256, seed: int = 0):
+        """
+        반응 결정 캐시 초기화
+
+        Args:
+            ttl_minutes: 결정 유효 시간 (게임 시간, 분)
+            hash_bits: 임베딩 버킷 SimHash 비트 수 (클수록 더 비슷해야 같은 버킷)
+            state_bucket_size: 욕구 상태 버킷 크기
+            max_entries_per_agent: 에이전트별 최대 항목 수 (넘으면 오래된 항목부터 제거)
+            seed: SimHash 투영 행렬 난수 시드
+        """
+        self.ttl_minutes = ttl_minutes
+        self.hash_bits = hash_bits
+        self.state_bucket_size = max(1, state_bucket_size)
+        self.max_entries_per_agent = max_entries_per_agent
+        self.seed = seed
+        self.lock = threading.Lock()
+        self._projection: Optional[np.ndarray] = None
+        self._entries: Dict[str, "OrderedDict[Tuple, Dict[str, Any]]"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.merged_perceptions = 0
+
+    def _embedding_bucket(self, embedding) -> Optional[int]:
+        """임베딩의 SimHash 버킷 (0 벡터면 None)"""
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        if vector.size == 0 or not np.any(vector):
+            return None
+        if self._projection is None or self._projection.shape[1] != vector.size:
+            rng = np.random.default_rng(self.seed)
+            self._projection = rng.standard_normal((self.hash_bits, vector.size)).astype(np.float32)
+        bits = (self._projection @ vector) > 0
+        return sum(1 << i for i in np.flatnonzero(bits).tolist())
+
+    def _state_bucket(self, state: Optional[Dict[str, Any]]) -> Tuple[int, ...]:
+        state = state or {}
+        bucket = []
+        for key in NEED_KEYS:
+            try:
+                value = float(state.get(key, 0) or 0)
+            except (TypeError, ValueError):
+                value = 0.0
+            bucket.append(int(value // self.state_bucket_size))
+        return tuple(bucket)
+
+    def make_key(self, event: Dict[str, Any], event_embedding, state: Optional[Dict[str, Any]]) -> Optional[Tuple]:
+        """
+        캐시 키 생성 (임베딩이 0 벡터면 None → 캐시 사용 안 함)
+        """
+        embedding_bucket = self._embedding_bucket(event_embedding)
+        if embedding_bucket is None:
+            return None
+        return (
+            event.get("event_type", ""),
+            event.get("event_location", ""),
+            event.get("event_role", ""),
+            embedding_bucket,
+            self._state_bucket(state)
+        )
+
+    def get(self, agent_name: str, key: Optional[Tuple], event_time: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        유효한 이전 결정 반환 (없거나 만료되었으면 None)
+
+        Returns:
+            {"should_react", "reason", "time", "memory_id", "hits"} 사본
+        """
+        now = game_minutes(event_time)
+        with self.lock:
+            if key is None or now is None:
+                self.misses += 1
+                return None
+            entries = self._entries.get(agent_name)
+            entry = entries.get(key) if entries else None
+            if entry is None:
+                self.misses += 1
+                return None
+            if not 0 <= now - entry["time"] <= self.ttl_minutes:
+                del entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            entry["hits"] += 1
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, agent_name: str, key: Optional[Tuple], event_time: Optional[str], should_react: bool, reason: str = ""):
+        """결정 저장 (키나 게임 시간이 없으면 저장하지 않음)"""
+        now = game_minutes(event_time)
+        if key is None or now is None:
+            return
+        with self.lock:
+            entries = self._entries.setdefault(agent_name, OrderedDict())
+            entries[key] = {
+                "should_react": bool(should_react),
+                "reason": reason,
+                "time": now,
+                "memory_id": None,
+                "hits": 0
+            }
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries_per_agent:
+                entries.popitem(last=False)
+
+    def set_memory_id(self, agent_name: str, key: Optional[Tuple], memory_id: Optional[str], merged: bool = False):
+        """결정에 연결된 관찰 메모리 ID 기록 (merged면 합친 관찰 수 증가)"""
+        with self.lock:
+            if merged:
+                self.merged_perceptions += 1
+            entry = self._entries.get(agent_name, {}).get(key) if key is not None else None
+            if entry is not None:
+                entry["memory_id"] = memory_id
+
+    def invalidate(self, agent_name: Optional[str] = None):
+        """에이전트(None이면 전체)의 캐시 항목 삭제 (데이터 초기화 / 교체 시)"""
+        with self.lock:
+            if agent_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(agent_name, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """캐시 크기와 hit/miss, 합친 관찰 수"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": sum(len(entries) for entries in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "merged_perceptions": self.merged_perceptions
+            }
@@ -0,0 +1,295 @@
+"""
+문장 임베딩 캐시 모듈
+
+MemoryUtils.get_embedding과 같은 방식(특수문자 제거 → 소문자 토큰 → Word2Vec 평균 → 정규화)으로
+문장 임베딩을 계산하고, 정규화된 텍스트를 키로 하는 LRU 캐시에 보관합니다.
+여러 문장은 get_embeddings로 단어 벡터를 한 번에 모아 구간 합으로 평균을 계산합니다.
+NPC 이벤트/상태 문장은 자주 반복되므로 같은 문장은 KeyedVectors 조회 없이 바로 반환됩니다.
+
+- 같은 Word2Vec 모델을 쓰는 모듈은 get_embedding_cache(model)로 같은 캐시를 공유
+- hits / misses 카운터 제공
+- persist_path를 지정하면 종료 시 .npz로 저장하고 다음 시작 때 불러옴
+"""
+
+import os
+import re
+import json
+import hashlib
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+
+def normalize_text(text: str) -> str:
+    """
+    캐시 키용 텍스트 정규화 (특수문자 제거, 소문자, 공백 정리)
+
+    임베딩은 이 결과의 토큰에만 의존하므로 정규화 결과가 같으면 임베딩도 같습니다.
+    """
+    return " ".join(_PUNCTUATION.sub('', text or "").lower().split())
+
+
+def text_hash(text: str) -> int:
+    """
+    정규화된 텍스트의 64비트 해시 (임베딩 변경 감지용, 0은 '알 수 없음'으로 예약)
+    """
+    value = int.from_bytes(hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=8).digest(), "little")
+    return value or 1
+
+
+def _word_indices(model, words: List[str]) -> List[int]:
+    """단어들의 KeyedVectors 행 인덱스 (사전에 없는 단어는 제외)"""
+    key_to_index = model.key_to_index
+    return [key_to_index[w] for w in words if w in key_to_index]
+
+
+def compute_sentence_embeddings(model, normalized_texts: List[str], max_tokens: int = 50000) -> np.ndarray:
+    """
+    정규화된 텍스트들의 문장 임베딩을 한꺼번에 계산
+
+    모든 문장의 단어 인덱스를 모아 KeyedVectors 행렬에서 한 번에 가져오고,
+    np.add.reduceat 구간 합으로 문장별 평균을 구한 뒤 정규화합니다.
+    단어가 하나도 없는 문장은 0 벡터입니다.
+
+    Args:
+        model: KeyedVectors (key_to_index, vectors 사용. 없으면 단어별 조회)
+        normalized_texts: normalize_text를 거친 텍스트 리스트
+        max_tokens: 한 번에 가져올 최대 단어 수 (메모리 사용량 제한)
+
+    Returns:
+        np.ndarray: (문장 수, 차원) float32 행렬
+    """
+    result = np.zeros((len(normalized_texts), model.vector_size), dtype=np.float32)
+    if not hasattr(model, "key_to_index"):
+        # KeyedVectors가 아닌 모델은 단어별로 조회
+        for i, text in enumerate(normalized_texts):
+            tokens = [w for w in text.split() if w in model]
+            if tokens:
+                result[i] = np.mean([model[w] for w in tokens], axis=0)
+    else:
+        start = 0
+        while start < len(normalized_texts):
+            # max_tokens 단위로 나누어 모음
+            rows, indices, lengths = [], [], []
+            end = start
+            while end < len(normalized_texts) and (len(indices) < max_tokens or end == start):
+                word_indices = _word_indices(model, normalized_texts[end].split())
+                if word_indices:
+                    rows.append(end)
+                    indices.extend(word_indices)
+                    lengths.append(len(word_indices))
+                end += 1
+            if rows:
+                gathered = model.vectors[np.asarray(indices)]
+                offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+                sums = np.add.reduceat(gathered, offsets, axis=0)
+                result[rows] = sums / np.asarray(lengths, dtype=np.float32)[:, None]
+            start = end
+
+    # 정규화
+    norms = np.linalg.norm(result, axis=1, keepdims=True)
+    np.divide(result, norms, out=result, where=norms > 0)
+    return result
+
+
+def compute_sentence_embedding(model, normalized_text: str) -> np.ndarray:
+    """정규화된 텍스트의 단어 벡터 평균을 정규화해 반환 (단어가 없으면 0 벡터)"""
+    return compute_sentence_embeddings(model, [normalized_text])[0]
+
+
+class EmbeddingCache:
+    def __init__(self, max_size: int = 50000, persist_path: Optional[str] = None):
+        """
+        임베딩 LRU 캐시 초기화
+
+        Args:
+            max_size: 최대 보관 문장 수 (넘으면 가장 오래 쓰지 않은 문장부터 제거)
+            persist_path: 캐시를 저장할 .npz 파일 경로 (None이면 저장하지 않음)
+        """
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self.lock = threading.Lock()
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._model_signature = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """캐시에서 임베딩을 찾고 hit/miss를 기록 (없으면 None)"""
+        with self.lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key: str, vector: np.ndarray):
+        """임베딩 저장 (용량을 넘으면 가장 오래된 항목 제거)"""
+        with self.lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """캐시와 카운터 초기화"""
+        with self.lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """캐시 크기와 hit/miss 통계"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+    def get_embedding(self, model, text: str) -> List[float]:
+        """
+        텍스트의 문장 임베딩 반환 (캐시에 없으면 계산 후 저장)
+
+        Returns:
+            List[float]: 임베딩 벡터 (호출자가 수정해도 캐시에는 영향 없음)
+        """
+        key = normalize_text(text)
+        vector = self.get(key)
+        if vector is None:
+            vector = compute_sentence_embedding(model, key)
+            self.put(key, vector)
+        return vector.tolist()
+
+    def get_embeddings(self, model, texts: List[str], as_array: bool = False):
+        """
+        여러 텍스트의 문장 임베딩을 한꺼번에 반환
+
+        정규화 후 중복을 제거하고, 캐시에 없는 문장만 compute_sentence_embeddings로 한 번에 계산합니다.
+
+        Args:
+            model: Word2Vec 모델
+            texts: 임베딩할 텍스트 리스트
+            as_array: True면 (텍스트 수, 차원) float32 행렬로 반환 (리스트 변환 비용 없음)
+
+        Returns:
+            texts와 같은 순서의 임베딩 리스트 (as_array면 np.ndarray)
+        """
+        keys = [normalize_text(text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        position = {key: i for i, key in enumerate(unique_keys)}
+        unique_vectors = np.zeros((len(unique_keys), model.vector_size), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(unique_keys):
+            vector = self.get(key)
+            if vector is None:
+                missing.append(i)
+            else:
+                unique_vectors[i] = vector
+        if missing:
+            computed = compute_sentence_embeddings(model, [unique_keys[i] for i in missing])
+            unique_vectors[missing] = computed
+            for i, vector in zip(missing, computed):
+                self.put(unique_keys[i], vector.copy())  # 배치 행렬 전체가 캐시에 남지 않도록 행 단위로 복사
+
+        vectors = unique_vectors[[position[key] for key in keys]] if keys else unique_vectors
+        return vectors if as_array else vectors.tolist()
+
+    # ------------------------------------------------------------------
+    # 저장 / 불러오기
+    # ------------------------------------------------------------------
+
+    def attach_model(self, model):
+        """
+        캐시를 사용할 모델을 지정하고, 저장된 캐시가 같은 모델로 만든 것이면 불러옴
+        """
+        self._model_signature = {"vector_size": int(model.vector_size), "vocab_size": len(model)}
+        self.load()
+
+    def load(self) -> int:
+        """persist_path에서 캐시를 불러오고 불러온 항목 수를 반환"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return 0
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if self._model_signature is not None and meta.get("model") != self._model_signature:
+                    print("⚠️ 저장된 임베딩 캐시가 현재 모델과 달라 무시합니다.")
+                    return 0
+                keys = data["keys"].tolist()
+                vectors = data["vectors"]
+            with self.lock:
+                for key, vector in zip(keys, vectors):
+                    self._entries[key] = vector
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            print(f"✅ 임베딩 캐시 로드 완료: {len(keys)}개")
+            return len(keys)
+        except Exception as e:
+            print(f"❌ 임베딩 캐시 로드 실패: {e}")
+            return 0
+
+    def save(self) -> bool:
+        """persist_path에 캐시 저장 (임시 파일에 쓴 뒤 교체)"""
+        if not self.persist_path:
+            return False
+        with self.lock:
+            keys = list(self._entries.keys())
+            vectors = list(self._entries.values())
+        if not keys:
+            return False
+        try:
+            os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+            tmp_path = self.persist_path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                keys=np.array(keys),
+                vectors=np.stack(vectors),
+                meta=np.array(json.dumps({"model": self._model_signature}))
+            )
+            os.replace(tmp_path, self.persist_path)
+            return True
+        except Exception as e:
+            print(f"❌ 임베딩 캐시 저장 실패: {e}")
+            return False
+
+
+# 모델별 공유 캐시
+_caches: Dict[int, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model, max_size: int = 50000, persist_path: Optional[str] = None) -> EmbeddingCache:
+    """
+    모델별 공유 임베딩 캐시 반환 (처음 요청할 때 생성)
+
+    이미 만들어진 캐시가 있으면 설정 인자는 무시하고 그 캐시를 반환합니다.
+    """
+    with _caches_lock:
+        cache = _caches.get(id(model))
+        if cache is None:
+            cache = EmbeddingCache(max_size=max_size, persist_path=persist_path)
+            cache.attach_model(model)
+            _caches[id(model)] = cache
+        return cache
+
+
+def _save_all_caches():
+    """프로세스 종료 시 저장 경로가 있는 캐시를 저장"""
+    for cache in list(_caches.values()):
+        cache.save()
+
+
+atexit.register(_save_all_caches)
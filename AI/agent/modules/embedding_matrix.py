@@ -0,0 +1,337 @@
+"""
+임베딩 행렬 모듈
+
+에이전트 한 명의 메모리 임베딩(event / action / feedback)을 연속된 float32 행렬로 보관합니다.
+메모리 ID → 행 번호 인덱스를 함께 유지하며, ID 목록과 행렬을 .npz 파일 하나에 저장합니다.
+유사도 검색 시 행렬-벡터 곱 한 번으로 모든 메모리를 계산할 수 있도록,
+원본 벡터와 함께 L2 정규화된 벡터(unit_vectors)도 유지합니다.
+필드별로 임베딩을 만든 텍스트의 해시(text_hashes)를 함께 저장해, 텍스트가 바뀐 필드만 다시 임베딩할 수 있습니다.
+"""
+
+import json
+from typing import Dict, List, Any, Optional, Iterable
+import numpy as np
+from .atomic_io import write_binary_atomic
+
+# 메모리마다 저장하는 임베딩 필드 (행렬의 첫 번째 축 순서)
+EMBEDDING_FIELDS = ("event", "action", "feedback")
+
+
+class EmbeddingMatrix:
+    def __init__(self, dim: Optional[int] = None, capacity: int = 64):
+        """
+        임베딩 행렬 초기화
+
+        Args:
+            dim: 임베딩 차원 (None이면 처음 저장되는 벡터의 길이로 결정)
+            capacity: 처음 할당할 행 수
+        """
+        self.dim = dim
+        self.capacity = max(capacity, 1)
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        # vectors[f, row] = 필드 f의 임베딩, present[f, row] = 해당 필드 임베딩 존재 여부
+        # unit_vectors[f, row] = 정규화된 임베딩 (0 벡터는 0으로 유지)
+        self.vectors: Optional[np.ndarray] = None
+        self.unit_vectors: Optional[np.ndarray] = None
+        self.present = np.zeros((len(EMBEDDING_FIELDS), self.capacity), dtype=bool)
+        # nonzero[f, row] = 존재하면서 0 벡터가 아닌 임베딩 여부
+        self.nonzero = np.zeros((len(EMBEDDING_FIELDS), self.capacity), dtype=bool)
+        # text_hashes[f, row] = 임베딩을 만든 텍스트의 해시 (0이면 알 수 없음)
+        self.text_hashes = np.zeros((len(EMBEDDING_FIELDS), self.capacity), dtype=np.uint64)
+        if dim is not None:
+            self._allocate(dim)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, memory_id) -> bool:
+        return str(memory_id) in self.index
+
+    # ------------------------------------------------------------------
+    # 내부 유틸
+    # ------------------------------------------------------------------
+
+    def _allocate(self, dim: int):
+        """현재 용량으로 원본/정규화 행렬 할당"""
+        self.dim = dim
+        self.vectors = np.zeros((len(EMBEDDING_FIELDS), self.capacity, dim), dtype=np.float32)
+        self.unit_vectors = np.zeros_like(self.vectors)
+
+    def _ensure_dim(self, dim: int):
+        """첫 벡터가 들어올 때 차원을 확정하고 행렬을 할당"""
+        if self.vectors is None:
+            self._allocate(dim)
+        elif dim != self.dim:
+            raise ValueError(f"임베딩 차원이 일치하지 않습니다: {dim} != {self.dim}")
+
+    def _grow(self, needed: int):
+        """행 수가 부족하면 두 배씩 늘림"""
+        if needed <= self.capacity:
+            return
+        new_capacity = self.capacity
+        while new_capacity < needed:
+            new_capacity *= 2
+        present = np.zeros((len(EMBEDDING_FIELDS), new_capacity), dtype=bool)
+        present[:, :self.capacity] = self.present
+        self.present = present
+        nonzero = np.zeros((len(EMBEDDING_FIELDS), new_capacity), dtype=bool)
+        nonzero[:, :self.capacity] = self.nonzero
+        self.nonzero = nonzero
+        text_hashes = np.zeros((len(EMBEDDING_FIELDS), new_capacity), dtype=np.uint64)
+        text_hashes[:, :self.capacity] = self.text_hashes
+        self.text_hashes = text_hashes
+        if self.vectors is not None:
+            vectors = np.zeros((len(EMBEDDING_FIELDS), new_capacity, self.dim), dtype=np.float32)
+            vectors[:, :self.capacity] = self.vectors
+            self.vectors = vectors
+            unit_vectors = np.zeros_like(vectors)
+            unit_vectors[:, :self.capacity] = self.unit_vectors
+            self.unit_vectors = unit_vectors
+        self.capacity = new_capacity
+
+    def _row(self, memory_id: str) -> int:
+        """메모리 ID의 행 번호를 반환 (없으면 새 행 추가)"""
+        row = self.index.get(memory_id)
+        if row is None:
+            row = len(self.ids)
+            self._grow(row + 1)
+            self.ids.append(memory_id)
+            self.index[memory_id] = row
+            self.present[:, row] = False
+            self.nonzero[:, row] = False
+            self.text_hashes[:, row] = 0
+            if self.vectors is not None:
+                self.vectors[:, row] = 0.0
+                self.unit_vectors[:, row] = 0.0
+        return row
+
+    # ------------------------------------------------------------------
+    # 읽기 / 쓰기
+    # ------------------------------------------------------------------
+
+    def set(self, memory_id, embeddings: Dict[str, Any], replace: bool = True,
+            text_hashes: Optional[Dict[str, int]] = None):
+        """
+        메모리의 임베딩 저장
+
+        Args:
+            memory_id: 메모리 ID
+            embeddings: {"event": [...], "action": [...], "feedback": [...]} (빈 리스트는 임베딩 없음)
+            replace: True면 주어지지 않은 필드는 비움, False면 주어진 필드만 갱신
+            text_hashes: 필드별 원본 텍스트 해시 (주어지지 않은 필드는 0 = 알 수 없음)
+        """
+        memory_id = str(memory_id)
+        row = self._row(memory_id)
+        text_hashes = text_hashes or {}
+        if replace:
+            self.present[:, row] = False
+            self.nonzero[:, row] = False
+            self.text_hashes[:, row] = 0
+            if self.vectors is not None:
+                self.vectors[:, row] = 0.0
+                self.unit_vectors[:, row] = 0.0
+
+        for field_idx, field in enumerate(EMBEDDING_FIELDS):
+            if field not in embeddings:
+                continue
+            vector = embeddings[field]
+            self.text_hashes[field_idx, row] = text_hashes.get(field, 0)
+            if vector is None or len(vector) == 0:
+                self.present[field_idx, row] = False
+                self.nonzero[field_idx, row] = False
+                if self.vectors is not None:
+                    self.vectors[field_idx, row] = 0.0
+                    self.unit_vectors[field_idx, row] = 0.0
+                continue
+            vector = np.asarray(vector, dtype=np.float32)
+            self._ensure_dim(vector.shape[0])
+            self.vectors[field_idx, row] = vector
+            norm = np.linalg.norm(vector)
+            self.unit_vectors[field_idx, row] = vector / norm if norm > 0 else 0.0
+            self.present[field_idx, row] = True
+            self.nonzero[field_idx, row] = norm > 0
+
+    def get(self, memory_id) -> Optional[Dict[str, List[float]]]:
+        """
+        메모리의 임베딩을 기존 JSON 구조와 같은 딕셔너리로 반환
+
+        Returns:
+            {"event": [...], "action": [...], "feedback": [...]} 또는 None (임베딩 없음)
+        """
+        row = self.index.get(str(memory_id))
+        if row is None:
+            return None
+        result = {}
+        for field_idx, field in enumerate(EMBEDDING_FIELDS):
+            if self.present[field_idx, row]:
+                result[field] = self.vectors[field_idx, row].tolist()
+            else:
+                result[field] = []
+        return result
+
+    def delete(self, memory_id):
+        """메모리의 임베딩 삭제 (마지막 행을 빈 자리로 옮겨 행렬을 연속 상태로 유지)"""
+        memory_id = str(memory_id)
+        row = self.index.pop(memory_id, None)
+        if row is None:
+            return
+        last = len(self.ids) - 1
+        if row != last:
+            last_id = self.ids[last]
+            self.ids[row] = last_id
+            self.index[last_id] = row
+            self.present[:, row] = self.present[:, last]
+            self.nonzero[:, row] = self.nonzero[:, last]
+            self.text_hashes[:, row] = self.text_hashes[:, last]
+            if self.vectors is not None:
+                self.vectors[:, row] = self.vectors[:, last]
+                self.unit_vectors[:, row] = self.unit_vectors[:, last]
+        self.ids.pop()
+        self.present[:, last] = False
+        self.nonzero[:, last] = False
+        self.text_hashes[:, last] = 0
+        if self.vectors is not None:
+            self.vectors[:, last] = 0.0
+            self.unit_vectors[:, last] = 0.0
+
+    def retain(self, memory_ids: Iterable[str]):
+        """주어진 메모리 ID에 해당하지 않는 행을 모두 삭제"""
+        keep = {str(memory_id) for memory_id in memory_ids}
+        for memory_id in [memory_id for memory_id in self.ids if memory_id not in keep]:
+            self.delete(memory_id)
+
+    def field_vectors(self, field: str) -> np.ndarray:
+        """필드 하나의 (행 수, 차원) 행렬 뷰를 반환 (복사 없음)"""
+        if self.vectors is None:
+            return np.zeros((len(self.ids), 0), dtype=np.float32)
+        return self.vectors[EMBEDDING_FIELDS.index(field), :len(self.ids)]
+
+    def unit_field_vectors(self, fields=EMBEDDING_FIELDS) -> np.ndarray:
+        """
+        정규화된 임베딩의 (필드 수, 행 수, 차원) 뷰를 반환 (복사 없음)
+
+        Args:
+            fields: 가져올 필드 이름들 (EMBEDDING_FIELDS 순서의 부분집합)
+        """
+        field_indices = [EMBEDDING_FIELDS.index(field) for field in fields]
+        if self.unit_vectors is None:
+            return np.zeros((len(field_indices), len(self.ids), 0), dtype=np.float32)
+        start, stop = field_indices[0], field_indices[-1] + 1
+        step = field_indices[1] - field_indices[0] if len(field_indices) > 1 else 1
+        if field_indices == list(range(start, stop, step)):
+            return self.unit_vectors[start:stop:step, :len(self.ids)]
+        return self.unit_vectors[field_indices, :len(self.ids)]
+
+    def field_present(self, field: str) -> np.ndarray:
+        """필드 하나의 (행 수,) 존재 여부 마스크 뷰를 반환"""
+        return self.present[EMBEDDING_FIELDS.index(field), :len(self.ids)]
+
+    def field_nonzero(self, field: str) -> np.ndarray:
+        """필드 하나의 (행 수,) 0이 아닌 임베딩 마스크 뷰를 반환"""
+        return self.nonzero[EMBEDDING_FIELDS.index(field), :len(self.ids)]
+
+    def has_field(self, memory_id, field: str) -> bool:
+        """메모리에 해당 필드 임베딩이 저장되어 있는지 확인"""
+        row = self.index.get(str(memory_id))
+        return row is not None and bool(self.present[EMBEDDING_FIELDS.index(field), row])
+
+    def text_hash(self, memory_id, field: str) -> int:
+        """필드 임베딩을 만든 텍스트의 해시 (임베딩이 없거나 알 수 없으면 0)"""
+        row = self.index.get(str(memory_id))
+        if row is None:
+            return 0
+        return int(self.text_hashes[EMBEDDING_FIELDS.index(field), row])
+
+    # ------------------------------------------------------------------
+    # 변환 / 저장
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_dict(cls, embeddings: Dict[str, Dict[str, Any]]) -> "EmbeddingMatrix":
+        """기존 JSON 구조({메모리 ID: {"event": [...], ...}})에서 행렬 생성"""
+        matrix = cls(capacity=max(len(embeddings), 1))
+        for memory_id, memory_embeddings in embeddings.items():
+            if isinstance(memory_embeddings, dict):
+                matrix.set(memory_id, memory_embeddings)
+        return matrix
+
+    def to_dict(self) -> Dict[str, Dict[str, List[float]]]:
+        """기존 JSON 구조로 변환 (내보내기용)"""
+        return {memory_id: self.get(memory_id) for memory_id in self.ids}
+
+    def copy(self) -> "EmbeddingMatrix":
+        """사용 중인 행만 복사한 새 행렬 반환 (스냅샷 기록용)"""
+        size = len(self.ids)
+        matrix = EmbeddingMatrix(dim=self.dim, capacity=max(size, 1))
+        matrix.ids = list(self.ids)
+        matrix.index = dict(self.index)
+        matrix.present[:, :size] = self.present[:, :size]
+        matrix.nonzero[:, :size] = self.nonzero[:, :size]
+        matrix.text_hashes[:, :size] = self.text_hashes[:, :size]
+        if self.vectors is not None:
+            matrix.vectors[:, :size] = self.vectors[:, :size]
+            matrix.unit_vectors[:, :size] = self.unit_vectors[:, :size]
+        return matrix
+
+    def save(self, path: str, fsync: bool = False):
+        """
+        행렬, ID 목록, 필드 존재 여부, 텍스트 해시를 .npz 파일 하나에 저장 (임시 파일에 쓴 뒤 교체)
+
+        ID와 벡터가 한 파일에 있으므로 기록 도중 종료되어도 새 행렬이 예전 ID 목록과 짝지어지지 않습니다.
+
+        Args:
+            path: 행렬 파일 경로 (.npz)
+            fsync: 교체 전에 os.fsync 호출 여부
+        """
+        size = len(self.ids)
+        if self.vectors is None:
+            vectors = np.zeros((len(EMBEDDING_FIELDS), size, 0), dtype=np.float32)
+        else:
+            vectors = self.vectors[:, :size]
+        arrays = {
+            "ids": np.asarray(self.ids, dtype=np.str_),
+            "vectors": np.ascontiguousarray(vectors),
+            "present": self.present[:, :size],
+            "text_hashes": self.text_hashes[:, :size],
+            "meta": np.asarray(json.dumps({"dim": self.dim, "fields": list(EMBEDDING_FIELDS)}))
+        }
+        write_binary_atomic(path, lambda f: np.savez(f, **arrays), fsync=fsync)
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingMatrix":
+        """save()로 저장한 .npz 파일에서 행렬 로드"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            ids = [str(memory_id) for memory_id in data["ids"].tolist()]
+            return cls._from_arrays(ids, data["vectors"], meta.get("dim"), data["present"], data["text_hashes"])
+
+    @classmethod
+    def load_legacy(cls, npy_path: str, index_path: str) -> "EmbeddingMatrix":
+        """예전 형식(.npy 행렬 + 인덱스 JSON 두 파일)에서 행렬 로드"""
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index_data = json.load(f)
+        ids = [str(memory_id) for memory_id in index_data.get("ids", [])]
+        return cls._from_arrays(ids, np.load(npy_path), index_data.get("dim"),
+                                index_data.get("present"), index_data.get("text_hashes"))
+
+    @classmethod
+    def _from_arrays(cls, ids: List[str], vectors: np.ndarray, dim: Optional[int],
+                     present, text_hashes) -> "EmbeddingMatrix":
+        size = len(ids)
+        if vectors.shape[1] != size:
+            raise ValueError(f"임베딩 행렬과 인덱스의 크기가 다릅니다: {vectors.shape[1]} != {size}")
+
+        matrix = cls(dim=dim, capacity=max(size, 1))
+        matrix.ids = ids
+        matrix.index = {memory_id: row for row, memory_id in enumerate(ids)}
+        if size:
+            matrix.present[:, :size] = np.asarray(present, dtype=bool)
+            if text_hashes is not None:
+                matrix.text_hashes[:, :size] = np.asarray(text_hashes, dtype=np.uint64)
+            if dim:
+                matrix.vectors[:, :size] = vectors
+                norms = np.linalg.norm(vectors, axis=2, keepdims=True)
+                np.divide(vectors, norms, out=matrix.unit_vectors[:, :size], where=norms > 0)
+                matrix.nonzero[:, :size] = matrix.present[:, :size] & (norms[:, :, 0] > 0)
+        return matrix
@@ -2,26 +2,34 @@
 임베딩 업데이트 모듈
 
 메모리와 반성 데이터의 임베딩을 업데이트하는 기능을 제공합니다.
+필드별 텍스트 해시로 바뀐 항목만 다시 임베딩합니다.
 """
 
 import json
 import os
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from pathlib import Path
 from datetime import datetime
 import numpy as np
 from .memory_utils import MemoryUtils
+from .embedding_cache import text_hash
+from .object_index import ObjectEmbeddingIndex
+from .atomic_io import write_json_atomic
 
 class EmbeddingUpdater:
-    def __init__(self, word2vec_model):
+    def __init__(self, word2vec_model, memory_utils: Optional[MemoryUtils] = None,
+                 object_index: Optional[ObjectEmbeddingIndex] = None):
         """
         임베딩 업데이트 초기화
         
         Args:
             word2vec_model: Word2Vec 모델
+            memory_utils: 공유할 MemoryUtils 인스턴스 (없으면 새로 생성, 저장소는 동일하게 공유됨)
+            object_index: 오브젝트 임베딩 생성 후 다시 만들 오브젝트 인덱스
         """
-        self.memory_utils = MemoryUtils(word2vec_model)
+        self.memory_utils = memory_utils if memory_utils is not None else MemoryUtils(word2vec_model)
         self.word2vec_model = word2vec_model
+        self.object_index = object_index
         
         # 현재 파일의 절대 경로를 기준으로 상위 디렉토리 찾기
         current_dir = Path(__file__).parent
@@ -73,20 +81,32 @@ class EmbeddingUpdater:
         
         # 임베딩 데이터 저장
         os.makedirs(os.path.dirname(self.object_embeddings_path), exist_ok=True)
-        with open(self.object_embeddings_path, "w", encoding="utf-8") as f:
-            json.dump(embeddings, f, ensure_ascii=False, indent=2)
+        write_json_atomic(self.object_embeddings_path, embeddings)
         print("✅ 오브젝트 임베딩 데이터 저장 완료!")
+
+        if self.object_index is not None:
+            self.object_index.build(embeddings)
+            print(f"✅ 오브젝트 임베딩 인덱스 재구성 완료 ({len(self.object_index)}개)")
         
         return embeddings
         
-    def update_embeddings(self) -> Dict[str, int]:
+    def update_embeddings(self) -> Dict[str, Any]:
         """
-        모든 메모리와 반성의 임베딩을 업데이트
+        새로 생기거나 내용이 바뀐 메모리/반성의 임베딩만 업데이트
+        
+        필드별 텍스트 해시를 임베딩과 함께 저장해 두고, 해시가 같으면 다시 계산하지 않습니다.
         
         Returns:
-            Dict[str, int]: 업데이트된 항목 수 {"memories": n, "reflections": m, "objects": o}
+            Dict[str, Any]: 항목별 처리 수
+                {"memories": {"recomputed": n, "skipped": n, "removed": n},
+                 "reflections": {"recomputed": n, "skipped": n, "removed": n},
+                 "objects": o}
         """
-        update_counts = {"memories": 0, "reflections": 0, "objects": 0}
+        update_counts = {
+            "memories": {"recomputed": 0, "skipped": 0, "removed": 0},
+            "reflections": {"recomputed": 0, "skipped": 0, "removed": 0},
+            "objects": 0
+        }
         
         # 오브젝트 임베딩 확인 및 생성
         if not os.path.exists(self.object_embeddings_path):
@@ -94,56 +114,101 @@ class EmbeddingUpdater:
             self.create_object_embeddings()
             update_counts["objects"] = 1
         
-        # 메모리 업데이트
-        memories = self.memory_utils._load_memories()
-        for agent_name in memories:
-            for memory_id, memory in memories[agent_name]["memories"].items():
-                # 임베딩 데이터 초기화
-                if "embeddings" not in memories[agent_name]:
-                    memories[agent_name]["embeddings"] = {}
-                
-                embeddings = {
-                    "event": [],
-                    "action": [],
-                    "feedback": []
-                }
-                
-                # event 임베딩
-                event = memory.get("event", "")
-                if event:
-                    embeddings["event"] = self.memory_utils.get_embedding(event)
-                
-                # action 임베딩
-                action = memory.get("action", "")
-                if action:
-                    embeddings["action"] = self.memory_utils.get_embedding(action)
-                
-                # feedback 임베딩
-                feedback = memory.get("feedback", "")
-                if feedback:
-                    embeddings["feedback"] = self.memory_utils.get_embedding(feedback)
-                
-                # 임베딩 저장
-                memories[agent_name]["embeddings"][memory_id] = embeddings
-                update_counts["memories"] += 1
-        
-        self.memory_utils._save_memories(memories)
+        self._update_memory_embeddings(update_counts["memories"])
+        self._update_reflection_embeddings(update_counts["reflections"])
         
-        # 반성 업데이트
+        return update_counts
+
+    def _update_memory_embeddings(self, counts: Dict[str, int]):
+        """텍스트 해시가 바뀐 event/action/feedback만 모아 한 번에 임베딩하고 행렬에 반영"""
+        store = self.memory_utils.store
+        memories = self.memory_utils._load_memories()
+        fields = ("event", "action", "feedback")
+        targets = []  # (에이전트, 메모리 ID, 필드, 해시)
+        texts = []
+        cleared: Dict[str, Dict[str, Dict[str, List[float]]]] = {}
+        removed: Dict[str, List[str]] = {}
+        for agent_name, agent_data in memories.items():
+            agent_memories = agent_data.get("memories", {})
+            matrix = store.get_embedding_matrix(agent_name)
+            for memory_id, memory in agent_memories.items():
+                for field in fields:
+                    text = memory.get(field, "")
+                    if not text:
+                        # 텍스트가 비었는데 임베딩이 남아 있으면 삭제
+                        if matrix.has_field(memory_id, field):
+                            cleared.setdefault(agent_name, {}).setdefault(memory_id, {})[field] = []
+                            counts["removed"] += 1
+                        continue
+                    hash_value = text_hash(text)
+                    if matrix.text_hash(memory_id, field) == hash_value:
+                        counts["skipped"] += 1
+                        continue
+                    targets.append((agent_name, memory_id, field, hash_value))
+                    texts.append(text)
+
+            # 메모리가 사라진 임베딩 행 삭제
+            stale = [memory_id for memory_id in matrix.ids if memory_id not in agent_memories]
+            if stale:
+                removed[agent_name] = stale
+                counts["removed"] += len(stale)
+
+        # 바뀐 텍스트만 한 번에 임베딩 (행렬로 받아 리스트 변환 없이 저장)
+        embeddings: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        hashes: Dict[str, Dict[str, Dict[str, int]]] = {}
+        vectors = self.memory_utils.get_embeddings(texts, as_array=True)
+        for (agent_name, memory_id, field, hash_value), vector in zip(targets, vectors):
+            embeddings.setdefault(agent_name, {}).setdefault(memory_id, {})[field] = vector
+            hashes.setdefault(agent_name, {}).setdefault(memory_id, {})[field] = hash_value
+        counts["recomputed"] = len(targets)
+
+        for agent_name, agent_cleared in cleared.items():
+            for memory_id, fields_cleared in agent_cleared.items():
+                embeddings.setdefault(agent_name, {}).setdefault(memory_id, {}).update(fields_cleared)
+
+        changed_agents = set(embeddings) | set(removed)
+        for agent_name in changed_agents:
+            store.apply_embedding_updates(agent_name, embeddings.get(agent_name, {}),
+                                          hashes.get(agent_name, {}), removed.get(agent_name, []))
+        if changed_agents:
+            store.compact()
+
+    def _update_reflection_embeddings(self, counts: Dict[str, int]):
+        """thought 해시(embedding_hash)가 바뀐 반성만 다시 임베딩"""
         reflections = self.memory_utils._load_reflections()
+        targets = []
+        changed_agents = set()
         for agent_name in reflections:
             for reflection in reflections[agent_name]["reflections"]:
                 event = reflection.get("thought", "")
-                if event:
-                    # 시간 필드가 없는 경우 현재 시간 추가
-                    current_time = datetime.now().strftime("%Y.%m.%d.%H:%M")
-                    if "time" not in reflection:
-                        reflection["time"] = current_time
-                    if "created" not in reflection:
-                        reflection["created"] = current_time
-                    reflection["embedding"] = self.memory_utils.get_embedding(event)
-                    update_counts["reflections"] += 1
-        
-        self.memory_utils._save_reflections(reflections)
-        
-        return update_counts 
\ No newline at end of file
+                if not event:
+                    if "embedding" in reflection or "embedding_hash" in reflection:
+                        reflection.pop("embedding", None)
+                        reflection.pop("embedding_hash", None)
+                        counts["removed"] += 1
+                        changed_agents.add(agent_name)
+                    continue
+                # 시간 필드가 없는 경우 현재 시간 추가
+                current_time = datetime.now().strftime("%Y.%m.%d.%H:%M")
+                if "time" not in reflection:
+                    reflection["time"] = current_time
+                    changed_agents.add(agent_name)
+                if "created" not in reflection:
+                    reflection["created"] = current_time
+                    changed_agents.add(agent_name)
+                hash_value = text_hash(event)
+                if reflection.get("embedding") and reflection.get("embedding_hash") == hash_value:
+                    counts["skipped"] += 1
+                    continue
+                reflection["embedding_hash"] = hash_value
+                targets.append(reflection)
+                changed_agents.add(agent_name)
+
+        embeddings = self.memory_utils.get_embeddings([reflection["thought"] for reflection in targets])
+        for reflection, embedding in zip(targets, embeddings):
+            reflection["embedding"] = embedding
+        counts["recomputed"] = len(targets)
+        
+        # 반성이 바뀐 에이전트의 파일만 다시 기록
+        for agent_name in changed_agents:
+            self.memory_utils._save_agent_reflections(agent_name, reflections[agent_name]) 
\ No newline at end of file
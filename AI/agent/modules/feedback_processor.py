@@ -291,7 +291,8 @@ Please create a concise, first-person perspective description of my experience t
             response = await self.ollama_client.process_prompt(
                 prompt=formatted_prompt,
                 system_prompt=system_prompt,
-                model_name="gemma3"
+                model_name="gemma3",
+                priority="normal"
             )
             
             if response.get("status") != "success":
@@ -335,27 +336,19 @@ Please create a concise, first-person perspective description of my experience t
             
             # 메모리 데이터 로드
             memories = self.memory_utils._load_memories()
-            
-            # 에이전트가 존재하는지 확인
-            if agent_name not in memories:
-                memories[agent_name] = {"memories": {}}
-            
-            if "memories" not in memories[agent_name]:
-                memories[agent_name]["memories"] = {}
+            agent_memories = memories.get(agent_name, {}).get("memories", {})
             
             # 이벤트 텍스트 생성
             event_text = self._create_event_text(action, interactable, current_location)
             
             # 메모리 ID가 있으면 해당 메모리에 피드백 저장
             if memory_id:
-                agent_memories = memories[agent_name]["memories"]
-                
                 # 메모리 ID가 존재하는지 확인
                 if memory_id in agent_memories:
                     # 기존 메모리에 통합 피드백 추가
-                    agent_memories[memory_id]["feedback"] = combined_feedback
+                    self.memory_utils.store.update_memory(
+                        agent_name, memory_id, {"feedback": combined_feedback}, {"feedback": embedding})
                     print(f"✅ 메모리 ID {memory_id}에 통합 피드백 저장")
-                    self.memory_utils._save_memories(memories)
                     
                     return {
                         "success": True,
@@ -367,20 +360,20 @@ Please create a concise, first-person perspective description of my experience t
                     print(f"⚠️ 메모리 ID {memory_id}를 찾을 수 없습니다. 해당 ID로 새 메모리를 생성합니다.")
             
             # 새 메모리 생성 (기존 ID 유지)
+            new_memory = {
+                "event_role": "",
+                "event": event_text,  # 안전하게 생성된 이벤트 텍스트
+                "action": action if action else "",
+                "feedback": combined_feedback,  # 통합 피드백 저장
+                "conversation_detail": "",
+                "time": time,
+                "importance": 3  # 피드백의 기본 중요도
+            }
+            new_embeddings = {"event": [], "action": [], "feedback": embedding}
             if memory_id:
                 # 기존 ID로 새 메모리 생성
-                memories[agent_name]["memories"][memory_id] = {
-                    "event_role": "",
-                    "event": event_text,  # 안전하게 생성된 이벤트 텍스트
-                    "action": action if action else "",
-                    "feedback": combined_feedback,  # 통합 피드백 저장
-                    "conversation_detail": "",
-                    "time": time,
-                    "embeddings": embedding,
-                    "importance": 3  # 피드백의 기본 중요도
-                }
+                self.memory_utils.store.put_memory(agent_name, memory_id, new_memory, new_embeddings)
                 print(f"✅ 메모리 ID {memory_id}로 새 메모리 생성 및 통합 피드백 저장")
-                self.memory_utils._save_memories(memories)
                 
                 return {
                     "success": True,
@@ -390,19 +383,8 @@ Please create a concise, first-person perspective description of my experience t
                 }
             else:
                 # 새 ID로 메모리 생성
-                new_memory_id = self.memory_utils._get_next_memory_id(agent_name)
-                memories[agent_name]["memories"][new_memory_id] = {
-                    "event_role": "",
-                    "event": event_text,  # 안전하게 생성된 이벤트 텍스트
-                    "action": action if action else "",
-                    "feedback": combined_feedback,  # 통합 피드백 저장
-                    "conversation_detail": "",
-                    "time": time,
-                    "embeddings": embedding,
-                    "importance": 3  # 피드백의 기본 중요도
-                }
+                new_memory_id = self.memory_utils.store.add_memory(agent_name, new_memory, new_embeddings)
                 print(f"✅ 새 메모리 ID {new_memory_id}에 통합 피드백 저장")
-                self.memory_utils._save_memories(memories)
                 
                 return {
                     "success": True,
@@ -0,0 +1,193 @@
+"""
+게임 시간 모듈
+
+메모리 / 반성의 시간 문자열("YYYY.MM.DD.HH:MM")을 분 단위 정수(게임 분)로 바꾸고,
+에이전트별 메모리를 시간순으로 유지하는 TimeIndex를 제공합니다.
+
+- game_minutes: 기본 형식은 정규식으로 바로 계산하고, 그 밖의 형식(ISO 8601 등)만 strptime으로 해석
+  같은 시간 문자열이 반복해서 들어오므로 결과를 캐시합니다.
+- minute_date / date_minutes: 게임 분 ↔ 날짜 문자열(YYYY.MM.DD)
+- TimeIndex: (게임 분, 저장 순번) 키의 정렬 배열
+  최신 N개, 특정 날짜의 메모리, 최신순 순위를 bisect로 O(log n)(+ 결과 개수)에 조회합니다.
+"""
+
+import re
+from bisect import bisect_left
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Iterator, Iterable
+
+MINUTES_PER_DAY = 1440
+UNKNOWN_MINUTE = -1  # 해석할 수 없는 시간 (가장 오래된 것으로 취급)
+
+_TIME_PATTERN = re.compile(r'(\d{4})\.(\d{1,2})\.(\d{1,2})\.(\d{1,2}):(\d{1,2})(?::\d{1,2})?$')
+_DATE_PATTERN = re.compile(r'(\d{4})\.(\d{1,2})\.(\d{1,2})')
+FALLBACK_FORMATS = ("%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+@lru_cache(maxsize=65536)
+def game_minutes(time_str: Optional[str]) -> Optional[int]:
+    """게임 시간 문자열("YYYY.MM.DD.HH:MM[:SS]", 월 / 일 / 시 / 분은 한 자리도 허용)을 분 단위 정수로 변환 (해석할 수 없으면 None)"""
+    if not time_str:
+        return None
+    match = _TIME_PATTERN.match(time_str)
+    if match:
+        year, month, day, hour, minute = map(int, match.groups())
+        if hour < 24 and minute < 60:
+            try:
+                return date(year, month, day).toordinal() * MINUTES_PER_DAY + hour * 60 + minute
+            except ValueError:
+                return None
+        return None
+    for fmt in FALLBACK_FORMATS:
+        try:
+            parsed = datetime.strptime(time_str, fmt)
+        except ValueError:
+            continue
+        return parsed.toordinal() * MINUTES_PER_DAY + parsed.hour * 60 + parsed.minute
+    return None
+
+
+@lru_cache(maxsize=4096)
+def game_day(time_str: Optional[str]) -> Optional[int]:
+    """시간 문자열 안의 날짜(YYYY.MM.DD)를 그날 0시의 게임 분으로 변환 (날짜가 없으면 None)"""
+    match = _DATE_PATTERN.search(time_str or "")
+    if not match:
+        return None
+    try:
+        return date(*map(int, match.groups())).toordinal() * MINUTES_PER_DAY
+    except ValueError:
+        return None
+
+
+def minute_date(minute: Optional[int]) -> str:
+    """게임 분을 날짜 문자열(YYYY.MM.DD)로 변환 (알 수 없는 시간이면 빈 문자열)"""
+    if minute is None or minute < MINUTES_PER_DAY:
+        return ""
+    return date.fromordinal(minute // MINUTES_PER_DAY).strftime("%Y.%m.%d")
+
+
+def date_minutes(date_str: str) -> Optional[Tuple[int, int]]:
+    """날짜 문자열(YYYY.MM.DD)의 게임 분 범위 [시작, 끝) (해석할 수 없으면 None)"""
+    start = game_minutes(f"{date_str}.00:00")
+    if start is None:
+        return None
+    return start, start + MINUTES_PER_DAY
+
+
+def _minute_of(memory: Dict) -> int:
+    minute = game_minutes(memory.get("time") if isinstance(memory, dict) else None)
+    return UNKNOWN_MINUTE if minute is None else minute
+
+
+class TimeIndex:
+    """
+    에이전트 한 명의 메모리 ID를 (게임 분, 저장 순번) 순으로 정렬해 보관하는 인덱스
+
+    키는 (게임 분, -저장 순번)이라 뒤에서부터 읽으면 최신순이며, 시간이 같으면 먼저 저장된 메모리가 앞에 옵니다.
+    (기존 안정 정렬 결과와 같은 순서) 메모리를 덮어써도 저장 순번은 처음 값을 유지합니다.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[int, int]] = []
+        self._ids: List[str] = []
+        self._key_of: Dict[str, Tuple[int, int]] = {}
+        self._next_seq = 0
+
+    @classmethod
+    def build(cls, memories: Dict[str, Dict]) -> "TimeIndex":
+        """메모리 딕셔너리(저장 순서)로 인덱스를 한 번에 만듦"""
+        index = cls()
+        entries = []
+        for memory_id, memory in memories.items():
+            key = (_minute_of(memory), -index._next_seq)
+            index._next_seq += 1
+            index._key_of[memory_id] = key
+            entries.append((key, memory_id))
+        entries.sort()
+        index._keys = [key for key, _ in entries]
+        index._ids = [memory_id for _, memory_id in entries]
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, memory_id: str) -> bool:
+        return memory_id in self._key_of
+
+    def set(self, memory_id: str, time_str: Optional[str]):
+        """메모리 시간 등록 / 변경"""
+        minute = game_minutes(time_str)
+        minute = UNKNOWN_MINUTE if minute is None else minute
+        old_key = self._key_of.get(memory_id)
+        if old_key is not None:
+            if old_key[0] == minute:
+                return
+            self._remove_key(old_key)
+            seq = old_key[1]
+        else:
+            seq = -self._next_seq
+            self._next_seq += 1
+        key = (minute, seq)
+        position = bisect_left(self._keys, key)
+        self._keys.insert(position, key)
+        self._ids.insert(position, memory_id)
+        self._key_of[memory_id] = key
+
+    def remove(self, memory_id: str):
+        """메모리 제거 (없으면 무시)"""
+        key = self._key_of.pop(memory_id, None)
+        if key is not None:
+            self._remove_key(key)
+
+    def _remove_key(self, key: Tuple[int, int]):
+        position = bisect_left(self._keys, key)
+        del self._keys[position]
+        del self._ids[position]
+
+    def minute(self, memory_id: str) -> Optional[int]:
+        """메모리의 게임 분 (없거나 알 수 없는 시간이면 None)"""
+        key = self._key_of.get(memory_id)
+        if key is None or key[0] == UNKNOWN_MINUTE:
+            return None
+        return key[0]
+
+    def sort_key(self, memory_id: str) -> Tuple[int, int]:
+        """정렬 키 (클수록 최신, 인덱스에 없으면 가장 오래된 것으로 취급)"""
+        return self._key_of.get(memory_id, (UNKNOWN_MINUTE - 1, 0))
+
+    def rank(self, memory_id: str) -> Optional[int]:
+        """최신순 순위 (0이 가장 최신, 없으면 None)"""
+        key = self._key_of.get(memory_id)
+        if key is None:
+            return None
+        return len(self._keys) - 1 - bisect_left(self._keys, key)
+
+    def newest_first(self) -> Iterator[str]:
+        """최신순 메모리 ID (인덱스를 바꾸는 동안에는 사용하지 말 것)"""
+        return reversed(self._ids)
+
+    def latest(self, limit: Optional[int] = None) -> List[str]:
+        """최신 limit개의 메모리 ID (최신순, None이면 전체)"""
+        if limit is None:
+            return self._ids[::-1]
+        return self._ids[:-limit - 1:-1] if limit > 0 else []
+
+    def between(self, start: int, end: int) -> List[str]:
+        """게임 분이 [start, end) 범위인 메모리 ID (시간순, 시간이 같으면 저장 순서)"""
+        low = bisect_left(self._keys, (start, float("-inf")))
+        high = bisect_left(self._keys, (end, float("-inf")))
+        # 키의 저장 순번은 음수로 들어 있으므로 같은 분 안에서는 순서를 뒤집음
+        positions = sorted(range(low, high), key=lambda i: (self._keys[i][0], -self._keys[i][1]))
+        return [self._ids[i] for i in positions]
+
+    def latest_minute(self) -> Optional[int]:
+        """가장 최근 게임 분 (메모리가 없거나 모두 알 수 없는 시간이면 None)"""
+        if not self._keys or self._keys[-1][0] == UNKNOWN_MINUTE:
+            return None
+        return self._keys[-1][0]
+
+
+def sort_newest_first(memory_ids: Iterable[str], index: TimeIndex) -> List[str]:
+    """메모리 ID들을 인덱스 기준 최신순으로 정렬"""
+    return sorted(memory_ids, key=index.sort_key, reverse=True)
@@ -0,0 +1,137 @@
+"""
+스트리밍 JSON 파서 모듈
+
+Ollama 스트리밍 응답(토큰 조각)을 받는 대로 넣어 첫 번째 최상위 JSON 객체가 닫히는 순간을 감지합니다.
+응답 앞의 ```json 펜스나 설명 문장은 건너뛰고, 문자열 안의 중괄호와 이스케이프는 무시합니다.
+닫힌 객체가 JSON으로 파싱되지 않으면 그 뒤에 오는 다음 객체를 계속 찾습니다.
+
+객체가 아직 닫히지 않았어도 partial_string("message")로 문자열 필드의 현재까지 내용을 읽을 수 있어
+대화 문장을 생성되는 대로 보여줄 수 있습니다.
+"""
+
+import re
+import json
+from typing import Any, Optional
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        """스트리밍 JSON 파서 초기화"""
+        self.text = ""              # 지금까지 받은 전체 텍스트
+        self.value: Optional[Any] = None  # 완성된 JSON 객체 (없으면 None)
+        self._pos = 0               # 다음에 검사할 위치
+        self._start = -1            # 현재 최상위 객체의 시작 위치
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def complete(self) -> bool:
+        """JSON 객체가 완성되었는지 여부"""
+        return self.value is not None
+
+    def feed(self, chunk: str) -> Optional[Any]:
+        """
+        텍스트 조각 추가
+
+        Args:
+            chunk: 스트리밍으로 받은 텍스트 조각
+
+        Returns:
+            이번 조각으로 최상위 JSON 객체가 완성되면 파싱된 객체, 아니면 None
+            (이미 완성된 뒤에는 조각을 text에만 추가하고 None 반환)
+        """
+        self.text += chunk
+        if self.value is not None:
+            return None
+
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._depth == 0:
+                if ch == "{":
+                    self._start = i
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        self.value = json.loads(text[self._start:i + 1])
+                    except json.JSONDecodeError:
+                        # 잘못된 객체는 버리고 다음 객체를 찾음
+                        self._start = -1
+                        continue
+                    self._pos = i + 1
+                    return self.value
+        self._pos = len(text)
+        return None
+
+    @property
+    def json_text(self) -> str:
+        """현재 최상위 객체 부분의 텍스트 (객체를 찾지 못했으면 빈 문자열)"""
+        if self._start < 0:
+            return ""
+        return self.text[self._start:self._pos]
+
+    def partial_string(self, field: str) -> Optional[str]:
+        """
+        아직 닫히지 않은 객체에서 문자열 필드의 현재까지 내용을 반환
+
+        Args:
+            field: 필드 이름 (예: "message")
+
+        Returns:
+            디코딩된 문자열 (필드가 아직 나오지 않았으면 None)
+        """
+        if self.value is not None:
+            value = self.value.get(field) if isinstance(self.value, dict) else None
+            return value if isinstance(value, str) else None
+        if self._start < 0:
+            return None
+        match = re.search(r'"' + re.escape(field) + r'"\s*:\s*"', self.text[self._start:])
+        if not match:
+            return None
+
+        chars = []
+        text = self.text
+        i = self._start + match.end()
+        while i < len(text):
+            ch = text[i]
+            if ch == '"':
+                break
+            if ch != "\\":
+                chars.append(ch)
+                i += 1
+                continue
+            # 이스케이프가 조각 끝에서 잘렸으면 다음 조각을 기다림
+            if i + 1 >= len(text):
+                break
+            code = text[i + 1]
+            if code == "u":
+                digits = text[i + 2:i + 6]
+                if len(digits) < 4:
+                    break
+                try:
+                    chars.append(chr(int(digits, 16)))
+                except ValueError:
+                    pass
+                i += 6
+            else:
+                chars.append(_ESCAPES.get(code, code))
+                i += 2
+        return "".join(chars)
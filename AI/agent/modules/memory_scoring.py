@@ -0,0 +1,189 @@
+"""
+메모리 점수 계산 모듈
+
+ReactionDecider와 MemoryRetriever의 _find_similar_memories가 공유하는 벡터화된 점수 계산입니다.
+기존 반복문과 같은 순위를 만듭니다:
+
+    final_score = alpha * sim_max + beta * (importance / 10) + gamma * time_weight
+
+- sim_max: 현재 이벤트/상태 임베딩과 메모리 임베딩(feedback 우선, 없으면 event)의 코사인 유사도 중 큰 값.
+  임베딩이 없거나 0 벡터이면 0.01, 큰 값이 similarity_threshold 미만이어도 0.01
+- time_weight: 최신순 순위 i에 대해 max(1 - (min(i, K) / K)^2, 0.01)
+  저장소 시간 인덱스의 최신순 ID(recent_ids)를 받으면 시간 문자열을 정렬하지 않고 그 순서를 순위로 사용
+- 동점이면 최신 메모리가 앞에 옴
+
+코사인 유사도는 미리 정규화된 임베딩 행렬과의 행렬 곱 한 번으로 계산하고,
+상위 k개는 전체 정렬 대신 argpartition으로 고릅니다.
+"""
+
+from typing import Dict, List, Any, Tuple, Optional
+import numpy as np
+
+from .embedding_matrix import EmbeddingMatrix
+
+# 기본 가중치 (기존 _find_similar_memories와 동일)
+MEMORY_ALPHA = 0.5
+MEMORY_BETA = 0.2
+MEMORY_GAMMA = 0.3
+RECENCY_K = 20  # 포물선형 시간 가중치 계산용
+DEFAULT_SIMILARITY = 0.01
+DEFAULT_IMPORTANCE = 3
+
+
+def _normalize_query(embedding: Optional[List[float]]) -> Tuple[np.ndarray, bool]:
+    """질의 임베딩을 정규화하고 0 벡터 여부를 함께 반환"""
+    if embedding is None or len(embedding) == 0:
+        return np.zeros(0, dtype=np.float32), False
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return vector, False
+    return vector / norm, True
+
+
+def _top_k_indices(keys: np.ndarray, tie_breaker: np.ndarray, k: int) -> np.ndarray:
+    """
+    keys 내림차순, 동점이면 tie_breaker 오름차순으로 상위 k개의 인덱스를 반환
+
+    argpartition으로 k번째 값을 찾은 뒤 그 값 이상인 원소(동점 포함)만 정렬합니다.
+    """
+    n = keys.shape[0]
+    if n == 0 or k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        kth_value = keys[np.argpartition(-keys, k - 1)[k - 1]]
+        candidates = np.nonzero(keys >= kth_value)[0]
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((tie_breaker[candidates], -keys[candidates]))
+    return candidates[order[:k]]
+
+
+def score_memories(
+    memories: Dict[str, Dict[str, Any]],
+    embedding_matrix: EmbeddingMatrix,
+    event_embedding: List[float],
+    state_embedding: List[float],
+    top_k: int = 3,
+    similarity_threshold: float = 0.1,
+    alpha: float = MEMORY_ALPHA,
+    beta: float = MEMORY_BETA,
+    gamma: float = MEMORY_GAMMA,
+    recency_k: int = RECENCY_K,
+    candidate_ids: Optional[List[str]] = None,
+    recent_ids: Optional[List[str]] = None
+) -> List[Tuple[Dict[str, Any], float, bool]]:
+    """
+    메모리 점수를 한꺼번에 계산하고 상위 top_k개를 반환
+
+    Args:
+        memories: 에이전트의 메모리 딕셔너리 {메모리 ID: 메모리} (저장 순서 유지)
+        embedding_matrix: 에이전트의 임베딩 행렬
+        event_embedding: 현재 이벤트의 임베딩
+        state_embedding: 현재 상태의 임베딩
+        top_k: 반환할 메모리 개수
+        similarity_threshold: 유사도 임계값
+        alpha, beta, gamma: 유사도 / 중요도 / 시간 가중치 계수
+        recency_k: 시간 가중치가 0.01까지 떨어지는 순위
+        candidate_ids: 유사도를 계산할 메모리 ID (None이면 전체, 나머지는 기본 유사도 0.01)
+        recent_ids: 최신순 메모리 ID 전체 (MemoryStore.recent_memory_ids, None이면 시간 문자열로 순위 계산)
+
+    Returns:
+        List[Tuple[Dict[str, Any], float, bool]]: (메모리, 점수, 반성 여부) 리스트
+    """
+    # 1) 대상 메모리와 점수 계산용 열 구성 (내용이 빈 메모리는 제외)
+    memory_ids = []
+    times = []
+    importances = []
+    for memory_id, memory in memories.items():
+        if memory.get("event") == "" and memory.get("feedback") == "":
+            continue
+        memory_ids.append(memory_id)
+        times.append(memory.get("time", ""))
+        importances.append(float(memory.get("importance", DEFAULT_IMPORTANCE)))
+
+    n = len(memory_ids)
+    if n == 0:
+        return []
+    positions = np.arange(n)
+
+    # 2) 최신순 순위 (시간 내림차순, 같은 시간이면 저장 순서)
+    #    recency_key가 클수록 최신이며 값이 모두 달라 전체 정렬 없이 순위 비교가 가능
+    #    시간 가중치는 상위 recency_k개만 0.01보다 크므로 그 순위만 구함
+    recent = None
+    if recent_ids is not None:
+        # 시간 인덱스 순서를 그대로 사용 (인덱스와 memories가 어긋나면 아래 시간 문자열 경로로 계산)
+        position_of = {memory_id: pos for pos, memory_id in enumerate(memory_ids)}
+        order = np.fromiter((position_of[memory_id] for memory_id in recent_ids if memory_id in position_of),
+                            dtype=np.int64)
+        if len(order) == n:
+            recency_key = np.empty(n, dtype=np.int64)
+            recency_key[order] = np.arange(n - 1, -1, -1)
+            recent = order[:recency_k]
+    if recent is None:
+        _, time_rank = np.unique(np.asarray(times), return_inverse=True)
+        recency_key = time_rank.astype(np.int64) * n + (n - 1 - positions)
+        recent = _top_k_indices(recency_key, positions, recency_k)
+    recency_weight = np.full(n, 0.01)
+    ranks = np.arange(len(recent))
+    recency_weight[recent] = np.maximum(1.0 - (np.minimum(ranks, recency_k) / recency_k) ** 2, 0.01)
+
+    # 3) 유사도: 정규화된 feedback/event 행렬과 (이벤트, 상태) 질의의 행렬 곱 한 번
+    event_query, event_valid = _normalize_query(event_embedding)
+    state_query, state_valid = _normalize_query(state_embedding)
+    event_sim = np.full(n, DEFAULT_SIMILARITY)
+    state_sim = np.full(n, DEFAULT_SIMILARITY)
+
+    rows = np.fromiter((embedding_matrix.index.get(str(memory_id), -1) for memory_id in memory_ids),
+                       dtype=np.int64, count=n)
+    if candidate_ids is not None:
+        candidate_set = {str(memory_id) for memory_id in candidate_ids}
+        is_candidate = np.fromiter((str(memory_id) in candidate_set for memory_id in memory_ids),
+                                   dtype=bool, count=n)
+        rows = np.where(is_candidate, rows, -1)
+
+    if (event_valid or state_valid) and embedding_matrix.dim and len(embedding_matrix):
+        has_row = rows >= 0
+        target = np.nonzero(has_row)[0]
+        target_rows = rows[target]
+
+        unit = embedding_matrix.unit_field_vectors(("event", "feedback"))  # (2, 행 수, 차원)
+        queries = np.stack([
+            event_query if event_valid else np.zeros(embedding_matrix.dim, dtype=np.float32),
+            state_query if state_valid else np.zeros(embedding_matrix.dim, dtype=np.float32)
+        ], axis=1)
+        if target_rows.size * 2 < len(embedding_matrix):
+            # 후보가 적으면 해당 행만 모아서 곱함
+            sims = np.matmul(unit[:, target_rows], queries)  # (2, 후보 수, 2)
+        else:
+            sims = np.matmul(unit, queries)[:, target_rows]
+
+        # feedback 임베딩이 있으면 feedback, 없으면 event 사용 (0 벡터는 기본값 유지)
+        use_feedback = embedding_matrix.field_present("feedback")[target_rows]
+        use_event = ~use_feedback & embedding_matrix.field_present("event")[target_rows]
+        chosen = np.where(use_feedback[:, None], sims[1], sims[0])
+        valid = np.where(
+            use_feedback,
+            embedding_matrix.field_nonzero("feedback")[target_rows],
+            use_event & embedding_matrix.field_nonzero("event")[target_rows]
+        )
+
+        if event_valid:
+            event_sim[target[valid]] = chosen[valid, 0]
+        if state_valid:
+            state_sim[target[valid]] = chosen[valid, 1]
+
+    sim_max = np.maximum(event_sim, state_sim)
+    sim_max = np.where(sim_max >= similarity_threshold, sim_max, DEFAULT_SIMILARITY)
+
+    # 4) 최종 점수와 상위 top_k (동점이면 최신 메모리 우선)
+    scores = alpha * sim_max + beta * (np.asarray(importances) / 10.0) + gamma * recency_weight
+    top = _top_k_indices(scores, -recency_key, top_k)
+
+    result = []
+    for idx in top:
+        memory_id = memory_ids[idx]
+        memory_with_id = memories[memory_id].copy()
+        memory_with_id["memory_id"] = memory_id
+        result.append((memory_with_id, float(scores[idx]), False))
+    return result
@@ -0,0 +1,883 @@
+"""
+메모리 저장소 모듈
+
+memories.json 데이터를 프로세스 안에 상주시키는 저장소를 제공합니다.
+같은 파일을 사용하는 MemoryUtils, MemoryRetriever, EmbeddingUpdater, MemoryProcessor,
+AgentConversationManager 는 get_memory_store()를 통해 하나의 저장소를 공유합니다.
+
+저장 방식 (write-ahead journal):
+- 개별 쓰기(관찰, 피드백 갱신, 중요도 평가, 대화 메모리)는 memories.json.journal 파일에
+  한 줄짜리 JSON 레코드로 추가만 합니다. 쓰기 비용이 전체 메모리 크기와 무관합니다.
+- 백그라운드 스레드가 주기적으로 저널을 스냅샷에 합칩니다 (compaction).
+  스냅샷은 에이전트별 파일(memories/<에이전트>.json)이며, 마지막 compaction 이후 바뀐 에이전트의 파일만
+  다시 씁니다. 한 에이전트의 메모리가 많아도 다른 에이전트의 기록 비용은 늘지 않습니다.
+  각 파일은 임시 파일에 쓴 뒤 os.replace로 교체하므로 기록 도중 파일이 잘리지 않습니다.
+- 예전 단일 스냅샷(memories.json)이 있으면 로드 후 에이전트별 파일로 나누고 memories.json.migrated로 이름을 바꿉니다.
+- 시작 시 스냅샷을 읽고 journal.1(이전 compaction 도중 남은 저널), journal 순서로 재생합니다.
+  레코드는 모두 "값을 설정"하는 형태라 같은 레코드를 다시 재생해도 결과가 같습니다.
+
+임베딩 저장 방식:
+- 스냅샷 JSON에는 텍스트(memories)만 저장합니다.
+- 에이전트별 임베딩은 EmbeddingMatrix(float32 행렬 + ID 인덱스)로 상주하며,
+  memories_embeddings/<에이전트>.npz 파일 하나로 저장됩니다. (파일 이름은 스냅샷 샤드와 같은 방식으로 인코딩)
+- 예전 두 파일 형식(<에이전트>.npy + <에이전트>.index.json)은 로드 후 다음 compaction 때 .npz로 바뀝니다.
+- 예전 형식(JSON 안의 "embeddings")은 로드 시 행렬로 옮기고, 다음 compaction 때 JSON에서 빠집니다.
+- enable_ann_index()로 에이전트별 IVF 인덱스를 켜면, 메모리 쓰기마다 해당 메모리만 인덱스에 다시 배정됩니다.
+
+시간 인덱스:
+- 메모리의 시간 문자열은 기록할 때 정수 게임 분(game_time.game_minutes)으로 바꿔 에이전트별 TimeIndex에 넣습니다.
+- recent_memory_ids(최신 N개), memory_ids_on_date(특정 날짜), latest_memory_date는
+  매번 시간 문자열을 해석하거나 정렬하지 않고 인덱스에서 바로 읽습니다.
+
+조회 API (memory_ids_on_date, find_memory_ids, latest_memory_date):
+- 이 저장소(JSON 백엔드)는 날짜 / 최신순 조회는 시간 인덱스로, 종류 / 위치 조회는 메모리를 순회해서 찾습니다.
+- SQLiteMemoryStore(sqlite_memory_store.py)는 같은 API를 색인 조회로 처리합니다.
+- 백엔드는 configure_memory_store(backend="json" | "sqlite")로 고르며, 호출하는 쪽 코드는 같습니다.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from typing import Dict, Any, Optional, List, Iterable
+import numpy as np
+from .embedding_matrix import EmbeddingMatrix
+from .ann_index import IVFIndex
+from .agent_shards import read_shards, shard_file_name, agent_file_stem
+from .atomic_io import write_text_atomic
+from .game_time import TimeIndex, date_minutes, minute_date, sort_newest_first
+
+
+def default_memories() -> Dict[str, Any]:
+    """메모리 파일이 없거나 손상되었을 때 사용할 기본 구조"""
+    return {
+        "Tom": {
+            "memories": {}
+        },
+        "Jane": {
+            "memories": {}
+        }
+    }
+
+
+class MemoryStore:
+    def __init__(self, memories_file: str, compact_interval: float = 30.0,
+                 compact_threshold: int = 500, fsync: bool = False):
+        """
+        메모리 저장소 초기화
+
+        Args:
+            memories_file: 메모리 JSON 파일 경로 (에이전트별 스냅샷은 확장자를 뺀 디렉토리에 저장)
+            compact_interval: 저널이 남아 있을 때 스냅샷으로 합치는 주기 (초)
+            compact_threshold: 이 개수 이상의 레코드가 쌓이면 주기와 관계없이 바로 합침
+            fsync: 저널 레코드마다 os.fsync 호출 여부 (전원 장애까지 대비할 때 사용)
+        """
+        self.memories_file = memories_file
+        self.journal_file = memories_file + ".journal"
+        self.rotated_journal_file = self.journal_file + ".1"
+        self.shard_dir = os.path.splitext(memories_file)[0]
+        self.embeddings_dir = os.path.splitext(memories_file)[0] + "_embeddings"
+        self.compact_interval = compact_interval
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+
+        self.lock = threading.RLock()
+        self._compact_lock = threading.Lock()  # compaction(스냅샷 기록)은 한 번에 하나만 수행
+        self._data: Optional[Dict[str, Any]] = None
+        self._matrices: Dict[str, EmbeddingMatrix] = {}
+        self._ann_config: Optional[Dict[str, Any]] = None
+        self._ann_indexes: Dict[str, IVFIndex] = {}
+        self._ann_training: Dict[str, set] = {}  # 학습 중인 에이전트 → 학습 중에 바뀐 메모리 ID
+        self._ann_generation = 0  # 인덱스를 모두 버릴 때마다 증가 (학습 중에 버려졌으면 결과를 쓰지 않음)
+        self._time_indexes: Dict[str, TimeIndex] = {}  # 에이전트별 시간 인덱스 (처음 조회할 때 만듦)
+        self._max_ids: Dict[str, int] = {}  # 에이전트별 가장 큰 숫자 메모리 ID (새 ID 발급용)
+        self._dirty_agents = set()  # 마지막 compaction 이후 바뀐 에이전트 (스냅샷 파일을 다시 쓸 대상)
+        self._dirty_matrices = set()  # 마지막 compaction 이후 임베딩이 바뀐 에이전트 (행렬 파일을 다시 쓸 대상)
+        self._legacy_snapshot = False  # 예전 단일 스냅샷을 읽은 경우 compaction 후 이름을 바꿈
+        self._journal = None
+        self._journal_records = 0
+        self._last_compaction = time.time()
+        self._compact_requested = threading.Event()
+        self._stop_event = threading.Event()
+
+        self._start_compaction_thread()
+
+    # ------------------------------------------------------------------
+    # 로드 / 재생
+    # ------------------------------------------------------------------
+
+    def _shard_path(self, agent_name: str) -> str:
+        """에이전트 스냅샷 파일 경로"""
+        return os.path.join(self.shard_dir, shard_file_name(agent_name))
+
+    def _read_snapshot(self) -> Dict[str, Any]:
+        """
+        스냅샷을 읽어 데이터를 반환
+
+        예전 단일 스냅샷이 남아 있으면 먼저 읽고 에이전트별 파일로 덮어씁니다.
+        (변환 도중 종료된 경우 이미 기록된 에이전트별 파일이 더 최신)
+        """
+        data = {}
+        if os.path.exists(self.memories_file):
+            try:
+                with open(self.memories_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._legacy_snapshot = True
+            except Exception as e:
+                print(f"메모리 로드 중 오류 발생: {e}")
+        data.update(read_shards(self.shard_dir))
+        if not data:
+            data = default_memories()
+        if self._legacy_snapshot:
+            self._dirty_agents.update(data)
+        return data
+
+    def _matrix_path(self, agent_name: str) -> str:
+        """에이전트 임베딩 행렬 파일 경로 (.npz, 이름은 스냅샷 샤드와 같은 방식으로 인코딩)"""
+        return os.path.join(self.embeddings_dir, agent_file_stem(agent_name) + ".npz")
+
+    def _legacy_matrix_paths(self, agent_name: str):
+        """예전 형식 행렬 파일 경로 (.npy, 인덱스 JSON), 이름을 그대로 파일 이름으로 쓸 수 없으면 빈 튜플"""
+        if agent_file_stem(agent_name) != agent_name or agent_name in ("", ".", ".."):
+            return ()
+        base = os.path.join(self.embeddings_dir, agent_name)
+        return base + ".npy", base + ".index.json"
+
+    def _load_matrices(self, data: Dict[str, Any]) -> bool:
+        """
+        에이전트별 임베딩 행렬 로드
+
+        Returns:
+            bool: 예전 형식(JSON 안의 embeddings)을 행렬로 옮긴 경우 True
+        """
+        migrated = False
+        self._matrices = {}
+        for agent_name, agent_data in data.items():
+            if not isinstance(agent_data, dict):
+                continue
+            legacy = agent_data.pop("embeddings", None)
+            if legacy:
+                self._matrices[agent_name] = EmbeddingMatrix.from_dict(legacy)
+                self._dirty_agents.add(agent_name)
+                self._dirty_matrices.add(agent_name)
+                migrated = True
+                continue
+            legacy_paths = self._legacy_matrix_paths(agent_name)
+            try:
+                if os.path.exists(self._matrix_path(agent_name)):
+                    self._matrices[agent_name] = EmbeddingMatrix.load(self._matrix_path(agent_name))
+                elif legacy_paths and all(os.path.exists(path) for path in legacy_paths):
+                    self._matrices[agent_name] = EmbeddingMatrix.load_legacy(*legacy_paths)
+                    self._dirty_matrices.add(agent_name)
+            except Exception as e:
+                # 저널 재생과 /update_embeddings로 복구 가능
+                print(f"⚠️ {agent_name} 임베딩 행렬 로드 실패: {e}")
+        return migrated
+
+    def _replay_journal(self, data: Dict[str, Any], journal_file: str) -> int:
+        """저널 파일의 레코드를 순서대로 적용하고 적용한 레코드 수를 반환"""
+        if not os.path.exists(journal_file):
+            return 0
+
+        applied = 0
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 기록 도중 종료되어 잘린 마지막 레코드는 무시
+                    print(f"⚠️ 손상된 저널 레코드를 건너뜁니다: {journal_file}")
+                    continue
+                self._apply(data, record)
+                applied += 1
+        return applied
+
+    def load(self) -> Dict[str, Any]:
+        """
+        상주 중인 메모리 데이터를 반환합니다. (처음 호출 시에만 스냅샷 + 저널에서 복원)
+
+        반환된 딕셔너리는 저장소의 원본입니다. 개별 변경은 put_memory / update_memory /
+        delete_memory 로, 대량 변경은 replace()로 반영해야 디스크에 남습니다.
+
+        Returns:
+            Dict[str, Any]: 메모리 데이터
+        """
+        if self._data is None:
+            with self.lock:
+                if self._data is None:
+                    data = self._read_snapshot()
+                    migrated = self._load_matrices(data)
+                    replayed = self._replay_journal(data, self.rotated_journal_file)
+                    replayed += self._replay_journal(data, self.journal_file)
+                    self._data = data
+                    self._max_ids = self._scan_max_ids(data)
+                    self._journal_records = replayed
+                    if replayed:
+                        print(f"📒 메모리 저널 {replayed}개 레코드 재생 완료")
+                    if migrated:
+                        print("📦 JSON 임베딩을 행렬 파일로 옮깁니다.")
+                    if self._legacy_snapshot:
+                        print(f"📦 memories.json을 에이전트별 파일로 나눕니다: {self.shard_dir}")
+                    if replayed or migrated or self._legacy_snapshot:
+                        self._compact_requested.set()
+        return self._data
+
+    # ------------------------------------------------------------------
+    # 레코드 적용
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _agent_entry(data: Dict[str, Any], agent_name: str) -> Dict[str, Any]:
+        """에이전트 항목을 가져오고, 없으면 빈 구조를 만듭니다."""
+        agent_data = data.setdefault(agent_name, {})
+        agent_data.setdefault("memories", {})
+        return agent_data
+
+    def _matrix(self, agent_name: str) -> EmbeddingMatrix:
+        """에이전트 임베딩 행렬을 가져오고, 없으면 새로 만듭니다."""
+        matrix = self._matrices.get(agent_name)
+        if matrix is None:
+            matrix = EmbeddingMatrix()
+            self._matrices[agent_name] = matrix
+        return matrix
+
+    def _apply(self, data: Dict[str, Any], record: Dict[str, Any]):
+        """저널 레코드 하나를 데이터에 적용"""
+        op = record.get("op")
+        agent_name = record.get("agent")
+        memory_id = str(record.get("id", ""))
+        self._dirty_agents.add(agent_name)
+
+        if op == "put":
+            agent_data = self._agent_entry(data, agent_name)
+            agent_data["memories"][memory_id] = record.get("memory", {})
+            self._note_memory_id(agent_name, memory_id)
+            self._index_time(agent_name, memory_id, agent_data["memories"][memory_id].get("time"))
+            if record.get("embeddings") is not None:
+                self._matrix(agent_name).set(memory_id, record["embeddings"])
+                self._update_ann(agent_name, memory_id)
+                self._dirty_matrices.add(agent_name)
+        elif op == "update":
+            agent_data = self._agent_entry(data, agent_name)
+            fields = record.get("fields") or {}
+            indexed = memory_id in agent_data["memories"] and "time" not in fields
+            memory = agent_data["memories"].setdefault(memory_id, {})
+            memory.update(fields)
+            self._note_memory_id(agent_name, memory_id)
+            if not indexed:
+                self._index_time(agent_name, memory_id, memory.get("time"))
+            if record.get("embeddings"):
+                self._matrix(agent_name).set(memory_id, record["embeddings"], replace=False)
+                self._update_ann(agent_name, memory_id)
+                self._dirty_matrices.add(agent_name)
+        elif op == "delete":
+            agent_data = data.get(agent_name)
+            if isinstance(agent_data, dict):
+                agent_data.get("memories", {}).pop(memory_id, None)
+            if agent_name in self._matrices:
+                self._matrices[agent_name].delete(memory_id)
+                self._dirty_matrices.add(agent_name)
+            self._remove_ann(agent_name, memory_id)
+            if agent_name in self._time_indexes:
+                self._time_indexes[agent_name].remove(memory_id)
+
+    @staticmethod
+    def _scan_max_ids(data: Dict[str, Any]) -> Dict[str, int]:
+        """에이전트별 가장 큰 숫자 메모리 ID (로드 / 전체 교체 시 한 번만 계산)"""
+        max_ids = {}
+        for agent_name, agent_data in data.items():
+            memories = agent_data.get("memories", {}) if isinstance(agent_data, dict) else {}
+            max_ids[agent_name] = max((int(memory_id) for memory_id in memories if memory_id.isdigit()), default=0)
+        return max_ids
+
+    def _note_memory_id(self, agent_name: str, memory_id: str):
+        """숫자 메모리 ID가 추가되면 에이전트의 최대 ID 갱신 (lock 보유 상태에서 호출)"""
+        if memory_id.isdigit() and int(memory_id) > self._max_ids.get(agent_name, 0):
+            self._max_ids[agent_name] = int(memory_id)
+
+    def _index_time(self, agent_name: str, memory_id: str, time_str: Optional[str]):
+        """이미 만든 시간 인덱스가 있으면 메모리 시간 반영 (lock 보유 상태에서 호출)"""
+        index = self._time_indexes.get(agent_name)
+        if index is not None:
+            index.set(memory_id, time_str)
+
+    def _append_journal(self, record: Dict[str, Any]):
+        """저널 파일 끝에 레코드 한 줄 추가 (lock 보유 상태에서 호출)"""
+        if self._journal is None:
+            os.makedirs(os.path.dirname(self.journal_file), exist_ok=True)
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._journal_records += 1
+        if self._journal_records >= self.compact_threshold:
+            self._compact_requested.set()
+
+    def _write(self, record: Dict[str, Any]):
+        """레코드를 저널에 기록한 뒤 상주 데이터에 적용"""
+        self.load()
+        with self.lock:
+            self._append_journal(record)
+            self._apply(self._data, record)
+
+    # ------------------------------------------------------------------
+    # 쓰기 API
+    # ------------------------------------------------------------------
+
+    def put_memory(self, agent_name: str, memory_id: str, memory: Dict[str, Any],
+                   embeddings: Optional[Dict[str, Any]] = None):
+        """
+        메모리 한 개를 추가하거나 통째로 덮어씁니다.
+
+        Args:
+            agent_name: 에이전트 이름
+            memory_id: 메모리 ID
+            memory: 메모리 내용
+            embeddings: {"event": [...], "action": [...], "feedback": [...]} (없으면 기존 임베딩 유지)
+        """
+        self._write({
+            "op": "put",
+            "agent": agent_name,
+            "id": str(memory_id),
+            "memory": memory,
+            "embeddings": embeddings
+        })
+
+    def next_memory_id(self, agent_name: str) -> str:
+        """에이전트의 다음 메모리 ID (지금까지 본 숫자 ID 중 가장 큰 값 + 1, 삭제된 ID는 다시 쓰지 않음)"""
+        self.load()
+        with self.lock:
+            return str(self._max_ids.get(agent_name, 0) + 1)
+
+    def add_memory(self, agent_name: str, memory: Dict[str, Any],
+                   embeddings: Optional[Dict[str, Any]] = None) -> str:
+        """
+        새 메모리 ID를 발급해 메모리를 추가합니다.
+
+        ID 발급과 기록을 lock 안에서 한 번에 수행하므로 여러 스레드가 동시에 추가해도 ID가 겹치지 않습니다.
+
+        Returns:
+            str: 발급한 메모리 ID
+        """
+        with self.lock:
+            memory_id = self.next_memory_id(agent_name)
+            self.put_memory(agent_name, memory_id, memory, embeddings)
+        return memory_id
+
+    def update_memory(self, agent_name: str, memory_id: str, fields: Optional[Dict[str, Any]] = None,
+                      embeddings: Optional[Dict[str, Any]] = None):
+        """
+        메모리의 일부 필드만 갱신합니다. (피드백, 중요도 등)
+
+        Args:
+            agent_name: 에이전트 이름
+            memory_id: 메모리 ID
+            fields: 갱신할 메모리 필드
+            embeddings: 갱신할 임베딩 필드 (예: {"feedback": [...]})
+        """
+        self._write({
+            "op": "update",
+            "agent": agent_name,
+            "id": str(memory_id),
+            "fields": fields or {},
+            "embeddings": embeddings or {}
+        })
+
+    def delete_memory(self, agent_name: str, memory_id: str):
+        """메모리와 연결된 임베딩을 삭제합니다."""
+        self._write({
+            "op": "delete",
+            "agent": agent_name,
+            "id": str(memory_id)
+        })
+
+    def replace(self, data: Dict[str, Any]):
+        """
+        메모리 데이터 전체를 교체합니다. (/data/save, 임베딩 일괄 갱신 등 대량 변경용)
+
+        전체 데이터를 저널에 남기는 대신 바로 새 스냅샷을 기록합니다.
+        에이전트 항목에 "embeddings" 딕셔너리가 있으면 그 내용으로 임베딩 행렬을 다시 만들고,
+        없으면 기존 행렬에서 사라진 메모리의 행만 제거합니다.
+
+        Args:
+            data: 새 메모리 데이터
+        """
+        self.load()
+        with self.lock:
+            self._dirty_agents.update(self._data)
+            self._dirty_agents.update(data)
+            self._dirty_matrices.update(self._data)
+            self._dirty_matrices.update(data)
+            matrices = {}
+            for agent_name, agent_data in data.items():
+                if not isinstance(agent_data, dict):
+                    continue
+                embeddings = agent_data.pop("embeddings", None)
+                if embeddings is not None:
+                    matrices[agent_name] = EmbeddingMatrix.from_dict(embeddings)
+                else:
+                    matrix = self._matrices.get(agent_name, EmbeddingMatrix())
+                    matrix.retain(agent_data.get("memories", {}).keys())
+                    matrices[agent_name] = matrix
+            self._persist_replace(data)
+            self._data = data
+            self._max_ids = self._scan_max_ids(data)
+            self._matrices = matrices
+            # 행렬이 통째로 바뀌었으므로 ANN 인덱스는 다음 검색 때 다시 학습
+            self._reset_ann_indexes()
+            self._time_indexes = {}
+        self.compact()
+
+    def _persist_replace(self, data: Dict[str, Any]):
+        """전체 교체 내용을 영구 저장소에 바로 반영 (JSON 백엔드는 이어지는 compaction에서 기록, lock 보유 상태에서 호출)"""
+
+    def apply_embedding_updates(self, agent_name: str, embeddings: Dict[str, Dict[str, Any]],
+                                text_hashes: Optional[Dict[str, Dict[str, int]]] = None,
+                                removed: Optional[List[str]] = None):
+        """
+        임베딩만 일괄 갱신합니다. (EmbeddingUpdater의 증분 갱신용)
+
+        메모리 텍스트는 바뀌지 않으므로 저널에 남기지 않고 행렬만 갱신하며,
+        행렬 파일은 다음 compaction 때 기록됩니다.
+
+        Args:
+            agent_name: 에이전트 이름
+            embeddings: {메모리 ID: {필드: 임베딩}} (주어진 필드만 갱신, 빈 리스트는 임베딩 삭제)
+            text_hashes: {메모리 ID: {필드: 텍스트 해시}}
+            removed: 임베딩 행을 삭제할 메모리 ID 목록
+        """
+        self.load()
+        text_hashes = text_hashes or {}
+        with self.lock:
+            self._dirty_matrices.add(agent_name)
+            matrix = self._matrix(agent_name)
+            for memory_id, memory_embeddings in embeddings.items():
+                memory_id = str(memory_id)
+                matrix.set(memory_id, memory_embeddings, replace=False, text_hashes=text_hashes.get(memory_id))
+                self._update_ann(agent_name, memory_id)
+            for memory_id in removed or []:
+                matrix.delete(memory_id)
+                self._remove_ann(agent_name, memory_id)
+
+    # ------------------------------------------------------------------
+    # 임베딩 조회
+    # ------------------------------------------------------------------
+
+    def get_embedding_matrix(self, agent_name: str) -> EmbeddingMatrix:
+        """
+        에이전트의 임베딩 행렬을 반환합니다. (저장소 원본이므로 읽기 전용으로 사용)
+
+        Args:
+            agent_name: 에이전트 이름
+
+        Returns:
+            EmbeddingMatrix: 임베딩 행렬 (없으면 빈 행렬)
+        """
+        self.load()
+        with self.lock:
+            return self._matrix(agent_name)
+
+    def get_embeddings(self, agent_name: str, memory_id: str) -> Dict[str, Any]:
+        """메모리 하나의 임베딩을 {"event": [...], "action": [...], "feedback": [...]} 형태로 반환"""
+        self.load()
+        with self.lock:
+            matrix = self._matrices.get(agent_name)
+            if matrix is None:
+                return {}
+            return matrix.get(memory_id) or {}
+
+    # ------------------------------------------------------------------
+    # 조회
+    # ------------------------------------------------------------------
+
+    def _time_index(self, agent_name: str) -> TimeIndex:
+        """에이전트 시간 인덱스를 가져오고, 없으면 메모리로 만듭니다. (lock 보유 상태에서 호출)"""
+        index = self._time_indexes.get(agent_name)
+        if index is None:
+            agent_data = self._data.get(agent_name)
+            index = TimeIndex.build(agent_data.get("memories", {}) if isinstance(agent_data, dict) else {})
+            self._time_indexes[agent_name] = index
+        return index
+
+    def recent_memory_ids(self, agent_name: str, limit: Optional[int] = None,
+                          exclude: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        최신순 메모리 ID 목록 (시간이 같으면 저장 순서)
+
+        Args:
+            agent_name: 에이전트 이름
+            limit: 최대 개수 (None이면 전체)
+            exclude: 제외할 메모리 ID
+
+        Returns:
+            List[str]: 메모리 ID 목록
+        """
+        self.load()
+        with self.lock:
+            index = self._time_index(agent_name)
+            if not exclude:
+                return index.latest(limit)
+            excluded = set(exclude)
+            result = []
+            for memory_id in index.newest_first():
+                if limit is not None and len(result) >= limit:
+                    break
+                if memory_id not in excluded:
+                    result.append(memory_id)
+            return result
+
+    def memory_ids_on_date(self, agent_name: str, date_str: str) -> List[str]:
+        """
+        지정한 날짜(YYYY.MM.DD)의 메모리 ID 목록 (시간순)
+
+        Args:
+            agent_name: 에이전트 이름
+            date_str: 날짜 문자열
+
+        Returns:
+            List[str]: 메모리 ID 목록
+        """
+        day = date_minutes(date_str)
+        if day is None:
+            return []
+        self.load()
+        with self.lock:
+            return self._time_index(agent_name).between(*day)
+
+    def find_memory_ids(self, agent_name: str, event_type: str, event_location: Optional[str] = None) -> List[str]:
+        """
+        event_type(과 event_location)이 일치하는 메모리 ID 목록 (최신순, 시간이 같으면 저장 순서)
+
+        Args:
+            agent_name: 에이전트 이름
+            event_type: 이벤트 종류 (예: "conversation")
+            event_location: 이벤트 위치 (None이면 위치와 관계없이)
+
+        Returns:
+            List[str]: 메모리 ID 목록
+        """
+        data = self.load()
+        with self.lock:
+            memories = data.get(agent_name, {}).get("memories", {})
+            matches = [memory_id for memory_id, memory in memories.items()
+                       if memory.get("event_type") == event_type
+                       and (event_location is None or memory.get("event_location") == event_location)]
+            return sort_newest_first(matches, self._time_index(agent_name))
+
+    def latest_memory_date(self) -> str:
+        """모든 에이전트의 메모리 중 가장 최근 날짜 (YYYY.MM.DD, 없으면 빈 문자열)"""
+        data = self.load()
+        with self.lock:
+            minutes = [self._time_index(agent_name).latest_minute()
+                       for agent_name, agent_data in data.items() if isinstance(agent_data, dict)]
+        return minute_date(max((minute for minute in minutes if minute is not None), default=None))
+
+    # ------------------------------------------------------------------
+    # ANN 인덱스
+    # ------------------------------------------------------------------
+
+    def enable_ann_index(self, **config):
+        """
+        에이전트별 IVF 근사 검색 인덱스 사용 (설정은 IVFIndex 생성자 인자)
+
+        예: store.enable_ann_index(nprobe=8, min_size=5000, target_recall=0.95)
+        """
+        with self.lock:
+            self._ann_config = dict(config)
+            self._reset_ann_indexes()
+
+    def disable_ann_index(self):
+        """ANN 인덱스 사용 중지 (항상 전체 검색)"""
+        with self.lock:
+            self._ann_config = None
+            self._reset_ann_indexes()
+
+    def _reset_ann_indexes(self):
+        """모든 ANN 인덱스를 버림 (lock 보유 상태에서 호출)"""
+        self._ann_indexes = {}
+        self._ann_generation += 1
+
+    def _update_ann(self, agent_name: str, memory_id: str):
+        """학습된 인덱스가 있으면 메모리 하나만 다시 배정 (lock 보유 상태에서 호출)"""
+        if agent_name in self._ann_training:
+            self._ann_training[agent_name].add(memory_id)
+        index = self._ann_indexes.get(agent_name)
+        if index is not None and index.is_trained:
+            index.update(memory_id, self._matrices[agent_name])
+
+    def _remove_ann(self, agent_name: str, memory_id: str):
+        """인덱스에서 메모리 하나를 제거 (lock 보유 상태에서 호출)"""
+        if agent_name in self._ann_training:
+            self._ann_training[agent_name].add(memory_id)
+        if agent_name in self._ann_indexes:
+            self._ann_indexes[agent_name].remove(memory_id)
+
+    def _train_ann_index(self, agent_name: str, matrix: EmbeddingMatrix, config: Dict[str, Any],
+                         generation: int) -> Optional[IVFIndex]:
+        """
+        복사한 행렬로 lock 밖에서 인덱스를 학습한 뒤 lock 안에서 교체
+
+        학습하는 동안 다른 에이전트(와 같은 에이전트)의 읽기 / 쓰기는 막히지 않습니다.
+        학습 중에 바뀐 메모리는 교체 직전에 현재 행렬 기준으로 다시 배정하고,
+        그 사이 인덱스가 모두 버려졌으면(replace, 설정 변경) 학습 결과를 쓰지 않습니다.
+
+        Returns:
+            Optional[IVFIndex]: 교체한 인덱스 (학습 실패 / 결과를 버린 경우 None)
+        """
+        index = IVFIndex(**config)
+        try:
+            index.build(matrix)
+        except Exception as e:
+            print(f"⚠️ {agent_name} ANN 인덱스 학습 실패: {e}")
+            with self.lock:
+                self._ann_training.pop(agent_name, None)
+            return None
+        with self.lock:
+            changed = self._ann_training.pop(agent_name, set())
+            live = self._matrices.get(agent_name)
+            if generation != self._ann_generation or live is None:
+                return None
+            for memory_id in changed:
+                index.update(memory_id, live)
+            self._ann_indexes[agent_name] = index
+            return index
+
+    def find_ann_candidates(self, agent_name: str, queries: List[List[float]]) -> Optional[List[str]]:
+        """
+        ANN 인덱스로 유사도 계산 후보 메모리 ID를 찾습니다.
+
+        인덱스 학습(k-means, nprobe 보정)은 저장소 lock 밖에서 행렬 사본으로 수행합니다.
+        다른 스레드가 학습 중이면 기존 인덱스로 검색하고, 기존 인덱스가 없으면 전체 검색(None)합니다.
+
+        Args:
+            agent_name: 에이전트 이름
+            queries: 질의 임베딩들 (이벤트, 상태 등)
+
+        Returns:
+            Optional[List[str]]: 후보 메모리 ID 목록, 인덱스를 쓰지 않는 경우(비활성/메모리 수 부족/학습 중) None
+        """
+        if self._ann_config is None:
+            return None
+        self.load()
+        snapshot = None
+        with self.lock:
+            if self._ann_config is None:
+                return None
+            matrix = self._matrices.get(agent_name)
+            min_size = self._ann_config.get("min_size", 5000)
+            if matrix is None or len(matrix) < min_size:
+                return None
+            index = self._ann_indexes.get(agent_name)
+            if (index is None or index.needs_rebuild(matrix)) and agent_name not in self._ann_training:
+                self._ann_training[agent_name] = set()
+                snapshot = matrix.copy()
+                config = dict(self._ann_config)
+                generation = self._ann_generation
+
+        if snapshot is not None:
+            index = self._train_ann_index(agent_name, snapshot, config, generation) or index
+        if index is None or not index.is_trained:
+            return None
+
+        normalized = []
+        for query in queries:
+            vector = np.asarray(query if query is not None else [], dtype=np.float32)
+            norm = np.linalg.norm(vector) if vector.size else 0.0
+            if norm > 0:
+                normalized.append(vector / norm)
+        with self.lock:
+            return list(index.search(normalized))
+
+    def export_embeddings(self, agent_name: str) -> Dict[str, Dict[str, Any]]:
+        """에이전트 임베딩 전체를 예전 JSON 구조로 반환 (내보내기/호환용)"""
+        self.load()
+        with self.lock:
+            matrix = self._matrices.get(agent_name)
+            return matrix.to_dict() if matrix is not None else {}
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def _start_compaction_thread(self):
+        """백그라운드에서 저널을 스냅샷으로 합치는 스레드를 시작합니다."""
+        self.compaction_thread = threading.Thread(target=self._compaction_loop, daemon=True)
+        self.compaction_thread.start()
+
+    def _compaction_loop(self):
+        """compact_interval 마다, 또는 레코드가 많이 쌓였을 때 compaction 수행"""
+        while not self._stop_event.is_set():
+            self._compact_requested.wait(timeout=1.0)
+            if self._stop_event.is_set():
+                break
+            due = (time.time() - self._last_compaction) >= self.compact_interval
+            if self._compact_requested.is_set() or (due and self._journal_records > 0):
+                self._compact_requested.clear()
+                self.compact()
+
+    def _rotate_journal(self):
+        """현재 저널을 journal.1로 넘기고 새 저널을 시작합니다. (lock 보유 상태에서 호출)"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if not os.path.exists(self.journal_file):
+            return
+        if os.path.exists(self.rotated_journal_file):
+            # 이전 compaction이 끝나지 못한 경우 기존 journal.1 뒤에 이어 붙임
+            with open(self.journal_file, 'r', encoding='utf-8') as src, \
+                    open(self.rotated_journal_file, 'a', encoding='utf-8') as dst:
+                dst.write(src.read())
+            os.remove(self.journal_file)
+        else:
+            os.replace(self.journal_file, self.rotated_journal_file)
+
+    def compact(self) -> bool:
+        """
+        바뀐 에이전트의 스냅샷 파일과 임베딩이 바뀐 에이전트의 행렬 파일만 새로 기록하고 반영된 저널을 삭제합니다.
+        기록 비용은 전체 에이전트 수가 아니라 마지막 compaction 이후 바뀐 양에 비례합니다.
+
+        직렬화와 저널 교체만 lock 안에서 수행하고, 파일 기록은 lock 밖에서 수행하므로
+        그 사이에 들어온 쓰기는 새 저널에 계속 기록됩니다.
+
+        Returns:
+            bool: 성공 여부
+        """
+        with self._compact_lock:
+            with self.lock:
+                if self._data is None:
+                    return True
+                dirty = set(self._dirty_agents)
+                dirty_matrices = set(self._dirty_matrices)
+                try:
+                    payloads = self._serialize_snapshots(dirty)
+                except Exception as e:
+                    print(f"메모리 직렬화 중 오류 발생: {e}")
+                    return False
+                matrices = {agent_name: self._matrices[agent_name].copy()
+                            for agent_name in dirty_matrices if agent_name in self._matrices}
+                removed = (dirty | dirty_matrices) - set(self._data)
+                self._dirty_agents.clear()
+                self._dirty_matrices.clear()
+                self._rotate_journal()
+                self._journal_records = 0
+                self._last_compaction = time.time()
+
+            try:
+                self._write_matrices(matrices, removed)
+                self._write_snapshots(payloads, removed)
+                if os.path.exists(self.rotated_journal_file):
+                    os.remove(self.rotated_journal_file)
+                return True
+            except Exception as e:
+                # journal.1이 남아 있으므로 다음 시작 시 재생되고, 다음 compaction 때 다시 기록함
+                with self.lock:
+                    self._dirty_agents.update(dirty)
+                    self._dirty_matrices.update(dirty_matrices)
+                print(f"메모리 스냅샷 저장 중 오류 발생: {e}")
+                return False
+
+    def _serialize_snapshots(self, dirty) -> Dict[str, str]:
+        """바뀐 에이전트의 스냅샷 JSON 직렬화 (lock 보유 상태에서 호출)"""
+        return {agent_name: json.dumps(self._data[agent_name], ensure_ascii=False, indent=2)
+                for agent_name in dirty if agent_name in self._data}
+
+    def _write_snapshots(self, payloads: Dict[str, str], removed):
+        """에이전트별 스냅샷 파일 기록, 사라진 에이전트(removed)의 파일은 삭제"""
+        for agent_name, payload in payloads.items():
+            write_text_atomic(self._shard_path(agent_name), payload, fsync=True)
+        for agent_name in removed:
+            if os.path.exists(self._shard_path(agent_name)):
+                os.remove(self._shard_path(agent_name))
+        if self._legacy_snapshot:
+            # 모든 에이전트가 에이전트별 파일로 옮겨졌으므로 예전 스냅샷은 더 이상 읽지 않음
+            os.replace(self.memories_file, self.memories_file + ".migrated")
+            self._legacy_snapshot = False
+
+    def _write_matrices(self, matrices: Dict[str, EmbeddingMatrix], removed=()):
+        """에이전트별 임베딩 행렬 파일 기록, 사라진 에이전트(removed)의 파일은 삭제"""
+        os.makedirs(self.embeddings_dir, exist_ok=True)
+        for agent_name, matrix in matrices.items():
+            matrix.save(self._matrix_path(agent_name), fsync=True)
+            self._remove_files(self._legacy_matrix_paths(agent_name))
+        for agent_name in removed:
+            self._remove_files((self._matrix_path(agent_name),) + self._legacy_matrix_paths(agent_name))
+
+    @staticmethod
+    def _remove_files(paths):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def flush(self) -> bool:
+        """남은 저널을 즉시 스냅샷에 반영"""
+        return self.compact()
+
+    def close(self):
+        """compaction 스레드를 멈추고 남은 저널을 스냅샷에 반영"""
+        self._stop_event.set()
+        self._compact_requested.set()
+        if self._journal_records > 0:
+            self.compact()
+        with self.lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+_stores: Dict[str, MemoryStore] = {}
+_stores_lock = threading.Lock()
+_store_config: Dict[str, Any] = {"backend": "json"}
+
+
+def configure_memory_store(backend: str = "json", **options):
+    """
+    이후 get_memory_store()가 만드는 저장소의 백엔드와 생성자 옵션 설정 (이미 만든 저장소에는 적용되지 않음)
+
+    Args:
+        backend: "json"(에이전트별 JSON 스냅샷 + 저널) 또는 "sqlite"(WAL 모드 sqlite3 파일 + 색인)
+        options: 저장소 생성자 인자 (compact_interval, compact_threshold, fsync, sqlite의 db_file 등)
+    """
+    if backend not in ("json", "sqlite"):
+        raise ValueError(f"알 수 없는 메모리 저장소 백엔드: {backend}")
+    with _stores_lock:
+        _store_config.clear()
+        _store_config.update(options, backend=backend)
+
+
+def _create_store(memories_file: str) -> MemoryStore:
+    options = dict(_store_config)
+    if options.pop("backend") == "sqlite":
+        from .sqlite_memory_store import SQLiteMemoryStore
+        return SQLiteMemoryStore(memories_file, **options)
+    return MemoryStore(memories_file, **options)
+
+
+def get_memory_store(memories_file: str) -> MemoryStore:
+    """
+    파일 경로별로 하나의 MemoryStore를 반환합니다.
+
+    Args:
+        memories_file: 메모리 JSON 파일 경로
+
+    Returns:
+        MemoryStore: 공유 저장소 인스턴스
+    """
+    key = os.path.normcase(os.path.abspath(str(memories_file)))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _create_store(key)
+            _stores[key] = store
+        return store
+
+
+@atexit.register
+def _flush_all_stores():
+    """프로세스 종료 시 남은 저널을 스냅샷에 반영"""
+    for store in list(_stores.values()):
+        store.close()
@@ -1,14 +1,17 @@
-import json
 import os
-from typing import List, Dict, Any
-import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
 from numpy import dot
 from numpy.linalg import norm
+from .memory_store import get_memory_store, default_memories
+from .embedding_cache import get_embedding_cache
+from .agent_locks import get_agent_locks
+from .agent_shards import get_reflection_shards, get_plan_shards
 
 class MemoryUtils:
-    def __init__(self, word2vec_model):
+    def __init__(self, word2vec_model, ann_config: Dict[str, Any] = None,
+                 embedding_cache_config: Dict[str, Any] = None):
         # 현재 파일의 절대 경로를 기준으로 상위 디렉토리 찾기
         current_dir = Path(__file__).parent
         root_dir = current_dir.parent.parent  # AI 디렉토리
@@ -18,153 +21,141 @@ class MemoryUtils:
         self.memories_file = str(data_dir / "memories.json")
         self.plans_file = str(data_dir / "plans.json")
         self.reflections_file = str(data_dir / "reflections.json")
+
+        # 반성 / 계획은 에이전트별 파일로 저장 (reflections/<에이전트>.json, plans/<에이전트>.json)
+        self.reflection_shards = get_reflection_shards(self.reflections_file)
+        self.plan_shards = get_plan_shards(self.plans_file)
+
+        # 에이전트별 비동기 잠금 (같은 데이터 디렉토리를 쓰는 모듈끼리 공유)
+        self.agent_locks = get_agent_locks(str(data_dir))
         
         # Word2Vec 모델 설정
         self.model = word2vec_model
+
+        # 문장 임베딩 캐시 (같은 모델을 쓰는 모듈끼리 공유, 설정은 처음 만들 때만 적용)
+        self.embedding_cache = get_embedding_cache(word2vec_model, **(embedding_cache_config or {}))
         
         self._ensure_files_exist()
 
+        # 프로세스에 상주하는 메모리 저장소 (같은 파일을 쓰는 모듈끼리 공유)
+        self.store = get_memory_store(self.memories_file)
+
+        # 메모리가 많은 에이전트용 근사 검색 인덱스 (None이면 항상 전체 검색)
+        if ann_config is not None:
+            self.store.enable_ann_index(**ann_config)
+
+    def agent_lock(self, *agent_names: str):
+        """에이전트 잠금 (async with로 사용, 같은 에이전트의 메모리 읽기 / 쓰기를 순서대로 실행)"""
+        return self.agent_locks.agent(*agent_names)
+
+    def exclusive_lock(self):
+        """모든 에이전트 잠금 (async with로 사용, 전체 데이터 저장 / 로드 / 초기화용)"""
+        return self.agent_locks.exclusive()
+
     def _ensure_files_exist(self):
-        """필요한 JSON 파일들이 존재하는지 확인하고, 없다면 생성"""
-        for file_path in [self.memories_file, self.plans_file, self.reflections_file]:
-            if not os.path.exists(file_path):
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    if file_path == self.memories_file:
-                        # 새로운 메모리 구조로 초기화
-                        json.dump({
-                            "Tom": {
-                                "memories": {},
-                                "embeddings": {}
-                            },
-                            "Jane": {
-                                "memories": {},
-                                "embeddings": {}
-                            }
-                        }, f, ensure_ascii=False, indent=2)
-                    elif file_path == self.reflections_file:
-                        json.dump({"Tom": {"reflections": []}, "Jane": {"reflections": []}}, f, ensure_ascii=False, indent=2)
-                    else:
-                        json.dump({"Tom": {}, "Jane": {}}, f, ensure_ascii=False, indent=2)
+        """
+        데이터 디렉토리를 만들고, 예전 단일 반성 / 계획 파일이 있으면 에이전트별 파일로 나눔
+
+        에이전트별 파일은 처음 기록할 때 생성되며, 없는 에이전트는 기본 구조로 읽힙니다.
+        (메모리 파일은 저장소가 처음 로드할 때 나눔)
+        """
+        os.makedirs(os.path.dirname(self.memories_file), exist_ok=True)
+        self.reflection_shards.migrate()
+        self.plan_shards.migrate()
 
     def _load_memories(self, sort_by_time: bool = False) -> Dict[str, Dict[str, Dict[str, Dict[str, Any]]]]:
-        """메모리 데이터 로드. 필요에 따라 시간순으로 정렬합니다."""
+        """
+        메모리 데이터 로드. 필요에 따라 시간순으로 정렬합니다.
+
+        파일을 다시 읽지 않고 상주 저장소의 데이터를 반환합니다.
+        정렬을 요청한 경우 원본 순서는 유지하고, 정렬된 memories를 가진 사본 구조를 반환합니다.
+        """
         try:
-            with open(self.memories_file, 'r', encoding='utf-8') as f:
-                memories_data = json.load(f)
+            memories_data = self.store.load()
             
             if sort_by_time:
-                # 각 에이전트의 메모리를 시간 역순으로 정렬
-                for agent_name in memories_data:
-                    if "memories" in memories_data[agent_name] and isinstance(memories_data[agent_name]["memories"], dict):
-                        # 메모리 항목들을 시간 기준으로 정렬
-                        # strptime 포맷을 유연하게 처리하기 위해 여러 포맷 시도
-                        def parse_time(time_str):
-                            formats_to_try = [
-                                "%Y.%m.%d.%H:%M:%S", 
-                                "%Y.%m.%d.%H:%M",
-                                "%Y-%m-%dT%H:%M:%S.%fZ", # ISO 8601 format
-                                "%Y-%m-%d %H:%M:%S" # 다른 일반적인 포맷
-                            ]
-                            for fmt in formats_to_try:
-                                try:
-                                    return datetime.strptime(time_str, fmt)
-                                except ValueError:
-                                    continue
-                            # 모든 포맷에 실패하면 None 반환 또는 에러 처리
-                            print(f"Warning: Could not parse time string {time_str} for agent {agent_name}")
-                            return datetime.min # 정렬에서 가장 오래된 것으로 처리
-
-                        memory_items = []
-                        for mem_id, mem_content in memories_data[agent_name]["memories"].items():
-                            parsed_time = parse_time(mem_content.get("time", ""))
-                            memory_items.append((mem_id, mem_content, parsed_time))
-
-                        # 시간(parsed_time)을 기준으로 내림차순 정렬
-                        sorted_memory_items = sorted(
-                            memory_items,
-                            key=lambda item: item[2], # item[2]는 parsed_time
-                            reverse=True
-                        )
-                        
-                        # 정렬된 결과를 새 딕셔너리에 저장
-                        ordered_memories = {mem_id: mem_content for mem_id, mem_content, _ in sorted_memory_items}
-                        memories_data[agent_name]["memories"] = ordered_memories
+                sorted_data = {}
+                # 각 에이전트의 메모리를 시간 역순으로 정렬 (다른 에이전트가 추가되는 중에도 순회할 수 있도록 목록으로 복사)
+                for agent_name in list(memories_data):
+                    agent_data = memories_data[agent_name]
+                    if "memories" in agent_data and isinstance(agent_data["memories"], dict):
+                        # 저장소의 시간 인덱스(기록할 때 계산한 게임 분)에서 최신순 ID를 바로 읽음
+                        memories = agent_data["memories"]
+                        ordered_memories = {}
+                        for mem_id in self.store.recent_memory_ids(agent_name):
+                            mem_content = memories.get(mem_id)
+                            if mem_content is not None:
+                                ordered_memories[mem_id] = mem_content
+                        sorted_data[agent_name] = dict(agent_data, memories=ordered_memories)
+                    else:
+                        sorted_data[agent_name] = agent_data
+                return sorted_data
             
             return memories_data
         except Exception as e:
             print(f"메모리 로드 중 오류 발생: {e}")
-            return {
-                "Tom": {
-                    "memories": {},
-                    "embeddings": {}
-                },
-                "Jane": {
-                    "memories": {},
-                    "embeddings": {}
-                }
-            }
+            return default_memories()
 
     def _save_memories(self, memories: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]]):
-        """메모리 데이터 저장"""
+        """
+        메모리 데이터 전체 저장 (대량 변경용, 새 스냅샷을 기록)
+
+        개별 메모리 변경은 self.store.put_memory / update_memory / delete_memory 를 사용하면
+        전체 파일을 다시 쓰지 않고 저널에 한 줄만 추가됩니다.
+        """
         try:
-            with open(self.memories_file, 'w', encoding='utf-8') as f:
-                json.dump(memories, f, ensure_ascii=False, indent=2)
+            self.store.replace(memories)
         except Exception as e:
             print(f"메모리 저장 중 오류 발생: {e}")
 
+    def get_embedding_matrix(self, agent_name: str):
+        """에이전트의 메모리 임베딩 행렬 (EmbeddingMatrix, 메모리 ID → 행) 반환"""
+        return self.store.get_embedding_matrix(agent_name)
+
+    def find_memory_candidates(self, agent_name: str, event_embedding: List[float], state_embedding: List[float]):
+        """ANN 인덱스로 유사도 계산 대상 메모리 ID를 좁힘 (인덱스를 쓰지 않으면 None → 전체 검색)"""
+        return self.store.find_ann_candidates(agent_name, [event_embedding, state_embedding])
+
+    def recent_memory_ids(self, agent_name: str, limit: Optional[int] = None, exclude=None) -> List[str]:
+        """저장소 시간 인덱스에서 최신순 메모리 ID를 가져옴 (시간 문자열을 해석 / 정렬하지 않음)"""
+        return self.store.recent_memory_ids(agent_name, limit, exclude=exclude)
+
     def _load_reflections(self) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
-        """반성 데이터 로드"""
+        """반성 데이터 로드 (모든 에이전트의 반성 파일을 하나의 딕셔너리로 조립)"""
         try:
-            with open(self.reflections_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.reflection_shards.load_all()
         except Exception as e:
             print(f"반성 데이터 로드 중 오류 발생: {e}")
             return {"Tom": {"reflections": []}, "Jane": {"reflections": []}}
 
     def _save_reflections(self, reflections: Dict[str, Dict[str, List[Dict[str, Any]]]]):
-        """반성 데이터 저장"""
+        """반성 데이터 저장 (에이전트별 파일로 나눠 기록, 없어진 에이전트의 파일은 삭제)"""
         try:
-            with open(self.reflections_file, 'w', encoding='utf-8') as f:
-                json.dump(reflections, f, ensure_ascii=False, indent=2)
+            self.reflection_shards.save_all(reflections)
         except Exception as e:
             print(f"반성 데이터 저장 중 오류 발생: {e}")
 
-    def _get_next_memory_id(self, agent_name: str) -> str:
-        """에이전트의 다음 메모리 ID를 가져옴"""
-        memories = self._load_memories()
-        
-        if agent_name not in memories or "memories" not in memories[agent_name]:
-            return "1"
-            
-        agent_memories = memories[agent_name]["memories"]
-        if not agent_memories:
-            return "1"
-            
-        # 현재 메모리 ID 중 가장 큰 값을 찾음
+    def _save_agent_reflections(self, agent_name: str, agent_reflections: Dict[str, List[Dict[str, Any]]]):
+        """에이전트 한 명의 반성 데이터만 저장 ({"reflections": [...]}, 다른 에이전트의 파일은 건드리지 않음)"""
         try:
-            memory_ids = [int(id) for id in agent_memories.keys()]
-            return str(max(memory_ids) + 1)
-        except ValueError:
-            return "1"
+            self.reflection_shards.save_agent(agent_name, agent_reflections)
+        except Exception as e:
+            print(f"{agent_name} 반성 데이터 저장 중 오류 발생: {e}")
+
+    def _get_next_memory_id(self, agent_name: str) -> str:
+        """
+        에이전트의 다음 메모리 ID를 가져옴
+
+        조회만 하므로 새 메모리를 저장할 때는 ID 발급과 기록을 한 번에 하는 store.add_memory를 사용합니다.
+        """
+        return self.store.next_memory_id(agent_name)
 
     def save_memory(self, event_sentence: str, embedding: List[float], event_time: str, agent_name: str, event_role: str = "", importance:int = 0):
         """새로운 메모리 저장"""
-        memories = self._load_memories()
-        
-        if agent_name not in memories:
-            memories[agent_name] = {
-                "memories": {},
-                "embeddings": {}
-            }
-            
         # 현재 시간이 제공되지 않은 경우 현재 시간 사용
         if not event_time:
             event_time = datetime.now().strftime("%Y.%m.%d.%H:%M")
         
-        # 새 메모리 ID 생성
-        memory_id = self._get_next_memory_id(agent_name)
-            
         # 메모리 데이터 저장
         memory = {
             "event_role": event_role,
@@ -194,20 +185,15 @@ class MemoryUtils:
         if importance != 0 : 
             memory["importance"] = importance
 
-        # 메모리와 임베딩을 별도로 저장
-        memories[agent_name]["memories"][memory_id] = memory
-        
-        # 임베딩 데이터 저장
+        # 임베딩 데이터
         embeddings = {
             "event": embedding,
             "action": [],
             "feedback": []
         }
-        memories[agent_name]["embeddings"][memory_id] = embeddings
-        
-        self._save_memories(memories)
         
-        return memory_id
+        # 새 메모리 ID 발급과 메모리 / 임베딩 저장을 저널 레코드 하나로 수행
+        return self.store.add_memory(agent_name, memory, embeddings)
 
     def get_embedding(self, text: str) -> List[float]:
         """
@@ -220,26 +206,21 @@ class MemoryUtils:
             List[float]: 임베딩 벡터
         """
 
-        # 특수문자 제거 (공백 제외)
-        import re
-        cleaned_text = re.sub(r'[^\w\s]', '', text)    
+        # 정규화된 텍스트 기준으로 캐시된 임베딩 사용 (없으면 계산 후 저장)
+        return self.embedding_cache.get_embedding(self.model, text)
 
-        # 토큰화 및 소문자 변환
-        tokens = [w.lower() for w in cleaned_text.split() if w.lower() in self.model]
-        
-        if not tokens:
-            return [0.0] * self.model.vector_size
+    def get_embeddings(self, texts: List[str], as_array: bool = False):
+        """
+        여러 텍스트를 한꺼번에 임베딩 벡터로 변환 (대량 처리용)
         
-        # 단어 벡터의 평균을 문장 벡터로 사용
-        word_vectors = [self.model[w] for w in tokens]
-        sentence_vector = np.mean(word_vectors, axis=0)
+        Args:
+            texts: 임베딩할 텍스트 리스트
+            as_array: True면 (텍스트 수, 차원) np.ndarray로 반환
         
-        # 정규화
-        norm = np.linalg.norm(sentence_vector)
-        if norm > 0:
-            sentence_vector = sentence_vector / norm
-            
-        return sentence_vector.tolist()
+        Returns:
+            texts와 같은 순서의 임베딩 벡터 리스트 (as_array면 np.ndarray)
+        """
+        return self.embedding_cache.get_embeddings(self.model, texts, as_array=as_array)
 
     def event_to_sentence(self, event: Dict[str, Any]) -> str:
         """이벤트를 문장으로 변환"""
@@ -250,34 +231,60 @@ class MemoryUtils:
             return f"{event_description} at {event_location}"
         return event_description
 
+    def _save_perception_memory(self, event: Dict[str, Any], agent_name: str) -> str:
+        """관찰 정보를 새 메모리로 저장하고 메모리 ID 반환"""
+        event_sentence = event.get("event_description", "")
+        embedding = self.get_embedding(event_sentence)
+        event_role = event.get("event_role", "")
+        event_time = event.get("time", datetime.now().strftime("%Y.%m.%d.%H:%M"))
+        if event.get("importance", 0) != 0:
+            return self.save_memory(event_sentence, embedding, event_time, agent_name, event_role, importance=event.get("importance", 0))
+        return self.save_memory(event_sentence, embedding, event_time, agent_name, event_role)
+
     def save_perception(self, event: Dict[str, Any], agent_name: str) -> bool:
         """관찰 정보를 메모리에 저장"""
         try:
-            event_sentence = event.get("event_description", "")
-            embedding = self.get_embedding(event_sentence)
-            event_role = event.get("event_role", "")
-            event_time = event.get("time", datetime.now().strftime("%Y.%m.%d.%H:%M"))
-            if event.get("importance", 0) != 0:
-                memory_id = self.save_memory(event_sentence, embedding, event_time, agent_name, event_role, importance=event.get("importance", 0))
-            else:   
-                memory_id = self.save_memory(event_sentence, embedding, event_time, agent_name, event_role)
+            self._save_perception_memory(event, agent_name)
             return True
         except Exception as e:
             print(f"관찰 정보 저장 실패: {e}")
             return False
 
+    def save_or_merge_perception(self, event: Dict[str, Any], agent_name: str, memory_id: str = None) -> Tuple[Optional[str], bool]:
+        """
+        반복된 관찰은 기존 메모리에 합치고, 아니면 새 메모리로 저장
+
+        memory_id의 메모리가 같은 관찰이면 새 메모리를 만들지 않고 count(관찰 횟수)와
+        last_seen(마지막 관찰 시간)만 갱신합니다.
+
+        Args:
+            event: 관찰 이벤트
+            agent_name: 에이전트 이름
+            memory_id: 같은 관찰을 저장했던 메모리 ID (없으면 새로 저장)
+
+        Returns:
+            (메모리 ID, 합쳤는지 여부) - 저장 실패 시 (None, False)
+        """
+        try:
+            event_sentence = event.get("event_description", "")
+            event_time = event.get("time", datetime.now().strftime("%Y.%m.%d.%H:%M"))
+            if memory_id is not None:
+                memory = self._load_memories().get(agent_name, {}).get("memories", {}).get(str(memory_id))
+                if memory is not None and memory.get("event") == event_sentence:
+                    self.store.update_memory(agent_name, memory_id, {
+                        "count": memory.get("count", 1) + 1,
+                        "last_seen": event_time
+                    })
+                    return str(memory_id), True
+            return self._save_perception_memory(event, agent_name), False
+        except Exception as e:
+            print(f"관찰 정보 저장 실패: {e}")
+            return None, False
+
 ######################## 위치 저장하는 메소드 라인 ################################
 
     def overwrite_location_memory(self, event_sentence: str, embedding: List[float], event_location: str, event_type: str, event_time: str, agent_name: str, event_role: str = "", importance:int = 0):
         """기존 메모리 덮어쓰기"""
-        memories = self._load_memories(sort_by_time=True)
-        
-        if agent_name not in memories:
-            memories[agent_name] = {
-                "memories": {},
-                "embeddings": {}
-            }
-            
         # 현재 시간이 제공되지 않은 경우 현재 시간 사용
         if not event_time:
             event_time = datetime.now().strftime("%Y.%m.%d.%H:%M")
@@ -286,29 +293,20 @@ class MemoryUtils:
         older_duplicate_ids_to_delete = []
 
         # 기존 메모리에서 event_type과 event_location이 일치하는지 확인
-        # _load_memories(sort_by_time=True)로 인해 memories는 최신순으로 정렬되어 있음
-        if agent_name in memories and "memories" in memories[agent_name]:
-            for mem_id, mem_data in memories[agent_name]["memories"].items():
-                if mem_data.get("event_type") == event_type and \
-                   mem_data.get("event_location") == event_location:
-                    if most_recent_match_id is None: # 첫 번째 일치 항목 (가장 최신)
-                        most_recent_match_id = mem_id
-                    else: # 이후 일치 항목 (오래된 중복)
-                        older_duplicate_ids_to_delete.append(mem_id)
+        # (저장소 조회 결과는 최신순, SQLite 백엔드는 (agent, event_type, event_location) 색인 조회)
+        for mem_id in self.store.find_memory_ids(agent_name, event_type, event_location):
+            if most_recent_match_id is None: # 첫 번째 일치 항목 (가장 최신)
+                most_recent_match_id = mem_id
+            else: # 이후 일치 항목 (오래된 중복)
+                older_duplicate_ids_to_delete.append(mem_id)
         
-        # 오래된 중복 메모리 삭제
+        # 오래된 중복 메모리 삭제 (연결된 임베딩도 함께 삭제됨)
         if older_duplicate_ids_to_delete:
             for del_id in older_duplicate_ids_to_delete:
-                if del_id in memories[agent_name]["memories"]:
-                    del memories[agent_name]["memories"][del_id]
-                if del_id in memories[agent_name]["embeddings"]: # 연결된 임베딩도 삭제
-                    del memories[agent_name]["embeddings"][del_id]
-
-        # 사용할 메모리 ID 결정
-        if most_recent_match_id:
-            memory_id = most_recent_match_id
-        else:
-            memory_id = self._get_next_memory_id(agent_name)
+                self.store.delete_memory(agent_name, del_id)
+
+        # 사용할 메모리 ID 결정 (일치하는 메모리가 없으면 저장할 때 새 ID 발급)
+        memory_id = most_recent_match_id
 
         ## 디버그용 기본점수
         if importance == 0:
@@ -330,7 +328,7 @@ class MemoryUtils:
         
 
         print(f"memory: {memory}")
-        print(f"memory_id: {memory_id}")
+        print(f"memory_id: {memory_id or '(새 ID 발급)'}")
         # if event_role != "" and event_role != " ":
         #     memory["importance"] = 8
         
@@ -346,18 +344,18 @@ class MemoryUtils:
         if importance != 0 : 
             memory["importance"] = importance
 
-        # 메모리와 임베딩을 별도로 저장
-        memories[agent_name]["memories"][memory_id] = memory
-        
-        # 임베딩 데이터 저장
+        # 임베딩 데이터
         embeddings = {
             "event": embedding,
             "action": [],
             "feedback": []
         }
-        memories[agent_name]["embeddings"][memory_id] = embeddings
         
-        self._save_memories(memories)
+        # 메모리와 임베딩을 저널 레코드 하나로 저장
+        if memory_id:
+            self.store.put_memory(agent_name, memory_id, memory, embeddings)
+        else:
+            memory_id = self.store.add_memory(agent_name, memory, embeddings)
         
         return memory_id
 
@@ -0,0 +1,124 @@
+"""
+오브젝트 임베딩 인덱스 모듈
+
+object_embeddings.json의 오브젝트 임베딩을 정규화된 행렬과 이름 인덱스로 미리 만들어 두고,
+이벤트/상태 임베딩과의 유사도를 행렬-벡터 곱 두 번과 argpartition으로 계산합니다.
+서버 시작 시, 그리고 EmbeddingUpdater.create_object_embeddings 실행 시 다시 만듭니다.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+DEFAULT_SIMILARITY = 0.01
+
+
+class ObjectEmbeddingIndex:
+    def __init__(self, object_embeddings: Optional[Dict[str, Dict[str, List[float]]]] = None, field: str = "name_only"):
+        """
+        오브젝트 임베딩 인덱스 초기화
+
+        Args:
+            object_embeddings: {오브젝트 이름: {"name_only": [...], "name_and_info": [...]}}
+            field: 유사도 계산에 사용할 임베딩 종류
+        """
+        self.field = field
+        # (이름 리스트, 이름 -> 행 인덱스, 정규화 행렬)을 한 번에 교체해 검색 중 재구성에도 안전하게 함
+        self._compiled: Tuple[List[str], Dict[str, int], np.ndarray] = ([], {}, np.zeros((0, 0), dtype=np.float32))
+        if object_embeddings:
+            self.build(object_embeddings)
+
+    def build(self, object_embeddings: Dict[str, Dict[str, List[float]]]):
+        """
+        오브젝트 임베딩 딕셔너리로 정규화 행렬을 다시 만듭니다.
+        0 벡터, NaN, 차원이 다른 임베딩은 제외합니다.
+        """
+        names = []
+        vectors = []
+        dim = None
+        for name, data in object_embeddings.items():
+            embedding = data.get(self.field, []) if isinstance(data, dict) else []
+            if not embedding:
+                continue
+            vector = np.asarray(embedding, dtype=np.float32)
+            if vector.ndim != 1:
+                # 단어가 하나도 사전에 없으면 임베딩이 NaN 스칼라로 저장됨
+                continue
+            if dim is None:
+                dim = vector.shape[0]
+            if vector.shape[0] != dim:
+                continue
+            norm = np.linalg.norm(vector)
+            if not np.isfinite(norm) or norm == 0:
+                continue
+            names.append(name)
+            vectors.append(vector / norm)
+
+        if vectors:
+            matrix = np.stack(vectors)
+        else:
+            matrix = np.zeros((0, dim or 0), dtype=np.float32)
+        self._compiled = (names, {name: i for i, name in enumerate(names)}, matrix)
+
+    def __len__(self) -> int:
+        return len(self._compiled[0])
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._compiled[1]
+
+    @property
+    def names(self) -> List[str]:
+        return self._compiled[0]
+
+    @property
+    def dim(self) -> int:
+        return self._compiled[2].shape[1]
+
+    def get_vector(self, name: str) -> Optional[np.ndarray]:
+        """정규화된 오브젝트 임베딩 반환 (없으면 None)"""
+        names, name_index, matrix = self._compiled
+        row = name_index.get(name)
+        return None if row is None else matrix[row]
+
+    def find_relevant(
+        self,
+        event_embedding: List[float],
+        state_embedding: List[float],
+        top_k: int = 10,
+        similarity_threshold: float = 0.01
+    ) -> List[Tuple[str, float]]:
+        """
+        이벤트/상태 임베딩과 가장 유사한 상위 top_k개 오브젝트 반환
+
+        이벤트/상태 유사도 중 큰 값으로 순위를 매기고(동점이면 사전 순서),
+        큰 값이 similarity_threshold 미만인 오브젝트는 제외합니다.
+        0 벡터(또는 NaN) 질의의 유사도는 0.01로 취급합니다.
+
+        Returns:
+            List[Tuple[str, float]]: (오브젝트 이름, 이벤트 유사도) 리스트
+        """
+        names, _, matrix = self._compiled
+        n = len(names)
+        if n == 0 or top_k <= 0:
+            return []
+
+        sims = []
+        for embedding in (event_embedding, state_embedding):
+            query = np.asarray(embedding if embedding is not None else [], dtype=np.float32)
+            if query.shape != (matrix.shape[1],):
+                # 기존 구현과 같이 차원이 다른 질의로는 오브젝트를 찾지 않음
+                return []
+            norm = np.linalg.norm(query)
+            if not np.isfinite(norm) or norm == 0:
+                sims.append(np.full(n, DEFAULT_SIMILARITY))
+            else:
+                sims.append((matrix @ (query / norm)).astype(np.float64))
+        event_sim, state_sim = sims
+        max_sim = np.maximum(event_sim, state_sim)
+
+        candidates = np.nonzero(max_sim >= similarity_threshold)[0]
+        if len(candidates) > top_k:
+            kth_value = max_sim[candidates[np.argpartition(-max_sim[candidates], top_k - 1)[top_k - 1]]]
+            candidates = candidates[max_sim[candidates] >= kth_value]
+        # 유사도 내림차순, 동점이면 사전 순서 (stable)
+        order = candidates[np.argsort(-max_sim[candidates], kind="stable")][:top_k]
+        return [(names[i], float(event_sim[i])) for i in order]
@@ -1,120 +1,286 @@
-import urllib.request
 import json
 import time
 import asyncio
-from typing import Dict, Any, Optional
-from queue import Queue
-import threading
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from typing import Dict, Any, Optional, AsyncIterator, Callable, Tuple
+import aiohttp
+from .request_scheduler import PriorityScheduler
+from .response_cache import ResponseCache
+from .json_stream import IncrementalJSONParser
+
+# 재시도할 HTTP 상태 코드
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
 
 class OllamaClient:
-    def __init__(self, api_url: str = "http://localhost:11434/api/generate"):
+    def __init__(
+        self,
+        api_url: str = "http://localhost:11434/api/generate",
+        max_concurrency: int = 4,
+        model_concurrency: Optional[Dict[str, int]] = None,
+        timeout: float = 120,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        pool_size: int = 10,
+        aging_interval: float = 5.0,
+        reserved_slots: int = 1,
+        response_cache: Optional[ResponseCache] = None,
+        coalesce: bool = True
+    ):
+        """
+        Ollama API 비동기 클라이언트 초기화
+
+        요청마다 스레드 큐를 거치지 않고 이벤트 루프에서 바로 HTTP 요청을 보냅니다.
+        모델별 우선순위 스케줄러로 동시에 처리 중인 요청 수를 제한하며,
+        자리가 나면 interactive > normal > batch 순서(대기 시간에 따라 순위 상승)로 보냅니다.
+        모델, 프롬프트, 시스템 프롬프트, 옵션이 모두 같은 요청이 동시에 들어오면
+        하나만 보내고 결과를 함께 사용합니다 (single-flight).
+
+        Args:
+            api_url: Ollama generate API 주소
+            max_concurrency: 모델별 기본 동시 요청 수 (Ollama의 OLLAMA_NUM_PARALLEL에 맞춤)
+            model_concurrency: 모델별 동시 요청 수 (예: {"gemma3": 2})
+            timeout: 요청 타임아웃 (초)
+            max_retries: 연결 오류 / 5xx 응답 시 최대 재시도 횟수
+            backoff_factor: 재시도 간격 (backoff_factor * 2^(시도 횟수 - 1) 초)
+            pool_size: 연결 풀 크기
+            aging_interval: 대기 요청의 우선순위를 한 단계 올리는 시간 (초)
+            reserved_slots: batch 요청이 쓸 수 없도록 남겨 두는 모델별 자리 수
+            response_cache: 낮은 temperature 호출의 응답을 재사용할 캐시 (None이면 사용 안 함)
+            coalesce: 동시에 들어온 같은 요청을 하나로 합칠지 여부
+        """
         self.api_url = api_url
-        self.request_queue = Queue()
-        self.processing = False
-        self.lock = threading.Lock()
-        
-        # 세션 설정
-        self.session = requests.Session()
-        
-        # 재시도 전략 설정
-        retry_strategy = Retry(
-            total=3,  # 최대 3번 재시도
-            backoff_factor=0.5,  # 재시도 간격
-            status_forcelist=[500, 502, 503, 504]  # 재시도할 HTTP 상태 코드
-        )
-        
-        # 어댑터 설정
-        adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=10, pool_maxsize=10)
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
-        
-        self._start_processing_thread()
-
-    def _start_processing_thread(self):
-        """백그라운드에서 큐를 처리하는 스레드를 시작합니다."""
-        self.processing_thread = threading.Thread(target=self._process_queue, daemon=True)
-        self.processing_thread.start()
-
-    def _process_queue(self):
-        """큐에서 요청을 가져와 처리하는 메서드"""
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = dict(model_concurrency or {})
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self.aging_interval = aging_interval
+        self.reserved_slots = reserved_slots
+        self.response_cache = response_cache
+        self.coalesce = coalesce
+
+        # 세션과 스케줄러는 이벤트 루프에 묶이므로 사용하는 루프가 바뀌면 다시 만듦
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._schedulers: Dict[str, PriorityScheduler] = {}
+
+        # 처리 중인 요청 (요청 키 -> {"task", "waiters"})
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        self.executed_requests = 0
+        self.coalesced_requests = 0
+
+    def _prepare_loop(self):
+        """현재 이벤트 루프용 세션/스케줄러 준비 (루프가 바뀌었으면 새로 생성)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._session = None
+            self._schedulers = {}
+            self._inflight = {}
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'Content-Type': 'application/json'}
+            )
+
+    def _scheduler(self, model_name: str) -> PriorityScheduler:
+        """모델별 동시 요청 수 제한용 우선순위 스케줄러"""
+        scheduler = self._schedulers.get(model_name)
+        if scheduler is None:
+            scheduler = PriorityScheduler(
+                self.model_concurrency.get(model_name, self.max_concurrency),
+                aging_interval=self.aging_interval,
+                reserved_slots=self.reserved_slots
+            )
+            self._schedulers[model_name] = scheduler
+        return scheduler
+
+    def set_model_concurrency(self, model_name: str, limit: int):
+        """모델의 동시 요청 수 변경"""
+        self.model_concurrency[model_name] = limit
+        scheduler = self._schedulers.get(model_name)
+        if scheduler is not None:
+            scheduler.limit = max(1, limit)
+            scheduler.batch_limit = max(1, scheduler.limit - max(0, self.reserved_slots))
+            scheduler._dispatch()
+
+    def get_queue_metrics(self) -> Dict[str, Any]:
+        """
+        모델별 / 우선순위 클래스별 대기열 길이와 대기 시간 통계
+
+        Returns:
+            {모델 이름: {"limit": n, "active": n, "classes": {"interactive": {...}, "normal": {...}, "batch": {...}}}}
+        """
+        return {model_name: scheduler.metrics() for model_name, scheduler in self._schedulers.items()}
+
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """
+        동시 요청 합치기 통계
+
+        Returns:
+            {"executed": 실제로 보낸 요청 수, "coalesced": 다른 요청의 결과를 함께 쓴 호출 수,
+             "inflight": 처리 중인 고유 요청 수, "coalesce_rate": 합쳐진 호출 비율}
+        """
+        total = self.executed_requests + self.coalesced_requests
+        return {
+            "executed": self.executed_requests,
+            "coalesced": self.coalesced_requests,
+            "inflight": len(self._inflight),
+            "coalesce_rate": round(self.coalesced_requests / total, 4) if total else 0.0
+        }
+
+    async def _send_request(self, prompt: str, system_prompt: str, model_name: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
+        """올라마 API에 실제 요청을 보내는 메서드"""
+        # 기본 옵션 설정
+        default_options = {
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "frequency_penalty": 0.1,
+            "presence_penalty": 0.1
+        }
+
+        # 사용자 옵션과 기본 옵션 병합
+        if options:
+            default_options.update(options)
+
+        payload = {
+            "model": model_name,
+            "prompt": prompt,
+            "system": system_prompt,
+            "stream": False,
+            "options": default_options
+        }
+
+        self._prepare_loop()
+        attempt = 0
         while True:
-            if not self.request_queue.empty():
-                with self.lock:
-                    self.processing = True
-                    task = self.request_queue.get()
-                    
-                    try:
-                        response = self._send_request(
-                            task['prompt'],
-                            task['system_prompt'],
-                            task['model_name'],
-                            task.get('options', {})
+            try:
+                async with self._session.post(self.api_url, data=json.dumps(payload)) as response:
+                    if response.status in RETRY_STATUS_CODES and attempt < self.max_retries:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history,
+                            status=response.status, message=response.reason or ""
                         )
-                        if task['future']:
-                            task['future'].set_result(response)
-                    except Exception as e:
-                        if task['future']:
-                            task['future'].set_exception(e)
-                    
-                    self.request_queue.task_done()
-                    self.processing = False
-            time.sleep(0.1)
-
-    def _send_request(self, prompt: str, system_prompt: str, model_name: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
-        """올라마 API에 실제 요청을 보내는 메서드"""
-        try:
-            # 기본 옵션 설정
-            default_options = {
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "frequency_penalty": 0.1,
-                "presence_penalty": 0.1
-            }
+                    # 응답 확인
+                    response.raise_for_status()
+                    result = await response.json(content_type=None)
 
-            # 사용자 옵션과 기본 옵션 병합
-            if options:
-                default_options.update(options)
+                return {
+                    "response": result.get("response", ""),
+                    "status": "success",
+                    "prompt_tokens": result.get("prompt_eval_count", 0),
+                    "completion_tokens": result.get("eval_count", 0)
+                }
 
-            payload = {
-                "model": model_name,
-                "prompt": prompt,
-                "system": system_prompt,
-                "stream": False,
-                "options": default_options
-            }
+            except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUS_CODES
+                if retryable and attempt < self.max_retries:
+                    attempt += 1
+                    await asyncio.sleep(self.backoff_factor * (2 ** (attempt - 1)))
+                    continue
+                return {
+                    "response": "",
+                    "status": "error",
+                    "error": str(e) or type(e).__name__
+                }
+            except Exception as e:
+                return {
+                    "response": "",
+                    "status": "error",
+                    "error": str(e)
+                }
 
-            # 세션을 사용하여 요청 전송
-            response = self.session.post(
-                self.api_url,
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=120  # 120초 타임아웃 설정
-            )
-            
-            # 응답 확인
-            response.raise_for_status()
-            result = response.json()
-            
-            return {
-                "response": result.get("response", ""),
-                "status": "success"
-            }
-            
-        except requests.exceptions.RequestException as e:
-            return {
-                "response": "",
-                "status": "error",
-                "error": str(e)
-            }
-        except Exception as e:
-            return {
-                "response": "",
-                "status": "error",
-                "error": str(e)
-            }
+    def _merge_options(
+        self,
+        system_prompt: Optional[str],
+        model_name: Optional[str],
+        temperature: Optional[float],
+        options: Optional[Dict[str, Any]]
+    ) -> Tuple[Optional[str], str, Dict[str, Any]]:
+        """options의 system_prompt / model / temperature를 꺼내고 기본 샘플링 옵션과 병합"""
+        # 옵션에서 system_prompt, model_name, temperature 추출
+        if options:
+            system_prompt = options.pop('system_prompt', system_prompt)
+            model_name = options.pop('model', model_name)
+            temperature = options.pop('temperature', temperature)
+
+        # 필수 값 확인
+        if not model_name:
+            raise ValueError("model_name must be provided either directly or in options")
+
+        # 기본 옵션 설정
+        default_options = {
+            "temperature": temperature if temperature is not None else 0.7,
+            "top_p": 0.9,
+            "frequency_penalty": 0.1,
+            "presence_penalty": 0.1
+        }
+
+        # 사용자 옵션과 기본 옵션 병합
+        if options:
+            default_options.update(options)
+        return system_prompt, model_name, default_options
+
+    async def _stream_request(self, prompt: str, system_prompt: str, model_name: str, options: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        올라마 API에 스트리밍 요청을 보내고 NDJSON 줄마다 받은 텍스트 조각을 내보냄
+
+        첫 조각을 받기 전의 연결 오류 / 5xx 응답만 재시도합니다.
+        소비자가 끝까지 읽지 않고 중단하면(aclose) 연결을 끊어 Ollama의 생성도 멈춥니다.
+        """
+        payload = {
+            "model": model_name,
+            "prompt": prompt,
+            "system": system_prompt,
+            "stream": True,
+            "options": options
+        }
+
+        self._prepare_loop()
+        attempt = 0
+        while True:
+            received = False
+            try:
+                async with self._session.post(self.api_url, data=json.dumps(payload)) as response:
+                    if response.status in RETRY_STATUS_CODES and attempt < self.max_retries:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history,
+                            status=response.status, message=response.reason or ""
+                        )
+                    response.raise_for_status()
+                    finished = False
+                    try:
+                        async for line in response.content:
+                            line = line.strip()
+                            if not line:
+                                continue
+                            data = json.loads(line)
+                            if data.get("error"):
+                                raise RuntimeError(data["error"])
+                            text = data.get("response", "")
+                            if text:
+                                received = True
+                                yield text
+                            if data.get("done"):
+                                finished = True
+                                break
+                        finished = True
+                    finally:
+                        if not finished:
+                            # 생성 중단: 연결을 재사용하지 않고 닫음
+                            response.close()
+                return
+
+            except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUS_CODES
+                if retryable and not received and attempt < self.max_retries:
+                    attempt += 1
+                    await asyncio.sleep(self.backoff_factor * (2 ** (attempt - 1)))
+                    continue
+                raise
 
     async def process_prompt(
         self,
@@ -122,11 +288,12 @@ class OllamaClient:
         system_prompt: str = None,
         model_name: str = None,
         temperature: float = None,
-        options: Optional[Dict[str, Any]] = None
+        options: Optional[Dict[str, Any]] = None,
+        priority: str = "normal"
     ) -> Dict[str, Any]:
         """
         프롬프트를 처리하고 결과를 반환합니다.
-        
+
         Args:
             prompt (str): 처리할 프롬프트
             system_prompt (str, optional): 시스템 프롬프트. options에서도 지정 가능
@@ -139,63 +306,178 @@ class OllamaClient:
                 - top_p (float): 토큰 선택 확률 임계값 (0.0 ~ 1.0)
                 - frequency_penalty (float): 반복 패널티
                 - presence_penalty (float): 존재 패널티
-            
+            priority (str, optional): 우선순위 클래스 ("interactive", "normal", "batch")
+
         Returns:
             Dict[str, Any]: API 응답
         """
-        loop = asyncio.get_running_loop()
-        future = loop.create_future()
-        
-        # 옵션에서 system_prompt, model_name, temperature 추출
-        if options:
-            system_prompt = options.pop('system_prompt', system_prompt)
-            model_name = options.pop('model', model_name)
-            temperature = options.pop('temperature', temperature)
-        
-        # 필수 값 확인
-        if not model_name:
-            raise ValueError("model_name must be provided either directly or in options")
-        
-        # 기본 옵션 설정
-        default_options = {
-            "temperature": temperature if temperature is not None else 0.7,
-            "top_p": 0.9,
-            "frequency_penalty": 0.1,
-            "presence_penalty": 0.1
-        }
+        system_prompt, model_name, default_options = self._merge_options(system_prompt, model_name, temperature, options)
 
-        # 사용자 옵션과 기본 옵션 병합
-        if options:
-            default_options.update(options)
-        
-        task = {
-            'prompt': prompt,
-            'system_prompt': system_prompt,
-            'model_name': model_name,
-            'options': default_options,
-            'future': future
+        # 결정적인 호출(temperature <= 임계값)은 캐시된 응답을 바로 반환
+        request_key = None
+        cacheable = self.response_cache is not None and self.response_cache.is_cacheable(default_options)
+        if cacheable or self.coalesce:
+            request_key = ResponseCache.make_key(model_name, system_prompt, prompt, default_options)
+        if cacheable:
+            cached = await self.response_cache.get_async(request_key)
+            if cached is not None:
+                return cached
+
+        self._prepare_loop()
+        if not self.coalesce:
+            self.executed_requests += 1
+            return await self._execute_prompt(prompt, system_prompt, model_name, default_options, priority,
+                                              request_key if cacheable else None)
+
+        # 같은 요청이 처리 중이면 그 결과를 함께 사용
+        inflight = self._inflight.get(request_key)
+        if inflight is not None:
+            self.coalesced_requests += 1
+        else:
+            self.executed_requests += 1
+            task = asyncio.ensure_future(self._execute_prompt(
+                prompt, system_prompt, model_name, default_options, priority,
+                request_key if cacheable else None
+            ))
+            inflight = {"task": task, "waiters": 0}
+            self._inflight[request_key] = inflight
+            task.add_done_callback(lambda _, key=request_key, entry=inflight: self._finish_inflight(key, entry))
+
+        inflight["waiters"] += 1
+        try:
+            response = await asyncio.shield(inflight["task"])
+        except asyncio.CancelledError:
+            # 기다리는 호출이 모두 취소되면 요청도 취소
+            if inflight["waiters"] == 1 and not inflight["task"].done():
+                inflight["task"].cancel()
+            raise
+        finally:
+            inflight["waiters"] -= 1
+        return dict(response)
+
+    def _finish_inflight(self, request_key: str, entry: Dict[str, Any]):
+        """처리가 끝난 요청을 처리 중 목록에서 제거"""
+        if self._inflight.get(request_key) is entry:
+            del self._inflight[request_key]
+
+    async def _execute_prompt(self, prompt: str, system_prompt: str, model_name: str, options: Dict[str, Any],
+                              priority: str, cache_key: Optional[str]) -> Dict[str, Any]:
+        """스케줄러 자리를 받아 요청을 보내고, 캐시 대상이면 성공한 응답을 저장"""
+        async with self._scheduler(model_name).slot(priority):
+            response = await self._send_request(prompt, system_prompt, model_name, options)
+
+        if cache_key is not None and response.get("status") == "success":
+            self.response_cache.put(cache_key, response)
+        return response
+
+    async def stream_prompt(
+        self,
+        prompt: str,
+        system_prompt: str = None,
+        model_name: str = None,
+        temperature: float = None,
+        options: Optional[Dict[str, Any]] = None,
+        priority: str = "normal"
+    ) -> AsyncIterator[str]:
+        """
+        프롬프트를 스트리밍으로 처리하고 생성되는 텍스트 조각을 차례로 반환합니다.
+
+        인자는 process_prompt와 같습니다. 응답 캐시는 사용하지 않으며,
+        스트림이 끝나거나 소비자가 중단(aclose)할 때까지 스케줄러 자리를 차지합니다.
+        중간에 멈추려면 async for를 빠져나온 뒤 반드시 aclose()를 호출하세요.
+
+        Yields:
+            str: 텍스트 조각
+
+        Raises:
+            연결 오류, HTTP 오류, Ollama가 보낸 error 메시지
+        """
+        system_prompt, model_name, default_options = self._merge_options(system_prompt, model_name, temperature, options)
+        self._prepare_loop()
+        async with self._scheduler(model_name).slot(priority):
+            stream = self._stream_request(prompt, system_prompt, model_name, default_options)
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+    async def process_prompt_until_json(
+        self,
+        prompt: str,
+        system_prompt: str = None,
+        model_name: str = None,
+        temperature: float = None,
+        options: Optional[Dict[str, Any]] = None,
+        priority: str = "normal",
+        on_chunk: Optional[Callable[[IncrementalJSONParser], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        JSON 객체 하나를 응답으로 기대하는 프롬프트를 스트리밍으로 처리합니다.
+
+        토큰을 받는 대로 IncrementalJSONParser에 넣고, 최상위 JSON 객체가 닫히면
+        나머지 생성을 중단(연결 종료)하고 바로 반환합니다.
+
+        Args:
+            process_prompt와 같음
+            on_chunk: 조각을 받을 때마다 호출할 함수 (파서를 인자로 받음)
+
+        Returns:
+            Dict[str, Any]: {
+                "response": 받은 텍스트,
+                "json": 파싱된 객체 (객체가 완성되지 않았으면 None),
+                "status": "success" / "error",
+                "first_chunk_ms": 첫 조각까지 걸린 시간,
+                "total_ms": 전체 시간
+            }
+        """
+        parser = IncrementalJSONParser()
+        start_time = time.perf_counter()
+        first_chunk_ms = None
+        stream = self.stream_prompt(prompt, system_prompt, model_name, temperature, options, priority)
+        try:
+            async for chunk in stream:
+                if first_chunk_ms is None:
+                    first_chunk_ms = round((time.perf_counter() - start_time) * 1000, 2)
+                parser.feed(chunk)
+                if on_chunk is not None:
+                    on_chunk(parser)
+                if parser.complete:
+                    break
+        except Exception as e:
+            return {
+                "response": parser.text,
+                "json": parser.value,
+                "status": "error",
+                "error": str(e) or type(e).__name__,
+                "first_chunk_ms": first_chunk_ms,
+                "total_ms": round((time.perf_counter() - start_time) * 1000, 2)
+            }
+        finally:
+            await stream.aclose()
+
+        return {
+            "response": parser.text,
+            "json": parser.value,
+            "status": "success",
+            "first_chunk_ms": first_chunk_ms,
+            "total_ms": round((time.perf_counter() - start_time) * 1000, 2)
         }
-        
-        self.request_queue.put(task)
-        return await future
 
-    def __del__(self):
-        """소멸자: 세션 정리"""
-        if hasattr(self, 'session'):
-            self.session.close()
+    async def close(self):
+        """연결 풀과 응답 캐시 정리"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self.response_cache is not None:
+            self.response_cache.close()
 
 # 사용 예시:
 """
-client = OllamaClient()
-
-async def handle_response(response):
-    print("응답:", response)
+client = OllamaClient(model_concurrency={"gemma3": 2})
 
-async def handle_error(error):
-    print("에러:", error)
-
-# 프롬프트 처리 요청
-await client.process_prompt(
+# 프롬프트 처리 요청 (여러 요청을 동시에 보내면 모델별 동시 요청 수까지 병렬 처리)
+response = await client.process_prompt(
     prompt="What is the weather like?",
     system_prompt="You are a helpful assistant.",
     model_name="gemma3",
@@ -204,8 +486,13 @@ await client.process_prompt(
         "top_p": 0.9,
         "frequency_penalty": 0.1,
         "presence_penalty": 0.1
-    },
-    callback=handle_response,
-    error_callback=handle_error
+    }
 )
-""" 
\ No newline at end of file
+print("응답:", response)
+
+# JSON 응답은 스트리밍으로 받아 객체가 닫히는 즉시 반환 (나머지 생성은 중단)
+result = await client.process_prompt_until_json(prompt="...", model_name="gemma3", priority="interactive")
+print("JSON:", result["json"], "첫 조각:", result["first_chunk_ms"], "ms")
+
+await client.close()
+"""
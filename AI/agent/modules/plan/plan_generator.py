@@ -11,6 +11,11 @@ import logging
 import re
 from typing import Dict, List, Any
 from ..ollama_client import OllamaClient
+from .available_test import VALID_ACTIONS, REGION_LOCATION_OBJECTS
+from ..prompt_budget import PromptBuilder
+from ..agent_locks import get_agent_locks
+from ..agent_shards import get_plan_shards, get_reflection_shards
+from ..worker_pool import run_blocking
 import datetime
 
 # 로깅 설정
@@ -21,7 +26,9 @@ logging.basicConfig(
 logger = logging.getLogger("PlanGenerator")
 
 class PlanGenerator:
-    def __init__(self, plan_file_path: str, reflection_file_path: str, ollama_client: OllamaClient):
+    def __init__(self, plan_file_path: str, reflection_file_path: str, ollama_client: OllamaClient,
+                 plan_data: Dict = None, reflection_data: Dict = None, prompt_token_budget: int = None,
+                 worker_pool=None):
         """
         계획 생성기 초기화
         
@@ -29,6 +36,11 @@ class PlanGenerator:
             plan_file_path: 계획 데이터 파일 경로
             reflection_file_path: 반성 데이터 파일 경로
             ollama_client: Ollama API 클라이언트 인스턴스
+            plan_data: 미리 로드한 계획 데이터 (지정하면 파일을 읽지 않고 이 데이터를 사용하며,
+                       저장도 이 데이터에만 반영 - 파일 기록은 호출자가 한 번에 수행)
+            reflection_data: 미리 로드한 반성 데이터 (지정하면 반성 파일을 읽지 않음)
+            prompt_token_budget: 계획 프롬프트 토큰 예산 (None이면 prompt_budget의 "plan" 기본 예산)
+            worker_pool: 계획 / 반성 파일 입출력을 실행할 WorkerPool (None이면 이벤트 루프에서 바로 실행)
         """
         # 현재 파일의 절대 경로를 기준으로 상대 경로 계산
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -38,37 +50,65 @@ class PlanGenerator:
         self.plan_file_path = os.path.join(root_dir, "agent", "data", "plans.json")
         self.reflection_file_path = os.path.join(root_dir, "agent", "data", "reflections.json")
         self.ollama_client = ollama_client
+        self.plan_data = plan_data
+        self.reflection_data = reflection_data
+        self.prompt_token_budget = prompt_token_budget
+        self.worker_pool = worker_pool
+        
+        # 에이전트별 계획 / 반성 파일 (plans/<에이전트>.json, reflections/<에이전트>.json)
+        self.plan_shards = get_plan_shards(self.plan_file_path)
+        self.reflection_shards = get_reflection_shards(self.reflection_file_path)
         
         # 프롬프트 파일 경로 설정
         self.prompt_dir = os.path.join(root_dir, "agent", "prompts", "plan")
         self.prompt_path = os.path.join(self.prompt_dir, "plan_prompt.txt")
         self.system_path = os.path.join(self.prompt_dir, "plan_system.txt")
         self.timeslot_prompt_path = os.path.join(self.prompt_dir, "plan_timeslot_prompt.txt")
+        self.repair_prompt_path = os.path.join(self.prompt_dir, "plan_repair_prompt.txt")
+        
+        # 에이전트별 비동기 잠금 (같은 데이터 디렉토리를 쓰는 모듈끼리 공유)
+        self.agent_locks = get_agent_locks(os.path.dirname(self.plan_file_path))
+        
+        # 마지막 LLM 호출의 토큰 사용량 (파이프라인의 재시도 / 낭비 토큰 통계용)
+        self.last_usage = {"prompt_tokens": 0, "completion_tokens": 0}
         
         # 폴더 생성
         os.makedirs(os.path.dirname(self.plan_file_path), exist_ok=True)
         
         logger.info(f"계획 생성기 초기화 (계획 파일: {self.plan_file_path}, 반성 파일: {self.reflection_file_path})")
     
-    def load_plans(self) -> Dict:
-        """계획 JSON 파일 로드"""
+    def _record_usage(self, prompt: str, response: Dict[str, Any]):
+        """LLM 호출 토큰 사용량 기록 (Ollama가 개수를 주지 않으면 글자 수로 추정)"""
+        self.last_usage = {
+            "prompt_tokens": response.get("prompt_tokens") or len(prompt) // 4,
+            "completion_tokens": response.get("completion_tokens") or len(response.get("response", "")) // 4
+        }
+
+    def agent_lock(self, *agent_names: str):
+        """에이전트 잠금 (async with로 사용, 계획 파일 읽고-쓰기 구간용)"""
+        return self.agent_locks.agent(*agent_names)
+
+    def load_plans(self, *agent_names: str) -> Dict:
+        """계획 데이터 로드 (에이전트 이름을 주면 그 에이전트들의 파일만 읽음)"""
+        if self.plan_data is not None:
+            return self.plan_data
         try:
-            with open(self.plan_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            logger.info(f"계획 파일 로드 완료: {self.plan_file_path}")
+            data = self.plan_shards.load_agents(agent_names) if agent_names else self.plan_shards.load_all()
+            logger.info(f"계획 파일 로드 완료: {self.plan_shards.shard_dir} ({', '.join(agent_names) or '전체'})")
             return data
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+        except Exception as e:
             logger.warning(f"계획 파일 로드 오류 (새 파일 생성 예정): {e}")
             return {}
     
-    def load_reflections(self) -> Dict:
-        """반성 JSON 파일 로드"""
+    def load_reflections(self, *agent_names: str) -> Dict:
+        """반성 데이터 로드 (에이전트 이름을 주면 그 에이전트들의 파일만 읽음)"""
+        if self.reflection_data is not None:
+            return self.reflection_data
         try:
-            with open(self.reflection_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            logger.info(f"반성 파일 로드 완료: {self.reflection_file_path}")
+            data = self.reflection_shards.load_agents(agent_names) if agent_names else self.reflection_shards.load_all()
+            logger.info(f"반성 파일 로드 완료: {self.reflection_shards.shard_dir} ({', '.join(agent_names) or '전체'})")
             return data
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+        except Exception as e:
             logger.warning(f"반성 파일 로드 오류: {e}")
             return {}
     
@@ -104,7 +144,8 @@ class PlanGenerator:
     # 새로운 계획 데이터 병합
     def save_plans(self, new_plan_data: Dict) -> bool:
         try:
-            existing_data = self.load_plans()
+            # 새 계획이 있는 에이전트의 파일만 읽고 씀
+            existing_data = self.load_plans(*new_plan_data)
 
             for agent_name, agent_data in new_plan_data.items():
                 if agent_name not in existing_data:
@@ -127,8 +168,14 @@ class PlanGenerator:
                         # 정상적인 계획이면 그대로 저장
                         existing_data[agent_name]["plans"][date_key] = plan_value
 
-            with open(self.plan_file_path, 'w', encoding='utf-8') as f:
-                json.dump(existing_data, f, ensure_ascii=False, indent=2)
+            # 미리 로드한 데이터를 쓰는 경우 파일 기록은 호출자가 한 번에 수행
+            if self.plan_data is not None:
+                logger.info("✅ 계획 병합 완료 (파일 기록은 일괄 처리 후)")
+                return True
+
+            # 에이전트별 파일을 임시 파일에 쓴 뒤 교체 (기록 도중 실패해도 기존 파일 유지)
+            for agent_name in new_plan_data:
+                self.plan_shards.save_agent(agent_name, existing_data[agent_name])
 
             logger.info("✅ 계획 병합 저장 완료")
             return True
@@ -161,24 +208,24 @@ class PlanGenerator:
 
         template = self._load_prompt_template()
         
-        # 반성 데이터 포맷팅
-        reflections_text = ""
-        for r in reflections:
-            reflections_text += f"- event: {r.get('event', '')}, thought: {r.get('thought', '')}\n"
-        
         # 이전 계획 포맷팅
         previous_plans_text = ""
         if isinstance(previous_plans, dict):
             previous_plans_text = json.dumps(previous_plans, ensure_ascii=False)
         
-        # 프롬프트 생성
-        prompt = template.format(
-            AGENT_NAME=agent_name,
-            DATE=reflection_date,      # 🟡 반성 기준 날짜
-            PLAN_DATE=plan_date,       # 🟡 계획 생성 대상 날짜
-            REFLECTIONS=reflections_text,
-            PREVIOUS_PLANS=previous_plans_text
+        # 프롬프트 생성 (토큰 예산을 넘으면 예전의 중요도 낮은 반성 → 이전 계획 순으로 줄임)
+        builder = PromptBuilder("plan", budget=self.prompt_token_budget)
+        builder.add("AGENT_NAME", agent_name, required=True)
+        builder.add("DATE", reflection_date, required=True)      # 🟡 반성 기준 날짜
+        builder.add("PLAN_DATE", plan_date, required=True)       # 🟡 계획 생성 대상 날짜
+        # 반성은 오늘 반성 → 중요도 순으로 정렬되어 있으므로 뒤에서부터 제외
+        builder.add_items(
+            "REFLECTIONS",
+            [f"- event: {r.get('event', '')}, thought: {r.get('thought', '')}" for r in reflections],
+            priority=0, omitted_format="- ({count} less important reflections omitted)"
         )
+        builder.add("PREVIOUS_PLANS", previous_plans_text, priority=1)
+        prompt = builder.build(template)
 
         
         # JSON 형식의 변수 치환
@@ -213,7 +260,9 @@ class PlanGenerator:
             logger.info(f"다음 날짜: {next_date}")
             
             # 반성 데이터 로드
-            reflection_data = self.load_reflections()
+            reflection_data = await run_blocking(
+                self.worker_pool, "plan.load_reflections", self.load_reflections, agent_name, lane="store"
+            )
             if not reflection_data or agent_name not in reflection_data:
                 logger.warning(f"{agent_name}의 반성 데이터가 없습니다.")
                 return {}
@@ -226,11 +275,11 @@ class PlanGenerator:
                 if reflection_time == current_time or importance >= 7:  # 정확한 시간 비교 또는 중요도 7 이상
                     today_reflections.append(reflection)
             
-            # 중요도 순으로 정렬
-            today_reflections.sort(key=lambda x: x.get("importance", 0), reverse=True)
+            # 오늘 반성을 먼저, 그 안에서 중요도 순으로 정렬 (프롬프트 예산을 넘으면 뒤에서부터 제외)
+            today_reflections.sort(key=lambda x: (x.get("time", "") == current_time, x.get("importance", 0)), reverse=True)
             
             # 이전 계획 로드
-            plan_data = self.load_plans()
+            plan_data = await run_blocking(self.worker_pool, "plan.load_plans", self.load_plans, agent_name, lane="store")
             previous_plans = {}
             if agent_name in plan_data and "plans" in plan_data[agent_name]:
                 # 가장 최근 계획 찾기
@@ -249,8 +298,10 @@ class PlanGenerator:
             response = await self.ollama_client.process_prompt(
                 prompt=prompt,
                 system_prompt=system_prompt,
-                model_name="gemma3"
+                model_name="gemma3",
+                priority="batch"
             )
+            self._record_usage(prompt, response)
             
             if response.get("status") != "success":
                 logger.error(f"계획 생성 API 호출 실패: {response.get('status')}")
@@ -287,9 +338,9 @@ class PlanGenerator:
                 logger.info(f"생성된 계획: {plans}")
                 
                 # 계획 저장 (다음 날짜로 저장)
-                if self.save_plans(plans):
-                    return plans
-                return {}
+                async with self.agent_lock(agent_name):
+                    saved = await run_blocking(self.worker_pool, "plan.save", self.save_plans, plans, lane="store")
+                return plans if saved else {}
                 
             except json.JSONDecodeError as e:
                 logger.error(f"JSON 파싱 실패: {e}")
@@ -335,8 +386,10 @@ class PlanGenerator:
             response = await self.ollama_client.process_prompt(
                 prompt=prompt,
                 system_prompt=system_prompt,
-                model_name="gemma3"
+                model_name="gemma3",
+                priority="batch"
             )
+            self._record_usage(prompt, response)
 
             if response.get("status") != "success":
                 logger.error(f"Unity 계획 생성 API 호출 실패: {response.get('status')}")
@@ -374,4 +427,68 @@ class PlanGenerator:
 
         except Exception as e:
             logger.error(f"Unity 계획 생성 중 오류 발생: {str(e)}")
-            return {} 
\ No newline at end of file
+            return {} 
+
+    async def repair_unity_plan(self, plan_json: Dict, unity_plan: Dict, invalid_slots: Dict[int, str]) -> Dict[int, List]:
+        """
+        유효성 검사에 실패한 타임슬롯만 다시 생성 (전체 계획을 다시 만들지 않음)
+        Parameters:
+        - plan_json: 1단계에서 생성된 계획 JSON
+        - unity_plan: 2단계에서 생성된 Unity용 계획 객체
+        - invalid_slots: {슬롯 인덱스: 실패 메시지}
+        Returns:
+        - {슬롯 인덱스: 수정된 슬롯} (요청한 인덱스만, 실패하면 빈 딕셔너리)
+        """
+        try:
+            with open(self.repair_prompt_path, 'r', encoding='utf-8') as f:
+                prompt_template = f.read().strip()
+        except Exception as e:
+            logger.error(f"타임슬롯 수정 프롬프트 템플릿 로드 실패: {e}")
+            return {}
+
+        time_slots = unity_plan.get("time_slots", [])
+        prompt = prompt_template.format(
+            PLAN_JSON=json.dumps(plan_json, ensure_ascii=False, indent=2),
+            TIME_SLOTS="\n".join(f"{i}: {json.dumps(slot, ensure_ascii=False)}" for i, slot in enumerate(time_slots)),
+            INVALID_SLOTS="\n".join(f"- {i}: {message}" for i, message in sorted(invalid_slots.items())),
+            VALID_ACTIONS=", ".join(VALID_ACTIONS),
+            VALID_LOCATIONS=", ".join(REGION_LOCATION_OBJECTS)
+        )
+
+        response = await self.ollama_client.process_prompt(
+            prompt=prompt,
+            system_prompt="You are a helpful AI assistant that fixes invalid time slots in Unity-compatible daily plans.",
+            model_name="gemma3",
+            options={"temperature": 0.3},
+            priority="batch"
+        )
+        self._record_usage(prompt, response)
+
+        if response.get("status") != "success":
+            logger.error(f"타임슬롯 수정 API 호출 실패: {response.get('status')}")
+            return {}
+
+        try:
+            response_text = response["response"]
+            matches = re.findall(r'```(?:json)?\s*([\s\S]*?)```', response_text) or re.findall(r'({[\s\S]*})', response_text)
+            if not matches:
+                logger.error("수정 응답에서 JSON을 찾을 수 없습니다.")
+                return {}
+            data = json.loads(max(matches, key=len).strip())
+        except json.JSONDecodeError as e:
+            logger.error(f"수정 응답 JSON 파싱 실패: {e}")
+            return {}
+
+        repairs = {}
+        for item in data.get("repairs", []) if isinstance(data, dict) else []:
+            if not isinstance(item, dict):
+                continue
+            try:
+                index = int(item.get("index"))
+            except (TypeError, ValueError):
+                continue
+            slot = item.get("slot")
+            if index in invalid_slots and isinstance(slot, list):
+                repairs[index] = slot
+        logger.info(f"타임슬롯 수정: 요청 {len(invalid_slots)}개, 응답 {len(repairs)}개")
+        return repairs
@@ -4,8 +4,10 @@
 반성 처리 후 계획을 생성하는 파이프라인을 구현합니다.
 """
 
+import time
 import logging
-from typing import Dict, Any, Tuple
+import threading
+from typing import Dict, Any, Tuple, Optional
 from .plan_generator import PlanGenerator
 
 # validate_unity_plan.py
@@ -18,31 +20,32 @@ from .available_test import (
     OBJECT_LOCATION_MAP
 )
 
-def validate_unity_plan(plan_dict: Dict[str, List], retry_count: int = 0) -> Tuple[bool, str]:
+def find_invalid_slots(plan_dict: Dict[str, List]) -> Dict[int, str]:
     """
-    Unity용 계획의 유효성 검사
+    Unity용 계획에서 유효하지 않은 타임슬롯을 모두 찾음
 
     Args:
         plan_dict (Dict): 계획 데이터 (JSON 파싱 결과)
-        retry_count (int): 재시도 횟수 (0 또는 1)
 
     Returns:
-        Tuple[bool, str]: (유효성 여부, 실패 메시지 또는 성공 메시지)
+        Dict[int, str]: {슬롯 인덱스: 실패 메시지} (모두 유효하면 빈 딕셔너리)
     """
+    invalid = {}
     time_slots = plan_dict.get("time_slots", [])
     for i, slot in enumerate(time_slots):
-        if len(slot) != 6:
-            return False, f"[{i}] 항목 형식 오류: 6개의 요소가 필요합니다."
+        if not isinstance(slot, list) or len(slot) != 6:
+            invalid[i] = f"[{i}] 항목 형식 오류: 6개의 요소가 필요합니다."
+            continue
 
         action, location, target, start_time, end_time, importance = slot
 
         # 1. 액션 유효성
         if action not in VALID_ACTIONS:
-            return False, f"[{i}] 유효하지 않은 액션: '{action}'"
+            invalid[i] = f"[{i}] 유효하지 않은 액션: '{action}'"
 
         # 2. 로케이션 유효성
-        if location not in REGION_LOCATION_OBJECTS:
-            return False, f"[{i}] 존재하지 않는 위치: '{location}'"
+        elif location not in REGION_LOCATION_OBJECTS:
+            invalid[i] = f"[{i}] 존재하지 않는 위치: '{location}'"
 
         # 3. 타겟 유효성
         # location_objects = REGION_LOCATION_OBJECTS[location]
@@ -50,8 +53,8 @@ def validate_unity_plan(plan_dict: Dict[str, List], retry_count: int = 0) -> Tup
         #     return False, f"[{i}] '{location}'에 '{target}' 없음"
 
         # 4. importance 타입 확인
-        if not isinstance(importance, str) or not importance.isdigit():
-            return False, f"[{i}] 중요도 값 오류: 반드시 숫자 형태의 문자열이어야 함 (예: '3')"
+        elif not isinstance(importance, str) or not importance.isdigit():
+            invalid[i] = f"[{i}] 중요도 값 오류: 반드시 숫자 형태의 문자열이어야 함 (예: '3')"
 
         # 5. 액션에 따른 타겟 유효성 검사
         # if action == "find":
@@ -61,8 +64,25 @@ def validate_unity_plan(plan_dict: Dict[str, List], retry_count: int = 0) -> Tup
         #             return False, f"[{i}] '{target}'는 '{location}'에서 발견 불가"
 
         # 대소문자 판별별
-        if not target[0].isupper():
-            return False, f"[{i}] 타겟 대소문자 오류: '{target}'는 첫 글자가 대문자여야 함"
+        elif not isinstance(target, str) or not target[:1].isupper():
+            invalid[i] = f"[{i}] 타겟 대소문자 오류: '{target}'는 첫 글자가 대문자여야 함"
+
+    return invalid
+
+def validate_unity_plan(plan_dict: Dict[str, List], retry_count: int = 0) -> Tuple[bool, str]:
+    """
+    Unity용 계획의 유효성 검사
+
+    Args:
+        plan_dict (Dict): 계획 데이터 (JSON 파싱 결과)
+        retry_count (int): 재시도 횟수 (0 또는 1)
+
+    Returns:
+        Tuple[bool, str]: (유효성 여부, 실패 메시지 또는 성공 메시지)
+    """
+    invalid = find_invalid_slots(plan_dict)
+    if invalid:
+        return False, invalid[min(invalid)]
 
     # 모두 통과
     return True, "✅ 유효한 계획입니다." if retry_count == 0 else "✅ 재생성된 계획이 유효합니다."
@@ -74,17 +94,119 @@ logging.basicConfig(
 )
 logger = logging.getLogger("PlanPipeline")
 
-async def process_plan_request(request_data: Dict[str, Any], ollama_client) -> Tuple[bool, Dict]:
+# 유효성 검사에 실패한 슬롯만 다시 생성하는 최대 횟수 (넘으면 1, 2단계 전체 재생성)
+MAX_REPAIR_ROUNDS = 2
+
+class PlanPipelineStats:
+    """계획 파이프라인 재시도 횟수와 토큰 사용량(버려진 토큰 포함) 통계"""
+
+    COUNTERS = (
+        "requests", "succeeded", "failed", "first_pass_valid",
+        "repair_rounds", "repaired_slots", "full_regenerations",
+        "llm_calls", "total_tokens", "repair_tokens", "wasted_tokens"
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+
+    def add(self, counts: Dict[str, int]):
+        with self.lock:
+            for key, value in counts.items():
+                self.counts[key] += value
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            counts = dict(self.counts)
+        requests = counts["requests"]
+        counts["first_pass_rate"] = round(counts["first_pass_valid"] / requests, 4) if requests else None
+        counts["wasted_token_rate"] = round(counts["wasted_tokens"] / counts["total_tokens"], 4) if counts["total_tokens"] else 0.0
+        return counts
+
+plan_stats = PlanPipelineStats()
+
+def get_plan_pipeline_stats() -> Dict[str, Any]:
+    """계획 파이프라인 통계 (/plan/metrics)"""
+    return plan_stats.stats()
+
+def _spend(plan_generator: PlanGenerator, counts: Dict[str, int]) -> int:
+    """마지막 LLM 호출의 토큰을 통계에 더하고 그 수를 반환"""
+    usage = plan_generator.last_usage
+    tokens = usage["prompt_tokens"] + usage["completion_tokens"]
+    counts["llm_calls"] += 1
+    counts["total_tokens"] += tokens
+    return tokens
+
+async def _build_unity_plan(plan_generator: PlanGenerator, plans: Dict, counts: Dict[str, int]) -> Tuple[Dict, int]:
+    """
+    2단계 변환 후 유효하지 않은 슬롯만 다시 생성
+
+    Returns:
+        (유효한 Unity 계획 또는 빈 딕셔너리, 사용한 토큰 수)
+        실패하면 사용한 토큰은 모두 호출자가 낭비로 집계하고, 성공하면 버려진 슬롯 / 수정 응답 몫만 여기서 집계
+    """
+    unity_plan = await plan_generator.generate_unity_plan(plans)
+    spent = _spend(plan_generator, counts)
+
+    # 형식 자체가 틀리면 부분 수정 불가
+    if not isinstance(unity_plan.get("time_slots"), list) or not unity_plan["time_slots"]:
+        logger.warning("Unity 계획에 time_slots가 없습니다.")
+        return {}, spent
+
+    # 슬롯 하나를 다시 생성하면 그 슬롯 몫의 2단계 출력은 버려짐
+    slot_tokens = plan_generator.last_usage["completion_tokens"] // len(unity_plan["time_slots"])
+    wasted = 0
+
+    for round_index in range(MAX_REPAIR_ROUNDS + 1):
+        invalid = find_invalid_slots(unity_plan)
+        if not invalid:
+            counts["wasted_tokens"] += wasted
+            return unity_plan, spent
+        if round_index == MAX_REPAIR_ROUNDS:
+            break
+
+        logger.warning(f"유효하지 않은 슬롯 {len(invalid)}개 → 해당 슬롯만 다시 생성 ({round_index + 1}/{MAX_REPAIR_ROUNDS})")
+        counts["repair_rounds"] += 1
+        repairs = await plan_generator.repair_unity_plan(plans, unity_plan, invalid)
+        repair_tokens = _spend(plan_generator, counts)
+        counts["repair_tokens"] += repair_tokens
+        spent += repair_tokens
+        if not repairs:
+            wasted += repair_tokens
+            continue
+
+        for index, slot in repairs.items():
+            unity_plan["time_slots"][index] = slot
+        fixed = len(repairs) - len(set(repairs) & set(find_invalid_slots(unity_plan)))
+        counts["repaired_slots"] += fixed
+        wasted += slot_tokens * len(repairs)
+
+    logger.error(f"슬롯 수정 후에도 유효하지 않음: {validate_unity_plan(unity_plan)[1]}")
+    return {}, spent
+
+async def process_plan_request(request_data: Dict[str, Any], ollama_client, plan_data: Optional[Dict] = None,
+                               reflection_data: Optional[Dict] = None,
+                               timings: Optional[Dict[str, float]] = None, worker_pool=None) -> Tuple[bool, Dict]:
     """
     계획 생성 요청 처리
+
+    1단계 계획이 나오면 바로 Unity용 계획으로 변환하고, 유효성 검사에 실패한 타임슬롯은
+    그 슬롯만 다시 생성합니다. 슬롯 수정으로도 해결되지 않으면 1, 2단계를 한 번 다시 실행합니다.
     
     Args:
         request_data: 요청 데이터
         ollama_client: Ollama API 클라이언트 인스턴스
+        plan_data: 미리 로드한 계획 데이터 (지정하면 계획 파일을 읽고 쓰지 않고 이 데이터에 병합)
+        reflection_data: 미리 로드한 반성 데이터 (지정하면 반성 파일을 읽지 않음)
+        timings: 단계별 소요 시간(초)을 기록할 딕셔너리
+                 ("plan", "unity_plan", 전체 재생성 시 "retry_plan", "retry_unity_plan")
+        worker_pool: 계획 / 반성 파일 입출력을 실행할 WorkerPool (None이면 이벤트 루프에서 실행)
     
     Returns:
         Tuple[bool, Dict]: (성공 여부, Unity용 계획 객체)
     """
+    counts = dict.fromkeys(PlanPipelineStats.COUNTERS, 0)
+    counts["requests"] = 1
     try:
         # 요청 데이터 로깅
         logger.info(f"계획 생성 요청: {request_data}")
@@ -108,49 +230,52 @@ async def process_plan_request(request_data: Dict[str, Any], ollama_client) -> T
         plan_generator = PlanGenerator(
             plan_file_path="agent/data/plans.json",
             reflection_file_path="agent/data/reflections.json",
-            ollama_client=ollama_client
+            ollama_client=ollama_client,
+            plan_data=plan_data,
+            reflection_data=reflection_data,
+            worker_pool=worker_pool
         )
         
-        # 1단계: 계획 JSON 생성
-        plans = await plan_generator.generate_plans(agent_name, date)
-        
-        if not plans:
-            logger.error("계획 생성 실패")
-            return False, {}
-        
-        logger.info(f"1단계 계획 생성 성공: {plans}")
-        
-        # 2단계: Unity용 계획 객체 생성
-        unity_plan = await plan_generator.generate_unity_plan(plans)
-        
-        # 3단계 : 유효성 검사 (맵과 오브젝트, 액션 까지 모두 유효한지 검사) 
-        # 만약 유효성 검사 실패 또는 출력 형식에 맞지 않는 결과가 나올 경우 재생성
-
-        # 3단계: 유효성 검사
-        valid, message = validate_unity_plan(unity_plan, retry_count=0)
-        if not valid:
-            logger.warning(f"유효성 검사 실패: {message} → 1회 재시도 시도 중...")
-
-            # 재시도: 1단계, 2단계 다시 실행
-            retry_plans = await plan_generator.generate_plans(agent_name, date)
-            retry_unity_plan = await plan_generator.generate_unity_plan(retry_plans)
-
-            if not retry_unity_plan:
-                logger.error("재생성된 Unity 계획도 실패")
-                return False, {}
-
-            # 재검사
-            valid, message = validate_unity_plan(retry_unity_plan, retry_count=1)
-            if not valid:
-                logger.error(f"재생성된 계획도 유효하지 않음: {message}")
+        for attempt in range(2):
+            # 1단계: 계획 JSON 생성
+            stage_start = time.perf_counter()
+            plans = await plan_generator.generate_plans(agent_name, date)
+            plan_tokens = _spend(plan_generator, counts)
+            if timings is not None:
+                timings["plan" if attempt == 0 else "retry_plan"] = round(time.perf_counter() - stage_start, 3)
+            
+            if not plans:
+                logger.error("계획 생성 실패")
+                counts["wasted_tokens"] += plan_tokens
                 return False, {}
             
-            logger.info(f"✅ 재생성된 계획이 유효함: {message}")
-            return True, retry_unity_plan
-
-        logger.info(f"✅ 계획 유효성 검사 통과: {message}")
-        return True, unity_plan
+            logger.info(f"1단계 계획 생성 성공: {plans}")
+            
+            # 2단계: Unity용 계획 객체 생성 + 3단계: 유효성 검사 (실패한 슬롯만 수정)
+            stage_start = time.perf_counter()
+            unity_plan, unity_tokens = await _build_unity_plan(plan_generator, plans, counts)
+            if timings is not None:
+                timings["unity_plan" if attempt == 0 else "retry_unity_plan"] = round(time.perf_counter() - stage_start, 3)
+            
+            if unity_plan:
+                logger.info(f"✅ 계획 유효성 검사 통과{' (재생성)' if attempt else ''}")
+                counts["succeeded"] = 1
+                if attempt == 0 and counts["repair_rounds"] == 0:
+                    counts["first_pass_valid"] = 1
+                return True, unity_plan
+            
+            # 이번 시도의 결과는 모두 버려짐
+            counts["wasted_tokens"] += plan_tokens + unity_tokens
+            if attempt == 0:
+                logger.warning("슬롯 수정으로 해결되지 않음 → 1, 2단계 1회 재생성")
+                counts["full_regenerations"] += 1
+        
+        logger.error("재생성된 계획도 유효하지 않음")
+        return False, {}
 
     except Exception as e:
         logger.error(f"계획 생성 중 오류 발생: {str(e)}")
-        return False, {}
\ No newline at end of file
+        return False, {}
+    finally:
+        counts["failed"] = 1 - counts["succeeded"]
+        plan_stats.add(counts)
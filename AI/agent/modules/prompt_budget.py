@@ -0,0 +1,265 @@
+"""
+프롬프트 토큰 예산 모듈
+
+프롬프트 빌더(반성, 계획, 대화)가 섹션 단위로 프롬프트를 조립하고, 호출별 토큰 예산을 넘으면
+우선순위가 낮은 섹션부터 줄입니다. 월드가 오래될수록 반성 / 대화 기록이 쌓여 프롬프트가 길어지고,
+CPU에서는 Ollama prefill 시간이 프롬프트 길이에 비례하므로 예산으로 상한을 둡니다.
+
+- estimate_tokens: 토크나이저 없이 쓰는 빠른 토큰 수 추정
+  (영문 단어는 4글자당 1토큰, 숫자 / 구두점 / 한글 등은 글자당 1토큰)
+- PromptBuilder: 섹션 추가 → build()로 예산에 맞게 조립
+  - add(): 일반 텍스트 섹션 (넘치면 keep 방향의 반대쪽을 잘라냄)
+  - add_items(): 항목 목록 섹션 (넘치면 항목 단위로 제외하고 "N개 생략" 요약 줄을 남김)
+  - required=True 섹션은 줄이지 않음
+  - template을 주면 섹션을 {섹션 이름} 자리에 채움
+- 엔드포인트별 프롬프트 토큰 수(평균, p95, 최대)와 잘린 횟수를 기록 (get_prompt_stats)
+
+예산은 엔드포인트별 기본값(DEFAULT_BUDGETS)을 쓰며 configure_budgets로 바꿀 수 있습니다.
+"""
+
+import re
+import math
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional
+
+logger = logging.getLogger("PromptBudget")
+
+# 엔드포인트별 기본 프롬프트 토큰 예산 (None이면 제한 없이 기록만)
+DEFAULT_BUDGETS: Dict[str, Optional[int]] = {
+    "reflection": 3000,
+    "plan": 3500,
+    "conversation": 2000
+}
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\S")
+
+
+def estimate_tokens(text: str) -> int:
+    """텍스트의 토큰 수 추정 (SentencePiece 계열 토크나이저 기준 근사값)"""
+    if not text:
+        return 0
+    return sum(math.ceil(len(piece) / 4) if piece.isascii() and piece.isalpha() else 1
+               for piece in _TOKEN_PATTERN.findall(text))
+
+
+def _cut_text(text: str, max_tokens: int, keep: str) -> str:
+    """텍스트를 max_tokens 이하로 자름 (keep="head"면 앞부분, "tail"이면 뒷부분 유지, 가능하면 줄 단위)"""
+    if max_tokens <= 0:
+        return ""
+    lines = text.splitlines()
+    if keep == "tail":
+        lines.reverse()
+    kept, used = [], 0
+    for line in lines:
+        line_tokens = estimate_tokens(line)
+        if used + line_tokens > max_tokens:
+            # 첫 줄부터 넘치면 글자 단위로 자름
+            if not kept:
+                ratio = max_tokens / line_tokens
+                size = int(len(line) * ratio)
+                kept.append(line[:size] if keep == "head" else line[len(line) - size:])
+            break
+        kept.append(line)
+        used += line_tokens
+    if keep == "tail":
+        kept.reverse()
+    return "\n".join(kept)
+
+
+class _Section:
+    def __init__(self, name: str, priority: int, required: bool, keep: str,
+                 text: str = "", items: Optional[List[str]] = None, header: str = "",
+                 separator: str = "\n", omitted_format: str = "", empty_text: str = ""):
+        self.name = name
+        self.priority = priority
+        self.required = required
+        self.keep = keep
+        self.text = text
+        self.items = list(items) if items is not None else None
+        self.header = header
+        self.separator = separator
+        self.omitted_format = omitted_format
+        self.empty_text = empty_text
+        self.omitted = 0
+        self.truncated = False
+
+    def render(self) -> str:
+        if self.items is None:
+            return self.text
+        parts = list(self.items)
+        if self.omitted and self.omitted_format:
+            note = self.omitted_format.format(count=self.omitted)
+            if self.keep == "tail":
+                parts.insert(0, note)
+            else:
+                parts.append(note)
+        if not parts:
+            return self.empty_text
+        return self.header + self.separator.join(parts)
+
+    def tokens(self) -> int:
+        return estimate_tokens(self.render())
+
+    def shrink(self, excess: int) -> int:
+        """excess 토큰만큼 줄이고 실제로 줄인 토큰 수 반환"""
+        before = self.tokens()
+        if self.items is not None:
+            index = 0 if self.keep == "tail" else -1
+            separator_tokens = estimate_tokens(self.separator)
+            item_tokens = [estimate_tokens(item) + separator_tokens for item in self.items]
+            dropped = 0
+            while self.items and dropped < excess:
+                self.items.pop(index)
+                dropped += item_tokens.pop(index)
+                self.omitted += 1
+        else:
+            self.text = _cut_text(self.text, before - excess, self.keep)
+        reduced = before - self.tokens()
+        if reduced > 0:
+            self.truncated = True
+        return reduced
+
+
+class PromptBuilder:
+    def __init__(self, endpoint: str, budget: Optional[int] = None):
+        """
+        프롬프트 빌더 초기화
+
+        Args:
+            endpoint: 통계 / 예산 구분용 엔드포인트 이름 (예: "plan")
+            budget: 프롬프트 토큰 예산 (None이면 엔드포인트 기본 예산)
+        """
+        self.endpoint = endpoint
+        self.budget = budget if budget is not None else get_token_budget(endpoint)
+        self._sections: List[_Section] = []
+        self.tokens = 0
+        self.original_tokens = 0
+
+    def add(self, name: str, text: str, priority: int = 0, required: bool = False, keep: str = "head") -> "PromptBuilder":
+        """
+        텍스트 섹션 추가
+
+        Args:
+            name: 섹션 이름 (template 사용 시 자리 표시자 이름)
+            text: 섹션 텍스트
+            priority: 클수록 나중에 줄임
+            required: True면 줄이지 않음
+            keep: 넘칠 때 유지할 쪽 ("head" 또는 "tail")
+        """
+        self._sections.append(_Section(name, priority, required, keep, text=text or ""))
+        return self
+
+    def add_items(self, name: str, items: List[str], priority: int = 0, required: bool = False, keep: str = "head",
+                  header: str = "", separator: str = "\n", omitted_format: str = "({count} more omitted)",
+                  empty_text: str = "") -> "PromptBuilder":
+        """
+        항목 목록 섹션 추가 (중요한 항목이 keep 쪽에 오도록 정렬해서 전달)
+
+        Args:
+            name: 섹션 이름
+            items: 항목 텍스트 목록
+            priority: 클수록 나중에 줄임
+            required: True면 줄이지 않음
+            keep: "head"면 앞 항목부터 유지 (뒤에서 제외), "tail"이면 최근(뒤) 항목부터 유지
+            header: 항목이 있을 때 앞에 붙일 텍스트
+            separator: 항목 구분자
+            omitted_format: 제외된 항목 수를 알리는 줄 ({count} 사용, 빈 문자열이면 생략)
+            empty_text: 항목이 하나도 없을 때의 텍스트
+        """
+        self._sections.append(_Section(name, priority, required, keep, items=items, header=header,
+                                       separator=separator, omitted_format=omitted_format, empty_text=empty_text))
+        return self
+
+    def build(self, template: Optional[str] = None) -> str:
+        """
+        예산에 맞게 프롬프트 조립
+
+        Args:
+            template: 섹션 이름을 자리 표시자로 쓰는 템플릿 (None이면 섹션을 추가한 순서대로 이어 붙임)
+
+        Returns:
+            조립된 프롬프트
+        """
+        def assemble() -> str:
+            rendered = {section.name: section.render() for section in self._sections}
+            if template is not None:
+                return template.format(**rendered)
+            return "".join(rendered.values())
+
+        prompt = assemble()
+        self.original_tokens = self.tokens = estimate_tokens(prompt)
+        if self.budget is not None and self.tokens > self.budget:
+            total = self.tokens
+            for section in sorted((s for s in self._sections if not s.required), key=lambda s: s.priority):
+                if total <= self.budget:
+                    break
+                total -= section.shrink(total - self.budget)
+            prompt = assemble()
+            self.tokens = estimate_tokens(prompt)
+
+        truncated = [section.name for section in self._sections if section.truncated]
+        _stats.record(self.endpoint, self.tokens, self.original_tokens, bool(truncated))
+        if truncated:
+            logger.info(f"[{self.endpoint}] 프롬프트 {self.original_tokens} → {self.tokens} 토큰 "
+                        f"(예산 {self.budget}, 줄인 섹션: {', '.join(truncated)})")
+        else:
+            logger.info(f"[{self.endpoint}] 프롬프트 {self.tokens} 토큰")
+        return prompt
+
+
+class PromptStats:
+    """엔드포인트별 프롬프트 토큰 수 통계 (최근 window개로 p95 계산)"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self.lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, endpoint: str, tokens: int, original_tokens: int, truncated: bool):
+        with self.lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = {"count": 0, "truncated": 0, "saved_tokens": 0, "max": 0, "recent": deque(maxlen=self.window)}
+                self._endpoints[endpoint] = entry
+            entry["count"] += 1
+            entry["truncated"] += int(truncated)
+            entry["saved_tokens"] += original_tokens - tokens
+            entry["max"] = max(entry["max"], tokens)
+            entry["recent"].append(tokens)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            result = {}
+            for endpoint, entry in self._endpoints.items():
+                recent = sorted(entry["recent"])
+                result[endpoint] = {
+                    "count": entry["count"],
+                    "budget": get_token_budget(endpoint),
+                    "avg_tokens": round(sum(recent) / len(recent), 1) if recent else 0.0,
+                    "p95_tokens": recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0,
+                    "max_tokens": entry["max"],
+                    "truncated": entry["truncated"],
+                    "saved_tokens": entry["saved_tokens"]
+                }
+            return result
+
+
+_budgets: Dict[str, Optional[int]] = dict(DEFAULT_BUDGETS)
+_stats = PromptStats()
+
+
+def configure_budgets(budgets: Dict[str, Optional[int]]):
+    """엔드포인트별 프롬프트 토큰 예산 변경 (None이면 해당 엔드포인트 제한 해제)"""
+    _budgets.update(budgets)
+
+
+def get_token_budget(endpoint: str) -> Optional[int]:
+    """엔드포인트의 프롬프트 토큰 예산 (없으면 None)"""
+    return _budgets.get(endpoint)
+
+
+def get_prompt_stats() -> Dict[str, Dict[str, Any]]:
+    """엔드포인트별 프롬프트 토큰 통계"""
+    return _stats.stats()
@@ -7,13 +7,18 @@
 import json
 import os
 from typing import Dict, List, Any, Optional, Tuple
-import numpy as np
 from pathlib import Path
 from datetime import datetime
 from .retrieve import MemoryRetriever
+from .memory_scoring import score_memories
+from .reaction_gate import ReactionGate
+from .decision_cache import DecisionCache
+from .worker_pool import WorkerPool, run_blocking
 
 class ReactionDecider:
-    def __init__(self, memory_utils, ollama_client, word2vec_model, similarity_threshold: float = 0.1):
+    def __init__(self, memory_utils, ollama_client, word2vec_model, similarity_threshold: float = 0.1,
+                 gate: Optional[ReactionGate] = None, decision_cache: Optional[DecisionCache] = None,
+                 worker_pool: Optional[WorkerPool] = None):
         """
         반응 판단기 초기화
         
@@ -22,11 +27,17 @@ class ReactionDecider:
             ollama_client: OllamaClient 인스턴스
             word2vec_model: Word2Vec 모델
             similarity_threshold: 유사 메모리 검색을 위한 유사도 임계값
+            gate: 뻔한 경우를 LLM 없이 결정하는 반응 게이트 (None이면 항상 LLM 사용)
+            decision_cache: 짧은 게임 시간 안에 반복된 이벤트의 이전 결정을 재사용하는 캐시 (None이면 사용 안 함)
+            worker_pool: 임베딩 / 유사 메모리 검색을 실행할 작업자 풀 (None이면 이벤트 루프에서 바로 실행)
         """
         self.memory_utils = memory_utils
         self.ollama_client = ollama_client
         self.word2vec_model = word2vec_model
         self.similarity_threshold = similarity_threshold
+        self.gate = gate
+        self.decision_cache = decision_cache
+        self.worker_pool = worker_pool
         
         # 현재 파일의 절대 경로를 기준으로 상위 디렉토리 찾기
         current_dir = Path(__file__).parent
@@ -108,7 +119,7 @@ Keep your explanation concise and provide ONLY this JSON with NO additional text
         agent_name: str,
         top_k: int = 3,
         similarity_threshold: float = 0.1
-    ) -> List[Tuple[Dict[str, Any], float]]:
+    ) -> List[Tuple[Dict[str, Any], float, bool]]:
         """
         유사한 메모리 검색
         
@@ -120,208 +131,27 @@ Keep your explanation concise and provide ONLY this JSON with NO additional text
             similarity_threshold: 유사도 임계값
             
         Returns:
-            List[Tuple[Dict[str, Any], float]]: (메모리, 유사도) 튜플 리스트
+            List[Tuple[Dict[str, Any], float, bool]]: (메모리, 점수, 반성 여부) 튜플 리스트
         """
-        memories = self.memory_utils._load_memories(sort_by_time=True)
-        reflections = self.memory_utils._load_reflections()
+        memories = self.memory_utils._load_memories()
         
-        if agent_name not in memories or not memories[agent_name]["memories"]:
+        if agent_name not in memories or not memories[agent_name].get("memories"):
             return []
         
-        memory_items = []
-        reflection_items = []
-        current_event_embedding_np = np.array(event_embedding)
-        current_state_embedding_np = np.array(state_embedding)
-
-        is_current_event_embedding_zero = np.all(current_event_embedding_np == 0)
-        is_current_state_embedding_zero = np.all(current_state_embedding_np == 0)
-        
-        for memory_id, memory in memories[agent_name]["memories"].items():
-            if memory.get("event") == "" and memory.get("feedback") == "":
-                continue
-            memory_embeddings = memories[agent_name]["embeddings"].get(str(memory_id), {})
-            memory_with_id = memory.copy()
-            memory_with_id["memory_id"] = memory_id
-            # 기본 유사도를 0.01로 설정
-            calculated_event_similarity = 0.01
-            calculated_state_similarity = 0.01
-
-            if memory_embeddings:
-                # feedback 우선 확인
-                if memory_embeddings.get("feedback"):
-                    mem_feedback_embedding_np = np.array(memory_embeddings["feedback"])
-                    if not np.all(mem_feedback_embedding_np == 0): # 메모리의 feedback 임베딩이 0이 아닐 때
-                        if not is_current_event_embedding_zero: # 현재 이벤트 임베딩이 0이 아닐 때
-                            norm_current_event = np.linalg.norm(current_event_embedding_np)
-                            norm_mem_feedback = np.linalg.norm(mem_feedback_embedding_np)
-                            if norm_current_event > 0 and norm_mem_feedback > 0:
-                                calculated_event_similarity = np.dot(current_event_embedding_np, mem_feedback_embedding_np) / (norm_current_event * norm_mem_feedback)
-                        
-                        if not is_current_state_embedding_zero: # 현재 상태 임베딩이 0이 아닐 때
-                            norm_current_state = np.linalg.norm(current_state_embedding_np)
-                            norm_mem_feedback = np.linalg.norm(mem_feedback_embedding_np) # 위에서 계산되었을 수 있음
-                            if norm_current_state > 0 and norm_mem_feedback > 0:
-                                calculated_state_similarity = np.dot(current_state_embedding_np, mem_feedback_embedding_np) / (norm_current_state * norm_mem_feedback)
-                
-                # feedback이 없는 경우에만 event 확인
-                elif memory_embeddings.get("event"):
-                    mem_event_embedding_np = np.array(memory_embeddings["event"])
-                    if not np.all(mem_event_embedding_np == 0): # 메모리의 event 임베딩이 0이 아닐 때
-                        if not is_current_event_embedding_zero: # 현재 이벤트 임베딩이 0이 아닐 때
-                            norm_current_event = np.linalg.norm(current_event_embedding_np)
-                            norm_mem_event = np.linalg.norm(mem_event_embedding_np)
-                            if norm_current_event > 0 and norm_mem_event > 0:
-                                calculated_event_similarity = np.dot(current_event_embedding_np, mem_event_embedding_np) / (norm_current_event * norm_mem_event)
-
-                        if not is_current_state_embedding_zero: # 현재 상태 임베딩이 0이 아닐 때
-                            norm_current_state = np.linalg.norm(current_state_embedding_np)
-                            norm_mem_event = np.linalg.norm(mem_event_embedding_np) # 위에서 계산되었을 수 있음
-                            if norm_current_state > 0 and norm_mem_event > 0:
-                                calculated_state_similarity = np.dot(current_state_embedding_np, mem_event_embedding_np) / (norm_current_state * norm_mem_event)
-                
-            avg_similarity = (calculated_event_similarity + calculated_state_similarity) / 2
-            max_similarity_val = max(calculated_event_similarity, calculated_state_similarity) # 변수명 변경 max_similarity -> max_similarity_val
-            
-            if avg_similarity >= similarity_threshold or max_similarity_val >= similarity_threshold:
-                memory_items.append((memory_with_id, float(calculated_event_similarity), float(calculated_state_similarity), float(avg_similarity), float(max_similarity_val)))
-            else: # 임베딩이 없거나, 계산된 유사도가 낮아도 기본 점수로 추가 (추후 개선 가능)
-                memory_items.append((memory_with_id, 0.01, 0.01, 0.01, 0.01))
-
-
-        # ### 반성 데이터 불안정성, 추후 개선 필요
-        
-        # # 반성 추가 로직 (유사하게 0 임베딩 체크 및 기본 유사도 0.01 적용 필요)
-        # if agent_name in reflections:
-        #     for reflection in reflections[agent_name]["reflections"]:
-        #         reflection_embedding = reflection.get("embedding", [])
-        #         if reflection_embedding:
-        #             max_event_similarity = 0.01
-        #             max_state_similarity = 0.01
-                
-        #             reflection_embedding = np.array(reflection_embedding)
-        #             if not np.all(reflection_embedding == 0):  # 임베딩이 0이 아닐 때만 계산
-        #                 if not is_current_event_embedding_zero:  # 현재 이벤트 임베딩이 0이 아닐 때
-        #                     norm_current_event = np.linalg.norm(current_event_embedding_np)
-        #                     norm_reflection = np.linalg.norm(reflection_embedding)
-        #                     if norm_current_event > 0 and norm_reflection > 0:
-        #                         event_similarity = np.dot(current_event_embedding_np, reflection_embedding) / (norm_current_event * norm_reflection)
-        #                         max_event_similarity = max(max_event_similarity, float(event_similarity))
-                        
-        #                 if not is_current_state_embedding_zero:  # 현재 상태 임베딩이 0이 아닐 때
-        #                     norm_current_state = np.linalg.norm(current_state_embedding_np)
-        #                     norm_reflection = np.linalg.norm(reflection_embedding)  # 위에서 계산되었을 수 있음
-        #                     if norm_current_state > 0 and norm_reflection > 0:
-        #                         state_similarity = np.dot(current_state_embedding_np, reflection_embedding) / (norm_current_state * norm_reflection)
-        #                         max_state_similarity = max(max_state_similarity, float(state_similarity))
-                
-        #             avg_similarity = (max_event_similarity + max_state_similarity) / 2
-        #             max_similarity = max(max_event_similarity, max_state_similarity)
-                    
-        #             if avg_similarity >= similarity_threshold or max_similarity >= similarity_threshold:
-        #                 reflection_items.append((reflection, max_event_similarity, max_state_similarity, avg_similarity, max_similarity))
-        
-        # 시간순으로 정렬하여 가중치 계산
-        def get_time(item):
-            return item.get("time", "")
-            
-        memory_items.sort(key=lambda x: get_time(x[0]), reverse=True)
-        reflection_items.sort(key=lambda x: get_time(x[0]), reverse=True)
-        
-        # -------------------------------------------------------------------
-        # 1) 파라미터: 선형 가중합 계수
-        memory_alpha, memory_beta, memory_gamma = 0.5, 0.2, 0.3
-        K = 20  # 포물선형 시간 가중치 계산용
-
-        valued_items = []
-        to_print_items = []
-
-        ## 메모리 
-        for i, (item, event_sim, state_sim, avg_sim, max_sim) in enumerate(memory_items):
-        
-            # (1) 시간 가중치
-            t = min(i, K) / K
-            time_weight = max(1.0 - t**2, 0.01)
-
-            # (2) 중요도 정규화
-            importance = float(item.get("importance", 3))
-            imp_norm = importance / 10.0
-
-            # (3) 유사도 최고치
-            sim_max = max(event_sim, state_sim)
-
-            # (4) 최종 점수 계산
-            final_score = (
-                memory_alpha * sim_max
-            + memory_beta  * imp_norm
-            + memory_gamma * time_weight
-            )
-
-            valued_items.append((item, final_score, False))
-            # to_print_items.append((item, final_score, sim_max, imp_norm, time_weight, event_sim, state_sim))
-
-        ## 반성
-        
-        # reflection_alpha, reflection_beta, reflection_gamma = 0.7, 0.1, 0.1
-
-
-        # for i, (item, event_sim, state_sim, avg_sim, max_sim) in enumerate(reflection_items):
-        #     # (1) 시간 가중치
-        #     t = min(i, K) / K
-        #     time_weight = max(1.0 - t**2, 0.01)
-
-        #     # (2) 중요도 정규화
-        #     importance = float(item.get("importance", 3))
-        #     imp_norm = importance / 10.0
-
-        #     # (3) 유사도 최고치
-        #     sim_max = max(event_sim, state_sim)
-
-        #     # (4) 최종 점수 계산
-        #     final_score = (
-        #         reflection_alpha * sim_max
-        #     + reflection_beta  * imp_norm
-        #     + reflection_gamma * time_weight
-        #     )
-
-        #     valued_items.append((item, final_score, True))
-        #     to_print_items.append((item, final_score, sim_max, imp_norm, time_weight, event_sim, state_sim))
-
-        # final_score 기준 내림차순 정렬
-        valued_items.sort(key=lambda x: x[1], reverse=True)
-        to_print_items.sort(key=lambda x: x[1], reverse=True)
-
-        # 인자로 넘어온 top_k 사용
-        result = valued_items[:top_k]
-
-        for mem, score, sim_avg, imp_norm, tw, e_sim, s_sim in to_print_items[:top_k]:
-            print(f"=== 메모리 ID: {mem.get('memory_id')} ===")
-            print(f"  Final Score : {score:.4f}")
-            print(f"    sim_max   : {sim_avg:.4f}  (event_sim={e_sim:.4f}, state_sim={s_sim:.4f})")
-            print(f"    importance: {imp_norm:.4f}")
-            print(f"    time_weight: {tw:.4f}")
-            print()
-        
-        # # 결과가 부족한 경우 최근 메모리로 채우기
-        # if len(result) < top_k:
-        #     # 이미 선택된 메모리 ID 수집
-        #     selected_memory_ids = {item.get("memory_id") for item, _ in result}
-            
-        #     # 추가로 필요한 메모리 개수 계산
-        #     needed_count = top_k - len(result)
-            
-        #     # 최근 메모리 가져오기
-        #     recent_memories = self._get_recent_memories(
-        #         agent_name,
-        #         top_k=needed_count,
-        #         exclude_memory_ids=selected_memory_ids
-        #     )
-            
-        #     # 최근 메모리 추가
-        #     result.extend(recent_memories)
-        
-        return result
-
-    
+        # 반성 데이터는 아직 점수 계산에 사용하지 않음 (데이터 불안정성, 추후 개선 필요)
+        # 유사도·중요도·시간 가중치 계산은 memory_scoring.score_memories에서 한 번에 수행
+        # 메모리가 많으면 ANN 인덱스로 유사도 계산 대상을 좁힘 (중요도·시간 가중치는 전체에 적용)
+        candidate_ids = self.memory_utils.find_memory_candidates(agent_name, event_embedding, state_embedding)
+        return score_memories(
+            memories[agent_name]["memories"],
+            self.memory_utils.get_embedding_matrix(agent_name),
+            event_embedding,
+            state_embedding,
+            top_k=top_k,
+            similarity_threshold=similarity_threshold,
+            candidate_ids=candidate_ids,
+            recent_ids=self.memory_utils.recent_memory_ids(agent_name)
+        )
 
     def _format_state(self, state: Dict[str, int]) -> str:
         """
@@ -426,6 +256,11 @@ Keep your explanation concise and provide ONLY this JSON with NO additional text
         
         return f"- {content}\n"
     
+    def _embed_event(self, event: Dict[str, Any]) -> Tuple[str, List[float]]:
+        """이벤트 문장과 임베딩 생성"""
+        event_sentence = self.memory_utils.event_to_sentence(event)
+        return event_sentence, self.memory_utils.get_embedding(event_sentence)
+
     async def should_react_to_event(self, event: Dict[str, Any], agent_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         이벤트에 반응해야 하는지 판단
@@ -439,20 +274,55 @@ Keep your explanation concise and provide ONLY this JSON with NO additional text
         """
         agent_name = agent_data.get("name", "Unknown")
         
-        # 이벤트를 문장으로 변환
-        event_sentence = self.memory_utils.event_to_sentence(event)
-        
-        # 임베딩 생성
-        event_embedding = self.memory_utils.get_embedding(event_sentence)
+        # 이벤트를 문장으로 변환하고 임베딩 생성
+        event_sentence, event_embedding = await run_blocking(
+            self.worker_pool, "react.embedding", self._embed_event, event
+        )
 
 
         need_sentence = self._format_state(agent_data.get("state", {}))
         
+        # 짧은 게임 시간 안에 같은 이벤트를 다시 인식한 경우 이전 결정을 그대로 사용
+        cache_key = None
+        if self.decision_cache is not None:
+            cache_key = self.decision_cache.make_key(event, event_embedding, agent_data.get("state", {}))
+            cached = self.decision_cache.get(agent_name, cache_key, event.get("time"))
+            if cached is not None:
+                print(f"♻️ 이전 결정 재사용: {'반응' if cached['should_react'] else '무시'} (재사용 {cached['hits']}회)")
+                return {
+                    "should_react": cached["should_react"],
+                    "reason": cached["reason"],
+                    "source": "cache",
+                    "cache_key": cache_key,
+                    "memory_id": cached["memory_id"]
+                }
+        
+        # 최근 LLM 판단과 같은 상황이면 LLM 호출 없이 결정 (일부는 정확도 확인을 위해 LLM에도 물어봄)
+        event_role = event.get("event_role", "")
+        gate_decision = None
+        if self.gate is not None:
+            gate_decision = self.gate.classify(agent_name, event_embedding, agent_data.get("state", {}), event_role)
+            if gate_decision is not None and not self.gate.should_audit():
+                print(f"⚡ 게이트 결정: {'반응' if gate_decision['should_react'] else '무시'}, 이유: {gate_decision['reason']}")
+                if self.decision_cache is not None:
+                    self.decision_cache.put(agent_name, cache_key, event.get("time"), gate_decision["should_react"], gate_decision["reason"])
+                return {
+                    "should_react": gate_decision["should_react"],
+                    "reason": gate_decision["reason"],
+                    "source": "gate",
+                    "cache_key": cache_key
+                }
 
-        need_state_embedding = self.memory_utils.get_embedding(need_sentence)
+        need_state_embedding = await run_blocking(
+            self.worker_pool, "react.embedding", self.memory_utils.get_embedding, need_sentence
+        )
 
-        # 유사한 메모리 검색
-        similar_memories = self._find_similar_memories(event_embedding, need_state_embedding, agent_name, 3, 0.1)
+        # 유사한 메모리 검색 (메모리 저장소를 읽으므로 에이전트 잠금을 잡고 store 레인에서 실행)
+        async with self.memory_utils.agent_lock(agent_name):
+            similar_memories = await run_blocking(
+                self.worker_pool, "react.similar_memories", self._find_similar_memories,
+                event_embedding, need_state_embedding, agent_name, 3, 0.1, lane="store"
+            )
         
         # 중복 제거를 위한 Set 사용
         processed_events = set()
@@ -488,7 +358,8 @@ Keep your explanation concise and provide ONLY this JSON with NO additional text
             response = await self.ollama_client.process_prompt(
                 prompt=prompt,
                 system_prompt=system_prompt,
-                model_name="gemma3"
+                model_name="gemma3",
+                priority="interactive"
             )
             
             if response.get("status") != "success":
@@ -513,6 +384,16 @@ Keep your explanation concise and provide ONLY this JSON with NO additional text
                 try:
                     result = json.loads(json_str)
                     print(f"🤔 결정: {'반응' if result.get('should_react', True) else '무시'}, 이유: {result.get('reason', '')}")
+                    if self.gate is not None and isinstance(result.get("should_react"), bool):
+                        self.gate.record(
+                            agent_name, event_embedding, agent_data.get("state", {}), event_role,
+                            result["should_react"], gate_decision=gate_decision,
+                            event_sentence=event_sentence, event_time=event.get("time", "")
+                        )
+                    if self.decision_cache is not None and isinstance(result.get("should_react"), bool):
+                        self.decision_cache.put(agent_name, cache_key, event.get("time"), result["should_react"], result.get("reason", ""))
+                    result["source"] = "llm"
+                    result["cache_key"] = cache_key
                     return result
                 except json.JSONDecodeError:
                     print(f"❌ JSON 파싱 실패: {json_str}")
@@ -0,0 +1,327 @@
+"""
+반응 사전 판단(게이트) 모듈
+
+ReactionDecider가 LLM에 반응 여부를 묻기 전에, 최근에 LLM이 판단한 이벤트와 비교해
+결과가 뻔한 경우(같은 나무를 지나침, Wilson을 또 봄 등)를 LLM 호출 없이 바로 결정합니다.
+
+판단 기준 (에이전트별로 최근 LLM 판단 history_size개를 보관):
+- 이벤트 임베딩 코사인 유사도가 similarity_threshold 이상
+- event_role이 같음
+- 욕구 상태(hunger, sleepiness, loneliness, stress) 차이가 모두 state_tolerance 이하
+위 조건을 만족하는 과거 판단이 min_support개 이상이고 모두 같은 결정이면 그 결정을 따르고,
+아니면 None을 반환해 LLM으로 넘깁니다.
+
+정확도 확인:
+- audit_rate 비율만큼은 게이트가 확신해도 LLM에 물어 두 결정을 비교 (stats의 audit_accuracy)
+- log_path를 지정하면 LLM 판단을 JSONL로 기록하고, evaluate_log로 기록된 트래픽에 게이트를 재생해 정확도 보고
+  (파일이 log_max_bytes를 넘으면 <log_path>.1로 옮기고 새로 시작하므로 최대 두 파일 크기까지만 사용)
+  python -m agent.modules.reaction_gate agent/data/reaction_gate_log.jsonl
+"""
+
+import os
+import json
+import time
+import random
+import threading
+from typing import Dict, List, Any, Optional, Callable
+import numpy as np
+
+NEED_KEYS = ("hunger", "sleepiness", "loneliness", "stress")
+
+
+def state_vector(state: Optional[Dict[str, Any]]) -> np.ndarray:
+    """욕구 상태 딕셔너리를 (hunger, sleepiness, loneliness, stress) 벡터로 변환 (없는 값은 0)"""
+    state = state or {}
+    values = []
+    for key in NEED_KEYS:
+        try:
+            values.append(float(state.get(key, 0) or 0))
+        except (TypeError, ValueError):
+            values.append(0.0)
+    return np.asarray(values, dtype=np.float32)
+
+
+class _AgentHistory:
+    """에이전트별 최근 LLM 판단 링 버퍼"""
+
+    def __init__(self, capacity: int, dim: int):
+        self.capacity = capacity
+        self.embeddings = np.zeros((capacity, dim), dtype=np.float32)
+        self.states = np.zeros((capacity, len(NEED_KEYS)), dtype=np.float32)
+        self.roles = np.zeros(capacity, dtype=np.int32)
+        self.decisions = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.next = 0
+
+    def add(self, embedding: np.ndarray, state: np.ndarray, role: int, decision: bool):
+        i = self.next
+        self.embeddings[i] = embedding
+        self.states[i] = state
+        self.roles[i] = role
+        self.decisions[i] = decision
+        self.next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+
+class ReactionGate:
+    def __init__(
+        self,
+        similarity_threshold: float = 0.97,
+        min_support: int = 2,
+        state_tolerance: float = 15.0,
+        history_size: int = 256,
+        audit_rate: float = 0.05,
+        log_path: Optional[str] = None,
+        log_max_bytes: int = 10 * 1024 * 1024
+    ):
+        """
+        반응 게이트 초기화
+
+        Args:
+            similarity_threshold: 같은 이벤트로 볼 최소 코사인 유사도
+            min_support: 결정을 따르기 위해 필요한 일치 판단 수
+            state_tolerance: 같은 상태로 볼 욕구 값 최대 차이
+            history_size: 에이전트별로 보관할 최근 LLM 판단 수
+            audit_rate: 게이트가 확신한 경우에도 LLM에 물어 비교할 비율 (0이면 비교 안 함)
+            log_path: LLM 판단 기록 JSONL 파일 경로 (None이면 기록 안 함)
+            log_max_bytes: 기록 파일 최대 크기 (넘으면 <log_path>.1로 교체)
+        """
+        self.similarity_threshold = similarity_threshold
+        self.min_support = max(1, min_support)
+        self.state_tolerance = state_tolerance
+        self.history_size = history_size
+        self.audit_rate = audit_rate
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self.lock = threading.Lock()
+        self._log_lock = threading.Lock()  # 로그 기록 / 교체는 한 번에 한 스레드만
+        self._histories: Dict[str, _AgentHistory] = {}
+        self._role_ids: Dict[str, int] = {}
+
+        # 통계
+        self.calls = 0
+        self.gated = 0
+        self.gated_react = 0
+        self.audited = 0
+        self.audit_agree = 0
+        self.total_gate_time = 0.0
+
+    def _role_id(self, event_role: Optional[str]) -> int:
+        role = (event_role or "").strip()
+        role_id = self._role_ids.get(role)
+        if role_id is None:
+            role_id = len(self._role_ids)
+            self._role_ids[role] = role_id
+        return role_id
+
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        if vector.size == 0 or not np.isfinite(norm) or norm == 0:
+            return None
+        return vector / norm
+
+    def classify(self, agent_name: str, event_embedding, state: Optional[Dict[str, Any]], event_role: str = "") -> Optional[Dict[str, Any]]:
+        """
+        뻔한 경우 반응 여부를 바로 결정
+
+        Args:
+            agent_name: 에이전트 이름
+            event_embedding: 이벤트 문장 임베딩
+            state: 에이전트 욕구 상태
+            event_role: 이벤트 주체
+
+        Returns:
+            {"should_react", "reason", "support", "similarity"} 또는 None (LLM으로 넘김)
+        """
+        start = time.perf_counter()
+        with self.lock:
+            self.calls += 1
+            try:
+                history = self._histories.get(agent_name)
+                query = self._normalize(event_embedding)
+                if history is None or history.size == 0 or query is None or query.shape[0] != history.embeddings.shape[1]:
+                    return None
+
+                n = history.size
+                similarities = history.embeddings[:n] @ query
+                mask = similarities >= self.similarity_threshold
+                if not mask.any():
+                    return None
+                mask &= history.roles[:n] == self._role_id(event_role)
+                state_diff = np.abs(history.states[:n] - state_vector(state)).max(axis=1)
+                mask &= state_diff <= self.state_tolerance
+
+                support = int(mask.sum())
+                if support < self.min_support:
+                    return None
+                decisions = history.decisions[:n][mask]
+                if decisions.all():
+                    should_react = True
+                elif not decisions.any():
+                    should_react = False
+                else:
+                    return None
+
+                self.gated += 1
+                if should_react:
+                    self.gated_react += 1
+                similarity = float(similarities[mask].max())
+                return {
+                    "should_react": should_react,
+                    "reason": f"Same decision as {support} recent similar events (similarity {similarity:.3f}).",
+                    "support": support,
+                    "similarity": round(similarity, 4)
+                }
+            finally:
+                self.total_gate_time += time.perf_counter() - start
+
+    def should_audit(self) -> bool:
+        """게이트 결정을 LLM과 비교할지 여부 (audit_rate 확률)"""
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def record(
+        self,
+        agent_name: str,
+        event_embedding,
+        state: Optional[Dict[str, Any]],
+        event_role: str,
+        should_react: bool,
+        gate_decision: Optional[Dict[str, Any]] = None,
+        event_sentence: str = "",
+        event_time: str = ""
+    ):
+        """
+        LLM 판단 결과 기록 (게이트 학습 + 감사 비교 + 로그)
+
+        Args:
+            agent_name: 에이전트 이름
+            event_embedding: 이벤트 문장 임베딩
+            state: 에이전트 욕구 상태
+            event_role: 이벤트 주체
+            should_react: LLM의 결정
+            gate_decision: 같은 이벤트에 대한 게이트 결정 (감사 중이었으면)
+            event_sentence: 로그용 이벤트 문장
+            event_time: 로그용 게임 시간
+        """
+        vector = self._normalize(event_embedding)
+        should_react = bool(should_react)
+        with self.lock:
+            if gate_decision is not None:
+                self.audited += 1
+                if gate_decision["should_react"] == should_react:
+                    self.audit_agree += 1
+            if vector is not None:
+                history = self._histories.get(agent_name)
+                if history is None or history.embeddings.shape[1] != vector.shape[0]:
+                    history = _AgentHistory(self.history_size, vector.shape[0])
+                    self._histories[agent_name] = history
+                history.add(vector, state_vector(state), self._role_id(event_role), should_react)
+
+        if self.log_path:
+            self._append_log({
+                "agent": agent_name,
+                "time": event_time,
+                "event_sentence": event_sentence,
+                "event_role": event_role or "",
+                "state": {key: (state or {}).get(key, 0) for key in NEED_KEYS},
+                "should_react": should_react,
+                "gate_should_react": gate_decision["should_react"] if gate_decision is not None else None
+            })
+
+    def _append_log(self, entry: Dict[str, Any]):
+        try:
+            with self._log_lock:
+                if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= self.log_max_bytes:
+                    os.replace(self.log_path, self.log_path + ".1")
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"❌ 반응 게이트 로그 기록 실패: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """게이트 적용률, 감사 정확도, 평균 판단 시간"""
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "gated": self.gated,
+                "gated_react": self.gated_react,
+                "gated_ignore": self.gated - self.gated_react,
+                "fallthrough": self.calls - self.gated,
+                "gate_rate": round(self.gated / self.calls, 4) if self.calls else 0.0,
+                "audited": self.audited,
+                "audit_agree": self.audit_agree,
+                "audit_accuracy": round(self.audit_agree / self.audited, 4) if self.audited else None,
+                "avg_gate_us": round(self.total_gate_time / self.calls * 1e6, 2) if self.calls else 0.0
+            }
+
+
+def evaluate_log(entries: List[Dict[str, Any]], embed: Callable[[List[str]], Any], **gate_config) -> Dict[str, Any]:
+    """
+    기록된 LLM 판단에 게이트를 순서대로 재생해 정확도 계산
+
+    각 항목마다 게이트가 먼저 판단하고(확신한 경우만 비교), 이어서 LLM 결정을 기록합니다.
+
+    Args:
+        entries: ReactionGate 로그 항목 (시간 순서)
+        embed: 문장 리스트를 임베딩 행렬로 바꾸는 함수
+        gate_config: ReactionGate 설정 (log_path, log_max_bytes, audit_rate는 무시)
+
+    Returns:
+        적용률, 정확도, 오판 종류별 개수
+    """
+    gate_config.pop("log_path", None)
+    gate_config.pop("log_max_bytes", None)
+    gate_config["audit_rate"] = 0
+    gate = ReactionGate(**gate_config)
+    embeddings = embed([entry.get("event_sentence", "") for entry in entries]) if entries else []
+
+    gated = correct = false_react = false_ignore = 0
+    for entry, embedding in zip(entries, embeddings):
+        decision = gate.classify(entry["agent"], embedding, entry.get("state"), entry.get("event_role", ""))
+        if decision is not None:
+            gated += 1
+            if decision["should_react"] == entry["should_react"]:
+                correct += 1
+            elif decision["should_react"]:
+                false_react += 1
+            else:
+                false_ignore += 1
+        gate.record(entry["agent"], embedding, entry.get("state"), entry.get("event_role", ""), entry["should_react"])
+
+    total = len(entries)
+    return {
+        "total": total,
+        "gated": gated,
+        "coverage": round(gated / total, 4) if total else 0.0,
+        "correct": correct,
+        "accuracy": round(correct / gated, 4) if gated else None,
+        "false_react": false_react,    # 게이트는 반응, LLM은 무시
+        "false_ignore": false_ignore,  # 게이트는 무시, LLM은 반응
+        "avg_gate_us": gate.stats()["avg_gate_us"]
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+    from gensim.models import KeyedVectors
+    from .embedding_cache import EmbeddingCache
+
+    root_dir = Path(__file__).parent.parent.parent  # AI 디렉토리
+    log_path = sys.argv[1] if len(sys.argv) > 1 else str(root_dir / "agent" / "data" / "reaction_gate_log.jsonl")
+    kv_path = str(root_dir / "models" / "word2vec-google-news-300.kv")
+
+    if not os.path.exists(log_path):
+        print(f"❌ 로그 파일이 없습니다: {log_path}")
+        sys.exit(1)
+
+    with open(log_path, "r", encoding="utf-8") as f:
+        log_entries = [json.loads(line) for line in f if line.strip()]
+    print(f"📄 기록된 LLM 판단: {len(log_entries)}개")
+
+    model = KeyedVectors.load(kv_path, mmap='r')
+    cache = EmbeddingCache()
+    report = evaluate_log(log_entries, lambda texts: cache.get_embeddings(model, texts, as_array=True))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
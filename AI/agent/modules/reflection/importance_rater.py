@@ -21,20 +21,40 @@ logging.basicConfig(
 logger = logging.getLogger("ImportanceRater")
 
 class ImportanceRater:
-    def __init__(self, ollama_client: OllamaClient):
+    # 배치 프롬프트 길이 추정값 (문자 수)
+    BATCH_PROMPT_OVERHEAD = 1200    # 작업 설명 / 평가 기준 / 응답 형식 안내
+    BATCH_ITEM_OVERHEAD = 110       # 메모리 한 개당 헤더 + JSON 형식 예시
+
+    SYSTEM_PROMPT_SINGLE = "You are a helpful AI assistant that rates memory importance as instructed. Always respond only with a single integer."
+    SYSTEM_PROMPT_BATCH = "You are a helpful AI assistant that rates memory importance as instructed. Always respond only with the requested JSON object."
+    RATING_OPTIONS = {
+        "temperature": 0.1,
+        "top_p": 0.9,
+        "frequency_penalty": 0.0,
+        "presence_penalty": 0.0
+    }
+
+    def __init__(self, ollama_client: OllamaClient, max_batch_size: int = 20, max_prompt_chars: int = 6000):
         """
         메모리 중요도 평가기 초기화 (배치 처리 방식)
         
         Args:
             ollama_client: Ollama API 클라이언트 인스턴스
+            max_batch_size: 한 번의 LLM 호출로 평가할 최대 메모리 개수 (1이면 개별 평가)
+            max_prompt_chars: 배치 프롬프트의 최대 길이 (문자 수, 이 길이에 맞춰 배치 크기 결정)
         """
         self.ollama_client = ollama_client
-        self.MAX_BATCH_SIZE = 100  # 한 번에 처리할 최대 메모리 개수
-        logger.info(f"메모리 중요도 평가기 초기화 (배치 처리 방식, 최대 배치 크기: {self.MAX_BATCH_SIZE})")
+        self.MAX_BATCH_SIZE = max(1, max_batch_size)  # 한 번에 처리할 최대 메모리 개수
+        self.max_prompt_chars = max_prompt_chars
+        logger.info(f"메모리 중요도 평가기 초기화 (배치 처리 방식, 최대 배치 크기: {self.MAX_BATCH_SIZE}, 최대 프롬프트 길이: {self.max_prompt_chars})")
     
     async def add_importance_to_memories(self, memories: Dict, agent_name: str, target_memories: Dict[str, Dict]) -> Dict:
         """
-        메모리에 importance 필드 추가 (항상 개별 처리 방식)
+        메모리에 importance 필드 추가 (배치 처리 방식)
+        
+        프롬프트 길이에 맞춰 메모리를 배치로 나누어 한 번의 호출로 여러 메모리를 평가하고,
+        응답에 1-10 중요도가 없는 메모리만 개별 평가로 다시 요청합니다.
+        배치들은 동시에 보내며 동시 요청 수는 OllamaClient 스케줄러가 제한합니다.
         
         Parameters:
         - memories: 전체 메모리 데이터
@@ -42,7 +62,7 @@ class ImportanceRater:
         - target_memories: importance를 추가할 대상 메모리 목록 (ID를 키로 사용)
         
         Returns:
-        - 업데이트된 메모리 데이터
+        - 업데이트된 메모리 데이터 (중요도를 채운 메모리는 복사본이며 입력 데이터는 바꾸지 않음)
         """
         updated_memories = memories.copy()
         
@@ -50,134 +70,174 @@ class ImportanceRater:
         memories_to_rate = {}
         for memory_id, memory in target_memories.items():
             if "importance" not in memory:
-                memories_to_rate[memory_id] = memory
+                memories_to_rate[str(memory_id)] = memory
             else:
-                logger.info(f"메모리 ID {memory_id}, 이벤트 '{memory.get('event', '')}'는 이미 중요도가 있습니다: {memory.get('importance', 0)}")
+                logger.debug(f"메모리 ID {memory_id}, 이벤트 '{memory.get('event', '')}'는 이미 중요도가 있습니다: {memory.get('importance', 0)}")
         
         if not memories_to_rate:
             logger.info("중요도를 평가할 메모리가 없습니다.")
             return updated_memories
         
-        total_memories_to_rate = len(memories_to_rate)
-        logger.info(f"총 {total_memories_to_rate}개 메모리에 대한 개별 중요도 평가 시작")
+        batches = self._plan_batches(memories_to_rate)
+        logger.info(f"총 {len(memories_to_rate)}개 메모리에 대한 중요도 평가 시작 ({len(batches)}개 배치)")
         
-        processed_count = 0
-        for memory_id, memory_data in memories_to_rate.items():
-            processed_count += 1
-            logger.info(f"메모리 {processed_count}/{total_memories_to_rate} 평가 중 - ID: {memory_id}, 이벤트: '{memory_data.get('event', '')}'")
-            
-            # 개별 평가 프롬프트 생성
-            # 이전 오류 수정을 위해 _create_single_importance_rating_prompt 내부에서 safe_combined_event_text를 사용하도록 이미 수정됨
-            prompt = self._create_single_importance_rating_prompt(memory_data) 
-            logger.debug(f"생성된 개별 프롬프트 (ID: {memory_id}):\n{prompt}")
-            
-            try:
-                logger.info(f"Ollama API 호출 시작 - 메모리 ID: {memory_id}")
-                response = await self.ollama_client.process_prompt(
-                    prompt=prompt,
-                    system_prompt="You are a helpful AI assistant that rates memory importance as instructed. Always respond only with a single integer.",
-                    model_name="gemma3",
-                    options={
-                        "temperature": 0.1,
-                        "top_p": 0.9,
-                        "frequency_penalty": 0.0,
-                        "presence_penalty": 0.0
-                    }
-                )
-                
-                if response and response.get("status") == "success":
-                    logger.info(f"메모리 ID {memory_id} 응답 수신 성공")
-                    importance = self._extract_importance_rating(response["response"])
-                    
-                    if memory_id in updated_memories[agent_name]["memories"]:
-                        updated_memories[agent_name]["memories"][memory_id]["importance"] = importance
-                        logger.info(f"메모리 ID {memory_id}에 중요도 {importance} 추가됨")
-                    else:
-                        logger.warning(f"메모리 ID {memory_id}가 updated_memories에 존재하지 않습니다.")
-                else:
-                    logger.warning(f"메모리 ID {memory_id} 평가 실패 - 응답 상태: {response.get('status') if response else 'None'}. 기본값 5 적용.")
-                    if memory_id in updated_memories[agent_name]["memories"]:
-                        updated_memories[agent_name]["memories"][memory_id]["importance"] = 5
-                    else:
-                        logger.warning(f"메모리 ID {memory_id}가 updated_memories에 존재하지 않아 기본 중요도를 적용할 수 없습니다.")
-            
-            except Exception as e:
-                logger.error(f"메모리 ID {memory_id} 평가 중 오류 발생: {str(e)}")
-                logger.error(f"오류 상세 정보: {type(e).__name__}")
-                import traceback
-                logger.error(f"스택 트레이스:\n{traceback.format_exc()}")
-                logger.info(f"메모리 ID {memory_id}에 기본 중요도 5 적용.")
-                if memory_id in updated_memories[agent_name]["memories"]:
-                    updated_memories[agent_name]["memories"][memory_id]["importance"] = 5
-                else:
-                    logger.warning(f"메모리 ID {memory_id}가 updated_memories에 존재하지 않아 기본 중요도를 적용할 수 없습니다.")
-            
-            # 연속 API 호출 사이에 짧은 지연 추가 (선택 사항, API 정책에 따라 조절)
-            await asyncio.sleep(0.2)
-            
-        logger.info("모든 메모리 중요도 평가 완료.")
+        # 배치 평가
+        batch_results = await asyncio.gather(*[
+            self._rate_batch(batch_ids, [memories_to_rate[memory_id] for memory_id in batch_ids])
+            for batch_ids in batches
+        ])
+        ratings: Dict[str, int] = {}
+        for batch_ratings in batch_results:
+            ratings.update(batch_ratings)
+        
+        # 중요도를 받지 못한 메모리만 개별 재요청
+        missing_ids = [memory_id for memory_id in memories_to_rate if memory_id not in ratings]
+        if missing_ids:
+            logger.warning(f"배치 응답에 중요도가 없는 메모리 {len(missing_ids)}개를 개별 평가합니다: {missing_ids}")
+            ratings.update(await self._rate_memories_individually(missing_ids, memories_to_rate))
+        
+        # 저장소의 메모리 딕셔너리를 직접 바꾸지 않도록 에이전트 데이터와 평가한 메모리만 복사
+        agent_data = dict(updated_memories[agent_name])
+        agent_memories = dict(agent_data["memories"])
+        agent_data["memories"] = agent_memories
+        updated_memories[agent_name] = agent_data
+        for memory_id, importance in ratings.items():
+            if memory_id in agent_memories:
+                agent_memories[memory_id] = {**agent_memories[memory_id], "importance": importance}
+            else:
+                logger.warning(f"메모리 ID {memory_id}가 updated_memories에 존재하지 않습니다.")
+        
+        logger.info(
+            f"모든 메모리 중요도 평가 완료 (메모리 {len(memories_to_rate)}개, "
+            f"LLM 호출 {len(batches) + len(missing_ids)}회: 배치 {len(batches)}회 + 개별 {len(missing_ids)}회)"
+        )
         return updated_memories
     
-    async def _rate_memories_individually(self, memories: Dict, agent_name: str, 
-                                        memory_ids: List[str], target_memories: List[Dict]) -> None:
+    def _plan_batches(self, memories_to_rate: Dict[str, Dict]) -> List[List[str]]:
         """
-        각 메모리를 개별적으로 평가 (배치 처리 실패 시 폴백)
+        예상 프롬프트 길이와 최대 배치 크기에 맞춰 메모리 ID를 배치로 나눔
+        
+        Parameters:
+        - memories_to_rate: 평가할 메모리 (ID를 키로 사용)
+        
+        Returns:
+        - 메모리 ID 배치 목록
+        """
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_chars = self.BATCH_PROMPT_OVERHEAD
+        for memory_id, memory in memories_to_rate.items():
+            item_chars = self.BATCH_ITEM_OVERHEAD + 2 * len(memory_id) + len(self._combine_event_text(memory))
+            if current and (len(current) >= self.MAX_BATCH_SIZE or current_chars + item_chars > self.max_prompt_chars):
+                batches.append(current)
+                current = []
+                current_chars = self.BATCH_PROMPT_OVERHEAD
+            current.append(memory_id)
+            current_chars += item_chars
+        if current:
+            batches.append(current)
+        return batches
+    
+    async def _rate_batch(self, memory_ids: List[str], target_memories: List[Dict]) -> Dict[str, int]:
+        """
+        메모리 여러 개를 한 번의 LLM 호출로 평가
         
         Parameters:
-        - memories: 전체 메모리
-        - agent_name: 에이전트 이름
         - memory_ids: 메모리 ID 목록
         - target_memories: 대상 메모리 객체 목록
+        
+        Returns:
+        - 유효한 중요도를 받은 메모리의 {메모리 ID: 중요도} (실패한 ID는 빠짐)
         """
-        logger.info(f"{len(target_memories)}개 메모리에 대한 개별 평가로 전환")
+        if len(memory_ids) == 1:
+            importance = await self._rate_single_memory(memory_ids[0], target_memories[0])
+            return {memory_ids[0]: importance}
         
-        for i, memory in enumerate(target_memories):
-            memory_id = memory_ids[i]
-            # 메모리 이벤트 및 시간
-            event = memory.get("event", "")
-            time_str = memory.get("time", "")
-            
-            logger.info(f"메모리 ID {memory_id}, 이벤트 '{event}'의 중요도 개별 평가 중...")
-            
-            # 중요도 평가 프롬프트 생성
-            prompt = self._create_single_importance_rating_prompt(memory)
-            
-            try:
-                response = await self.ollama_client.process_prompt(
-                    prompt=prompt,
-                    system_prompt="You are a helpful AI assistant that rates memory importance.",
-                    model_name="gemma3",
-                    options={
-                        "temperature": 0.1,
-                        "top_p": 0.9,
-                        "frequency_penalty": 0.0,
-                        "presence_penalty": 0.0
-                    }
-                )
-                
-                if response and response.get("status") == "success":
-                    # 중요도 추출
-                    importance = self._extract_importance_rating(response["response"])
-                    
-                    # 원본 메모리에 중요도 추가
-                    if memory_id in memories[agent_name]["memories"]:
-                        memories[agent_name]["memories"][memory_id]["importance"] = importance
-                        logger.info(f"메모리 ID {memory_id}, 이벤트 '{event}'에 중요도 {importance} 추가됨")
-                else:
-                    logger.warning(f"메모리 ID {memory_id}, 이벤트 '{event}'의 중요도 개별 평가 실패 - 기본값 적용")
-                    # 기본 중요도 설정
-                    if memory_id in memories[agent_name]["memories"]:
-                        memories[agent_name]["memories"][memory_id]["importance"] = 5
-                        logger.info(f"메모리 ID {memory_id}, 이벤트 '{event}'에 기본 중요도 5 추가됨")
-            except Exception as e:
-                logger.error(f"메모리 ID {memory_id}, 이벤트 '{event}'의 중요도 개별 평가 중 오류 발생: {str(e)}")
-                # 기본 중요도 설정
-                if memory_id in memories[agent_name]["memories"]:
-                    memories[agent_name]["memories"][memory_id]["importance"] = 5
-                    logger.info(f"메모리 ID {memory_id}, 이벤트 '{event}'에 기본 중요도 5 추가됨")
-                        
-            # 연속 API 호출 사이에 짧은 지연 추가
-            await asyncio.sleep(0.2)
+        prompt = self._create_batch_importance_rating_prompt(target_memories, memory_ids)
+        try:
+            response = await self.ollama_client.process_prompt(
+                prompt=prompt,
+                system_prompt=self.SYSTEM_PROMPT_BATCH,
+                model_name="gemma3",
+                options=dict(self.RATING_OPTIONS),
+                priority="batch"
+            )
+        except Exception as e:
+            logger.error(f"배치 중요도 평가 중 오류 발생 (메모리 {len(memory_ids)}개): {str(e)}")
+            return {}
+        
+        if not response or response.get("status") != "success":
+            logger.warning(f"배치 중요도 평가 실패 (메모리 {len(memory_ids)}개) - 응답 상태: {response.get('status') if response else 'None'}")
+            return {}
+        
+        ratings = self._extract_batch_importance_ratings(response["response"], memory_ids)
+        logger.info(f"배치 중요도 평가 완료: {len(ratings)}/{len(memory_ids)}개 유효")
+        return ratings
+    
+    async def _rate_single_memory(self, memory_id: str, memory: Dict) -> int:
+        """
+        메모리 한 개를 개별 평가 (실패 시 기본값 5)
+        
+        Parameters:
+        - memory_id: 메모리 ID
+        - memory: 메모리 데이터
+        
+        Returns:
+        - 중요도 (1-10 정수)
+        """
+        prompt = self._create_single_importance_rating_prompt(memory)
+        try:
+            response = await self.ollama_client.process_prompt(
+                prompt=prompt,
+                system_prompt=self.SYSTEM_PROMPT_SINGLE,
+                model_name="gemma3",
+                options=dict(self.RATING_OPTIONS),
+                priority="batch"
+            )
+        except Exception as e:
+            logger.error(f"메모리 ID {memory_id} 평가 중 오류 발생: {str(e)}. 기본값 5 적용.")
+            return 5
+        
+        if response and response.get("status") == "success":
+            return self._extract_importance_rating(response["response"])
+        logger.warning(f"메모리 ID {memory_id} 평가 실패 - 응답 상태: {response.get('status') if response else 'None'}. 기본값 5 적용.")
+        return 5
+    
+    async def _rate_memories_individually(self, memory_ids: List[str], memories_to_rate: Dict[str, Dict]) -> Dict[str, int]:
+        """
+        각 메모리를 개별적으로 평가 (배치 응답에서 빠진 메모리용 폴백)
+        
+        Parameters:
+        - memory_ids: 개별 평가할 메모리 ID 목록
+        - memories_to_rate: 평가할 메모리 (ID를 키로 사용)
+        
+        Returns:
+        - {메모리 ID: 중요도}
+        """
+        logger.info(f"{len(memory_ids)}개 메모리에 대한 개별 평가로 전환")
+        importances = await asyncio.gather(*[
+            self._rate_single_memory(memory_id, memories_to_rate[memory_id]) for memory_id in memory_ids
+        ])
+        return dict(zip(memory_ids, importances))
+    
+    def _combine_event_text(self, memory: Dict) -> str:
+        """
+        평가 프롬프트에 넣을 통합 이벤트 텍스트 (event_role, event, action, feedback)
+        
+        Parameters:
+        - memory: 메모리 데이터
+        
+        Returns:
+        - 통합 이벤트 텍스트
+        """
+        parts = [
+            memory.get("event_role", ""),
+            memory.get("event", ""),
+            memory.get("action", ""),
+            memory.get("feedback", ""),
+            memory.get("feedback_negative", "")
+        ]
+        return " ".join(str(part) for part in parts if part)
     
     def _create_batch_importance_rating_prompt(self, memories: List[Dict], memory_ids: List[str]) -> str:
         """
@@ -194,25 +254,8 @@ class ImportanceRater:
         memory_list = ""
         for i, memory in enumerate(memories):
             memory_id = memory_ids[i]
-            event_role = memory.get("event_role", "")
-            event = memory.get("event", "")
-            action = memory.get("action", "")
-            feedback = memory.get("feedback", "")
-            time_str = memory.get("time", "")
-            # 통합 이벤트 필드 생성
-            combined_event = ""
-            if event_role:
-                combined_event += f"{event_role} "
-            if event:
-                combined_event += f"{event} "
-            if action:
-                combined_event += f"{action} "
-            if feedback:
-                combined_event += f"{feedback}"
-            
-            memory["combined_event"] = combined_event.strip()
-            logger.debug(f"메모리 ID {memory_id}의 통합 이벤트 필드: '{memory['combined_event']}'")
-
+            combined_event = self._combine_event_text(memory)
+            logger.debug(f"메모리 ID {memory_id}의 통합 이벤트 필드: '{combined_event}'")
 
             memory_list += f"MEMORY #{i+1} (ID: {memory_id}):\n"
             memory_list += f"  MEMORY CONTENT: \"{combined_event}\"\n"
@@ -255,7 +298,6 @@ Provide a JSON object with ratings for each memory. Each rating should be an int
 
 IMPORTANT: Only provide the JSON object with no additional text.
 """
-        print(prompt)
         return prompt
     
     def _create_single_importance_rating_prompt(self, memory: Dict) -> str:
@@ -328,6 +370,7 @@ Provide ONLY a single integer rating from 1 to 10 with no additional text.
         
         Returns:
         - 중요도 평가 딕셔너리 (메모리 ID를 키, 1-10 정수를 값으로 사용)
+          유효한 중요도가 없는 ID는 포함하지 않음
         """
         try:
             logger.info(f"배치 중요도 추출 시작 - 원본 응답: '{response_text}'")
@@ -361,34 +404,33 @@ Provide ONLY a single integer rating from 1 to 10 with no additional text.
                 logger.warning("JSON 응답에 ratings 배열이 없습니다.")
                 return {}
             
-            # 중요도 추출
+            # 중요도 추출 (요청한 ID의 1-10 정수만 인정, 나머지는 호출자가 개별 재평가)
+            requested_ids = {str(memory_id) for memory_id in memory_ids}
             ratings = {}
             for rating_item in data["ratings"]:
-                if "memory_id" in rating_item and "importance" in rating_item:
-                    memory_id = rating_item["memory_id"]
-                    importance = rating_item["importance"]
-                    
-                    # 숫자로 변환 및 범위 확인
-                    if isinstance(importance, int) and 1 <= importance <= 10:
-                        ratings[memory_id] = importance
-                    else:
-                        # 문자열인 경우 숫자로 변환 시도
-                        try:
-                            importance_int = int(importance)
-                            if 1 <= importance_int <= 10:
-                                ratings[memory_id] = importance_int
-                            else:
-                                ratings[memory_id] = 5  # 범위 외 값은 중간값으로 대체
-                        except:
-                            ratings[memory_id] = 5  # 변환 실패 시 중간값 사용
+                if not isinstance(rating_item, dict) or "memory_id" not in rating_item or "importance" not in rating_item:
+                    continue
+                memory_id = str(rating_item["memory_id"]).strip()
+                if memory_id not in requested_ids:
+                    logger.warning(f"요청하지 않은 메모리 ID의 중요도는 무시합니다: {memory_id}")
+                    continue
+                try:
+                    value = float(str(rating_item["importance"]).strip())
+                    if not value.is_integer():
+                        raise ValueError
+                    importance = int(value)
+                except (TypeError, ValueError):
+                    logger.warning(f"메모리 ID {memory_id}의 중요도가 정수가 아닙니다: {rating_item['importance']}")
+                    continue
+                if 1 <= importance <= 10:
+                    ratings[memory_id] = importance
+                else:
+                    logger.warning(f"메모리 ID {memory_id}의 중요도가 범위를 벗어남: {importance} (1-10 범위가 아님)")
             
             # 메모리 개수와 일치하는지 확인
-            if len(ratings) != len(memory_ids):
-                logger.warning(f"중요도 개수({len(ratings)})가 메모리 개수({len(memory_ids)})와 일치하지 않습니다.")
-                # 부족한 경우 기본값으로 채우기
-                for memory_id in memory_ids:
-                    if memory_id not in ratings:
-                        ratings[memory_id] = 5
+            if len(ratings) != len(requested_ids):
+                missing = [memory_id for memory_id in memory_ids if str(memory_id) not in ratings]
+                logger.warning(f"중요도 개수({len(ratings)})가 메모리 개수({len(requested_ids)})와 일치하지 않습니다. 누락: {missing}")
             
             logger.info(f"추출된 중요도 목록: {ratings}")
             return ratings
@@ -498,5 +540,7 @@ if __name__ == "__main__":
                 print(f"메모리 ID: {memory_id}, 이벤트: {test_memories[memory_id]['event']}, 중요도: {importance}")
         else:
             print(f"API 호출 실패: {response.get('status') if response else 'None'}")
+        
+        await ollama_client.close()
     
     asyncio.run(test_batch_rating())
\ No newline at end of file
@@ -11,6 +11,8 @@ import re
 import datetime
 import logging
 from typing import Dict, List, Any, Union
+from ..memory_store import get_memory_store
+from ..agent_locks import get_agent_locks
 
 # 로깅 설정
 logging.basicConfig(
@@ -28,21 +30,28 @@ class MemoryProcessor:
         - memory_file_path: 메모리 JSON 파일 경로
         """
         self.memory_file_path = memory_file_path
+        # 서버의 MemoryUtils와 같은 상주 저장소를 공유
+        self.store = get_memory_store(memory_file_path)
+        # 에이전트별 비동기 잠금 (같은 데이터 디렉토리를 쓰는 모듈끼리 공유)
+        self.agent_locks = get_agent_locks(os.path.dirname(os.path.abspath(memory_file_path)))
         self.today_str = datetime.datetime.now().strftime("%Y.%m.%d")
         
         logger.info(f"메모리 처리기 초기화 (파일: {memory_file_path})")
     
+    def agent_lock(self, *agent_names: str):
+        """에이전트 잠금 (async with로 사용, 에이전트 메모리를 읽거나 쓰는 구간용)"""
+        return self.agent_locks.agent(*agent_names)
+
     def load_memories(self) -> Dict:
         """
-        메모리 JSON 파일 로드
+        메모리 데이터 로드 (상주 저장소에서 가져옴)
         
         Returns:
         - 로드된 메모리 데이터
         """
         try:
-            with open(self.memory_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            logger.info(f"메모리 파일 로드 완료: {self.memory_file_path}")
+            data = self.store.load()
+            logger.info(f"메모리 로드 완료: {self.memory_file_path}")
             return data
         except Exception as e:
             logger.error(f"메모리 파일 로드 오류: {e}")
@@ -50,7 +59,7 @@ class MemoryProcessor:
     
     def save_memories(self, memories: Dict) -> bool:
         """
-        메모리 JSON 파일 저장
+        메모리 데이터 전체 저장 (상주 저장소를 교체하고 새 스냅샷을 기록)
         
         Parameters:
         - memories: 저장할 메모리 데이터
@@ -59,14 +68,33 @@ class MemoryProcessor:
         - 저장 성공 여부
         """
         try:
-            with open(self.memory_file_path, 'w', encoding='utf-8') as f:
-                json.dump(memories, f, ensure_ascii=False, indent=2)
-            logger.info(f"메모리 파일 저장 완료: {self.memory_file_path}")
+            self.store.replace(memories)
+            logger.info(f"메모리 저장 완료: {self.memory_file_path}")
             return True
         except Exception as e:
             logger.error(f"메모리 파일 저장 오류: {e}")
             return False
     
+    def save_importance_ratings(self, agent_name: str, ratings: Dict[str, int]) -> bool:
+        """
+        중요도 평가 결과를 메모리별 저널 레코드로 저장 (전체 파일을 다시 쓰지 않음)
+        
+        Parameters:
+        - agent_name: 에이전트 이름
+        - ratings: {메모리 ID: 중요도}
+        
+        Returns:
+        - 저장 성공 여부
+        """
+        try:
+            for memory_id, importance in ratings.items():
+                self.store.update_memory(agent_name, memory_id, {"importance": importance})
+            logger.info(f"중요도 {len(ratings)}건 저장 완료: {agent_name}")
+            return True
+        except Exception as e:
+            logger.error(f"중요도 저장 오류: {e}")
+            return False
+    
     def filter_todays_memories(self, agent_name: str, date_str: str = None) -> Dict[str, Dict]:
         """
         오늘 날짜(또는 지정한 날짜)의 메모리 필터링
@@ -87,16 +115,14 @@ class MemoryProcessor:
         # 메모리 로드
         memories = self.load_memories()
         
-        # 특정 날짜 메모리 필터링
+        # 특정 날짜 메모리 필터링 (저장소의 날짜 조회, SQLite 백엔드는 (agent, date) 색인)
         filtered_memories = {}
         
         if agent_name in memories and "memories" in memories[agent_name]:
-            for memory_id, memory in memories[agent_name]["memories"].items():
-                time_str = memory.get("time", "")
-                # 날짜 부분만 추출하여 비교
-                memory_date = self._extract_date_from_time(time_str)
-                if memory_date == date_str:
-                    filtered_memories[memory_id] = memory
+            agent_memories = memories[agent_name]["memories"]
+            for memory_id in self.store.memory_ids_on_date(agent_name, date_str):
+                if memory_id in agent_memories:
+                    filtered_memories[memory_id] = agent_memories[memory_id]
         
         logger.info(f"에이전트 '{agent_name}'의 {date_str} 날짜 메모리 {len(filtered_memories)}개를 필터링했습니다.")
         return filtered_memories
@@ -123,28 +149,13 @@ class MemoryProcessor:
         Returns:
         - 최신 날짜 (YYYY.MM.DD 형식) 또는 빈 문자열
         """
-        memory_data = self.load_memories()
-        latest_date = ""
-        latest_datetime = datetime.datetime.min
-        
-        for agent_name in memory_data:
-            if "memories" in memory_data[agent_name]:
-                for memory_id, memory in memory_data[agent_name]["memories"].items():
-                    time_str = memory.get("time", "")
-                    if time_str:
-                        # 날짜 부분 추출 (YYYY.MM.DD)
-                        date_str = self._extract_date_from_time(time_str)
-                        if date_str:
-                            try:
-                                # datetime 객체로 변환하여 비교
-                                date_obj = datetime.datetime.strptime(date_str, "%Y.%m.%d")
-                                if date_obj > latest_datetime:
-                                    latest_datetime = date_obj
-                                    latest_date = date_str
-                            except:
-                                pass
-        
-        return latest_date
+        # YYYY.MM.DD는 문자열 순서가 날짜 순서와 같으므로 저장소에서 최댓값만 조회
+        # (SQLite 백엔드는 에이전트별 (agent, date) 색인 조회)
+        try:
+            return self.store.latest_memory_date()
+        except Exception as e:
+            logger.error(f"최신 메모리 날짜 조회 오류: {e}")
+            return ""
 
     def select_important_memories(self, memories: Dict, agent_name: str, date_str: str = None, top_k: int = 3) -> Dict[str, Dict]:
         """
@@ -165,7 +176,7 @@ class MemoryProcessor:
         # 해당 날짜의 메모리만 필터링
         todays_memories = {}
         if agent_name in memories and "memories" in memories[agent_name]:
-            for memory_id, memory in memories[agent_name]["memories"].items():
+            for memory_id, memory in list(memories[agent_name]["memories"].items()):
                 time_str = memory.get("time", "")
                 memory_date = self._extract_date_from_time(time_str)
                 if memory_date == date_str:
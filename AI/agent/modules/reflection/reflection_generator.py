@@ -13,7 +13,12 @@ import logging
 import asyncio
 from typing import Dict, List, Any, Tuple
 from ..ollama_client import OllamaClient
-import numpy as np
+from ..embedding_cache import get_embedding_cache
+from ..prompt_budget import PromptBuilder
+from ..agent_locks import get_agent_locks
+from ..agent_shards import get_reflection_shards
+from ..game_time import game_minutes, game_day, MINUTES_PER_DAY
+from ..worker_pool import run_blocking
 
 # 로깅 설정
 logging.basicConfig(
@@ -23,18 +28,30 @@ logging.basicConfig(
 logger = logging.getLogger("ReflectionGenerator")
 
 class ReflectionGenerator:
-    def __init__(self, reflection_file_path: str, ollama_client: OllamaClient, embedding_model=None):
+    def __init__(self, reflection_file_path: str, ollama_client: OllamaClient, embedding_model=None,
+                 reflection_data: Dict = None, prompt_token_budget: int = None, worker_pool=None):
         """
         반성 생성기 초기화
         
         Args:
-            reflection_file_path: 반성 데이터 파일 경로
+            reflection_file_path: 반성 데이터 파일 경로 (에이전트별 파일은 확장자를 뺀 디렉토리에 저장)
             ollama_client: Ollama API 클라이언트 인스턴스
             embedding_model: 임베딩 모델 (word2vec 등)
+            reflection_data: 미리 로드한 반성 데이터 (지정하면 파일을 읽지 않고 이 데이터를 사용하며,
+                             저장도 이 데이터에만 반영 - 파일 기록은 호출자가 한 번에 수행)
+            prompt_token_budget: 반성 프롬프트 토큰 예산 (None이면 prompt_budget의 "reflection" 기본 예산)
+            worker_pool: 통찰 임베딩을 실행할 WorkerPool (None이면 이벤트 루프에서 바로 실행)
         """
         self.reflection_file_path = reflection_file_path
         self.ollama_client = ollama_client
         self.embedding_model = embedding_model
+        self.reflection_data = reflection_data
+        self.prompt_token_budget = prompt_token_budget
+        self.worker_pool = worker_pool
+        # 에이전트별 반성 파일 (reflections/<에이전트>.json)
+        self.shards = get_reflection_shards(reflection_file_path)
+        # 에이전트별 비동기 잠금 (같은 데이터 디렉토리를 쓰는 모듈끼리 공유)
+        self.agent_locks = get_agent_locks(os.path.dirname(reflection_file_path))
         
         logger.info(f"ReflectionGenerator 초기화 완료")
         logger.info(f"임베딩 모델 상태: {'사용 가능' if self.embedding_model else '사용 불가'}")
@@ -57,19 +74,30 @@ class ReflectionGenerator:
         
         logger.info(f"반성 생성기 초기화 (파일: {reflection_file_path})")
     
-    def load_reflections(self) -> Dict:
+    def agent_lock(self, *agent_names: str):
+        """에이전트 잠금 (async with로 사용, 반성 파일 읽고-쓰기 구간용)"""
+        return self.agent_locks.agent(*agent_names)
+
+    def load_reflections(self, agent_name: str = None) -> Dict:
         """
-        반성 JSON 파일 로드
+        반성 데이터 로드
+        
+        Parameters:
+        - agent_name: 에이전트 이름 (지정하면 그 에이전트의 파일만 읽음)
         
         Returns:
-        - 로드된 반성 데이터
+        - 로드된 반성 데이터 ({에이전트 이름: {"reflections": [...]}})
         """
+        if self.reflection_data is not None:
+            return self.reflection_data
         try:
-            with open(self.reflection_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            logger.info(f"반성 파일 로드 완료: {self.reflection_file_path}")
+            if agent_name is not None:
+                data = {agent_name: self.shards.load_agent(agent_name)}
+            else:
+                data = self.shards.load_all()
+            logger.info(f"반성 파일 로드 완료: {self.shards.shard_dir} ({agent_name or '전체'})")
             return data
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+        except Exception as e:
             logger.warning(f"반성 파일 로드 오류 (새 파일 생성 예정): {e}")
             return {}
     
@@ -85,8 +113,8 @@ class ReflectionGenerator:
         - 저장 성공 여부
         """
         try:
-            # 기존 반성 파일 로드
-            reflection_data = self.load_reflections()
+            # 기존 반성 파일 로드 (해당 에이전트 파일만)
+            reflection_data = self.load_reflections(agent_name)
             
             # 에이전트가 없으면 생성
             if agent_name not in reflection_data:
@@ -97,11 +125,15 @@ class ReflectionGenerator:
                 reflection_data[agent_name]["reflections"].append(reflection)
                 logger.info(f"{agent_name}의 반성 '{reflection.get('event', '')}' 가 추가되었습니다.")
             
-            # 파일 저장
-            with open(self.reflection_file_path, 'w', encoding='utf-8') as f:
-                json.dump(reflection_data, f, ensure_ascii=False, indent=2)
+            # 미리 로드한 데이터를 쓰는 경우 파일 기록은 호출자가 한 번에 수행
+            if self.reflection_data is not None:
+                logger.info(f"반성 {len(reflections)}개 추가 (파일 기록은 일괄 처리 후)")
+                return True
             
-            logger.info(f"반성 파일 저장 완료: {self.reflection_file_path}")
+            # 에이전트 파일만 임시 파일에 쓴 뒤 교체 (기록 도중 실패해도 기존 파일 유지)
+            self.shards.save_agent(agent_name, reflection_data[agent_name])
+            
+            logger.info(f"반성 파일 저장 완료: {self.shards.path(agent_name)}")
             return True
             
         except Exception as e:
@@ -126,7 +158,7 @@ class ReflectionGenerator:
         logger.info(f"현재 시간: {current_time}")
         
         # 반성 데이터 로드
-        reflection_data = self.load_reflections()
+        reflection_data = self.load_reflections(agent_name)
         # logger.info(f"로드된 반성 데이터: {reflection_data}")
         
         if not reflection_data:
@@ -142,8 +174,11 @@ class ReflectionGenerator:
             return []
         
         try:
-            # 현재 시간을 datetime 객체로 변환
-            current_time_obj = datetime.datetime.strptime(current_time, "%Y.%m.%d.%H:%M")
+            # 현재 시간을 게임 분(정수)으로 변환
+            current_minute = game_minutes(current_time)
+            if current_minute is None:
+                logger.error(f"현재 시간 형식을 해석할 수 없습니다: {current_time}")
+                return []
             
             # 이전 반성 목록
             previous_reflections = []
@@ -152,19 +187,15 @@ class ReflectionGenerator:
                 reflection_time = reflection.get("time", "")
                 logger.debug(f"반성 생성 시간: {reflection_time}")
                 
-                # time 필드에서 날짜 추출
-                date_match = re.search(r'(\d{4}\.\d{2}\.\d{2})', reflection_time)
-                if date_match:
-                    reflection_date_str = date_match.group(1)
-                    logger.debug(f"추출된 반성 날짜: {reflection_date_str}")
+                # time 필드의 날짜를 그날 0시의 게임 분으로 변환 (같은 시간 문자열은 캐시됨)
+                reflection_day = game_day(reflection_time)
+                if reflection_day is not None:
+                    logger.debug(f"추출된 반성 날짜(게임 분): {reflection_day}")
                     try:
-                        # 반성 날짜를 datetime 객체로 변환
-                        reflection_date_obj = datetime.datetime.strptime(reflection_date_str, "%Y.%m.%d")
-                        
                         # 현재 날짜보다 이전 날짜인 경우만 처리
-                        if reflection_date_obj < current_time_obj:
+                        if reflection_day < current_minute:
                             # 날짜 차이 계산 (일 단위)
-                            days_diff = (current_time_obj - reflection_date_obj).days
+                            days_diff = (current_minute - reflection_day) // MINUTES_PER_DAY
                             logger.debug(f"날짜 차이: {days_diff}일")
                             
                             # 최근성 점수 계산 (0에 가까울수록 최근)
@@ -268,7 +299,8 @@ class ReflectionGenerator:
                     "top_p": 0.9,
                     "frequency_penalty": 0.1,
                     "presence_penalty": 0.1
-                }
+                },
+                priority="batch"
             )
             
             if response.get("status") != "success":
@@ -296,37 +328,26 @@ class ReflectionGenerator:
                     # 반성에 원본 이벤트와 통합 이벤트 저장
                     reflection["event"] = combined_event
                     # reflection["original_event"] = original_event
-                    
-                    # 통찰(thought)에 대한 임베딩 생성
-                    if self.embedding_model and "thought" in reflection:
-                        try:
-                            thought = reflection.get("thought", "")
-                            if thought:
-                                logger.info(f"통찰 '{thought}'에 대한 임베딩 생성 시작")
-                                
-                                # 토큰화 및 소문자 변환
-                                tokens = [w.lower() for w in thought.split() if w.lower() in self.embedding_model]
-                                if not tokens:
-                                    embedding = [0.0] * self.embedding_model.vector_size
-                                else:
-                                    # 단어 벡터의 평균을 문장 벡터로 사용
-                                    word_vectors = [self.embedding_model[w] for w in tokens]
-                                    sentence_vector = np.mean(word_vectors, axis=0)
-                                    # 정규화
-                                    norm = np.linalg.norm(sentence_vector)
-                                    if norm > 0:
-                                        sentence_vector = sentence_vector / norm
-                                    embedding = sentence_vector.tolist()
-                                reflection["embedding"] = embedding
-                                logger.info(f"통찰 '{thought}'에 대한 임베딩 생성 완료")
-                            else:
-                                logger.warning("통찰이 비어있어 임베딩을 생성할 수 없습니다.")
-                        except Exception as e:
-                            logger.error(f"임베딩 생성 중 오류 발생: {str(e)}")
                 else:
                     logger.warning(f"메모리 ID {memory_id}에 해당하는 메모리를 찾을 수 없습니다.")
                 
                 reflections.append(reflection)
+
+            # 통찰(thought) 임베딩을 한 번에 생성 (MemoryUtils와 같은 공유 문장 임베딩 캐시 사용)
+            if self.embedding_model:
+                targets = [reflection for reflection in reflections
+                           if reflection.get("memory_id", "") in important_memories and reflection.get("thought", "")]
+                try:
+                    cache = get_embedding_cache(self.embedding_model)
+                    embeddings = await run_blocking(
+                        self.worker_pool, "reflection.embedding", cache.get_embeddings,
+                        self.embedding_model, [reflection["thought"] for reflection in targets]
+                    )
+                    for reflection, embedding in zip(targets, embeddings):
+                        reflection["embedding"] = embedding
+                    logger.info(f"{len(targets)}개의 통찰 임베딩 생성 완료")
+                except Exception as e:
+                    logger.error(f"임베딩 생성 중 오류 발생: {str(e)}")
                 
             logger.info(f"{len(reflections)}개의 반성이 생성되었습니다.")
             return reflections
@@ -396,11 +417,9 @@ Importance: {importance}
         
         memories_text = "\n".join(memory_sections)
         
-        # 이전 반성 섹션 추가 (있는 경우)
-        previous_reflections_text = ""
+        # 이전 반성 섹션 (관련성 순으로 정렬되어 있으므로 예산을 넘으면 뒤에서부터 제외)
+        previous_reflections_sections = []
         if previous_reflections and len(previous_reflections) > 0:
-            previous_reflections_sections = []
-            
             for i, reflection in enumerate(previous_reflections):
                 event = reflection.get("event", "")
                 thought = reflection.get("thought", "")
@@ -414,12 +433,6 @@ Thought: "{thought}"
 Importance: {importance}
 """
                 previous_reflections_sections.append(section)
-            
-            previous_reflections_text = "\n".join(previous_reflections_sections)
-            previous_reflections_text = f"""
-RECENT REFLECTIONS (Consider these for context when generating today's reflections):
-{previous_reflections_text}
-"""
         
         # 기본 프롬프트 생성
         prompt = f"""
@@ -431,10 +444,6 @@ DATE: {current_date}
 
 {memories_text}
 """
-
-        # 이전 반성이 있으면 추가
-        if previous_reflections_text:
-            prompt += previous_reflections_text
         
         # 지시사항 및 출력 형식 추가
         reflection_format = ""
@@ -449,7 +458,7 @@ DATE: {current_date}
     }}{", " if i < len(memories)-1 else ""}
 """
         
-        prompt += f"""
+        instructions = f"""
 INSTRUCTIONS:
 - Process each memory SEPARATELY and create an independent reflection for each
 - Each reflection should be 2-3 VERY SIMPLE sentences
@@ -485,7 +494,16 @@ REFLECTION GUIDELINES:
 - Make sure the reflection is complete and coherent despite its brevity
 """
         
-        return prompt
+        # 토큰 예산을 넘으면 이전 반성만 줄임 (오늘 메모리와 지시사항은 유지)
+        builder = PromptBuilder("reflection", budget=self.prompt_token_budget)
+        builder.add("memories", prompt, required=True)
+        builder.add_items(
+            "previous_reflections", previous_reflections_sections,
+            header="\nRECENT REFLECTIONS (Consider these for context when generating today's reflections):\n",
+            omitted_format="({count} less relevant reflections omitted)"
+        )
+        builder.add("instructions", instructions, required=True)
+        return builder.build()
     
     def _extract_json_from_response(self, response_text: str) -> Dict[str, Any]:
         """
@@ -581,5 +599,7 @@ if __name__ == "__main__":
             print(f"  생각: {reflection.get('thought', '')}")
             print(f"  중요도: {reflection.get('importance', 0)}")
             print(f"  생성 시간: {reflection.get('time', '')}")
+        
+        await ollama_client.close()
     
     asyncio.run(test_reflection())
\ No newline at end of file
@@ -12,10 +12,11 @@ AI 브릿지로부터 요청을 받아 처리하고 결과를 반환합니다.
 """
 
 import os
+import time
 import logging
 import traceback
 import re
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from pathlib import Path
 
 # 각 단계별 처리 모듈 가져오기
@@ -23,6 +24,7 @@ from .memory_processor import MemoryProcessor
 from .importance_rater import ImportanceRater
 from .reflection_generator import ReflectionGenerator
 from ..ollama_client import OllamaClient
+from ..worker_pool import run_blocking
 
 # 로깅 설정
 logging.basicConfig(
@@ -50,7 +52,9 @@ def _extract_date_from_time(time_str: str) -> str:
         return match.group(1)
     return ""
 
-async def process_reflection_request(request_data: Dict[str, Any], ollama_client: OllamaClient, word2vec_model=None) -> bool:
+async def process_reflection_request(request_data: Dict[str, Any], ollama_client: OllamaClient, word2vec_model=None,
+                                     reflection_data: Optional[Dict] = None, timings: Optional[Dict[str, float]] = None,
+                                     worker_pool=None) -> bool:
     """
     AI 브릿지의 반성 요청 처리 파이프라인 (새로운 메모리 구조 대응)
     
@@ -58,6 +62,9 @@ async def process_reflection_request(request_data: Dict[str, Any], ollama_client
     - request_data: AI 브릿지로부터의 요청 데이터
     - ollama_client: Ollama API 클라이언트 인스턴스
     - word2vec_model: word2vec 임베딩 모델 (선택적)
+    - reflection_data: 미리 로드한 반성 데이터 (지정하면 반성 파일을 읽고 쓰지 않고 이 데이터에 추가)
+    - timings: 단계별 소요 시간(초)을 기록할 딕셔너리 ("importance", "reflection")
+    - worker_pool: 반성 파일 입출력(store 레인)과 통찰 임베딩을 실행할 WorkerPool (None이면 이벤트 루프에서 실행)
     
     Returns:
     - 성공 여부 (True/False)
@@ -88,13 +95,6 @@ async def process_reflection_request(request_data: Dict[str, Any], ollama_client
         
         # 1. 메모리 처리기 초기화 및 메모리 로드
         memory_processor = MemoryProcessor(str(memory_file_path))
-        memories = memory_processor.load_memories()
-        
-        if not memories or agent_name not in memories:
-            logger.error(f"에이전트 '{agent_name}'의 메모리를 찾을 수 없습니다.")
-            return False
-        
-        # 2. 특정 날짜의 메모리 필터링 (날짜가 제공된 경우)
         date_str = None
         if agent_date:
             # 날짜 부분만 추출
@@ -102,12 +102,26 @@ async def process_reflection_request(request_data: Dict[str, Any], ollama_client
             if not date_str:
                 logger.error(f"유효하지 않은 날짜 형식: {agent_date}")
                 return False
-            filtered_memories = memory_processor.filter_todays_memories(agent_name, date_str=date_str)
-            logger.info(f"날짜 '{date_str}'로 특정된 메모리를 필터링합니다.")
-        else:
-            # 날짜가 제공되지 않은 경우 최신 날짜 사용
-            filtered_memories = memory_processor.filter_todays_memories(agent_name)
-            logger.info(f"날짜가 제공되지 않아 최신 메모리를 사용합니다.")
+        
+        # 메모리를 읽는 구간만 에이전트 잠금 (중요도 평가 LLM 호출 동안 다른 요청을 막지 않음)
+        async with memory_processor.agent_lock(agent_name):
+            memories = memory_processor.load_memories()
+            
+            if not memories or agent_name not in memories:
+                logger.error(f"에이전트 '{agent_name}'의 메모리를 찾을 수 없습니다.")
+                return False
+            
+            # 2. 특정 날짜의 메모리 필터링 (날짜가 제공된 경우)
+            if date_str:
+                filtered_memories = memory_processor.filter_todays_memories(agent_name, date_str=date_str)
+                logger.info(f"날짜 '{date_str}'로 특정된 메모리를 필터링합니다.")
+            else:
+                # 날짜가 제공되지 않은 경우 최신 날짜 사용
+                filtered_memories = memory_processor.filter_todays_memories(agent_name)
+                logger.info(f"날짜가 제공되지 않아 최신 메모리를 사용합니다.")
+            
+            # 잠금 밖에서 중요도를 채우므로 저장소의 메모리 대신 복사본 사용 (저장은 아래 저널 레코드로만)
+            filtered_memories = {memory_id: dict(memory) for memory_id, memory in filtered_memories.items()}
         
         if not filtered_memories:
             # 해당 날짜에 메모리가 없는 경우
@@ -120,13 +134,25 @@ async def process_reflection_request(request_data: Dict[str, Any], ollama_client
         logger.info(f"{len(filtered_memories)}개의 필터링된 메모리를 찾았습니다.")
         
         # 3. 메모리 중요도 평가 (배치 처리)
+        stage_start = time.perf_counter()
         importance_rater = ImportanceRater(ollama_client)
         logger.info("메모리 중요도 배치 평가 시작...")
-        rated_memories = await importance_rater.add_importance_to_memories(memories, agent_name, filtered_memories)
+        rated_memories = await importance_rater.add_importance_to_memories(
+            {agent_name: {"memories": filtered_memories}}, agent_name, filtered_memories
+        )
         
-        # 4. 업데이트된 메모리 저장
-        memory_processor.save_memories(rated_memories)
+        # 4. 업데이트된 중요도 저장 (메모리별 저널 레코드)
+        agent_rated = rated_memories.get(agent_name, {}).get("memories", {})
+        ratings = {
+            memory_id: agent_rated[memory_id]["importance"]
+            for memory_id in filtered_memories
+            if memory_id in agent_rated and "importance" in agent_rated[memory_id]
+        }
+        async with memory_processor.agent_lock(agent_name):
+            memory_processor.save_importance_ratings(agent_name, ratings)
         logger.info("중요도가 추가된 메모리가 저장되었습니다.")
+        if timings is not None:
+            timings["importance"] = round(time.perf_counter() - stage_start, 3)
         
         # 5. 중요한 메모리 선택 (특정 날짜에 맞게)
         important_memories = memory_processor.select_important_memories(
@@ -142,11 +168,18 @@ async def process_reflection_request(request_data: Dict[str, Any], ollama_client
         logger.info(f"{len(important_memories)}개의 중요한 메모리를 선택했습니다.")
         
         # 6. 반성 생성기 초기화 (word2vec 모델 직접 전달)
-        reflection_generator = ReflectionGenerator(str(reflection_file_path), ollama_client, embedding_model=word2vec_model)
+        stage_start = time.perf_counter()
+        reflection_generator = ReflectionGenerator(
+            str(reflection_file_path), ollama_client,
+            embedding_model=word2vec_model, reflection_data=reflection_data, worker_pool=worker_pool
+        )
         logger.info(f"반성 생성기 초기화 완료 (임베딩 모델: {'사용' if word2vec_model else '미사용'})")
         
         # 7. 이전 반성 가져오기
-        previous_reflections = reflection_generator.get_previous_reflections(agent_name, agent_date)
+        previous_reflections = await run_blocking(
+            worker_pool, "reflection.previous", reflection_generator.get_previous_reflections,
+            agent_name, agent_date, lane="store"
+        )
         
         # 8. 반성 생성
         reflections = await reflection_generator.generate_reflections(agent_name, important_memories, previous_reflections, time=agent_date)
@@ -158,7 +191,13 @@ async def process_reflection_request(request_data: Dict[str, Any], ollama_client
         logger.info(f"{len(reflections)}개의 반성이 생성되었습니다.")
         
         # 9. 반성 저장
-        success = reflection_generator.save_reflections(agent_name, reflections)
+        async with reflection_generator.agent_lock(agent_name):
+            success = await run_blocking(
+                worker_pool, "reflection.save", reflection_generator.save_reflections,
+                agent_name, reflections, lane="store"
+            )
+        if timings is not None:
+            timings["reflection"] = round(time.perf_counter() - stage_start, 3)
         
         if not success:
             logger.error("반성 저장에 실패했습니다.")
@@ -198,6 +237,8 @@ if __name__ == "__main__":
         result = await process_reflection_request(test_request, ollama_client)
         
         print(f"처리 결과: {result}")
+        
+        await ollama_client.close()
     
     # 테스트 실행
     asyncio.run(test_reflection_process())
\ No newline at end of file
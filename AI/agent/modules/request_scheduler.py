@@ -0,0 +1,177 @@
+"""
+LLM 요청 스케줄러 모듈
+
+OllamaClient가 모델별 동시 요청 수를 제한할 때 사용하는 우선순위 스케줄러입니다.
+빈 자리가 생기면 대기 중인 요청 중 우선순위가 가장 높은 요청부터 보냅니다.
+
+우선순위 클래스:
+- interactive: 플레이어/NPC가 기다리는 호출 (/react 판단, /make_reaction, /conversation 턴)
+- normal: 일반 호출 (행동 피드백 등)
+- batch: 백그라운드 대량 작업 (중요도 평가, 반성, 계획 생성)
+
+기아 방지 (aging):
+- 실효 순위 = 클래스 순위 - 대기 시간 / aging_interval
+  예) aging_interval=5초이면 10초 기다린 batch 요청은 막 들어온 interactive 요청과 같은 순위가 됩니다.
+- batch 요청은 동시에 limit - reserved_slots 개까지만 처리해 interactive 요청용 자리를 남겨 둡니다.
+
+클래스별 대기열 길이, 처리 중 개수, 대기 시간(평균/p50/p95/최대)을 metrics()로 확인할 수 있습니다.
+"""
+
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, Optional
+
+PRIORITY_CLASSES = ("interactive", "normal", "batch")
+PRIORITY_RANKS = {name: rank for rank, name in enumerate(PRIORITY_CLASSES)}
+DEFAULT_PRIORITY = "normal"
+
+
+def normalize_priority(priority: Optional[str]) -> str:
+    """알 수 없는 우선순위는 normal로 처리"""
+    return priority if priority in PRIORITY_RANKS else DEFAULT_PRIORITY
+
+
+class _ClassMetrics:
+    def __init__(self, window: int):
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits = deque(maxlen=window)
+
+    def record_wait(self, wait: float):
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        waits = sorted(self.recent_waits)
+        started = self.completed + self.active
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+        return {
+            "queue_depth": self.waiting,
+            "active": self.active,
+            "completed": self.completed,
+            "avg_wait_ms": round(self.total_wait / started * 1000, 2) if started else 0.0,
+            "p50_wait_ms": round(percentile(0.5) * 1000, 2),
+            "p95_wait_ms": round(percentile(0.95) * 1000, 2),
+            "max_wait_ms": round(self.max_wait * 1000, 2)
+        }
+
+
+class PriorityScheduler:
+    def __init__(self, limit: int, aging_interval: float = 5.0, reserved_slots: int = 1, metrics_window: int = 1000):
+        """
+        우선순위 스케줄러 초기화
+
+        Args:
+            limit: 동시에 처리할 최대 요청 수
+            aging_interval: 대기 시간이 이만큼 늘 때마다 순위를 한 단계 올림 (초)
+            reserved_slots: batch 요청이 쓸 수 없는 자리 수 (limit이 1이면 무시)
+            metrics_window: p50/p95 계산에 쓰는 최근 대기 시간 개수
+        """
+        self.limit = max(1, limit)
+        self.aging_interval = aging_interval
+        self.batch_limit = max(1, self.limit - max(0, reserved_slots))
+        self.active = 0
+        self._waiters: List[Dict[str, Any]] = []
+        self._seq = 0
+        self._metrics = {name: _ClassMetrics(metrics_window) for name in PRIORITY_CLASSES}
+
+    def _effective_rank(self, waiter: Dict[str, Any], now: float) -> float:
+        """대기 시간만큼 올라간 실효 순위 (작을수록 먼저)"""
+        waited = now - waiter["enqueued"]
+        return PRIORITY_RANKS[waiter["priority"]] - waited / self.aging_interval
+
+    def _can_start(self, priority: str) -> bool:
+        if self.active >= self.limit:
+            return False
+        if priority == "batch" and self._metrics["batch"].active >= self.batch_limit:
+            return False
+        return True
+
+    def _start(self, priority: str, wait: float):
+        self.active += 1
+        metrics = self._metrics[priority]
+        metrics.active += 1
+        metrics.record_wait(wait)
+
+    def _dispatch(self):
+        """빈 자리가 있는 동안 실효 순위가 가장 높은 대기 요청을 깨움"""
+        while self._waiters and self.active < self.limit:
+            now = time.monotonic()
+            candidates = [waiter for waiter in self._waiters if self._can_start(waiter["priority"])]
+            if not candidates:
+                return
+            waiter = min(candidates, key=lambda w: (self._effective_rank(w, now), w["seq"]))
+            self._waiters.remove(waiter)
+            self._metrics[waiter["priority"]].waiting -= 1
+            if waiter["future"].done():
+                continue
+            self._start(waiter["priority"], now - waiter["enqueued"])
+            waiter["future"].set_result(True)
+
+    async def acquire(self, priority: str = DEFAULT_PRIORITY):
+        """자리가 날 때까지 대기"""
+        priority = normalize_priority(priority)
+        if not self._waiters and self._can_start(priority):
+            self._start(priority, 0.0)
+            return
+
+        self._seq += 1
+        waiter = {
+            "priority": priority,
+            "enqueued": time.monotonic(),
+            "seq": self._seq,
+            "future": asyncio.get_running_loop().create_future()
+        }
+        self._waiters.append(waiter)
+        self._metrics[priority].waiting += 1
+        # 대기열이 있어도 이 요청이 먼저 시작할 수 있는 경우 (batch 제한으로 막힌 요청만 있을 때 등)
+        self._dispatch()
+        try:
+            await waiter["future"]
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._metrics[priority].waiting -= 1
+            elif waiter["future"].done() and not waiter["future"].cancelled():
+                # 자리를 받은 직후 취소된 경우 자리 반납
+                self.release(priority)
+            raise
+
+    def release(self, priority: str = DEFAULT_PRIORITY):
+        """처리 완료 후 자리 반납"""
+        priority = normalize_priority(priority)
+        self.active -= 1
+        metrics = self._metrics[priority]
+        metrics.active -= 1
+        metrics.completed += 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = DEFAULT_PRIORITY):
+        """async with scheduler.slot("interactive"): ... 형태로 자리 사용"""
+        priority = normalize_priority(priority)
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def metrics(self) -> Dict[str, Any]:
+        """클래스별 대기열 길이 / 처리 중 개수 / 대기 시간 통계"""
+        return {
+            "limit": self.limit,
+            "batch_limit": self.batch_limit,
+            "active": self.active,
+            "classes": {name: metrics.snapshot() for name, metrics in self._metrics.items()}
+        }
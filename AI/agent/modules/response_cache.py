@@ -0,0 +1,234 @@
+"""
+LLM 응답 캐시 모듈
+
+temperature가 낮아 사실상 결정적인 process_prompt 호출(중요도 평가 등)의 응답을 재사용합니다.
+키는 모델, 시스템 프롬프트, 프롬프트, 샘플링 옵션을 합친 해시입니다.
+
+- 메모리: TTL이 있는 LRU (OrderedDict)
+- 디스크 (선택): persist_path를 지정하면 sqlite3 파일에 함께 저장하고, 메모리에 없으면 디스크에서 찾음
+  디스크 기록은 백그라운드 스레드가 flush_interval마다 모아서 한 번에 커밋하고,
+  디스크 조회는 get_async가 실행기 스레드에서 수행하므로 이벤트 루프를 막지 않습니다.
+- hits / misses / 저장 거부(temperature 초과) 통계 제공
+"""
+
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+class ResponseCache:
+    def __init__(self, max_size: int = 5000, ttl: float = 7 * 24 * 3600, max_temperature: float = 0.2,
+                 persist_path: Optional[str] = None, flush_interval: float = 1.0):
+        """
+        응답 캐시 초기화
+
+        Args:
+            max_size: 메모리에 보관할 최대 응답 수
+            ttl: 응답 유효 시간 (초)
+            max_temperature: 이 값 이하의 temperature로 호출한 응답만 캐시
+            persist_path: 디스크 캐시(sqlite3) 파일 경로 (None이면 메모리에만 저장)
+            flush_interval: 디스크에 모아서 기록하는 주기 (초)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.persist_path = persist_path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self._db_lock = threading.Lock()  # sqlite 연결은 한 번에 한 스레드만 사용
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # 키 -> (저장 시각, 응답)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._pending: Dict[str, tuple] = {}  # 아직 디스크에 기록하지 않은 응답
+        self._flush_requested = threading.Event()
+        self._stop_event = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        if persist_path:
+            self._open_db()
+        if self._db is not None:
+            self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+            self._writer.start()
+
+    # ------------------------------------------------------------------
+    # 디스크 저장소
+    # ------------------------------------------------------------------
+
+    def _open_db(self):
+        """sqlite3 캐시 파일을 열고 만료된 응답을 정리"""
+        try:
+            os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created REAL, response TEXT)"
+            )
+            self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            self._db.commit()
+        except Exception as e:
+            print(f"❌ LLM 응답 캐시 파일 열기 실패: {e}")
+            self._db = None
+
+    def _db_get(self, key: str) -> Optional[tuple]:
+        try:
+            with self._db_lock:
+                if self._db is None:
+                    return None
+                row = self._db.execute("SELECT created, response FROM responses WHERE key = ?", (key,)).fetchone()
+        except Exception as e:
+            print(f"❌ LLM 응답 캐시 조회 실패: {e}")
+            return None
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def flush(self):
+        """모아 둔 응답을 한 트랜잭션으로 디스크에 기록"""
+        with self.lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        rows = [(key, created, json.dumps(response, ensure_ascii=False))
+                for key, (created, response) in pending.items()]
+        try:
+            with self._db_lock:
+                if self._db is None:
+                    return
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO responses (key, created, response) VALUES (?, ?, ?)", rows
+                )
+                self._db.commit()
+        except Exception as e:
+            print(f"❌ LLM 응답 캐시 저장 실패: {e}")
+
+    def _writer_loop(self):
+        """flush_interval마다 (또는 쌓인 응답이 많으면 바로) 디스크에 기록"""
+        while not self._stop_event.is_set():
+            self._flush_requested.wait(timeout=self.flush_interval)
+            self._flush_requested.clear()
+            self.flush()
+
+    # ------------------------------------------------------------------
+    # 조회 / 저장
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def make_key(model_name: str, system_prompt: Optional[str], prompt: str, options: Dict[str, Any]) -> str:
+        """모델, 시스템 프롬프트, 프롬프트, 샘플링 옵션으로 캐시 키 생성"""
+        payload = json.dumps(
+            {"model": model_name, "system": system_prompt or "", "prompt": prompt, "options": options},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, options: Dict[str, Any]) -> bool:
+        """temperature가 임계값 이하인지 확인 (초과하면 bypassed 카운트)"""
+        temperature = options.get("temperature", 0.7)
+        if temperature is None or temperature > self.max_temperature:
+            with self.lock:
+                self.bypassed += 1
+            return False
+        return True
+
+    def _get_memory(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        """메모리 LRU에서 조회 (hit면 카운트)"""
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[1])
+                del self._entries[key]
+            return None
+
+    def _finish_disk_lookup(self, key: str, entry: Optional[tuple], now: float) -> Optional[Dict[str, Any]]:
+        """디스크 조회 결과 반영 (hit면 메모리에 올림)"""
+        with self.lock:
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._remember(key, entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return dict(entry[1])
+            self.misses += 1
+            return None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """캐시된 응답 반환 (없거나 만료되면 None, 디스크 조회를 호출한 스레드에서 수행)"""
+        now = time.time()
+        cached = self._get_memory(key, now)
+        if cached is not None:
+            return cached
+        return self._finish_disk_lookup(key, self._db_get(key) if self._db is not None else None, now)
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """get과 같지만 디스크 조회는 실행기 스레드에서 수행 (이벤트 루프에서 호출)"""
+        now = time.time()
+        cached = self._get_memory(key, now)
+        if cached is not None:
+            return cached
+        entry = None
+        if self._db is not None:
+            entry = await asyncio.get_running_loop().run_in_executor(None, self._db_get, key)
+        return self._finish_disk_lookup(key, entry, now)
+
+    def _remember(self, key: str, entry: tuple):
+        """메모리 LRU에 저장 (lock 보유 상태에서 호출)"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def put(self, key: str, response: Dict[str, Any]):
+        """성공한 응답 저장 (디스크에는 백그라운드 스레드가 모아서 기록)"""
+        entry = (time.time(), dict(response))
+        with self.lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._pending[key] = entry
+                if len(self._pending) >= 100:
+                    self._flush_requested.set()
+
+    def clear(self):
+        """메모리/디스크 캐시와 통계 초기화"""
+        with self.lock:
+            self._entries.clear()
+            self._pending.clear()
+            self.hits = self.disk_hits = self.misses = self.bypassed = 0
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """캐시 크기와 hit/miss 통계"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+    def close(self):
+        """남은 응답을 디스크에 기록하고 닫기"""
+        self._stop_event.set()
+        self._flush_requested.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -6,22 +6,24 @@
 
 import json
 import os
-from typing import List, Dict, Any, Optional, Tuple, Set
-import numpy as np
+from typing import List, Dict, Any, Optional, Tuple, Set, Union
 from datetime import datetime
 from pathlib import Path
 from .memory_utils import MemoryUtils
+from .memory_scoring import score_memories
+from .object_index import ObjectEmbeddingIndex
 
 class MemoryRetriever:
-    def __init__(self, memory_file_path: str, word2vec_model):
+    def __init__(self, memory_file_path: str, word2vec_model, memory_utils: Optional[MemoryUtils] = None):
         """
         메모리 검색기 초기화
         
         Args:
             memory_file_path: 메모리 JSON 파일 경로
             word2vec_model: Word2Vec 모델
+            memory_utils: 공유할 MemoryUtils 인스턴스 (없으면 새로 생성, 저장소는 동일하게 공유됨)
         """
-        self.memory_utils = MemoryUtils(word2vec_model)
+        self.memory_utils = memory_utils if memory_utils is not None else MemoryUtils(word2vec_model)
         self.memory_file_path = memory_file_path
         self.object_dictionary = self._load_object_dictionary()
 
@@ -44,7 +46,7 @@ class MemoryRetriever:
         self,
         event_embedding: List[float],
         state_embedding: List[float],
-        object_embeddings: Dict[str, Dict[str, List[float]]],
+        object_embeddings: Union[ObjectEmbeddingIndex, Dict[str, Dict[str, List[float]]]],
         top_k: int = 10,
         similarity_threshold: float = 0.01
     ) -> List[Tuple[str, float]]:
@@ -54,53 +56,16 @@ class MemoryRetriever:
         Args:
             event_embedding: 이벤트 임베딩
             state_embedding: 상태 임베딩
-            object_embeddings: 오브젝트 임베딩 딕셔너리
+            object_embeddings: 미리 만든 오브젝트 임베딩 인덱스 (딕셔너리면 호출마다 인덱스를 만듦)
             top_k: 반환할 오브젝트 개수
             similarity_threshold: 유사도 임계값
             
         Returns:
             List[Tuple[str, float]]: (오브젝트 이름, 유사도) 튜플 리스트
         """
-        
-        event_embedding_np = np.array(event_embedding)
-        state_embedding_np = np.array(state_embedding)
-
-        is_event_embedding_zero = np.all(event_embedding_np == 0)
-        is_state_embedding_zero = np.all(state_embedding_np == 0)
-        
-        object_similarities = []
-        
-        for obj_name, obj_data in object_embeddings.items():
-            obj_embedding_np = np.array(obj_data.get("name_only", []))
-            
-            if np.all(obj_embedding_np == 0): # Object embedding이 0이면 건너뛰기
-                continue
-
-            if obj_embedding_np.shape == event_embedding_np.shape:
-                event_similarity = 0.01
-                if not is_event_embedding_zero:
-                    norm_event = np.linalg.norm(event_embedding_np)
-                    norm_obj = np.linalg.norm(obj_embedding_np)
-                    if norm_event > 0 and norm_obj > 0:
-                        event_similarity = np.dot(event_embedding_np, obj_embedding_np) / (norm_event * norm_obj)
-                
-                state_similarity = 0.01
-                if not is_state_embedding_zero:
-                    norm_state = np.linalg.norm(state_embedding_np)
-                    norm_obj = np.linalg.norm(obj_embedding_np) # norm_obj는 위에서 이미 계산되었을 수 있으나, 명확성을 위해 다시 계산
-                    if norm_state > 0 and norm_obj > 0:
-                        state_similarity = np.dot(state_embedding_np, obj_embedding_np) / (norm_state * norm_obj)
-                
-                avg_similarity = (event_similarity + state_similarity) / 2
-                max_similarity = max(event_similarity, state_similarity)
-                
-                if avg_similarity >= similarity_threshold or max_similarity >= similarity_threshold:
-                    object_similarities.append((obj_name, float(event_similarity), float(state_similarity), float(avg_similarity), float(max_similarity)))
-        
-        avg_sorted = sorted(object_similarities, key=lambda x: x[3], reverse=True)
-        max_sorted = sorted(object_similarities, key=lambda x: x[4], reverse=True)
-        
-        return [(obj_name, event_sim) for obj_name, event_sim, _, _, _ in max_sorted[:top_k]]
+        if not isinstance(object_embeddings, ObjectEmbeddingIndex):
+            object_embeddings = ObjectEmbeddingIndex(object_embeddings)
+        return object_embeddings.find_relevant(event_embedding, state_embedding, top_k, similarity_threshold)
 
     def _get_object_description(self, object_name: str) -> str:
         """
@@ -119,7 +84,7 @@ class MemoryRetriever:
         self,
         event_embedding: List[float],
         state_embedding: List[float],
-        object_embeddings: Dict[str, Dict[str, List[float]]],
+        object_embeddings: Union[ObjectEmbeddingIndex, Dict[str, Dict[str, List[float]]]],
         visible_interactables: List[Dict[str, Any]] = None
     ) -> List[str]:
         """
@@ -128,7 +93,7 @@ class MemoryRetriever:
         Args:
             event_embedding: 이벤트 임베딩
             state_embedding: 상태 임베딩
-            object_embeddings: 오브젝트 임베딩 딕셔너리
+            object_embeddings: 오브젝트 임베딩 인덱스
             visible_interactables: 현재 보이는 상호작용 가능한 객체 목록
             
         Returns:
@@ -215,7 +180,7 @@ class MemoryRetriever:
         agent_name: str,
         top_k: int = 3,
         similarity_threshold: float = 0.1
-    ) -> List[Tuple[Dict[str, Any], float]]:
+    ) -> List[Tuple[Dict[str, Any], float, bool]]:
         """
         유사한 메모리 검색
         
@@ -227,206 +192,27 @@ class MemoryRetriever:
             similarity_threshold: 유사도 임계값
             
         Returns:
-            List[Tuple[Dict[str, Any], float]]: (메모리, 유사도) 튜플 리스트
+            List[Tuple[Dict[str, Any], float, bool]]: (메모리, 점수, 반성 여부) 튜플 리스트
         """
-        memories = self.memory_utils._load_memories(sort_by_time=True)
-        reflections = self.memory_utils._load_reflections()
+        memories = self.memory_utils._load_memories()
         
-        if agent_name not in memories or not memories[agent_name]["memories"]:
+        if agent_name not in memories or not memories[agent_name].get("memories"):
             return []
         
-        memory_items = []
-        reflection_items = []
-        current_event_embedding_np = np.array(event_embedding)
-        current_state_embedding_np = np.array(state_embedding)
-
-        is_current_event_embedding_zero = np.all(current_event_embedding_np == 0)
-        is_current_state_embedding_zero = np.all(current_state_embedding_np == 0)
-        
-        for memory_id, memory in memories[agent_name]["memories"].items():
-            if memory.get("event") == "" and memory.get("feedback") == "":
-                continue
-            memory_embeddings = memories[agent_name]["embeddings"].get(str(memory_id), {})
-            memory_with_id = memory.copy()
-            memory_with_id["memory_id"] = memory_id
-            # 기본 유사도를 0.01로 설정
-            calculated_event_similarity = 0.01
-            calculated_state_similarity = 0.01
-
-            if memory_embeddings:
-                # feedback 우선 확인
-                if memory_embeddings.get("feedback"):
-                    mem_feedback_embedding_np = np.array(memory_embeddings["feedback"])
-                    if not np.all(mem_feedback_embedding_np == 0): # 메모리의 feedback 임베딩이 0이 아닐 때
-                        if not is_current_event_embedding_zero: # 현재 이벤트 임베딩이 0이 아닐 때
-                            norm_current_event = np.linalg.norm(current_event_embedding_np)
-                            norm_mem_feedback = np.linalg.norm(mem_feedback_embedding_np)
-                            if norm_current_event > 0 and norm_mem_feedback > 0:
-                                calculated_event_similarity = np.dot(current_event_embedding_np, mem_feedback_embedding_np) / (norm_current_event * norm_mem_feedback)
-                        
-                        if not is_current_state_embedding_zero: # 현재 상태 임베딩이 0이 아닐 때
-                            norm_current_state = np.linalg.norm(current_state_embedding_np)
-                            norm_mem_feedback = np.linalg.norm(mem_feedback_embedding_np) # 위에서 계산되었을 수 있음
-                            if norm_current_state > 0 and norm_mem_feedback > 0:
-                                calculated_state_similarity = np.dot(current_state_embedding_np, mem_feedback_embedding_np) / (norm_current_state * norm_mem_feedback)
-                
-                # feedback이 없는 경우에만 event 확인
-                elif memory_embeddings.get("event"):
-                    mem_event_embedding_np = np.array(memory_embeddings["event"])
-                    if not np.all(mem_event_embedding_np == 0): # 메모리의 event 임베딩이 0이 아닐 때
-                        if not is_current_event_embedding_zero: # 현재 이벤트 임베딩이 0이 아닐 때
-                            norm_current_event = np.linalg.norm(current_event_embedding_np)
-                            norm_mem_event = np.linalg.norm(mem_event_embedding_np)
-                            if norm_current_event > 0 and norm_mem_event > 0:
-                                calculated_event_similarity = np.dot(current_event_embedding_np, mem_event_embedding_np) / (norm_current_event * norm_mem_event)
-
-                        if not is_current_state_embedding_zero: # 현재 상태 임베딩이 0이 아닐 때
-                            norm_current_state = np.linalg.norm(current_state_embedding_np)
-                            norm_mem_event = np.linalg.norm(mem_event_embedding_np) # 위에서 계산되었을 수 있음
-                            if norm_current_state > 0 and norm_mem_event > 0:
-                                calculated_state_similarity = np.dot(current_state_embedding_np, mem_event_embedding_np) / (norm_current_state * norm_mem_event)
-                
-            avg_similarity = (calculated_event_similarity + calculated_state_similarity) / 2
-            max_similarity_val = max(calculated_event_similarity, calculated_state_similarity) # 변수명 변경 max_similarity -> max_similarity_val
-            
-            if avg_similarity >= similarity_threshold or max_similarity_val >= similarity_threshold:
-                memory_items.append((memory_with_id, float(calculated_event_similarity), float(calculated_state_similarity), float(avg_similarity), float(max_similarity_val)))
-            else: # 임베딩이 없거나, 계산된 유사도가 낮아도 기본 점수로 추가 (추후 개선 가능)
-                memory_items.append((memory_with_id, 0.01, 0.01, 0.01, 0.01))
-
-
-        # ### 반성 데이터 불안정성, 추후 개선 필요
-        
-        # # 반성 추가 로직 (유사하게 0 임베딩 체크 및 기본 유사도 0.01 적용 필요)
-        # if agent_name in reflections:
-        #     for reflection in reflections[agent_name]["reflections"]:
-        #         reflection_embedding = reflection.get("embedding", [])
-        #         if reflection_embedding:
-        #             max_event_similarity = 0.01
-        #             max_state_similarity = 0.01
-                
-        #             reflection_embedding = np.array(reflection_embedding)
-        #             if not np.all(reflection_embedding == 0):  # 임베딩이 0이 아닐 때만 계산
-        #                 if not is_current_event_embedding_zero:  # 현재 이벤트 임베딩이 0이 아닐 때
-        #                     norm_current_event = np.linalg.norm(current_event_embedding_np)
-        #                     norm_reflection = np.linalg.norm(reflection_embedding)
-        #                     if norm_current_event > 0 and norm_reflection > 0:
-        #                         event_similarity = np.dot(current_event_embedding_np, reflection_embedding) / (norm_current_event * norm_reflection)
-        #                         max_event_similarity = max(max_event_similarity, float(event_similarity))
-                        
-        #                 if not is_current_state_embedding_zero:  # 현재 상태 임베딩이 0이 아닐 때
-        #                     norm_current_state = np.linalg.norm(current_state_embedding_np)
-        #                     norm_reflection = np.linalg.norm(reflection_embedding)  # 위에서 계산되었을 수 있음
-        #                     if norm_current_state > 0 and norm_reflection > 0:
-        #                         state_similarity = np.dot(current_state_embedding_np, reflection_embedding) / (norm_current_state * norm_reflection)
-        #                         max_state_similarity = max(max_state_similarity, float(state_similarity))
-                
-        #             avg_similarity = (max_event_similarity + max_state_similarity) / 2
-        #             max_similarity = max(max_event_similarity, max_state_similarity)
-                    
-        #             if avg_similarity >= similarity_threshold or max_similarity >= similarity_threshold:
-        #                 reflection_items.append((reflection, max_event_similarity, max_state_similarity, avg_similarity, max_similarity))
-        
-        # 시간순으로 정렬하여 가중치 계산
-        def get_time(item):
-            return item.get("time", "")
-            
-        memory_items.sort(key=lambda x: get_time(x[0]), reverse=True)
-        reflection_items.sort(key=lambda x: get_time(x[0]), reverse=True)
-        
-        # -------------------------------------------------------------------
-        # 1) 파라미터: 선형 가중합 계수
-        memory_alpha, memory_beta, memory_gamma = 0.5, 0.2, 0.3
-        K = 20  # 포물선형 시간 가중치 계산용
-
-        valued_items = []
-        to_print_items = []
-
-        ## 메모리 
-        for i, (item, event_sim, state_sim, avg_sim, max_sim) in enumerate(memory_items):
-        
-            # (1) 시간 가중치
-            t = min(i, K) / K
-            time_weight = max(1.0 - t**2, 0.01)
-
-            # (2) 중요도 정규화
-            importance = float(item.get("importance", 3))
-            imp_norm = importance / 10.0
-
-            # (3) 유사도 최고치
-            sim_max = max(event_sim, state_sim)
-
-            # (4) 최종 점수 계산
-            final_score = (
-                memory_alpha * sim_max
-            + memory_beta  * imp_norm
-            + memory_gamma * time_weight
-            )
-
-            valued_items.append((item, final_score, False))
-            # to_print_items.append((item, final_score, sim_max, imp_norm, time_weight, event_sim, state_sim))
-
-        ## 반성
-        
-        # reflection_alpha, reflection_beta, reflection_gamma = 0.7, 0.1, 0.1
-
-
-        # for i, (item, event_sim, state_sim, avg_sim, max_sim) in enumerate(reflection_items):
-        #     # (1) 시간 가중치
-        #     t = min(i, K) / K
-        #     time_weight = max(1.0 - t**2, 0.01)
-
-        #     # (2) 중요도 정규화
-        #     importance = float(item.get("importance", 3))
-        #     imp_norm = importance / 10.0
-
-        #     # (3) 유사도 최고치
-        #     sim_max = max(event_sim, state_sim)
-
-        #     # (4) 최종 점수 계산
-        #     final_score = (
-        #         reflection_alpha * sim_max
-        #     + reflection_beta  * imp_norm
-        #     + reflection_gamma * time_weight
-        #     )
-
-        #     valued_items.append((item, final_score, True))
-        #     to_print_items.append((item, final_score, sim_max, imp_norm, time_weight, event_sim, state_sim))
-
-        # final_score 기준 내림차순 정렬
-        valued_items.sort(key=lambda x: x[1], reverse=True)
-        to_print_items.sort(key=lambda x: x[1], reverse=True)
-
-        # 인자로 넘어온 top_k 사용
-        result = valued_items[:top_k]
-
-        # for mem, score, sim_avg, imp_norm, tw, e_sim, s_sim in to_print_items[:top_k]:
-        #     print(f"=== 메모리 ID: {mem.get('memory_id')} ===")
-        #     print(f"  Final Score : {score:.4f}")
-        #     print(f"    sim_max   : {sim_avg:.4f}  (event_sim={e_sim:.4f}, state_sim={s_sim:.4f})")
-        #     print(f"    importance: {imp_norm:.4f}")
-        #     print(f"    time_weight: {tw:.4f}")
-        #     print()
-        
-        # # 결과가 부족한 경우 최근 메모리로 채우기
-        # if len(result) < top_k:
-        #     # 이미 선택된 메모리 ID 수집
-        #     selected_memory_ids = {item.get("memory_id") for item, _ in result}
-            
-        #     # 추가로 필요한 메모리 개수 계산
-        #     needed_count = top_k - len(result)
-            
-        #     # 최근 메모리 가져오기
-        #     recent_memories = self._get_recent_memories(
-        #         agent_name,
-        #         top_k=needed_count,
-        #         exclude_memory_ids=selected_memory_ids
-        #     )
-            
-        #     # 최근 메모리 추가
-        #     result.extend(recent_memories)
-        
-        return result
+        # 반성 데이터는 아직 점수 계산에 사용하지 않음 (데이터 불안정성, 추후 개선 필요)
+        # 유사도·중요도·시간 가중치 계산은 memory_scoring.score_memories에서 한 번에 수행
+        # 메모리가 많으면 ANN 인덱스로 유사도 계산 대상을 좁힘 (중요도·시간 가중치는 전체에 적용)
+        candidate_ids = self.memory_utils.find_memory_candidates(agent_name, event_embedding, state_embedding)
+        return score_memories(
+            memories[agent_name]["memories"],
+            self.memory_utils.get_embedding_matrix(agent_name),
+            event_embedding,
+            state_embedding,
+            top_k=top_k,
+            similarity_threshold=similarity_threshold,
+            candidate_ids=candidate_ids,
+            recent_ids=self.memory_utils.recent_memory_ids(agent_name)
+        )
 
     def _create_event_string(self, memory: Dict[str, Any], is_reflection: bool) -> str:
         """
@@ -584,7 +370,7 @@ class MemoryRetriever:
         agent_data: Dict[str, Any] = None,
         similar_data_cnt: int = 3,
         similarity_threshold: float = 0.5,
-        object_embeddings: List[Dict[str, Any]] = None
+        object_embeddings: Optional[ObjectEmbeddingIndex] = None
     ) -> Optional[str]:
         """
         이벤트에 대한 반응을 결정하기 위한 프롬프트 생성
@@ -599,7 +385,7 @@ class MemoryRetriever:
             agent_data: 에이전트 데이터 (성격, 위치, 상호작용 가능한 객체 등)
             similar_data_cnt: 유사한 이벤트 개수
             similarity_threshold: 유사도 임계값
-            object_embeddings: 오브젝트 임베딩 리스트
+            object_embeddings: 오브젝트 임베딩 인덱스
             
         Returns:
             Optional[str]: 생성된 프롬프트
@@ -703,18 +489,16 @@ class MemoryRetriever:
         if agent_name not in memories:
             return []
             
-        # 메모리를 시간순으로 정렬
+        # 저장소 시간 인덱스에서 최신 top_k개만 가져옴 (전체 복사 / 정렬 없음)
+        agent_memories = memories[agent_name]["memories"]
         memory_list = []
-        for memory_id, memory in memories[agent_name]["memories"].items():
-            if exclude_memory_ids and memory_id in exclude_memory_ids:
+        for memory_id in self.memory_utils.recent_memory_ids(agent_name, top_k, exclude=exclude_memory_ids):
+            memory = agent_memories.get(memory_id)
+            if memory is None:
                 continue
-                
             memory_with_id = memory.copy()
             memory_with_id["memory_id"] = memory_id
             memory_list.append(memory_with_id)
-            
-        # 시간 기준으로 정렬 (최신순)
-        memory_list.sort(key=lambda x: x.get("time", ""), reverse=True)
         
         # 상위 k개 메모리 반환 (기본 유사도 0.5 부여)
-        return [(memory, 0.5) for memory in memory_list[:top_k]]
\ No newline at end of file
+        return [(memory, 0.5) for memory in memory_list]
\ No newline at end of file
@@ -358,54 +358,27 @@ class SimpleFeedbackProcessor:
 
             # 메모리 데이터 로드
             memories = self.memory_utils._load_memories()
-            
-            # 에이전트가 존재하는지 확인
-            if agent_name not in memories:
-                memories[agent_name] = {"memories": {}}
-            
-            if "memories" not in memories[agent_name]:
-                memories[agent_name]["memories"] = {}
+            agent_memories = memories.get(agent_name, {}).get("memories", {})
             
             # 이벤트 텍스트 생성
             event_text = self._create_event_text(action, interactable, current_location)
             
             # 메모리 ID가 있으면 해당 메모리에 피드백 저장
             if memory_id:
-                agent_memories = memories[agent_name]["memories"]
-                
                 # 메모리 ID가 존재하는지 확인
                 if memory_id in agent_memories:
-                    # 기존 메모리에 통합 피드백 추가
-                    agent_memories[memory_id]["feedback"] = feedback_sentence
-                    # 기존 메모리에 부정 피드백 추가
-                    agent_memories[memory_id]["feedback_negative"] = feedback_sentence_negative
-                    print(f"✅ 메모리 ID {memory_id}에 통합 피드백 저장")
-
+                    # 기존 메모리에 통합 피드백, 부정 피드백 추가
+                    fields = {
+                        "feedback": feedback_sentence,
+                        "feedback_negative": feedback_sentence_negative
+                    }
                     if importance != 0:
-                        agent_memories[memory_id]["importance"] = importance
-
-                    self.memory_utils._save_memories(memories)
+                        fields["importance"] = importance
                     
-                    # 임베딩 데이터 저장
-                    print(f"🔍 임베딩 저장 시작 - agent_name: {agent_name}, memory_id: {memory_id}")
-                    if "embeddings" not in memories[agent_name]:
-                        print("📁 embeddings 디렉토리 생성")
-                        memories[agent_name]["embeddings"] = {}
-                    if memory_id not in memories[agent_name]["embeddings"]:
-                        print("📝 새로운 memory_id에 대한 임베딩 구조 생성")
-                        memories[agent_name]["embeddings"][memory_id] = {
-                            "event": [],
-                            "action": [],
-                            "feedback": []
-                        }
+                    # 피드백과 피드백 임베딩을 저널 레코드 하나로 저장
                     print(f"💾 임베딩 저장 시도 - embedding 길이: {len(embedding) if embedding else 'None'}")
-                    memories[agent_name]["embeddings"][memory_id]["feedback"] = embedding
-                    print("✅ 임베딩 저장 완료")
-
-
-                    # 메모리 저장 확인
-                    self.memory_utils._save_memories(memories)
-                    print("💾 메모리 파일 저장 완료")
+                    self.memory_utils.store.update_memory(agent_name, memory_id, fields, {"feedback": embedding})
+                    print(f"✅ 메모리 ID {memory_id}에 통합 피드백 저장")
 
                     return {
                         "success": True,
@@ -419,8 +392,7 @@ class SimpleFeedbackProcessor:
             # 새 메모리 생성 
             if memory_id == "":
                 # 새 ID로 메모리 생성
-                new_memory_id = self.memory_utils._get_next_memory_id(agent_name)
-                memories[agent_name]["memories"][new_memory_id] = {
+                new_memory = {
                     "event_role": "",
                     "event": event_text,  # 안전하게 생성된 이벤트 텍스트
                     "action": action if action else "",
@@ -432,28 +404,15 @@ class SimpleFeedbackProcessor:
                     "event_location": ""
                 }
                 if importance != 0:
-                    memories[agent_name]["memories"][new_memory_id]["importance"] = importance
+                    new_memory["importance"] = importance
 
-                print(f"✅ 새 메모리 ID {new_memory_id}에 통합 피드백 저장")
-                self.memory_utils._save_memories(memories)
-                    
-                # 임베딩 데이터 저장
-                print(f"🔍 임베딩 저장 시작 - agent_name: {agent_name}, memory_id: {memory_id}")
-                if "embeddings" not in memories[agent_name]:
-                    print("📁 embeddings 디렉토리 생성")
-                    memories[agent_name]["embeddings"] = {}
-                if memory_id not in memories[agent_name]["embeddings"]:
-                    print("📝 새로운 memory_id에 대한 임베딩 구조 생성")
-                    memories[agent_name]["embeddings"][new_memory_id] = {
-                        "event": [],
-                        "action": [],
-                        "feedback": []
-                    }
                 print(f"💾 임베딩 저장 시도 - embedding 길이: {len(embedding) if embedding else 'None'}")
-                memories[agent_name]["embeddings"][new_memory_id]["feedback"] = embedding
-                print("✅ 임베딩 저장 완료")
-                # 메모리 저장 확인
-                self.memory_utils._save_memories(memories)
+                new_memory_id = self.memory_utils.store.add_memory(agent_name, new_memory, {
+                    "event": [],
+                    "action": [],
+                    "feedback": embedding
+                })
+                print(f"✅ 새 메모리 ID {new_memory_id}에 통합 피드백 저장")
                 
                 return {
                     "success": True,
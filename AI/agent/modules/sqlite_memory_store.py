@@ -0,0 +1,305 @@
+"""
+SQLite 메모리 저장소 모듈
+
+MemoryStore와 같은 API를 제공하면서 메모리 텍스트를 sqlite3 파일(WAL 모드)에 메모리 한 개당 한 행으로 저장합니다.
+configure_memory_store(backend="sqlite")로 선택하며, 메모리 데이터는 JSON 백엔드와 마찬가지로 프로세스에 상주합니다.
+
+- 쓰기(put / update / delete)마다 해당 행만 바로 기록하므로 JSON 스냅샷 compaction이 필요 없습니다.
+- 조회용 열과 색인
+  - minute: 기록할 때 계산한 정수 게임 분 (시간 문자열 대신 정렬 기준으로 사용, date도 이 값에서 계산)
+  - (agent, date): memory_ids_on_date, latest_memory_date (에이전트별 MAX(date))
+  - (agent, event_type, event_location, minute): find_memory_ids (위치 기억 덮어쓰기, 이전 대화 검색)
+  - (agent, importance): 중요도 기준 조회용
+- 임베딩은 JSON 백엔드와 같이 memories_embeddings/<에이전트>.npz 행렬 파일(ID 목록과 행렬을 함께 저장)에 저장하고,
+  다음 compaction 전까지는 임베딩 변경만 저널(memories.json.journal)에 남겨 재시작 시 재생합니다.
+- 처음 로드할 때 한 번만 기존 JSON 스냅샷(에이전트별 파일 또는 memories.json)을 가져오고 meta 테이블에 기록합니다.
+  JSON 파일은 백업으로 그대로 두며 이후에는 갱신되지 않습니다. (/data/clear로 비운 뒤 다시 가져오지 않음)
+- minute 열이 없는 예전 데이터베이스는 열을 추가하고 처음 로드할 때 모든 행을 다시 기록합니다.
+- load()가 돌려주는 데이터 구조가 같으므로 /data/load의 JSON 내보내기 형식도 그대로입니다.
+"""
+
+import os
+import json
+import sqlite3
+from typing import Dict, Any, Optional, List
+from .memory_store import MemoryStore
+from .game_time import game_minutes, game_day, minute_date, UNKNOWN_MINUTE
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS agents (
+        agent TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS memories (
+        agent TEXT NOT NULL,
+        id TEXT NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        minute INTEGER NOT NULL DEFAULT -1,
+        event_type TEXT,
+        event_location TEXT,
+        importance REAL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (agent, id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )""",
+)
+
+_JSON_IMPORTED = "json_imported"  # JSON 스냅샷을 가져왔는지 (또는 가져올 필요가 없었는지)
+
+_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS memories_agent_date ON memories (agent, date)",
+    "CREATE INDEX IF NOT EXISTS memories_agent_type_location_minute "
+    "ON memories (agent, event_type, event_location, minute)",
+    "CREATE INDEX IF NOT EXISTS memories_agent_importance ON memories (agent, importance)"
+)
+
+_UPSERT = """INSERT INTO memories (agent, id, date, time, minute, event_type, event_location, importance, data)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (agent, id) DO UPDATE SET
+        date = excluded.date, time = excluded.time, minute = excluded.minute, event_type = excluded.event_type,
+        event_location = excluded.event_location, importance = excluded.importance, data = excluded.data"""
+
+
+def _column(value: Any) -> Any:
+    """sqlite 열에 넣을 수 있는 값으로 변환 (문자열 / 숫자 / None 외에는 JSON 문자열)"""
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _memory_row(agent_name: str, memory_id: str, memory: Dict[str, Any]) -> tuple:
+    """메모리 한 개를 memories 테이블 행으로 변환"""
+    time_str = str(memory.get("time", "") or "")
+    minute = game_minutes(time_str)
+    importance = memory.get("importance")
+    if not isinstance(importance, (int, float)) or isinstance(importance, bool):
+        importance = None
+    return (agent_name, memory_id, minute_date(minute), time_str,
+            UNKNOWN_MINUTE if minute is None else minute,
+            _column(memory.get("event_type")), _column(memory.get("event_location")), importance,
+            json.dumps(memory, ensure_ascii=False))
+
+
+def _agent_extra(agent_data: Dict[str, Any]) -> str:
+    """에이전트 항목 중 메모리 / 임베딩을 뺀 나머지 필드 (agents 테이블에 저장)"""
+    return json.dumps({key: value for key, value in agent_data.items() if key not in ("memories", "embeddings")},
+                      ensure_ascii=False)
+
+
+class SQLiteMemoryStore(MemoryStore):
+    def __init__(self, memories_file: str, db_file: Optional[str] = None, **options):
+        """
+        SQLite 메모리 저장소 초기화
+
+        Args:
+            memories_file: 메모리 JSON 파일 경로 (저널 / 임베딩 행렬 / 기존 JSON 스냅샷 위치 기준)
+            db_file: sqlite3 파일 경로 (None이면 memories.sqlite3)
+            options: MemoryStore 생성자 인자 (compact_interval, compact_threshold, fsync)
+        """
+        self.db_file = db_file or os.path.splitext(memories_file)[0] + ".sqlite3"
+        self._db: Optional[sqlite3.Connection] = None
+        self._backfill_minutes = False  # minute 열을 새로 추가한 경우 로드할 때 모든 행을 다시 기록
+        super().__init__(memories_file, **options)
+
+    # ------------------------------------------------------------------
+    # 데이터베이스
+    # ------------------------------------------------------------------
+
+    def _open_db(self) -> sqlite3.Connection:
+        """sqlite3 파일을 WAL 모드로 열고 테이블 / 색인 생성 (lock 보유 상태에서 호출)"""
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+            # isolation_level=None: 쓰기마다 자동 커밋, 여러 문장은 명시적 트랜잭션으로 묶음
+            db = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'NORMAL'}")
+            for statement in _SCHEMA:
+                db.execute(statement)
+            columns = {row[1] for row in db.execute("PRAGMA table_info(memories)")}
+            if "minute" not in columns:
+                db.execute("ALTER TABLE memories ADD COLUMN minute INTEGER NOT NULL DEFAULT -1")
+                db.execute("DROP INDEX IF EXISTS memories_agent_type_location")
+                self._backfill_minutes = True
+            for statement in _INDEXES:
+                db.execute(statement)
+            self._db = db
+        return self._db
+
+    def _read_snapshot(self) -> Dict[str, Any]:
+        """데이터베이스에서 메모리를 읽어 상주 데이터 구조로 조립 (처음 한 번은 JSON 스냅샷을 가져옴)"""
+        db = self._open_db()
+        imported = db.execute("SELECT 1 FROM meta WHERE key = ?", (_JSON_IMPORTED,)).fetchone() is not None
+        if not imported and db.execute("SELECT 1 FROM agents LIMIT 1").fetchone() is not None:
+            # meta 테이블 이전에 가져온 데이터베이스
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, '1')", (_JSON_IMPORTED,))
+            imported = True
+        if not imported:
+            json_snapshot = os.path.exists(self.memories_file) or os.path.isdir(self.shard_dir)
+            data = super()._read_snapshot()
+            # JSON 파일은 백업으로 남겨 두므로 이름을 바꾸지 않음
+            self._legacy_snapshot = False
+            self._persist_replace(data)
+            if json_snapshot:
+                print(f"📦 JSON 메모리 스냅샷을 SQLite로 가져왔습니다: {self.db_file}")
+            return data
+
+        data: Dict[str, Any] = {}
+        for agent_name, extra in db.execute("SELECT agent, data FROM agents ORDER BY rowid"):
+            data[agent_name] = {"memories": {}, **json.loads(extra)}
+        for agent_name, memory_id, memory in db.execute("SELECT agent, id, data FROM memories ORDER BY rowid"):
+            self._agent_entry(data, agent_name)["memories"][memory_id] = json.loads(memory)
+        if self._backfill_minutes:
+            self._persist_replace(data)
+            self._backfill_minutes = False
+            print(f"📦 메모리 시간 인덱스 열(minute)을 채웠습니다: {self.db_file}")
+        return data
+
+    def _persist_replace(self, data: Dict[str, Any]):
+        """데이터베이스 내용을 data로 통째로 교체 (한 트랜잭션, 이후 JSON 스냅샷은 다시 가져오지 않음)"""
+        db = self._open_db()
+        db.execute("BEGIN")
+        try:
+            db.execute("DELETE FROM memories")
+            db.execute("DELETE FROM agents")
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, '1')", (_JSON_IMPORTED,))
+            for agent_name, agent_data in data.items():
+                if not isinstance(agent_data, dict):
+                    continue
+                db.execute("INSERT INTO agents (agent, data) VALUES (?, ?)", (agent_name, _agent_extra(agent_data)))
+                db.executemany(_UPSERT, (_memory_row(agent_name, str(memory_id), memory)
+                                         for memory_id, memory in agent_data.get("memories", {}).items()))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _store_row(self, agent_name: str, memory_id: str, memory: Optional[Dict[str, Any]]):
+        """메모리 행 하나를 기록 (memory가 None이면 삭제, lock 보유 상태에서 호출)"""
+        db = self._open_db()
+        if memory is None:
+            db.execute("DELETE FROM memories WHERE agent = ? AND id = ?", (agent_name, memory_id))
+            return
+        db.execute("BEGIN")
+        try:
+            db.execute("INSERT OR IGNORE INTO agents (agent, data) VALUES (?, '{}')", (agent_name,))
+            db.execute(_UPSERT, _memory_row(agent_name, memory_id, memory))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _persist_record(self, record: Dict[str, Any]):
+        """레코드 하나를 해당 메모리 행에 반영 (상주 데이터에 적용하기 전, lock 보유 상태에서 호출)"""
+        op = record.get("op")
+        agent_name = record.get("agent")
+        memory_id = str(record.get("id", ""))
+        if op == "delete":
+            memory = None
+        elif op == "put":
+            memory = record.get("memory", {})
+        else:
+            current = self._data.get(agent_name, {}).get("memories", {}).get(memory_id, {})
+            memory = dict(current, **(record.get("fields") or {}))
+        self._store_row(agent_name, memory_id, memory)
+
+    # ------------------------------------------------------------------
+    # 쓰기 / 저널
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _embedding_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """저널에 남길 임베딩 변경 레코드 (메모리 텍스트는 데이터베이스에 있으므로 제외)"""
+        op = record.get("op")
+        if op == "delete":
+            return record
+        if record.get("embeddings"):
+            return {"op": "embed", "agent": record.get("agent"), "id": record.get("id"),
+                    "embeddings": record["embeddings"], "replace": op == "put"}
+        return None
+
+    def _write(self, record: Dict[str, Any]):
+        """레코드를 데이터베이스(텍스트)와 저널(임베딩)에 기록한 뒤 상주 데이터에 적용"""
+        self.load()
+        with self.lock:
+            self._persist_record(record)
+            embedding_record = self._embedding_record(record)
+            if embedding_record is not None:
+                self._append_journal(embedding_record)
+            self._apply(self._data, record)
+
+    def _apply(self, data: Dict[str, Any], record: Dict[str, Any]):
+        """저널 레코드 하나를 적용 (embed 레코드는 임베딩 행렬에만 적용)"""
+        op = record.get("op")
+        agent_name = record.get("agent")
+        memory_id = str(record.get("id", ""))
+        if op == "embed":
+            self._dirty_matrices.add(agent_name)
+            self._matrix(agent_name).set(memory_id, record.get("embeddings") or {}, replace=record.get("replace", True))
+            self._update_ann(agent_name, memory_id)
+            return
+        super()._apply(data, record)
+        if self._data is None:
+            # 시작 시 저널 재생 중: JSON 백엔드가 남긴 저널의 텍스트 변경도 데이터베이스에 반영
+            self._store_row(agent_name, memory_id, data.get(agent_name, {}).get("memories", {}).get(memory_id))
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def _serialize_snapshots(self, dirty) -> Dict[str, str]:
+        """메모리 텍스트는 쓰기마다 데이터베이스에 기록되므로 스냅샷 JSON이 필요 없음"""
+        return {}
+
+    def _write_snapshots(self, payloads: Dict[str, str], removed):
+        """WAL 파일을 데이터베이스에 반영 (임베딩 행렬은 compaction에서 기록됨)"""
+        with self.lock:
+            if self._db is not None:
+                self._db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        """남은 임베딩 저널을 행렬 파일에 반영하고 데이터베이스를 닫음"""
+        super().close()
+        with self.lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # ------------------------------------------------------------------
+    # 조회 (색인 사용)
+    # ------------------------------------------------------------------
+
+    def _query_ids(self, sql: str, params: tuple) -> List[str]:
+        self.load()
+        with self.lock:
+            return [row[0] for row in self._open_db().execute(sql, params)]
+
+    def memory_ids_on_date(self, agent_name: str, date_str: str) -> List[str]:
+        """지정한 날짜(YYYY.MM.DD)의 메모리 ID 목록, 시간순 ((agent, date) 색인)"""
+        # date 열은 minute_date 형식이므로 "2025.3.1" 같은 입력도 같은 형식으로 맞춤
+        return self._query_ids("SELECT id FROM memories WHERE agent = ? AND date = ? ORDER BY minute, rowid",
+                               (agent_name, minute_date(game_day(date_str))))
+
+    def find_memory_ids(self, agent_name: str, event_type: str, event_location: Optional[str] = None) -> List[str]:
+        """event_type(과 event_location)이 일치하는 메모리 ID 목록, 최신순 ((agent, event_type, event_location, minute) 색인)"""
+        if event_location is None:
+            return self._query_ids(
+                "SELECT id FROM memories WHERE agent = ? AND event_type = ? ORDER BY minute DESC, rowid",
+                (agent_name, event_type))
+        return self._query_ids(
+            "SELECT id FROM memories WHERE agent = ? AND event_type = ? AND event_location = ? "
+            "ORDER BY minute DESC, rowid",
+            (agent_name, event_type, _column(event_location)))
+
+    def latest_memory_date(self) -> str:
+        """모든 에이전트의 메모리 중 가장 최근 날짜 (에이전트별 MAX(date), (agent, date) 색인)"""
+        self.load()
+        with self.lock:
+            db = self._open_db()
+            agents = [row[0] for row in db.execute("SELECT agent FROM agents")]
+            dates = [db.execute("SELECT MAX(date) FROM memories WHERE agent = ?", (agent_name,)).fetchone()[0]
+                     for agent_name in agents]
+        return max((date for date in dates if date), default="")
@@ -0,0 +1,211 @@
+"""
+작업자 스레드 풀 모듈
+
+FastAPI 엔드포인트는 모두 async def라 이벤트 루프에서 실행됩니다. 그 안에서 JSON 파일 입출력,
+KeyedVectors 조회, NumPy 점수 계산을 직접 하면 그동안 다른 요청(/react 등)이 모두 멈추므로
+이런 작업은 WorkerPool로 넘깁니다.
+
+- "compute" 레인: 공유 상태를 바꾸지 않는 계산 (문장 임베딩 등), max_workers개 스레드에서 병렬 실행
+- "store" 레인: 메모리 저장소를 읽고 쓰는 작업, store_workers개 스레드에서 실행
+  호출자가 에이전트 잠금(agent_locks)을 잡고 넘기므로 같은 에이전트의 작업은 순서대로,
+  서로 다른 에이전트의 작업은 동시에 실행됩니다. store_workers=1이면 모든 저장소 작업이 요청 순서대로 실행됩니다.
+- 라벨별 호출 수, 대기열 대기 시간, 실행 시간, 오류 수를 기록 (stats)
+
+measure_loop_blocking으로 코루틴이 이벤트 루프를 점유한 시간(await 사이에 실행된 시간의 합)을
+엔드포인트별로 기록합니다 (get_loop_block_stats).
+"""
+
+import time
+import types
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+LANES = ("compute", "store")
+
+
+class WorkerPool:
+    def __init__(self, max_workers: Optional[int] = None, store_workers: int = 1):
+        """
+        작업자 스레드 풀 초기화
+
+        Args:
+            max_workers: compute 레인 스레드 수 (None이면 ThreadPoolExecutor 기본값)
+            store_workers: store 레인 스레드 수
+        """
+        self.max_workers = max_workers
+        self.store_workers = store_workers
+        self._executors = {
+            "compute": ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="worker-compute"),
+            "store": ThreadPoolExecutor(max_workers=store_workers, thread_name_prefix="worker-store")
+        }
+        self.lock = threading.Lock()
+        self._pending = dict.fromkeys(LANES, 0)
+        self._labels: Dict[str, Dict[str, Any]] = {}
+
+    async def run(self, label: str, func: Callable, *args, lane: str = "compute", **kwargs) -> Any:
+        """
+        func(*args, **kwargs)를 작업자 스레드에서 실행하고 결과를 기다림
+
+        Args:
+            label: 통계 구분용 작업 이름
+            func: 실행할 동기 함수
+            lane: "compute"(상태를 바꾸지 않는 계산) 또는 "store"(메모리 저장소 작업)
+
+        Returns:
+            func의 반환값 (예외는 그대로 전달)
+        """
+        executor = self._executors[lane]
+        with self.lock:
+            self._pending[lane] += 1
+        submitted = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self._call, label, lane, submitted, func, args, kwargs)
+
+    def _call(self, label: str, lane: str, submitted: float, func: Callable, args, kwargs) -> Any:
+        started = time.perf_counter()
+        failed = False
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._record(label, lane, started - submitted, time.perf_counter() - started, failed)
+
+    def _record(self, label: str, lane: str, wait: float, run_time: float, failed: bool):
+        with self.lock:
+            self._pending[lane] -= 1
+            entry = self._labels.get(label)
+            if entry is None:
+                entry = {"lane": lane, "calls": 0, "errors": 0, "wait": 0.0, "max_wait": 0.0, "run": 0.0, "max_run": 0.0}
+                self._labels[label] = entry
+            entry["calls"] += 1
+            entry["errors"] += int(failed)
+            entry["wait"] += wait
+            entry["max_wait"] = max(entry["max_wait"], wait)
+            entry["run"] += run_time
+            entry["max_run"] = max(entry["max_run"], run_time)
+
+    def stats(self) -> Dict[str, Any]:
+        """레인별 대기 중인 작업 수와 라벨별 대기 / 실행 시간(ms) 통계"""
+        with self.lock:
+            tasks = {}
+            for label, entry in self._labels.items():
+                calls = entry["calls"]
+                tasks[label] = {
+                    "lane": entry["lane"],
+                    "calls": calls,
+                    "errors": entry["errors"],
+                    "avg_wait_ms": round(entry["wait"] / calls * 1000, 2),
+                    "max_wait_ms": round(entry["max_wait"] * 1000, 2),
+                    "avg_run_ms": round(entry["run"] / calls * 1000, 2),
+                    "max_run_ms": round(entry["max_run"] * 1000, 2)
+                }
+            return {
+                "max_workers": self._executors["compute"]._max_workers,
+                "store_workers": self.store_workers,
+                "pending": dict(self._pending),
+                "tasks": tasks
+            }
+
+    def shutdown(self, wait: bool = True):
+        """스레드 풀 종료 (실행 중인 작업은 끝날 때까지 기다림)"""
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
+
+
+async def run_blocking(pool: Optional[WorkerPool], label: str, func: Callable, *args,
+                       lane: str = "compute", **kwargs) -> Any:
+    """pool이 있으면 작업자 스레드에서, 없으면 바로 실행 (풀을 선택적으로 받는 모듈용)"""
+    if pool is None:
+        return func(*args, **kwargs)
+    return await pool.run(label, func, *args, lane=lane, **kwargs)
+
+
+class LoopBlockStats:
+    """엔드포인트별 이벤트 루프 점유 시간 통계 (최근 window개로 p95 계산)"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self.lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, endpoint: str, blocked: float, elapsed: float):
+        with self.lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = {"count": 0, "blocked": 0.0, "elapsed": 0.0, "max": 0.0, "recent": deque(maxlen=self.window)}
+                self._endpoints[endpoint] = entry
+            entry["count"] += 1
+            entry["blocked"] += blocked
+            entry["elapsed"] += elapsed
+            entry["max"] = max(entry["max"], blocked)
+            entry["recent"].append(blocked)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            result = {}
+            for endpoint, entry in self._endpoints.items():
+                recent = sorted(entry["recent"])
+                count = entry["count"]
+                result[endpoint] = {
+                    "count": count,
+                    "avg_blocked_ms": round(entry["blocked"] / count * 1000, 2),
+                    "p95_blocked_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 2),
+                    "max_blocked_ms": round(entry["max"] * 1000, 2),
+                    "avg_elapsed_ms": round(entry["elapsed"] / count * 1000, 2),
+                    # 처리 시간 중 이벤트 루프를 점유한 비율 (낮을수록 다른 요청과 잘 겹쳐 실행됨)
+                    "blocked_ratio": round(entry["blocked"] / entry["elapsed"], 4) if entry["elapsed"] else 0.0
+                }
+            return result
+
+
+_loop_stats = LoopBlockStats()
+
+
+@types.coroutine
+def _timed(coro, endpoint: str):
+    """coro를 한 단계씩 실행하며 각 단계(이벤트 루프를 점유한 구간)의 시간을 더함"""
+    blocked = 0.0
+    started = time.perf_counter()
+    value, error = None, None
+    try:
+        while True:
+            step_start = time.perf_counter()
+            try:
+                yielded = coro.throw(error) if error is not None else coro.send(value)
+            finally:
+                blocked += time.perf_counter() - step_start
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        _loop_stats.record(endpoint, blocked, time.perf_counter() - started)
+
+
+async def measure_loop_blocking(coro, endpoint: str) -> Any:
+    """
+    코루틴을 실행하면서 이벤트 루프를 점유한 시간을 endpoint 이름으로 기록
+
+    Args:
+        coro: 실행할 코루틴 (예: 라우트 핸들러 호출)
+        endpoint: 통계 구분용 이름 (예: "/react")
+
+    Returns:
+        코루틴의 반환값
+    """
+    return await _timed(coro, endpoint)
+
+
+def get_loop_block_stats() -> Dict[str, Dict[str, Any]]:
+    """엔드포인트별 이벤트 루프 점유 시간 통계"""
+    return _loop_stats.stats()
@@ -1,6 +1,8 @@
 # server.py
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
 import json
 import re
 import asyncio
@@ -8,6 +10,7 @@ import sys
 from pathlib import Path
 import os
 import shutil
+import copy
 from datetime import datetime, timedelta
 import time
 import gensim.downloader as api
@@ -33,6 +36,7 @@ import_start = time.time()
 
 try:
     from agent.modules.ollama_client import OllamaClient
+    from agent.modules.response_cache import ResponseCache
     print("✅ OllamaClient 임포트 완료")
 except Exception as e:
     print(f"❌ OllamaClient 임포트 실패: {e}")
@@ -55,8 +59,14 @@ try:
 except Exception as e:
     print(f"❌ EmbeddingUpdater 임포트 실패: {e}")
 
+from agent.modules.object_index import ObjectEmbeddingIndex
 from agent.modules.reaction_decider import ReactionDecider
+from agent.modules.reaction_gate import ReactionGate
+from agent.modules.decision_cache import DecisionCache
+from agent.modules.prompt_budget import configure_budgets, get_prompt_stats
+from agent.modules.memory_store import configure_memory_store
 from agent.modules.agent_conversation import AgentConversationManager
+from agent.modules.worker_pool import WorkerPool, measure_loop_blocking, get_loop_block_stats
 
 # feedback_processor 모듈 임포트
 try:
@@ -75,14 +85,28 @@ except Exception as e:
 try:
     from agent.modules.reflection.importance_rater import ImportanceRater
     from agent.modules.reflection.reflection_pipeline import process_reflection_request
-    from agent.modules.plan.plan_pipeline import process_plan_request
+    from agent.modules.plan.plan_pipeline import process_plan_request, get_plan_pipeline_stats
+    from agent.modules.day_batch import process_reflect_and_plan_batch
     print("✅ reflection 및 plan 모듈 임포트 완료")
 except Exception as e:
     print(f"❌ reflection 및 plan 모듈 임포트 실패: {e}")
 
 print(f"⏱ 모듈 임포트 시간: {time.time() - import_start:.2f}초")
 
+class LoopTimedRoute(APIRoute):
+    """요청 처리(본문 파싱, 핸들러, 응답 직렬화)가 이벤트 루프를 점유한 시간을 경로별로 기록"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def timed_handler(request):
+            return await measure_loop_blocking(handler(request), path)
+
+        return timed_handler
+
 app = FastAPI()
+app.router.route_class = LoopTimedRoute
 
 # CORS 설정
 app.add_middleware(
@@ -139,35 +163,96 @@ except Exception as e:
     print(f"❌ object_embeddings.json 파일 로딩 실패: {e}")
     object_embeddings = {}
 
+# 오브젝트 임베딩을 정규화 행렬로 미리 만들어 반응 요청마다 다시 계산하지 않음
+object_index = ObjectEmbeddingIndex(object_embeddings)
+print(f"✅ 오브젝트 임베딩 인덱스 생성 완료 ({len(object_index)}개)")
+
+# 모델별 Ollama 동시 요청 수 (Ollama 서버의 OLLAMA_NUM_PARALLEL 이하로 설정)
+OLLAMA_CONCURRENCY = {"gemma3": 4}
+
+# 엔드포인트별 프롬프트 토큰 예산 (넘으면 이전 반성 / 오래된 대화 기록 등 우선순위 낮은 섹션부터 줄임, None이면 제한 없음)
+PROMPT_TOKEN_BUDGETS = {"reflection": 3000, "plan": 3500, "conversation": 2000}
+configure_budgets(PROMPT_TOKEN_BUDGETS)
+
+# temperature 0.2 이하 호출(중요도 평가 등)의 응답 캐시 (None이면 사용 안 함, 기본값)
+# 사용하려면 예: {"max_size": 5000, "ttl": 7 * 24 * 3600, "max_temperature": 0.2}
+# 재시작 후에도 재사용하려면 "persist_path": str(ROOT_DIR / "agent" / "data" / "llm_response_cache.sqlite3") 추가
+LLM_RESPONSE_CACHE_CONFIG = None
+
 try:
-    client = OllamaClient()
+    response_cache = ResponseCache(**LLM_RESPONSE_CACHE_CONFIG) if LLM_RESPONSE_CACHE_CONFIG else None
+    client = OllamaClient(model_concurrency=OLLAMA_CONCURRENCY, response_cache=response_cache)
     print("✅ OllamaClient 인스턴스 생성 완료")
 except Exception as e:
     print(f"❌ OllamaClient 인스턴스 생성 실패: {e}")
 
+# 파일 입출력 / 임베딩 / 점수 계산을 이벤트 루프 밖에서 실행할 작업자 스레드 수
+# (store_workers: 메모리 저장소 작업 스레드 수, 같은 에이전트의 작업은 에이전트 잠금으로 순서대로 실행)
+WORKER_POOL_CONFIG = {"max_workers": os.cpu_count() or 4, "store_workers": 4}
+worker_pool = WorkerPool(**WORKER_POOL_CONFIG)
+
+# 메모리 저장소 백엔드 ("json": 에이전트별 JSON 스냅샷 + 저널, "sqlite": WAL 모드 sqlite3 파일 + 날짜 / 종류·위치 / 중요도 색인)
+# sqlite로 바꾸면 처음 시작할 때 기존 JSON 메모리를 agent/data/memories.sqlite3로 가져옴
+MEMORY_STORE_CONFIG = {"backend": "json"}
+configure_memory_store(**MEMORY_STORE_CONFIG)
+
+# 에이전트 메모리가 min_size개 이상이면 IVF 근사 검색으로 유사도 계산 대상을 좁힘 (None이면 항상 전체 검색)
+MEMORY_ANN_CONFIG = {"nprobe": 8, "min_size": 5000, "target_recall": 0.95}
+
+# 문장 임베딩 LRU 캐시 (persist_path에 종료 시 저장하고 재시작 때 불러옴)
+EMBEDDING_CACHE_CONFIG = {
+    "max_size": 50000,
+    "persist_path": str(ROOT_DIR / "agent" / "data" / "embedding_cache.npz")
+}
+
 try:
-    memory_utils = MemoryUtils(word2vec_model)
+    memory_utils = MemoryUtils(word2vec_model, ann_config=MEMORY_ANN_CONFIG, embedding_cache_config=EMBEDDING_CACHE_CONFIG)
     print("✅ MemoryUtils 인스턴스 생성 완료")
 except Exception as e:
     print(f"❌ MemoryUtils 인스턴스 생성 실패: {e}")
 
 try:
-    retrieve = MemoryRetriever(memory_file_path="agent/data/memories.json", word2vec_model=word2vec_model)
+    retrieve = MemoryRetriever(memory_file_path="agent/data/memories.json", word2vec_model=word2vec_model, memory_utils=memory_utils)
     print("✅ MemoryRetriever 인스턴스 생성 완료")
 except Exception as e:
     print(f"❌ MemoryRetriever 인스턴스 생성 실패: {e}")
 
 try:
-    embedding_updater = EmbeddingUpdater(word2vec_model)
+    embedding_updater = EmbeddingUpdater(word2vec_model, memory_utils=memory_utils, object_index=object_index)
     print("✅ EmbeddingUpdater 인스턴스 생성 완료")
 except Exception as e:
     print(f"❌ EmbeddingUpdater 인스턴스 생성 실패: {e}")
 
+# /react 사전 판단 게이트: 최근 LLM 판단과 같은 상황이면 LLM 호출 생략 (None이면 항상 LLM 사용)
+REACTION_GATE_CONFIG = {
+    "similarity_threshold": 0.97,
+    "min_support": 2,
+    "state_tolerance": 15,
+    "history_size": 256,
+    "audit_rate": 0.05,
+    # LLM 판단을 기록해 evaluate_log로 게이트 정확도를 확인하려면 아래 두 줄 추가 (기본값은 기록 안 함)
+    # "log_path": str(ROOT_DIR / "agent" / "data" / "reaction_gate_log.jsonl"),
+    # "log_max_bytes": 10 * 1024 * 1024
+}
+
+# /react 결정 캐시: 게임 시간 ttl_minutes 안에 같은 이벤트를 다시 인식하면 이전 결정 재사용 (None이면 사용 안 함)
+REACTION_DECISION_CACHE_CONFIG = {
+    "ttl_minutes": 30,
+    "hash_bits": 16,
+    "state_bucket_size": 25,
+    "max_entries_per_agent": 256
+}
+
 try:
+    reaction_gate = ReactionGate(**REACTION_GATE_CONFIG) if REACTION_GATE_CONFIG else None
+    decision_cache = DecisionCache(**REACTION_DECISION_CACHE_CONFIG) if REACTION_DECISION_CACHE_CONFIG else None
     reaction_decider = ReactionDecider(
         memory_utils=memory_utils,
         ollama_client=client,
-        word2vec_model=word2vec_model
+        word2vec_model=word2vec_model,
+        gate=reaction_gate,
+        decision_cache=decision_cache,
+        worker_pool=worker_pool
     )
     print("✅ ReactionDecider 인스턴스 생성 완료")
 except Exception as e:
@@ -178,7 +263,8 @@ try:
         ollama_client=client,
         memory_utils=memory_utils,
         word2vec_model=word2vec_model,
-        max_turns=4  # 모듈 내부에서 최대 턴 수 설정 (필요에 따라 변경 가능)
+        max_turns=4,  # 모듈 내부에서 최대 턴 수 설정 (필요에 따라 변경 가능)
+        worker_pool=worker_pool
     )
     print("✅ AgentConversationManager 인스턴스 생성 완료")
 except Exception as e:
@@ -259,10 +345,51 @@ def load_prompt_file(file_path: Path) -> str:
             return RETRIEVE_SYSTEM_TEMPLATE
         return ""
 
+@app.on_event("shutdown")
+async def close_ollama_client():
+    """서버 종료 시 Ollama 연결 풀과 작업자 스레드 정리"""
+    await client.close()
+    worker_pool.shutdown()
+
 @app.get("/hello")
 async def hello():
     return "Hello from Python!"
 
+@app.get("/llm/metrics")
+async def llm_metrics():
+    """모델별 / 우선순위 클래스별 LLM 대기열 길이와 대기 시간 통계, 응답 캐시 / 동시 요청 합치기 통계, 엔드포인트별 프롬프트 토큰 수"""
+    return {
+        "success": True,
+        "metrics": client.get_queue_metrics(),
+        "response_cache": client.response_cache.stats() if client.response_cache else None,
+        "coalescing": client.get_coalescing_stats(),
+        "prompts": get_prompt_stats()
+    }
+
+@app.get("/react/metrics")
+async def react_metrics():
+    """반응 게이트 적용률과 LLM 대비 정확도(감사 표본), 결정 캐시 통계"""
+    return {
+        "success": True,
+        "gate": reaction_decider.gate.stats() if reaction_decider.gate else None,
+        "decision_cache": reaction_decider.decision_cache.stats() if reaction_decider.decision_cache else None
+    }
+
+@app.get("/plan/metrics")
+async def plan_metrics():
+    """계획 생성 재시도(슬롯 수정 / 전체 재생성) 횟수와 낭비된 토큰 통계"""
+    return {"success": True, "metrics": get_plan_pipeline_stats()}
+
+@app.get("/server/metrics")
+async def server_metrics():
+    """엔드포인트별 이벤트 루프 점유 시간과 작업자 풀 대기 / 실행 시간 통계"""
+    return {
+        "success": True,
+        "loop_blocking": get_loop_block_stats(),
+        "worker_pool": worker_pool.stats(),
+        "agent_locks": memory_utils.agent_locks.stats()
+    }
+
 @app.post("/perceive")
 async def perceive_event(payload: dict):
     """관찰 정보를 저장하는 엔드포인트"""
@@ -284,7 +411,10 @@ async def perceive_event(payload: dict):
         # 메모리 저장
         success = False
         if event_data.get("event_is_save", True):
-            success = memory_utils.save_perception(event_data, agent_name)
+            async with memory_utils.agent_lock(agent_name):
+                success = await worker_pool.run(
+                    "perceive.save", memory_utils.save_perception, event_data, agent_name, lane="store"
+                )
         else:
             print("💾 event_is_save 값이 False이므로 메모리 저장 건너뜀")
         return {
@@ -316,7 +446,10 @@ async def location_data(payload: dict):
         # 메모리 저장
         success = False
         if event_data.get("event_is_save", True):
-            success = memory_utils.save_location_data(event_data, agent_name)
+            async with memory_utils.agent_lock(agent_name):
+                success = await worker_pool.run(
+                    "location_data.save", memory_utils.save_location_data, event_data, agent_name, lane="store"
+                )
         else:
             print("💾 event_is_save 값이 False이므로 메모리 저장 건너뜀")
         return {
@@ -356,7 +489,7 @@ async def should_react(payload: dict):
         decision_start = time.time()
         reaction_decision = await reaction_decider.should_react_to_event(event_data, agent_data)
         decision_time = time.time() - decision_start
-        print(f"⏱ 반응 판단 시간: {decision_time:.2f}초")
+        print(f"⏱ 반응 판단 시간: {decision_time:.2f}초 ({reaction_decision.get('source', 'llm')})")
         
         # 결과 추출 - 단순 불리언 값과 이유
         should_react = reaction_decision.get("should_react", True)
@@ -366,12 +499,21 @@ async def should_react(payload: dict):
         ## 실패시에만 저장하는 이유는 성공했을 때 make_reaction에서 저장하기 때문
         ### event_is_save 파라미터를 통해 저장 여부를 결정하는 것도 추가
         event_is_save = event_data.get("event_is_save", True)
+        ### 같은 결정을 재사용한 반복 관찰은 새 메모리 대신 기존 메모리의 count / last_seen 갱신
         if should_react == False and event_is_save == True:
             print("💾 메모리 저장 중...")
             memory_start = time.time()
-            success = memory_utils.save_perception(event_data, agent_name)
+            async with memory_utils.agent_lock(agent_name):
+                memory_id, merged = await worker_pool.run(
+                    "react.save", memory_utils.save_or_merge_perception,
+                    event_data, agent_name, memory_id=reaction_decision.get("memory_id"), lane="store"
+                )
+            if reaction_decider.decision_cache is not None and memory_id is not None:
+                reaction_decider.decision_cache.set_memory_id(
+                    agent_name, reaction_decision.get("cache_key"), memory_id, merged=merged
+                )
             memory_time = time.time() - memory_start
-            print(f"⏱ 메모리 저장 시간: {memory_time:.2f}초")
+            print(f"⏱ 메모리 {'병합' if merged else '저장'} 시간: {memory_time:.2f}초 (메모리 ID: {memory_id})")
         
         # 전체 처리 시간 계산
         total_time = time.time() - react_start_time
@@ -388,6 +530,14 @@ async def should_react(payload: dict):
         return {"success": False, "error": str(e)}
 
 
+def _embed_reaction_event(event: Dict[str, Any], agent_data: Dict[str, Any]):
+    """반응 생성용 이벤트 문장, 이벤트 임베딩, 상태 임베딩 생성 (상태가 없으면 이벤트 임베딩 사용)"""
+    event_sentence = memory_utils.event_to_sentence(event)
+    embedding = memory_utils.get_embedding(event_sentence)
+    state_str = retrieve._format_state(agent_data.get("state", {})) if agent_data and "state" in agent_data else ""
+    state_embedding = memory_utils.get_embedding(state_str) if state_str else embedding
+    return event_sentence, embedding, state_embedding
+
 @app.post("/make_reaction")
 async def react_to_event(payload: dict):
     """이벤트에 대한 반응을 생성하는 엔드포인트"""
@@ -452,32 +602,30 @@ async def react_to_event(payload: dict):
             "event_role": event_role
         }
         
-        # 이벤트를 문장으로 변환
-        event_sentence = memory_utils.event_to_sentence(event)
+        # 이벤트 문장 / 임베딩 생성 (compute 레인)
+        event_sentence, embedding, state_embedding = await worker_pool.run(
+            "make_reaction.embedding", _embed_reaction_event, event, agent_data
+        )
         print(f"📝 이벤트 문장: {event_sentence}")
-        
-        # 임베딩 생성
-        embedding = memory_utils.get_embedding(event_sentence)
         print(f"🔢 임베딩 생성 완료 (차원: {len(embedding)})")
-
-        # 상태 임베딩 생성
-        state_str = retrieve._format_state(agent_data.get("state", {})) if agent_data and "state" in agent_data else ""
-        state_embedding = memory_utils.get_embedding(state_str) if state_str else embedding
         print(f"🔢 상태 임베딩 생성 완료 (차원: {len(state_embedding)})")
 
-        # 프롬프트 생성
-        prompt = retrieve.create_reaction_prompt(
-            event_sentence=event_sentence,
-            event_role=event_role,
-            event_embedding=embedding,
-            state_embedding=state_embedding,
-            agent_name=agent_name,
-            prompt_template=load_prompt_file(RETRIEVE_PROMPT_PATH),
-            agent_data=agent_data,
-            similar_data_cnt=5,  # 유사한 이벤트 5개 포함
-            similarity_threshold=0.1,  # 유사도 0.5 이상인 이벤트만 포함
-            object_embeddings=object_embeddings
-        )
+        # 프롬프트 생성 (메모리 저장소를 읽으므로 에이전트 잠금을 잡고 store 레인)
+        async with memory_utils.agent_lock(agent_name):
+            prompt = await worker_pool.run(
+                "make_reaction.prompt", retrieve.create_reaction_prompt,
+                event_sentence=event_sentence,
+                event_role=event_role,
+                event_embedding=embedding,
+                state_embedding=state_embedding,
+                agent_name=agent_name,
+                prompt_template=load_prompt_file(RETRIEVE_PROMPT_PATH),
+                agent_data=agent_data,
+                similar_data_cnt=5,  # 유사한 이벤트 5개 포함
+                similarity_threshold=0.1,  # 유사도 0.5 이상인 이벤트만 포함
+                object_embeddings=object_index,
+                lane="store"
+            )
         print(f"📋 생성된 프롬프트:\n{prompt}")
         
         # Ollama API 호출
@@ -487,8 +635,8 @@ async def react_to_event(payload: dict):
         ollama_start_time = time.time()
         
         try:
-            # Ollama API 호출
-            response = await client.process_prompt(
+            # Ollama API 스트리밍 호출 (JSON 객체가 닫히면 나머지 생성을 중단하고 바로 반환)
+            response = await client.process_prompt_until_json(
                 prompt=prompt,
                 system_prompt=load_prompt_file(RETRIEVE_SYSTEM_PATH),
                 model_name="gemma3",
@@ -497,7 +645,8 @@ async def react_to_event(payload: dict):
                     "top_p": 0.9,
                     "frequency_penalty": 0.1,
                     "presence_penalty": 0.1
-                }
+                },
+                priority="interactive"
             )
             
             # Ollama 응답 시간 계산
@@ -509,22 +658,27 @@ async def react_to_event(payload: dict):
             answer = response.get("response", "")
             print(f"📥 Ollama 응답: {answer}")
             
-            # 1) 펜스 제거
-            cleaned = answer.replace("```json", "").replace("```", "").strip()
-            print(f"🧹 정제된 응답: {cleaned}")
-            
-            # 2) JSON 텍스트 추출 (더 유연한 패턴)
-            match = re.search(r'\{[\s\S]*\}', cleaned)
-            if not match:
-                print("❌ JSON 형식이 아닙니다.")
-                raise HTTPException(status_code=500, detail="응답에서 JSON을 찾을 수 없습니다.")
-            
-            json_text = match.group(0)
-            print(f"📄 추출된 JSON: {json_text}")
+            reaction_obj = response.get("json")
+            if isinstance(reaction_obj, dict):
+                print(f"✅ 스트리밍 JSON 파싱 성공 (첫 토큰 {response.get('first_chunk_ms')}ms): {reaction_obj}")
+            else:
+                # 스트림에서 완성된 JSON 객체를 찾지 못한 경우 전체 텍스트에서 추출
+                # 1) 펜스 제거
+                cleaned = answer.replace("```json", "").replace("```", "").strip()
+                print(f"🧹 정제된 응답: {cleaned}")
+                
+                # 2) JSON 텍스트 추출 (더 유연한 패턴)
+                match = re.search(r'\{[\s\S]*\}', cleaned)
+                if not match:
+                    print("❌ JSON 형식이 아닙니다.")
+                    raise HTTPException(status_code=500, detail="응답에서 JSON을 찾을 수 없습니다.")
+                
+                json_text = match.group(0)
+                print(f"📄 추출된 JSON: {json_text}")
 
-            # 3) 파싱
-            reaction_obj = json.loads(json_text)
-            print(f"✅ JSON 파싱 성공: {reaction_obj}")
+                # 3) 파싱
+                reaction_obj = json.loads(json_text)
+                print(f"✅ JSON 파싱 성공: {reaction_obj}")
             
             # # 필수 필드 확인
             # if "action" not in reaction_obj or "details" not in reaction_obj:
@@ -544,14 +698,17 @@ async def react_to_event(payload: dict):
                 event_importance = 0
                 embedding = memory_utils.get_embedding("")
 
-            memory_id = memory_utils.save_memory(
-                event_sentence=event_sentence,
-                embedding=embedding,
-                event_time=agent_time,  # 에이전트의 시간 사용
-                agent_name=agent_name,
-                event_role=event_role,
-                importance=event_importance
-            )
+            async with memory_utils.agent_lock(agent_name):
+                memory_id = await worker_pool.run(
+                    "make_reaction.save", memory_utils.save_memory,
+                    event_sentence=event_sentence,
+                    embedding=embedding,
+                    event_time=agent_time,  # 에이전트의 시간 사용
+                    agent_name=agent_name,
+                    event_role=event_role,
+                    importance=event_importance,
+                    lane="store"
+                )
             print(f"💾 메모리 저장 완료 (시간: {agent_time}, 메모리 ID: {memory_id})")
 
             # 전체 처리 시간 계산
@@ -559,6 +716,7 @@ async def react_to_event(payload: dict):
             
             # 시간 측정 결과 출력
             print(f"\n⏱ 시간 측정 결과:")
+            print(f"  - Ollama 첫 토큰 시간: {(response.get('first_chunk_ms') or 0) / 1000:.2f}초")
             print(f"  - Ollama 응답 시간: {ollama_response_time:.2f}초")
             print(f"  - 전체 처리 시간: {total_response_time:.2f}초")
             
@@ -595,7 +753,11 @@ async def save_simple_action_feedback(payload: dict):
             return {"success": False, "error": "agent field is required"}
             
         # 피드백 처리
-        result = simple_feedback_processor.process_simple_feedback(payload)
+        agent_data = payload.get('agent', {})
+        async with memory_utils.agent_lock(agent_data.get('agent_name', agent_data.get('name', ''))):
+            result = await worker_pool.run(
+                "simple_action_feedback", simple_feedback_processor.process_simple_feedback, payload, lane="store"
+            )
         
         if not result:
             return {"success": False, "error": "Failed to process feedback"}
@@ -633,13 +795,14 @@ async def reflection_and_plan(payload: Dict[str, Any]):
         
         # 반성 처리 시작 시간
         reflection_start_time = time.time()
-        reflection_success = await process_reflection_request(payload, client, word2vec_model=word2vec_model)
+        reflection_success = await process_reflection_request(payload, client, word2vec_model=word2vec_model,
+                                                                worker_pool=worker_pool)
         reflection_time = time.time() - reflection_start_time
         print(f"⏱ 반성 처리 시간: {reflection_time:.2f}초")
         
         # 계획 처리 시작 시간
         plan_start_time = time.time()
-        plan_success, unity_plan = await process_plan_request(payload, client)
+        plan_success, unity_plan = await process_plan_request(payload, client, worker_pool=worker_pool)
         plan_time = time.time() - plan_start_time
         print(f"⏱ 계획 처리 시간: {plan_time:.2f}초")
         
@@ -659,6 +822,40 @@ async def reflection_and_plan(payload: Dict[str, Any]):
         print(f"❌ 반성 및 계획 처리 중 오류 발생: {str(e)}")
         return {"success": False, "error": str(e)}
 
+@app.post("/reflect-and-plan/batch")
+async def reflection_and_plan_batch(payload: Dict[str, Any]):
+    """
+    여러 에이전트의 반성 및 계획 일괄 생성 엔드포인트
+
+    요청: {"agents": [{"name": "Tom", "time": "2025.05.07.22:00"}, ...]}
+    응답: {"success", "results": {이름: {"success", "next_day_plan", "timings"}}, "timings"}
+    """
+    try:
+        print(f"\n=== /reflect-and-plan/batch 엔드포인트 호출 ===")
+        agents = payload.get("agents", [])
+        if not isinstance(agents, list) or not agents:
+            return {"success": False, "error": "agents 목록이 필요합니다."}
+
+        names = set()
+        for agent in agents:
+            if not isinstance(agent, dict) or not agent.get("name"):
+                return {"success": False, "error": "모든 agents 항목에 name이 필요합니다."}
+            if not agent.get("time"):
+                return {"success": False, "error": f"{agent['name']}의 time이 필요합니다."}
+            if agent["name"] in names:
+                return {"success": False, "error": f"중복된 에이전트: {agent['name']}"}
+            names.add(agent["name"])
+
+        print(f"📥 에이전트 {len(agents)}명: {', '.join(names)}")
+        return await process_reflect_and_plan_batch(
+            agents, client, word2vec_model=word2vec_model,
+            max_concurrent_agents=payload.get("max_concurrent_agents"), worker_pool=worker_pool
+        )
+
+    except Exception as e:
+        print(f"❌ 반성 및 계획 일괄 처리 중 오류 발생: {str(e)}")
+        return {"success": False, "error": str(e)}
+
 ######################################################################################
 ###                                     계획                                       ###
 ######################################################################################
@@ -670,11 +867,15 @@ async def update_embeddings():
     """
     try:
         print("\n=== 임베딩 업데이트 시작 ===")
-        update_counts = embedding_updater.update_embeddings()
+        async with memory_utils.exclusive_lock():
+            update_counts = await worker_pool.run("update_embeddings", embedding_updater.update_embeddings, lane="store")
         print(f"✅ 임베딩 업데이트 완료: {update_counts}")
+        cache_stats = memory_utils.embedding_cache.stats()
+        print(f"📊 임베딩 캐시: {cache_stats}")
         return {
             "success": True,
-            "updated": update_counts
+            "updated": update_counts,
+            "embedding_cache": cache_stats
         }
     except Exception as e:
         print(f"❌ 임베딩 업데이트 실패: {e}")
@@ -721,42 +922,70 @@ async def handle_conversation(payload: dict):
     except Exception as e:
         print(f"❌ 대화 처리 중 오류 발생: {str(e)}")
         return {"success": False, "error": str(e)}
+
+
+@app.post("/conversation/stream")
+async def handle_conversation_stream(payload: dict):
+    """
+    Agent 간 대화를 스트리밍으로 처리하는 엔드포인트
+    
+    /conversation과 같은 요청을 받아 NDJSON(한 줄에 JSON 하나)으로 응답합니다.
+    - {"type": "start", "conversation_id", "speaker"}
+    - {"type": "delta", "text"}: 생성 중인 대사 조각 (이어 붙이면 전체 대사)
+    - {"type": "result", ...}: /conversation과 같은 최종 결과
+    - {"type": "error", "error"}
+    """
+    print("\n=== /conversation/stream 엔드포인트 호출 ===")
+    print("📥 요청 데이터:", json.dumps(payload, indent=2, ensure_ascii=False))
+
+    async def event_stream():
+        start_time = time.time()
+        first_delta_time = None
+        async for event in conversation_manager.process_conversation_stream(payload):
+            if event["type"] == "delta" and first_delta_time is None:
+                first_delta_time = time.time() - start_time
+                print(f"⏱ 첫 대사 조각까지: {first_delta_time:.2f}초")
+            elif event["type"] == "result":
+                print(f"⏱ 대화 처리 시간: {time.time() - start_time:.2f}초")
+                if not event.get("should_continue", True):
+                    print("🔚 대화가 종료되었습니다. 이유:", event.get("conversation", {}).get("end_reason", ""))
+            elif event["type"] == "error":
+                print(f"❌ 대화 처리 중 오류 발생: {event.get('error')}")
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
     
 
 def _perform_clear_all_data():
     """
     실제로 모든 데이터 파일을 빈 상태로 초기화하는 내부 함수.
-    memories.json, plans.json, reflections.json 파일을 완전히 초기화합니다.
+    memories, plans, reflections의 에이전트별 파일을 모두 삭제합니다.
     주의: 이 작업은 되돌릴 수 없습니다.
     """
     try:
         results = {}
-        data_dir = os.path.dirname(memory_utils.memories_file)
         
-        # 초기화할 파일 목록
+        # 초기화할 데이터 목록 (반성 / 계획은 에이전트별 샤드 저장소)
         files_to_clear = [
-            {"name": "memories", "path": memory_utils.memories_file},
-            {"name": "plans", "path": memory_utils.plans_file},
-            {"name": "reflections", "path": memory_utils.reflections_file}
+            {"name": "memories", "shards": None},
+            {"name": "plans", "shards": memory_utils.plan_shards},
+            {"name": "reflections", "shards": memory_utils.reflection_shards}
         ]
         
-        # 각 파일 초기화
+        # 각 데이터 초기화
         for file_info in files_to_clear:
             file_name = file_info["name"]
-            file_path = file_info["path"]
             
             try:
-                # 파일 존재 확인
-                if not os.path.exists(file_path):
-                    print(f"⚠️ {file_name}.json 파일이 존재하지 않습니다. 빈 파일을 생성합니다.")
-                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                
-                # 빈 데이터 구조 생성
-                empty_data = {}
-                
-                # 파일에 저장
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(empty_data, f, ensure_ascii=False, indent=2)
+                if file_name == "memories":
+                    # 상주 저장소를 비우고 즉시 기록 (이전 데이터가 나중에 다시 기록되지 않도록)
+                    memory_utils._save_memories({})
+                    memory_utils.store.flush()
+                    if reaction_decider.decision_cache is not None:
+                        reaction_decider.decision_cache.invalidate()
+                else:
+                    # 모든 에이전트 파일 삭제
+                    file_info["shards"].save_all({})
                 
                 print(f"🧹 {file_name}.json 파일이 완전히 초기화되었습니다.")
                 
@@ -792,55 +1021,58 @@ async def clear_all_data():
     """
     모든 데이터 파일을 빈 상태로 초기화하는 엔드포인트
     
-    memories.json, plans.json, reflections.json 파일을 완전히 초기화합니다.
+    memories, plans, reflections의 에이전트별 파일을 모두 삭제합니다.
     주의: 이 작업은 되돌릴 수 없습니다.
     """
-    return _perform_clear_all_data()
+    async with memory_utils.exclusive_lock():
+        return await worker_pool.run("data.clear", _perform_clear_all_data, lane="store")
 
 
-@app.post("/data/save")
-async def set_all_data(payload: dict):
+def _perform_save_all_data(payload: dict):
     """
-    서버의 모든 데이터를 설정하는 엔드포인트
-    payload는 {"이름": {"memories":{}, "reflections":[], "plans":[]}} 형식이어야 합니다.
-    저장 후에는 임베딩을 업데이트합니다.
+    실제로 모든 데이터를 저장하고 임베딩을 업데이트하는 내부 함수.
+    파일 입출력과 임베딩 계산이 길어 작업자 풀(store 레인)에서 실행합니다.
     """
     try:
         if not payload:
             return {"success": False, "error": "데이터가 비어있습니다."}
         
         memories = {}
-        # 각 에이전트별로 데이터 처리
+        # 각 에이전트별로 데이터 처리 (반성 / 계획은 에이전트별 파일로 나눠 기록)
         for agent_name, agent_data in payload.items():
-            # 메모리 데이터 저장
+            # 메모리 데이터 수집 (모든 에이전트를 모은 뒤 한 번에 저장)
             if "memories" in agent_data:
+                # "embeddings"를 넘기지 않아 기존 임베딩 행을 유지 (바뀐 텍스트만 아래에서 다시 임베딩)
                 memories[agent_name] = {
-                    "memories": {},
-                    "embeddings": {}
+                    "memories": {}
                 }
                 memories[agent_name]["memories"] = agent_data["memories"]
-                memory_utils._save_memories(memories)
+                if reaction_decider.decision_cache is not None:
+                    reaction_decider.decision_cache.invalidate(agent_name)
             
             # 반성 데이터 저장
             if "reflections" in agent_data:
-                reflections = memory_utils._load_reflections()
-                if agent_name not in reflections:
-                    reflections[agent_name] = {"reflections": []}
-                reflections[agent_name]["reflections"] = agent_data["reflections"]
-                memory_utils._save_reflections(reflections)
+                agent_reflections = memory_utils.reflection_shards.load_agent(agent_name)
+                # 같은 thought의 기존 임베딩은 그대로 옮겨 다시 계산하지 않음
+                previous = {
+                    reflection.get("thought"): reflection
+                    for reflection in agent_reflections.get("reflections", [])
+                    if reflection.get("embedding") and "embedding_hash" in reflection
+                }
+                for reflection in agent_data["reflections"]:
+                    old_reflection = previous.get(reflection.get("thought"))
+                    if old_reflection is not None and "embedding" not in reflection:
+                        reflection["embedding"] = old_reflection["embedding"]
+                        reflection["embedding_hash"] = old_reflection["embedding_hash"]
+                agent_reflections["reflections"] = agent_data["reflections"]
+                memory_utils._save_agent_reflections(agent_name, agent_reflections)
             
             # 계획 데이터 저장
             if "plans" in agent_data:
-                try:
-                    with open(memory_utils.plans_file, 'r', encoding='utf-8') as f:
-                        plans = json.load(f)
-                except Exception:
-                    plans = {}
-                
-                plans[agent_name] = agent_data["plans"]
-                
-                with open(memory_utils.plans_file, 'w', encoding='utf-8') as f:
-                    json.dump(plans, f, ensure_ascii=False, indent=2)
+                memory_utils.plan_shards.save_agent(agent_name, agent_data["plans"])
+        
+        if memories:
+            memory_utils._save_memories(memories)
         
         # 임베딩 업데이트
         print("\n=== 임베딩 업데이트 시작 ===")
@@ -858,11 +1090,20 @@ async def set_all_data(payload: dict):
         return {"success": False, "error": str(e)}
 
 
-@app.get("/data/load")
-async def get_all_data():
+@app.post("/data/save")
+async def set_all_data(payload: dict):
     """
-    현재 서버의 모든 데이터를 가져오는 엔드포인트
-    memories, reflections, plans 데이터를 하나의 객체로 반환합니다.
+    서버의 모든 데이터를 설정하는 엔드포인트
+    payload는 {"이름": {"memories":{}, "reflections":[], "plans":[]}} 형식이어야 합니다.
+    저장 후에는 임베딩을 업데이트합니다.
+    """
+    async with memory_utils.exclusive_lock():
+        return await worker_pool.run("data.save", _perform_save_all_data, payload, lane="store")
+
+
+def _perform_load_all_data():
+    """
+    실제로 memories, reflections, plans 데이터를 하나의 객체로 모으는 내부 함수.
     임베딩 데이터는 제외됩니다.
     """
     try:
@@ -872,10 +1113,9 @@ async def get_all_data():
         # 반성 데이터 로드
         reflections_data = memory_utils._load_reflections()
         
-        # 계획 데이터 로드
+        # 계획 데이터 로드 (에이전트별 파일을 하나로 조립)
         try:
-            with open(memory_utils.plans_file, 'r', encoding='utf-8') as f:
-                plans_data = json.load(f)
+            plans_data = memory_utils.plan_shards.load_all()
         except Exception as e:
             print(f"계획 데이터 로드 중 오류 발생: {e}")
             plans_data = {"Tom": [], "Jane": []}
@@ -892,8 +1132,9 @@ async def get_all_data():
             }
             
             # 메모리 데이터 처리 (임베딩 제외)
+            # 응답 직렬화는 이벤트 루프에서 하므로 저장소의 딕셔너리 대신 복사본을 반환
             if "memories" in memories_data[agent_name]:
-                result[agent_name]["memories"] = memories_data[agent_name]["memories"]
+                result[agent_name]["memories"] = copy.deepcopy(memories_data[agent_name]["memories"])
             
             # 반성 데이터 처리 (임베딩 제외)
             if agent_name in reflections_data and "reflections" in reflections_data[agent_name]:
@@ -901,6 +1142,7 @@ async def get_all_data():
                     # 임베딩 필드 제거
                     if "embedding" in reflection:
                         del reflection["embedding"]
+                    reflection.pop("embedding_hash", None)
                     result[agent_name]["reflections"].append(reflection)
             
             # 계획 데이터 처리
@@ -917,6 +1159,17 @@ async def get_all_data():
         return {"success": False, "error": str(e)}
 
 
+@app.get("/data/load")
+async def get_all_data():
+    """
+    현재 서버의 모든 데이터를 가져오는 엔드포인트
+    memories, reflections, plans 데이터를 하나의 객체로 반환합니다.
+    임베딩 데이터는 제외됩니다.
+    """
+    async with memory_utils.exclusive_lock():
+        return await worker_pool.run("data.load", _perform_load_all_data, lane="store")
+
+
 if __name__ == "__main__":
     print(f"\n=== 서버 초기화 완료 (총 소요시간: {time.time() - start_time:.2f}초) ===")
     import uvicorn
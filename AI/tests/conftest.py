@@ -0,0 +1,33 @@
+import pytest
+
+from agent.modules.memory_store import MemoryStore
+
+
+@pytest.fixture
+def open_store():
+    """디렉토리의 memories.json으로 저장소를 여는 함수 (compaction은 테스트에서 직접 호출)"""
+    def open_store(directory, store_class=MemoryStore, **options):
+        options.setdefault("compact_interval", 3600)
+        options.setdefault("compact_threshold", 10 ** 6)
+        return store_class(str(directory / "memories.json"), **options)
+    return open_store
+
+
+@pytest.fixture
+def crash():
+    """compaction 없이 저장소를 버리는 함수 (프로세스가 죽은 상황)"""
+    def crash(store):
+        store._stop_event.set()
+        store._compact_requested.set()
+        if store._journal is not None:
+            store._journal.close()
+            store._journal = None
+    return crash
+
+
+@pytest.fixture
+def memory():
+    """테스트용 메모리 딕셔너리를 만드는 함수"""
+    def memory(event, time="2025.03.01.09:00"):
+        return {"event": event, "action": "", "feedback": "", "time": time, "importance": 5}
+    return memory
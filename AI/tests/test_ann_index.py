@@ -0,0 +1,63 @@
+import threading
+
+import numpy as np
+
+from agent.modules.ann_index import IVFIndex
+from agent.modules.memory_store import MemoryStore
+
+
+def test_training_runs_outside_store_lock(tmp_path, monkeypatch):
+    store = MemoryStore(str(tmp_path / "memories.json"), compact_interval=3600)
+    rng = np.random.default_rng(0)
+    for i in range(200):
+        store.put_memory("Tom", str(i), {"event": f"e{i}"}, {"event": rng.normal(size=8).tolist()})
+    store.enable_ann_index(min_size=100, n_lists=4, nprobe=4)
+
+    started, release = threading.Event(), threading.Event()
+    build = IVFIndex.build
+
+    def slow_build(index, matrix):
+        started.set()
+        assert release.wait(5)
+        build(index, matrix)
+
+    monkeypatch.setattr(IVFIndex, "build", slow_build)
+    result = {}
+    query = rng.normal(size=8).tolist()
+    searcher = threading.Thread(target=lambda: result.setdefault("ids", store.find_ann_candidates("Tom", [query])))
+    searcher.start()
+    try:
+        assert started.wait(5)
+        # 학습 중에도 쓰기 / 다른 검색은 막히지 않음 (학습 중인 에이전트는 전체 검색으로 대체)
+        store.put_memory("Tom", "new", {"event": "n"}, {"event": query})
+        store.delete_memory("Tom", "0")
+        assert store.find_ann_candidates("Tom", [query]) is None
+    finally:
+        release.set()
+        searcher.join(5)
+
+    # 학습 중에 바뀐 메모리는 교체 전에 다시 배정됨
+    assert "new" in result["ids"]
+    index = store._ann_indexes["Tom"]
+    assert "new" in index.assignments and "0" not in index.assignments
+    store.close()
+
+
+def test_training_result_dropped_after_reset(tmp_path, monkeypatch):
+    store = MemoryStore(str(tmp_path / "memories.json"), compact_interval=3600)
+    rng = np.random.default_rng(1)
+    for i in range(120):
+        store.put_memory("Tom", str(i), {"event": f"e{i}"}, {"event": rng.normal(size=4).tolist()})
+    store.enable_ann_index(min_size=100, n_lists=2, nprobe=2)
+
+    build = IVFIndex.build
+
+    def build_then_disable(index, matrix):
+        build(index, matrix)
+        store.disable_ann_index()
+        store.enable_ann_index(min_size=100, n_lists=2, nprobe=2)
+
+    monkeypatch.setattr(IVFIndex, "build", build_then_disable)
+    assert store.find_ann_candidates("Tom", [rng.normal(size=4).tolist()]) is None
+    assert "Tom" not in store._ann_indexes
+    store.close()
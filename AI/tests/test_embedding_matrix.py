@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+
+from agent.modules.embedding_matrix import EmbeddingMatrix
+from agent.modules.memory_store import MemoryStore
+
+
+def test_save_load_roundtrip(tmp_path):
+    matrix = EmbeddingMatrix()
+    matrix.set("1", {"event": [1.0, 0.0], "feedback": [0.0, 2.0]}, text_hashes={"event": 7})
+    matrix.set("2", {"event": [0.0, 0.0]})
+    matrix.delete("1")
+    matrix.set("3", {"action": [3.0, 4.0]})
+    path = str(tmp_path / "Tom.npz")
+    matrix.save(path)
+
+    loaded = EmbeddingMatrix.load(path)
+    assert loaded.ids == ["2", "3"]
+    assert loaded.to_dict() == matrix.to_dict()
+    assert not loaded.field_nonzero("event")[0]
+    np.testing.assert_allclose(loaded.unit_field_vectors(("action",))[0, 1], [0.6, 0.8])
+    assert [name for name in os.listdir(tmp_path)] == ["Tom.npz"]
+
+
+def test_legacy_matrix_files_are_converted(tmp_path):
+    matrix = EmbeddingMatrix()
+    matrix.set("1", {"event": [1.0, 0.0]})
+    embeddings_dir = tmp_path / "memories_embeddings"
+    embeddings_dir.mkdir()
+    np.save(embeddings_dir / "Tom.npy", matrix.vectors[:, :1])
+    (embeddings_dir / "Tom.index.json").write_text(
+        '{"dim": 2, "ids": ["1"], "present": [[1], [0], [0]], "text_hashes": [[0], [0], [0]]}')
+    (tmp_path / "memories").mkdir()
+    (tmp_path / "memories" / "Tom.json").write_text('{"memories": {"1": {"event": "a"}}}')
+
+    store = MemoryStore(str(tmp_path / "memories.json"), compact_interval=3600)
+    try:
+        assert store.get_embeddings("Tom", "1")["event"] == [1.0, 0.0]
+        assert store.compact()
+        assert sorted(os.listdir(embeddings_dir)) == ["Tom.npz"]
+    finally:
+        store.close()
+
+
+def test_matrix_path_stays_in_embeddings_dir(tmp_path):
+    store = MemoryStore(str(tmp_path / "data" / "memories.json"), compact_interval=3600)
+    try:
+        store.put_memory("../x", "1", {"event": "a"}, {"event": [1.0, 0.0]})
+        assert store.compact()
+        assert os.listdir(tmp_path) == ["data"]
+        assert os.listdir(tmp_path / "data" / "memories_embeddings") == ["%2E.%2Fx.npz"]
+    finally:
+        store.close()
+
+    restored = MemoryStore(str(tmp_path / "data" / "memories.json"), compact_interval=3600)
+    try:
+        assert restored.get_embeddings("../x", "1")["event"] == [1.0, 0.0]
+    finally:
+        restored.close()
@@ -0,0 +1,36 @@
+import json
+
+from agent.modules.json_stream import IncrementalJSONParser
+
+
+def feed_chars(parser, text):
+    results = [parser.feed(ch) for ch in text]
+    return [result for result in results if result is not None]
+
+
+def test_braces_inside_strings_do_not_close_object():
+    payload = {"message": "열린 { 닫힌 } 괄호 }}", "reason": "\"{\" 와 \\ 문자"}
+    text = json.dumps(payload, ensure_ascii=False)
+    parser = IncrementalJSONParser()
+    assert feed_chars(parser, text) == [payload]
+    assert parser.complete
+    assert parser.json_text == text
+
+
+def test_skips_fence_and_invalid_object_then_parses_next():
+    parser = IncrementalJSONParser()
+    chunks = ["설명 {not json}\n```json\n{\"message\": \"a}", "b\", \"n\": {\"x\": 1}}\n```"]
+    results = [parser.feed(chunk) for chunk in chunks]
+    assert results == [None, {"message": "a}b", "n": {"x": 1}}]
+    assert parser.feed("{\"ignored\": true}") is None
+
+
+def test_partial_string_reads_unfinished_message():
+    parser = IncrementalJSONParser()
+    parser.feed('{"message": "안녕 {친구} \\"반가')
+    assert not parser.complete
+    assert parser.partial_string("message") == '안녕 {친구} "반가'
+    parser.feed('워\\u0021\\')
+    assert parser.partial_string("message") == '안녕 {친구} "반가워!'
+    parser.feed('n"}')
+    assert parser.partial_string("message") == '안녕 {친구} "반가워!\n'
@@ -0,0 +1,111 @@
+def test_journal_replay_after_crash(tmp_path, open_store, memory, crash):
+    store = open_store(tmp_path)
+    store.load()
+    store.put_memory("Tom", "1", memory("a"), {"event": [1.0, 0.0]})
+    store.put_memory("Tom", "2", memory("b"), {"event": [0.0, 1.0]})
+    store.update_memory("Tom", "1", {"feedback": "good"}, {"feedback": [0.5, 0.5]})
+    store.delete_memory("Tom", "2")
+    crash(store)
+
+    restored = open_store(tmp_path)
+    try:
+        memories = restored.load()["Tom"]["memories"]
+        assert list(memories) == ["1"]
+        assert memories["1"]["feedback"] == "good"
+        assert restored.get_embeddings("Tom", "1")["feedback"] == [0.5, 0.5]
+        assert restored.get_embeddings("Tom", "2") == {}
+    finally:
+        restored.close()
+
+
+def test_truncated_journal_record_is_skipped(tmp_path, open_store, memory, crash):
+    store = open_store(tmp_path)
+    store.load()
+    store.put_memory("Tom", "1", memory("a"))
+    crash(store)
+    with open(store.journal_file, "a", encoding="utf-8") as f:
+        f.write('{"op": "put", "agent": "Tom", "id": "2", "memo')
+
+    restored = open_store(tmp_path)
+    try:
+        assert list(restored.load()["Tom"]["memories"]) == ["1"]
+    finally:
+        restored.close()
+
+
+def test_replay_after_crash_during_compaction(tmp_path, open_store, memory, crash):
+    store = open_store(tmp_path)
+    store.load()
+    store.put_memory("Tom", "1", memory("a"))
+    with store.lock:
+        # compaction이 저널을 journal.1로 넘긴 직후 종료된 상황
+        store._rotate_journal()
+    store.put_memory("Tom", "2", memory("b"))
+    crash(store)
+
+    restored = open_store(tmp_path)
+    try:
+        assert list(restored.load()["Tom"]["memories"]) == ["1", "2"]
+        assert restored.compact()
+        assert not (tmp_path / "memories.json.journal.1").exists()
+    finally:
+        restored.close()
+
+    reopened = open_store(tmp_path)
+    try:
+        assert list(reopened.load()["Tom"]["memories"]) == ["1", "2"]
+    finally:
+        reopened.close()
+
+
+def test_compaction_rewrites_only_changed_agents(tmp_path, monkeypatch, open_store, memory):
+    store = open_store(tmp_path)
+    store.load()
+    store.put_memory("Tom", "1", memory("a"), {"event": [1.0, 0.0]})
+    store.put_memory("Jane", "1", memory("b"), {"event": [0.0, 1.0]})
+    assert store.compact()
+
+    written = {"snapshots": [], "matrices": []}
+    write_snapshots, write_matrices = store._write_snapshots, store._write_matrices
+    monkeypatch.setattr(store, "_write_snapshots",
+                        lambda payloads, removed: (written["snapshots"].append(set(payloads)),
+                                                   write_snapshots(payloads, removed)))
+    monkeypatch.setattr(store, "_write_matrices",
+                        lambda matrices, removed=(): (written["matrices"].append(set(matrices)),
+                                                      write_matrices(matrices, removed)))
+
+    # 텍스트만 바뀐 경우 행렬 파일은 다시 쓰지 않음
+    store.update_memory("Tom", "1", {"importance": 9})
+    assert store.compact()
+    assert written == {"snapshots": [{"Tom"}], "matrices": [set()]}
+
+    store.apply_embedding_updates("Jane", {"1": {"feedback": [1.0, 1.0]}})
+    assert store.compact()
+    assert written["snapshots"][-1] == set()
+    assert written["matrices"][-1] == {"Jane"}
+    store.close()
+
+    restored = open_store(tmp_path)
+    try:
+        assert restored.load()["Tom"]["memories"]["1"]["importance"] == 9
+        assert restored.get_embeddings("Jane", "1")["feedback"] == [1.0, 1.0]
+    finally:
+        restored.close()
+
+
+def test_next_memory_id_survives_restart(tmp_path, open_store, memory, crash):
+    store = open_store(tmp_path)
+    store.load()
+    assert store.add_memory("Tom", memory("a")) == "1"
+    store.put_memory("Tom", "7", memory("b"))
+    assert store.add_memory("Tom", memory("c")) == "8"
+    store.delete_memory("Tom", "8")
+    assert store.next_memory_id("Tom") == "9"
+    assert store.next_memory_id("Ann") == "1"
+    crash(store)
+
+    restored = open_store(tmp_path)
+    try:
+        assert restored.next_memory_id("Tom") == "8"
+    finally:
+        restored.close()
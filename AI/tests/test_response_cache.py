@@ -0,0 +1,33 @@
+import asyncio
+import sqlite3
+
+from agent.modules.response_cache import ResponseCache
+
+
+def stored_rows(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def test_put_defers_disk_write_until_flush(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(persist_path=path, flush_interval=3600)
+    cache.put("key", {"response": "ok"})
+    assert cache.get("key") == {"response": "ok"}
+    assert stored_rows(path) == 0
+    cache.close()
+    assert stored_rows(path) == 1
+
+
+def test_get_async_reads_disk_after_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(persist_path=path)
+    cache.put("key", {"response": "ok"})
+    cache.close()
+
+    reopened = ResponseCache(persist_path=path)
+    assert asyncio.run(reopened.get_async("key")) == {"response": "ok"}
+    assert asyncio.run(reopened.get_async("missing")) is None
+    stats = reopened.stats()
+    assert (stats["disk_hits"], stats["misses"]) == (1, 1)
+    reopened.close()
@@ -0,0 +1,46 @@
+import json
+
+from agent.modules.sqlite_memory_store import SQLiteMemoryStore
+
+
+def test_json_snapshot_is_not_reimported_after_clear(tmp_path, open_store, memory):
+    (tmp_path / "memories.json").write_text(json.dumps({"Tom": {"memories": {"1": memory("a")}}}))
+    store = open_store(tmp_path, SQLiteMemoryStore)
+    assert list(store.load()["Tom"]["memories"]) == ["1"]
+    store.replace({})
+    store.close()
+
+    restarted = open_store(tmp_path, SQLiteMemoryStore)
+    try:
+        assert restarted.load() == {}
+    finally:
+        restarted.close()
+
+
+def test_time_queries_match_json_backend(tmp_path, open_store, memory):
+    entries = [
+        ("1", memory("a", "2025.03.01.09:00")),
+        ("2", memory("b", "2025.3.1.9:00")),
+        ("3", memory("c", "2025.03.01.08:30")),
+        ("4", memory("d", "2025.03.01.09:00")),
+        ("5", memory("e", "2025.03.02.07:00")),
+    ]
+    for _, entry in entries:
+        entry["event_type"] = "talk"
+    (tmp_path / "json").mkdir()
+    (tmp_path / "sqlite").mkdir()
+    json_store = open_store(tmp_path / "json")
+    sqlite_store = open_store(tmp_path / "sqlite", SQLiteMemoryStore)
+    try:
+        for store in (json_store, sqlite_store):
+            store.load()
+            for memory_id, entry in entries:
+                store.put_memory("Tom", memory_id, dict(entry))
+            store.update_memory("Tom", "1", {"time": "2025.03.01.09:00", "feedback": "moved"})
+        for date_str in ("2025.03.01", "2025.3.1", "2025.03.02"):
+            assert json_store.memory_ids_on_date("Tom", date_str) == sqlite_store.memory_ids_on_date("Tom", date_str)
+        assert json_store.memory_ids_on_date("Tom", "2025.3.1") == ["3", "1", "2", "4"]
+        assert json_store.find_memory_ids("Tom", "talk") == sqlite_store.find_memory_ids("Tom", "talk")
+    finally:
+        json_store.close()
+        sqlite_store.close()